@@ -0,0 +1,125 @@
+"""
+Benchmark: CSV vs Parquet vs Arrow IPC downloads, file size and load time.
+
+For synthetic statements of several sizes, renders each download from a
+TransactionTable shaped like the rows the download views read from the
+Transaction table (2-place Decimal amounts, parsed dates), and reports its size,
+the time to write it and the time a consumer takes to load it into typed
+columns (dates, Decimal amounts):
+
+  csv (stdlib)    csv.DictReader, then date.fromisoformat / Decimal per value
+  csv (pyarrow)   pyarrow.csv.read_csv, the fastest CSV reader at hand
+  parquet         pyarrow.parquet.read_table
+  arrow           pyarrow.ipc.open_file(...).read_all()
+
+Needs pyarrow. Run from the repository root:
+
+    python benchmarks/bench_columnar_export.py
+    python benchmarks/bench_columnar_export.py --rows 1000 100000
+"""
+import argparse
+import csv
+import io
+import os
+import sys
+import timeit
+from datetime import date
+from decimal import Decimal
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+import django  # noqa: E402
+
+django.setup()  # arrow_export reads its defaults from settings
+
+from bench_statement_codec import make_transactions  # noqa: E402
+from converter_app import arrow_export  # noqa: E402
+from converter_app.dates import normalize_transaction_dates  # noqa: E402
+from converter_app.transaction_table import TransactionTable  # noqa: E402
+from converter_app.transactions import parse_amount  # noqa: E402
+from converter_app.utils import convert_data_to_csv_string  # noqa: E402
+
+DEFAULT_ROW_COUNTS = [1000, 10000, 100000]
+
+
+def stored_values(rows):
+    """The rows as the Transaction table's values_list() returns them, parsed dates last."""
+    return [(row['date'], row['description'], parse_amount(row['debit']), parse_amount(row['credit']),
+             parse_amount(row['balance']), parsed_date)
+            for row, parsed_date in zip(rows, normalize_transaction_dates(rows))]
+
+
+def time_call(func, number=None):
+    """Best time of one call in milliseconds."""
+    if number is None:
+        number = max(1, min(100, int(0.2 / max(timeit.timeit(func, number=1), 1e-6))))
+    return min(timeit.repeat(func, number=number, repeat=3)) / number * 1000
+
+
+def load_csv_stdlib(data):
+    columns = {'date': [], 'description': [], 'debit': [], 'credit': [], 'balance': []}
+    for row in csv.DictReader(io.StringIO(data.decode('utf-8'))):
+        columns['date'].append(date.fromisoformat(row['date']) if row['date'] else None)
+        columns['description'].append(row['description'])
+        for column in ('debit', 'credit', 'balance'):
+            columns[column].append(Decimal(row[column]) if row[column] else None)
+    return columns
+
+
+def load_csv_pyarrow(data):
+    return arrow_export.pyarrow.csv.read_csv(arrow_export.pyarrow.BufferReader(data))
+
+
+def load_parquet(data):
+    return arrow_export.pyarrow.parquet.read_table(arrow_export.pyarrow.BufferReader(data))
+
+
+def load_arrow(data):
+    return arrow_export.pyarrow.ipc.open_file(arrow_export.pyarrow.BufferReader(data)).read_all()
+
+
+def render_columnar(export_format, table):
+    with arrow_export.convert_data_to_columnar_file(export_format, table) as output_file:
+        return output_file.read()
+
+
+def measure(values):
+    def table():
+        return TransactionTable.from_values(values, with_parsed_dates=True)
+
+    results = []
+    csv_bytes = convert_data_to_csv_string(table()).encode('utf-8')
+    csv_write_ms = time_call(lambda: convert_data_to_csv_string(table()))
+    results.append(('csv (stdlib)', len(csv_bytes), csv_write_ms, time_call(lambda: load_csv_stdlib(csv_bytes))))
+    results.append(('csv (pyarrow)', len(csv_bytes), csv_write_ms, time_call(lambda: load_csv_pyarrow(csv_bytes))))
+    for export_format, load in ((arrow_export.FORMAT_PARQUET, load_parquet), (arrow_export.FORMAT_ARROW, load_arrow)):
+        data = render_columnar(export_format, table())
+        assert load(data).num_rows == len(values)
+        results.append((export_format, len(data), time_call(lambda: render_columnar(export_format, table())),
+                        time_call(lambda: load(data))))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROW_COUNTS,
+                        help="Transactions per statement (default: %(default)s)")
+    args = parser.parse_args()
+
+    if not arrow_export.is_available():
+        parser.exit(1, "pyarrow isn't installed; install it to run this benchmark.\n")
+    import pyarrow.csv  # noqa: F401  (loaded on demand; the app itself never parses CSV)
+
+    for row_count in args.rows:
+        results = measure(stored_values(make_transactions(row_count)))
+        csv_size = results[0][1]
+        print(f"\n{row_count} transactions")
+        print(f"{'format':<16}{'bytes':>12}{'vs csv':>10}{'write ms':>12}{'load ms':>12}")
+        for name, size, write_ms, load_ms in results:
+            print(f"{name:<16}{size:>12}{size / csv_size:>10.1%}{write_ms:>12.2f}{load_ms:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
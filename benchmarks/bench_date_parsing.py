@@ -0,0 +1,97 @@
+"""
+Benchmark: per-row strptime trial-and-error vs statement-wide date format inference.
+
+Times the date-range computation over synthetic statements in each supported
+date style, and counts rows the per-row loop reads in a different format from
+the rest of the statement. Run from the repository root:
+
+    python benchmarks/bench_date_parsing.py
+    python benchmarks/bench_date_parsing.py --rows 1000 10000 --repeat 5
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from converter_app.dates import normalize_dates  # noqa: E402
+
+DEFAULT_ROW_COUNTS = [1000, 10000, 100000]
+DEFAULT_REPEAT = 3
+ROWS_PER_DAY = 8  # Statements usually have several transactions per posting date
+
+DATE_STYLES = {
+    'iso': '%Y-%m-%d',
+    'day_first': '%d/%m/%Y',
+    'month_first': '%m/%d/%Y',
+    'month_name': '%d-%b-%Y',
+    'day_first_short': '%d/%m/%y',
+}
+
+
+def make_date_strings(row_count, style):
+    """Builds the date column of a synthetic statement, oldest row first."""
+    start = date(2021, 1, 1)
+    fmt = DATE_STYLES[style]
+    return [(start + timedelta(days=i // ROWS_PER_DAY)).strftime(fmt) for i in range(row_count)]
+
+
+def legacy_parse_dates(date_strings):
+    """The date loop as it was before format inference: every format tried on every row."""
+    date_formats = [
+        "%Y-%m-%d", "%d/%m/%Y", "%m/%d/%Y", "%d-%b-%Y", "%d-%B-%Y", "%d/%m/%y"]
+    parsed = []
+    for date_str in date_strings:
+        parsed_dt = None
+        for fmt in date_formats:
+            try:
+                parsed_dt = datetime.strptime(date_str, fmt).date()
+                break
+            except (ValueError, TypeError):
+                continue
+        parsed.append(parsed_dt)
+    return parsed
+
+
+def best_time(func, date_strings, repeat):
+    """Returns (fastest wall time over repeat runs, last result)."""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(date_strings)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def count_misread(parsed, style, date_strings):
+    """Rows whose parsed date differs from what the statement's own format says."""
+    fmt = DATE_STYLES[style]
+    return sum(1 for value, parsed_dt in zip(date_strings, parsed)
+               if parsed_dt != datetime.strptime(value, fmt).date())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROW_COUNTS)
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    args = parser.parse_args()
+
+    print(f"{'style':<18}{'rows':>9}{'legacy ms':>12}{'inferred ms':>13}{'speedup':>9}"
+          f"{'legacy misread':>16}{'inferred misread':>18}")
+    for row_count in args.rows:
+        for style in DATE_STYLES:
+            date_strings = make_date_strings(row_count, style)
+            legacy_seconds, legacy_parsed = best_time(legacy_parse_dates, date_strings, args.repeat)
+            inferred_seconds, inferred_parsed = best_time(normalize_dates, date_strings, args.repeat)
+            print(f"{style:<18}{row_count:>9}{legacy_seconds * 1000:>12.1f}{inferred_seconds * 1000:>13.1f}"
+                  f"{legacy_seconds / inferred_seconds:>8.1f}x"
+                  f"{count_misread(legacy_parsed, style, date_strings):>16}"
+                  f"{count_misread(inferred_parsed, style, date_strings):>18}")
+
+
+if __name__ == '__main__':
+    main()
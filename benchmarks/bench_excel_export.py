@@ -0,0 +1,116 @@
+"""
+Benchmark: in-memory vs write-only XLSX export.
+
+Each (engine, row count) pair runs in a fresh subprocess so peak RSS is measured
+in isolation. Run from the repository root:
+
+    python benchmarks/bench_excel_export.py
+    python benchmarks/bench_excel_export.py --rows 1000 10000 100000
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+DEFAULT_ROW_COUNTS = [1000, 10000, 100000]
+ENGINES = ['legacy', 'write_only']
+
+
+def make_transactions(row_count):
+    """Builds synthetic transactions shaped like StatementData.extracted_data."""
+    balance = 100000.0
+    rows = []
+    for i in range(row_count):
+        debit = round((i % 97) * 1.37, 2) if i % 3 else None
+        credit = round((i % 53) * 2.11, 2) if not i % 3 else None
+        balance = round(balance - (debit or 0) + (credit or 0), 2)
+        rows.append({
+            'date': f"2024-{(i % 12) + 1:02d}-{(i % 28) + 1:02d}",
+            'description': f"CARD PURCHASE {i} MERCHANT NAME LTD",
+            'debit': debit,
+            'credit': credit,
+            'balance': balance,
+        })
+    return rows
+
+
+def legacy_export(data_list):
+    """The exporter as it was before write-only mode: every cell held in memory, then getvalue()."""
+    import openpyxl
+    from converter_app.utils import sanitize_for_formula_injection
+
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    headers = ['date', 'description', 'debit', 'credit', 'balance']
+    sheet.append(headers)
+    for row_dict in data_list:
+        sheet.append([sanitize_for_formula_injection(row_dict.get(h)) for h in headers])
+    excel_bytes = io.BytesIO()
+    workbook.save(excel_bytes)
+    excel_bytes.seek(0)
+    return len(excel_bytes.getvalue())
+
+
+def write_only_export(data_list):
+    from converter_app.utils import convert_data_to_excel_file
+
+    with convert_data_to_excel_file(data_list) as excel_file:
+        # Drain it the way FileResponse does, in fixed-size blocks
+        size = 0
+        while True:
+            block = excel_file.read(64 * 1024)
+            if not block:
+                break
+            size += len(block)
+    return size
+
+
+def run_single(engine, row_count):
+    """Runs one measurement in the current process and prints a JSON result line."""
+    data_list = make_transactions(row_count)
+    baseline_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    size = legacy_export(data_list) if engine == 'legacy' else write_only_export(data_list)
+    elapsed = time.perf_counter() - started
+    peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        'engine': engine,
+        'rows': row_count,
+        'seconds': round(elapsed, 3),
+        'peak_rss_mb': round(peak_rss_kb / 1024, 1),
+        # Growth over the process's RSS after building the input rows
+        'export_rss_mb': round((peak_rss_kb - baseline_rss_kb) / 1024, 1),
+        'file_bytes': size,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROW_COUNTS)
+    parser.add_argument('--single', nargs=2, metavar=('ENGINE', 'ROWS'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        run_single(args.single[0], int(args.single[1]))
+        return
+
+    print(f"{'engine':<12}{'rows':>9}{'seconds':>10}{'peak RSS MB':>13}{'export RSS MB':>15}{'file KB':>10}")
+    for row_count in args.rows:
+        for engine in ENGINES:
+            output = subprocess.run(
+                [sys.executable, __file__, '--single', engine, str(row_count)],
+                check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{result['engine']:<12}{result['rows']:>9}{result['seconds']:>10}"
+                  f"{result['peak_rss_mb']:>13}{result['export_rss_mb']:>15}{result['file_bytes'] // 1024:>10}")
+
+
+if __name__ == '__main__':
+    main()
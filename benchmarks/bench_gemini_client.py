@@ -0,0 +1,74 @@
+"""
+Benchmark: per-upload Gemini setup vs the shared process-wide client.
+
+Times what each upload paid before any API call: genai.configure(), opening the
+generative and file service clients, and building the GenerativeModel; against
+fetching the already configured model from GeminiClient. No request is sent to
+the API, so any placeholder key works. Run from the repository root:
+
+    python benchmarks/bench_gemini_client.py
+    python benchmarks/bench_gemini_client.py --requests 500
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import google.generativeai as genai  # noqa: E402
+from django.conf import settings  # noqa: E402
+from google.generativeai import client as genai_client  # noqa: E402
+
+DEFAULT_REQUESTS = 200
+DEFAULT_MODEL_NAME = 'gemini-1.5-flash'
+
+
+def per_request_setup(api_key, model_name):
+    """Setup as upload_pdf_view used to do it; the clients open on the first API call."""
+    genai.configure(api_key=api_key)
+    genai_client.get_default_generative_client()
+    genai_client.get_default_file_client()
+    return genai.GenerativeModel(model_name=model_name)
+
+
+def time_calls(func, count):
+    """Returns per-call durations in milliseconds."""
+    durations = []
+    for _ in range(count):
+        started = time.perf_counter()
+        func()
+        durations.append((time.perf_counter() - started) * 1000)
+    return durations
+
+
+def summarize(label, durations):
+    ordered = sorted(durations)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(f"{label:<22}{statistics.mean(durations):>10.3f}{statistics.median(durations):>10.3f}"
+          f"{p95:>10.3f}{sum(durations):>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=DEFAULT_REQUESTS)
+    parser.add_argument('--model', default=DEFAULT_MODEL_NAME)
+    args = parser.parse_args()
+
+    api_key = os.getenv('GEMINI_API_KEY') or 'benchmark-placeholder-key'
+    settings.configure(GEMINI_API_KEY=api_key, GEMINI_MODEL_NAME=args.model)
+    from converter_app.gemini_client import GeminiClient
+
+    shared = GeminiClient()
+    shared.get_model()  # Warm-up, as done at worker start when GEMINI_WARMUP_ENABLED is set
+
+    print(f"{'setup per upload':<22}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'total ms':>12}")
+    summarize('configure + build', time_calls(lambda: per_request_setup(api_key, args.model), args.requests))
+    summarize('shared client', time_calls(shared.get_model, args.requests))
+    print(f"One-time warm-up: {shared.setup_ms:.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
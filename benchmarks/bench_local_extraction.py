@@ -0,0 +1,68 @@
+"""
+Benchmark: local text-layer extraction over a folder of statement PDFs.
+
+For each PDF, reports how long the local engine took and whether its result
+was used or the statement would fall back to Gemini (and why, from the log).
+Nothing is sent to any API. Run from the repository root:
+
+    python benchmarks/bench_local_extraction.py path/to/statements/*.pdf
+    python benchmarks/bench_local_extraction.py statement.pdf --repeat 5
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from django.conf import settings  # noqa: E402
+
+DEFAULT_REPEAT = 3
+
+
+class _ReasonHandler(logging.Handler):
+    """Keeps the fallback reason of the last extraction."""
+
+    def __init__(self):
+        super().__init__()
+        self.reason = None
+
+    def emit(self, record):
+        self.reason = getattr(record, 'fallback_reason', self.reason)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('pdfs', nargs='+')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    args = parser.parse_args()
+
+    settings.configure()
+    from converter_app.local_extraction import extract_text_layer
+
+    reason_handler = _ReasonHandler()
+    extraction_logger = logging.getLogger('converter_app.local_extraction')
+    extraction_logger.addHandler(reason_handler)
+    extraction_logger.setLevel(logging.INFO)
+    extraction_logger.propagate = False
+
+    used = 0
+    print(f"{'pdf':<40}{'best ms':>10}{'rows':>7}  result")
+    for path in args.pdfs:
+        best, rows = None, None
+        for _ in range(args.repeat):
+            reason_handler.reason = None
+            started = time.perf_counter()
+            rows = extract_text_layer(path)
+            elapsed = (time.perf_counter() - started) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        used += rows is not None
+        result = 'local' if rows is not None else f"Gemini fallback: {reason_handler.reason}"
+        print(f"{os.path.basename(path)[:39]:<40}{best:>10.1f}{len(rows or []):>7}  {result}")
+    print(f"{used} of {len(args.pdfs)} statements extracted locally.")
+
+
+if __name__ == '__main__':
+    main()
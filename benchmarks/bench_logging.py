@@ -0,0 +1,158 @@
+"""
+Benchmark: per-request logging overhead, synchronous handlers vs the log queue.
+
+Serves a mix of typical requests (upload page, job status poll, JSON download)
+through the Django test client, in a fresh process per logging setup:
+
+  off    logging above CRITICAL, the baseline
+  sync   DEBUG logging written by the handlers on the request thread (before)
+  queue  DEBUG logging handed to the background listener (after)
+
+and reports each setup's time per request and its overhead over the baseline.
+It also times one disabled logger.debug() call with an eager f-string and
+extra dict against the lazy %-style call. Runs in development mode, so the
+handlers are the console and the rotating JSON file (written to a temporary
+directory). Console output is discarded, or with --sink-kbps piped to a reader
+draining it at that rate, like a container log collector under pressure. With
+a fast sink the queue can't save CPU time (the listener runs in the same
+process); it pays off when writes would block. Run from the repository root:
+
+    python benchmarks/bench_logging.py
+    python benchmarks/bench_logging.py --sink-kbps 64
+    python benchmarks/bench_logging.py --requests 2000 --sample-rate 0.1
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import uuid
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, BENCHMARKS_DIR)
+
+DEFAULT_REQUESTS = 600
+DEFAULT_ROWS = 50
+# Reads stdin in 4 KB blocks at a fixed rate (argv[1] KB/s), discarding the data
+SLOW_READER = ("import sys, time\n"
+               "rate = float(sys.argv[1]) * 1024\n"
+               "while sys.stdin.buffer.read1(4096):\n"
+               "    time.sleep(4096 / rate)\n")
+MODES = {
+    'off': {'LOAD_TEST_LOG_LEVEL': 'CRITICAL', 'LOG_QUEUE_ENABLED': 'false'},
+    'sync': {'LOAD_TEST_LOG_LEVEL': 'DEBUG', 'LOG_QUEUE_ENABLED': 'false'},
+    'queue': {'LOAD_TEST_LOG_LEVEL': 'DEBUG', 'LOG_QUEUE_ENABLED': 'true'},
+}
+
+
+def run_mode(mode, requests, rows, sink_kbps, environment):
+    """Runs in a fresh process: boots Django with the mode's logging and times the request mix."""
+    os.environ.update(environment)
+    os.environ.update(MODES[mode])
+    reader = None
+    if sink_kbps:
+        reader = subprocess.Popen([sys.executable, '-c', SLOW_READER, str(sink_kbps)], stdin=subprocess.PIPE)
+        os.dup2(reader.stdin.fileno(), 2)
+    else:
+        os.dup2(os.open(os.devnull, os.O_WRONLY), 2)  # The console handler still writes; nobody reads it
+    import django
+    django.setup()
+    from django.core.management import call_command
+    from django.test import Client
+    from django.test.utils import setup_test_environment
+    from converter_app.models import ExtractionJob, StatementData
+
+    setup_test_environment()
+    call_command('migrate', verbosity=0)
+    statement = StatementData.objects.create(pdf_filename='bench.pdf', extracted_data=[
+        {'date': f"2024-01-{day % 28 + 1:02d}", 'description': f"PAYMENT {day}", 'debit': 10.5,
+         'credit': None, 'balance': 1000 - day * 10.5} for day in range(rows)])
+    job = ExtractionJob.objects.create(pdf_filename='bench.pdf', status=ExtractionJob.STATUS_SUCCEEDED,
+                                       results_ready=True, statement=statement, date_range_string='bench')
+    client = Client()
+    session = client.session
+    session.update({'statement_data_id': statement.id, 'statement_data_ids': [statement.id],
+                    'date_range_string': 'bench', 'extraction_job_id': str(job.id)})
+    session.save()
+    paths = ['/', f"/jobs/{job.id}/", '/download/json/']
+
+    for path in paths * 10:  # Warm up
+        client.get(path)
+    durations = []
+    for index in range(requests):
+        started = time.perf_counter()
+        client.get(paths[index % len(paths)])
+        durations.append((time.perf_counter() - started) * 1000)
+    dropped = sum(getattr(handler, 'dropped_total', 0) for name in ('django', 'converter_app')
+                  for handler in logging.getLogger(name).handlers)
+    if reader is not None:
+        reader.kill()  # Don't wait for the backlog to drain
+    return durations, dropped
+
+
+def disabled_call_cost(count=200000):
+    """Microseconds per disabled logger.debug() call: eager f-string + extra dict vs lazy %-style."""
+    logger = logging.getLogger('bench_logging.disabled')
+    logger.setLevel(logging.INFO)
+    request_id, job_id, path = str(uuid.uuid4()), uuid.uuid4(), '/jobs/'
+
+    def eager():
+        logger.debug(f"Enter extraction_job_status_view. Job: {job_id}", extra={
+                     'request_id': request_id, 'job_id': str(job_id), 'path': path})
+
+    def lazy():
+        logger.debug("Enter extraction_job_status_view. Job: %s", job_id, extra={
+                     'request_id': request_id, 'job_id': job_id, 'path': path})
+
+    return {name: min(timeit.repeat(func, number=count, repeat=3)) / count * 1e6
+            for name, func in (('eager', eager), ('lazy', lazy))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=DEFAULT_REQUESTS)
+    parser.add_argument('--rows', type=int, default=DEFAULT_ROWS, help="Transactions in the downloaded statement")
+    parser.add_argument('--sample-rate', type=float, default=1.0, help="LOG_DEBUG_SAMPLE_RATE for the logged modes")
+    parser.add_argument('--sink-kbps', type=float, default=0,
+                        help="Drain console output at this rate instead of discarding it")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='bench-logging-')
+    environment = {
+        'DJANGO_SETTINGS_MODULE': 'load_settings',
+        'APP_MODE': 'development',
+        'DJANGO_SECRET_KEY': os.getenv('DJANGO_SECRET_KEY') or uuid.uuid4().hex * 2,
+        'LOAD_TEST_LOG_DIR': work_dir,
+        'LOG_DEBUG_SAMPLE_RATE': str(args.sample_rate),
+    }
+    context = multiprocessing.get_context('spawn')  # Logging is configured once per process
+    results = {}
+    for mode in MODES:
+        environment['LOAD_TEST_DB_PATH'] = os.path.join(work_dir, f"{mode}.sqlite3")
+        with context.Pool(1) as pool:
+            results[mode] = pool.apply(run_mode, (mode, args.requests, args.rows, args.sink_kbps, environment))
+
+    baseline = statistics.median(results['off'][0])
+    sink = f"console drained at {args.sink_kbps:g} KB/s" if args.sink_kbps else "console discarded"
+    print(f"{args.requests} requests per setup (upload page, job status, JSON download), "
+          f"debug sample rate {args.sample_rate}, {sink}")
+    print(f"{'setup':<8}{'median ms':>12}{'mean ms':>12}{'p95 ms':>12}{'overhead ms':>14}{'dropped':>10}")
+    for mode, (durations, dropped) in results.items():
+        ordered = sorted(durations)
+        median = statistics.median(durations)
+        print(f"{mode:<8}{median:>12.3f}{statistics.mean(durations):>12.3f}"
+              f"{ordered[int(len(ordered) * 0.95)]:>12.3f}{median - baseline:>14.3f}{dropped:>10}")
+    costs = disabled_call_cost()
+    print(f"Disabled logger.debug(): eager f-string {costs['eager']:.3f} us/call, lazy %-style "
+          f"{costs['lazy']:.3f} us/call")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Benchmark: StatementData storage size and decode time, JSON vs the columnar codec.
+
+For synthetic statements of several sizes, reports the bytes each storage format
+takes and the time to turn the stored bytes back into the list of transaction
+dicts (what every download and Sheets export does first):
+
+  json         the JSON text the JSONField stores (before PostgreSQL's own TOAST
+               compression, which is pglz: weaker than zlib, so json+zlib is a
+               lower bound for what the old column takes on disk)
+  json+zlib    that text compressed with zlib, decoded with zlib + json.loads
+  columnar     converter_app/statement_codec.py with zlib, and with zstd when the
+               zstandard package is installed
+
+Descriptions repeat the way real statements do (a pool of merchants, some with a
+reference number); --unique-descriptions makes every one distinct, the worst
+case for dictionary encoding. Run from the repository root:
+
+    python benchmarks/bench_statement_codec.py
+    python benchmarks/bench_statement_codec.py --rows 100 1000 50000 --unique-descriptions
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+import zlib
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from converter_app import statement_codec  # noqa: E402  (pure Python, no Django setup needed)
+
+DEFAULT_ROW_COUNTS = [100, 1000, 10000]
+MERCHANTS = [f"CARD PURCHASE {name} {city}" for name in (
+    'TESCO', 'AMAZON MKTPLACE', 'SHELL', 'UBER *TRIP', 'SPOTIFY', 'PRET A MANGER', 'BOOTS', 'NETFLIX.COM',
+    'DELIVEROO', 'TFL TRAVEL CH', 'SAINSBURYS', 'COSTA COFFEE', 'APPLE.COM/BILL', 'IKEA', 'WAITROSE')
+    for city in ('LONDON', 'MANCHESTER', 'ONLINE')]
+
+
+def make_transactions(row_count, unique_descriptions=False, seed=1):
+    """Builds synthetic transactions shaped like StatementData.extracted_data."""
+    rng = random.Random(seed)
+    balance = 2500.0
+    rows = []
+    for i in range(row_count):
+        if unique_descriptions:
+            description = f"CARD PURCHASE {i} MERCHANT NAME LTD"
+        elif i % 10 == 0:
+            description = f"FASTER PAYMENT REF {rng.randrange(10 ** 8):08d}"
+        else:
+            description = rng.choice(MERCHANTS)
+        is_credit = i % 10 == 0
+        amount = round(rng.uniform(1, 300 if not is_credit else 2000), 2)
+        if amount == int(amount):
+            amount = int(amount)  # Gemini sends whole amounts as JSON integers
+        balance = round(balance + (amount if is_credit else -amount), 2)
+        rows.append({
+            'date': f"2024-{(i * 12 // max(row_count, 1)) + 1:02d}-{(i % 28) + 1:02d}",
+            'description': description,
+            'debit': None if is_credit else amount,
+            'credit': amount if is_credit else None,
+            'balance': balance,
+        })
+    return rows
+
+
+def time_call(func, number=None):
+    """Best time of one call in milliseconds."""
+    if number is None:
+        number = max(1, min(200, int(0.2 / max(timeit.timeit(func, number=1), 1e-6))))
+    return min(timeit.repeat(func, number=number, repeat=3)) / number * 1000
+
+
+def measure(rows):
+    json_text = json.dumps(rows).encode('utf-8')
+    json_zlib = zlib.compress(json_text, statement_codec.ZLIB_LEVEL)
+    results = [
+        ('json', len(json_text), time_call(lambda: json.loads(json_text)),
+         time_call(lambda: json.dumps(rows).encode('utf-8'))),
+        ('json+zlib', len(json_zlib), time_call(lambda: json.loads(zlib.decompress(json_zlib))),
+         time_call(lambda: zlib.compress(json.dumps(rows).encode('utf-8'), statement_codec.ZLIB_LEVEL))),
+    ]
+    compressions = ['zlib'] + (['zstd'] if statement_codec.zstandard is not None else [])
+    for compression in compressions:
+        packed = statement_codec.encode(rows, compression=compression)
+        assert packed is not None and statement_codec.decode(packed) == rows
+        results.append((f"columnar+{compression}", len(packed), time_call(lambda: statement_codec.decode(packed)),
+                        time_call(lambda: statement_codec.encode(rows, compression=compression))))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROW_COUNTS,
+                        help="Transactions per statement (default: %(default)s)")
+    parser.add_argument('--unique-descriptions', action='store_true',
+                        help="Make every description distinct (worst case for the dictionary)")
+    args = parser.parse_args()
+
+    if statement_codec.zstandard is None:
+        print("zstandard isn't installed; columnar+zstd is skipped.")
+    for row_count in args.rows:
+        rows = make_transactions(row_count, unique_descriptions=args.unique_descriptions)
+        results = measure(rows)
+        json_size = results[0][1]
+        print(f"\n{row_count} transactions")
+        print(f"{'format':<16}{'bytes':>12}{'vs json':>10}{'decode ms':>12}{'encode ms':>12}")
+        for name, size, decode_ms, encode_ms in results:
+            print(f"{name:<16}{size:>12}{size / json_size:>10.1%}{decode_ms:>12.3f}{encode_ms:>12.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+Benchmark: exporting a statement from row dicts vs from one shared TransactionTable.
+
+For each row count, renders the CSV, the XLSX and the Google Sheets request body
+the way the exporters did before converter_app/transaction_table.py (each one
+walking the list of dicts and sanitizing or parsing every value itself), then
+from a TransactionTable built once and shared, as the artifact renderer does.
+Reports time and peak traced memory per exporter. Descriptions repeat the way
+real statements do. Run from the repository root:
+
+    python benchmarks/bench_transaction_table.py
+    python benchmarks/bench_transaction_table.py --rows 1000 50000
+"""
+import argparse
+import csv
+import io
+import os
+import sys
+import time
+import timeit
+import tracemalloc
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+import django  # noqa: E402
+
+django.setup()  # google_sheets imports the metrics and client modules, which read settings
+
+from bench_statement_codec import make_transactions  # noqa: E402
+from converter_app import google_sheets, utils  # noqa: E402
+from converter_app.dates import normalize_transaction_dates  # noqa: E402
+from converter_app.transaction_table import TransactionTable  # noqa: E402
+from converter_app.transactions import parse_amount  # noqa: E402
+
+DEFAULT_ROW_COUNTS = [1000, 10000]
+
+
+def legacy_csv(rows):
+    writer = csv.writer(utils._EchoBuffer())
+    lines = [writer.writerow(utils.CSV_FIELDNAMES)]
+    for row in rows:
+        lines.append(writer.writerow(
+            [utils.sanitize_for_formula_injection(row.get(key)) for key in utils.CSV_FIELDNAMES]))
+    return ''.join(lines)
+
+
+def legacy_xlsx(rows):
+    import openpyxl
+    from openpyxl.cell import WriteOnlyCell
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(utils.CSV_FIELDNAMES)
+    for row in rows:
+        values = []
+        for header in utils.CSV_FIELDNAMES:
+            value = row.get(header)
+            number = utils._to_excel_number(value) if header in utils.EXCEL_AMOUNT_COLUMNS else None
+            if number is not None:
+                cell = WriteOnlyCell(sheet, value=number)
+                cell.number_format = utils.EXCEL_AMOUNT_FORMAT
+                values.append(cell)
+            else:
+                values.append(utils.sanitize_for_formula_injection(value))
+        sheet.append(values)
+    output = io.BytesIO()
+    workbook.save(output)
+    return output.getvalue()
+
+
+def _legacy_cell(column, value, parsed_date):
+    if column == 'date' and parsed_date is not None:
+        return {'userEnteredValue': {'numberValue': (parsed_date - google_sheets.SHEETS_DATE_EPOCH).days},
+                'userEnteredFormat': {'numberFormat': {'type': 'DATE', 'pattern': 'yyyy-mm-dd'}}}
+    if column in google_sheets.SHEET_AMOUNT_COLUMNS:
+        amount = parse_amount(value)
+        if amount is not None:
+            return {'userEnteredValue': {'numberValue': float(amount)}}
+    if value is None or value == '':
+        return {}
+    return {'userEnteredValue': {'stringValue': str(value)}}
+
+
+def legacy_sheets(rows):
+    parsed_dates = normalize_transaction_dates(rows)
+    return [{'values': [_legacy_cell(column, row.get(column), parsed_date) for column in google_sheets.SHEET_COLUMNS]}
+            for row, parsed_date in zip(rows, parsed_dates)]
+
+
+def measure(func, argument):
+    """Returns (best of 3 milliseconds, peak traced KiB) of a call; memory is traced in a separate run."""
+    elapsed_ms = min(timeit.repeat(lambda: func(argument), number=1, repeat=3)) * 1000
+    tracemalloc.start()
+    func(argument)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed_ms, peak / 1024
+
+
+def measure_shared(rows, exporters):
+    """
+    Like measure(), for the exporters run in turn on one freshly built table, as the
+    artifact renderer does, so only the first one pays for the derived columns they share.
+    """
+    timings = {name: [] for name, _ in exporters}
+    for _ in range(3):
+        table = TransactionTable.from_rows(rows)
+        for name, func in exporters:
+            started = time.perf_counter()
+            func(table)
+            timings[name].append((time.perf_counter() - started) * 1000)
+    results = []
+    table = TransactionTable.from_rows(rows)
+    for name, func in exporters:
+        tracemalloc.start()
+        func(table)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results.append((name, min(timings[name]), peak / 1024))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROW_COUNTS,
+                        help="Transactions per statement (default: %(default)s)")
+    args = parser.parse_args()
+
+    for row_count in args.rows:
+        rows = make_transactions(row_count)
+        legacy = [('csv', legacy_csv), ('xlsx', legacy_xlsx), ('sheets', legacy_sheets)]
+        legacy_results = [(name,) + measure(func, rows) for name, func in legacy]
+
+        table_results = [('build',) + measure(TransactionTable.from_rows, rows)]
+        exporters = [('csv', utils.convert_data_to_csv_string), ('xlsx', utils.convert_data_to_excel_bytes),
+                     ('sheets', lambda table: google_sheets.build_spreadsheet_body('bench', table))]
+        table_results += measure_shared(rows, exporters)
+
+        print(f"\n{row_count} transactions")
+        print(f"{'export':<10}{'dict ms':>10}{'table ms':>10}{'dict KiB':>11}{'table KiB':>11}")
+        print(f"{'build':<10}{'':>10}{table_results[0][1]:>10.1f}{'':>11}{table_results[0][2]:>11.0f}")
+        for (name, dict_ms, dict_kib), (_, table_ms, table_kib) in zip(legacy_results, table_results[1:]):
+            print(f"{name:<10}{dict_ms:>10.1f}{table_ms:>10.1f}{dict_kib:>11.0f}{table_kib:>11.0f}")
+        print(f"{'total':<10}{sum(r[1] for r in legacy_results):>10.1f}{sum(r[1] for r in table_results):>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
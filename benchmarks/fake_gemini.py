@@ -0,0 +1,289 @@
+"""
+Local stand-in for the Gemini API endpoints the extraction pipeline uses.
+
+Serves the File API upload (discovery document, resumable upload, file
+lookup) and generateContent / streamGenerateContent over plain HTTP, with
+configurable latency, jitter, error rate and canned responses of varying
+transaction counts. Point the app at it with GEMINI_API_ENDPOINT and
+GEMINI_TRANSPORT='rest' (benchmarks/load_upload.py does this itself), or run
+it standalone:
+
+    python benchmarks/fake_gemini.py --port 8765 --generate-latency-ms 3000 --rows 20 200
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+DEFAULT_UPLOAD_LATENCY_MS = 300
+DEFAULT_GENERATE_LATENCY_MS = 2000
+DEFAULT_JITTER_MS = 200
+DEFAULT_ROW_COUNTS = [20, 100, 500]
+STREAM_PIECES = 10  # A generated response is sent in this many parts, spread over its latency
+FILE_STATE_ACTIVE = 2  # google.ai.generativelanguage File.State.ACTIVE
+FINISH_REASON_STOP = 1
+
+_GENERATE_PATH = re.compile(r'/v1beta/models/(?P<model>[^/:]+):(?P<method>generateContent|streamGenerateContent)')
+_FILE_PATH = re.compile(r'/v1beta/files/(?P<file_id>[^/?]+)')
+_UPLOAD_SESSION_PATH = re.compile(r'/upload-session/(?P<file_id>[^/?]+)')
+
+
+def build_statement_rows(row_count, seed=0):
+    """Canned transactions whose running balances reconcile, oldest first."""
+    rng = random.Random(seed)
+    balance = 10000.0
+    rows = []
+    for index in range(row_count):
+        amount = round(rng.uniform(1, 500), 2)
+        is_debit = rng.random() < 0.7
+        balance = round(balance - amount if is_debit else balance + amount, 2)
+        rows.append({
+            'date': (date(2024, 1, 1) + timedelta(days=index // 5)).isoformat(),
+            'description': f"CARD PAYMENT {index:05d} MERCHANT {rng.randint(100, 999)}",
+            'debit': amount if is_debit else None,
+            'credit': None if is_debit else amount,
+            'balance': balance,
+        })
+    return rows
+
+
+def discovery_document(root_url):
+    """The subset of the File API discovery document used by genai.upload_file()."""
+    return {
+        'kind': 'discovery#restDescription', 'discoveryVersion': 'v1',
+        'id': 'generativelanguage:v1beta', 'name': 'generativelanguage', 'version': 'v1beta',
+        'rootUrl': root_url, 'servicePath': '', 'baseUrl': root_url, 'batchPath': 'batch',
+        'protocol': 'rest', 'parameters': {
+            'key': {'type': 'string', 'location': 'query'},
+            'alt': {'type': 'string', 'location': 'query', 'default': 'json'},
+        },
+        'schemas': {
+            'File': {'id': 'File', 'type': 'object', 'properties': {
+                'name': {'type': 'string'}, 'displayName': {'type': 'string'},
+                'mimeType': {'type': 'string'}, 'uri': {'type': 'string'}, 'state': {'type': 'string'}}},
+            'CreateFileRequest': {'id': 'CreateFileRequest', 'type': 'object',
+                                  'properties': {'file': {'$ref': 'File'}}},
+            'CreateFileResponse': {'id': 'CreateFileResponse', 'type': 'object',
+                                   'properties': {'file': {'$ref': 'File'}}},
+        },
+        'resources': {'media': {'methods': {'upload': {
+            'id': 'generativelanguage.media.upload', 'path': 'v1beta/files', 'flatPath': 'v1beta/files',
+            'httpMethod': 'POST', 'parameters': {}, 'parameterOrder': [],
+            'request': {'$ref': 'CreateFileRequest'}, 'response': {'$ref': 'CreateFileResponse'},
+            'supportsMediaUpload': True,
+            'mediaUpload': {'accept': ['*/*'], 'protocols': {
+                'simple': {'multipart': True, 'path': '/upload/v1beta/files'},
+                'resumable': {'multipart': True, 'path': '/resumable/upload/v1beta/files'},  # Unused by the client
+            }},
+        }}}},
+    }
+
+
+class FakeGeminiConfig:
+    """Behaviour of the fake API; shared by all handler threads."""
+
+    def __init__(self, upload_latency_ms=DEFAULT_UPLOAD_LATENCY_MS,
+                 generate_latency_ms=DEFAULT_GENERATE_LATENCY_MS, jitter_ms=DEFAULT_JITTER_MS,
+                 error_rate=0.0, row_counts=None, seed=0):
+        self.upload_latency_ms = upload_latency_ms
+        self.generate_latency_ms = generate_latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.row_counts = row_counts or DEFAULT_ROW_COUNTS
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        # Canned response bodies, built once per row count
+        self.responses = {count: json.dumps(build_statement_rows(count, seed=count)) for count in self.row_counts}
+        self.request_counts = {'upload': 0, 'generate': 0, 'errors': 0}
+
+    def delay_seconds(self, base_ms):
+        with self._lock:
+            jitter = self._random.uniform(-self.jitter_ms, self.jitter_ms)
+        return max(0.0, base_ms + jitter) / 1000
+
+    def should_fail(self):
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def pick_response(self):
+        with self._lock:
+            return self.responses[self._random.choice(self.row_counts)]
+
+    def count(self, key):
+        with self._lock:
+            self.request_counts[key] += 1
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakeGemini/1.0'
+
+    @property
+    def config(self):
+        return self.server.config
+
+    def log_message(self, format, *args):
+        pass  # Keep benchmark output readable
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _send_json(self, payload, status=200, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self):
+        self.config.count('errors')
+        status = random.choice([429, 500, 503])
+        self._send_json({'error': {'code': status, 'message': 'Injected fake error', 'status': 'UNAVAILABLE'}},
+                        status=status)
+
+    def _file_resource(self, file_id):
+        return {'name': f"files/{file_id}", 'displayName': file_id, 'mimeType': 'application/pdf',
+                'uri': f"{self.server.root_url}v1beta/files/{file_id}", 'state': FILE_STATE_ACTIVE}
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == '/$discovery/rest':
+            self._send_json(discovery_document(self.server.root_url))
+            return
+        match = _FILE_PATH.fullmatch(path)
+        if match:
+            self._send_json(self._file_resource(match.group('file_id')))
+            return
+        self._send_json({'error': {'code': 404, 'message': f"No fake for {path}"}}, status=404)
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        path = url.path
+        body = self._read_body()
+        if path == '/upload/v1beta/files':
+            file_id = uuid.uuid4().hex[:16]
+            if 'uploadType=resumable' in url.query:
+                # Start of a resumable upload: hand out the session URL the content is PUT to
+                self._send_json({}, headers={'Location': f"{self.server.root_url}upload-session/{file_id}"})
+            else:
+                self._complete_upload(file_id)  # Multipart: metadata and content in one request
+            return
+        match = _GENERATE_PATH.fullmatch(path)
+        if match:
+            self._generate(match.group('method') == 'streamGenerateContent')
+            return
+        self._send_json({'error': {'code': 404, 'message': f"No fake for {path} ({len(body)} bytes)"}}, status=404)
+
+    def do_PUT(self):
+        path = urlsplit(self.path).path
+        self._read_body()
+        match = _UPLOAD_SESSION_PATH.fullmatch(path)
+        if not match:
+            self._send_json({'error': {'code': 404, 'message': f"No fake for {path}"}}, status=404)
+            return
+        self._complete_upload(match.group('file_id'))
+
+    def _complete_upload(self, file_id):
+        self.config.count('upload')
+        time.sleep(self.config.delay_seconds(self.config.upload_latency_ms))
+        if self.config.should_fail():
+            self._send_error()
+            return
+        self._send_json({'file': self._file_resource(file_id)})
+
+    def _generate(self, stream):
+        self.config.count('generate')
+        total_delay = self.config.delay_seconds(self.config.generate_latency_ms)
+        if self.config.should_fail():
+            time.sleep(total_delay / 2)
+            self._send_error()
+            return
+        text = self.config.pick_response()
+
+        def response_part(piece):
+            return {'candidates': [{'content': {'role': 'model', 'parts': [{'text': piece}]},
+                                    'finishReason': FINISH_REASON_STOP, 'index': 0}]}
+
+        if not stream:
+            time.sleep(total_delay)
+            self._send_json(response_part(text))
+            return
+
+        # A JSON array of responses sent with chunked encoding, as the REST streaming API does.
+        # The first part arrives after a "thinking" pause, the rest are spread over the remaining time.
+        piece_size = max(1, -(-len(text) // STREAM_PIECES))
+        pieces = [text[i:i + piece_size] for i in range(0, len(text), piece_size)]
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        time.sleep(total_delay / 2)
+        for index, piece in enumerate(pieces):
+            chunk = ('[' if index == 0 else ',\r\n') + json.dumps(response_part(piece))
+            if index == len(pieces) - 1:
+                chunk += ']'
+            data = chunk.encode('utf-8')
+            self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n")
+            self.wfile.flush()
+            time.sleep(total_delay / 2 / len(pieces))
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class FakeGeminiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, config, host='127.0.0.1', port=0):
+        super().__init__((host, port), FakeGeminiHandler)
+        self.config = config
+        self.root_url = f"http://{host}:{self.server_address[1]}/"
+
+    def start(self):
+        """Serves from a daemon thread; returns self."""
+        threading.Thread(target=self.serve_forever, name='fake-gemini', daemon=True).start()
+        return self
+
+
+def add_fake_arguments(parser):
+    """Adds the fake API's behaviour options to an argparse parser."""
+    parser.add_argument('--upload-latency-ms', type=float, default=DEFAULT_UPLOAD_LATENCY_MS)
+    parser.add_argument('--generate-latency-ms', type=float, default=DEFAULT_GENERATE_LATENCY_MS)
+    parser.add_argument('--jitter-ms', type=float, default=DEFAULT_JITTER_MS)
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of API calls that fail")
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROW_COUNTS,
+                        help="Transaction counts of the canned responses, picked at random per call")
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def config_from_args(args):
+    return FakeGeminiConfig(upload_latency_ms=args.upload_latency_ms, generate_latency_ms=args.generate_latency_ms,
+                            jitter_ms=args.jitter_ms, error_rate=args.error_rate, row_counts=args.rows,
+                            seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    add_fake_arguments(parser)
+    args = parser.parse_args()
+    server = FakeGeminiServer(config_from_args(args), host=args.host, port=args.port)
+    print(f"Fake Gemini API on {server.root_url} (GEMINI_API_ENDPOINT={server.root_url.rstrip('/')}, "
+          f"GEMINI_TRANSPORT=rest)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,29 @@
+"""
+Django settings for benchmarks/load_upload.py: the app's own settings, with a
+throwaway SQLite database unless LOAD_TEST_DATABASE_URL points at a real one,
+and app logging turned down (LOAD_TEST_LOG_LEVEL) so it doesn't dominate the measurement.
+"""
+import os
+
+import dj_database_url
+
+from config.settings import *  # noqa: F401,F403
+from config.settings import LOGGING
+
+if os.getenv('LOAD_TEST_DATABASE_URL'):
+    DATABASES = {'default': dj_database_url.parse(os.environ['LOAD_TEST_DATABASE_URL'], conn_max_age=600)}
+else:
+    DATABASES = {'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['LOAD_TEST_DB_PATH'],
+        # WAL and immediate transactions let concurrent request and worker threads share the file
+        'OPTIONS': {'timeout': 60, 'transaction_mode': 'IMMEDIATE',
+                    'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;'},
+    }}
+
+for _logger in LOGGING['loggers'].values():
+    _logger['level'] = os.getenv('LOAD_TEST_LOG_LEVEL', 'WARNING')
+
+if os.getenv('LOAD_TEST_LOG_DIR') and 'rotating_file_json' in LOGGING['handlers']:
+    # Keep the development log file of benchmark runs out of the repository's logs/
+    LOGGING['handlers']['rotating_file_json']['filename'] = os.path.join(os.environ['LOAD_TEST_LOG_DIR'], 'app.log.json')
@@ -0,0 +1,259 @@
+"""
+Load test: concurrent PDF uploads through upload_pdf_view against a fake Gemini API.
+
+Starts benchmarks/fake_gemini.py in-process, then runs one or more worker
+processes. Each is a full Django app on its own database, with the extraction
+pool pointed at the fake over real HTTP. Simulated clients upload unique PDFs
+and poll the job status until each extraction finishes. Reports p50/p95/p99
+latency of the upload request and of the whole extraction, throughput, errors
+and peak memory per worker process. Results go to a JSON file so runs on
+different commits can be compared. Run from the repository root:
+
+    python benchmarks/load_upload.py --uploads 200 --concurrency 16
+    python benchmarks/load_upload.py --processes 2 --error-rate 0.05 --rows 50 500 --output after.json
+    python benchmarks/load_upload.py --compare before.json --output after.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from fake_gemini import FakeGeminiServer, add_fake_arguments, config_from_args  # noqa: E402
+
+DEFAULT_UPLOADS = 100
+DEFAULT_CONCURRENCY = 8
+DEFAULT_OUTPUT = 'load_results.json'
+POLL_INTERVAL_SECONDS = 0.05
+JOB_DEADLINE_SECONDS = 300
+COMPARED_METRICS = ['upload_p50_ms', 'upload_p95_ms', 'upload_p99_ms', 'extraction_p50_ms',
+                    'extraction_p95_ms', 'extraction_p99_ms', 'throughput_per_second', 'error_rate']
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of an unsorted list; None when empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))]
+
+
+def make_upload_pdf(index):
+    """A small PDF without a text layer, unique per upload so the result cache never hits."""
+    marker = f"{uuid.uuid4().hex}-{index}".encode('ascii')
+    return (b"%PDF-1.4\n1 0 obj << /Type /Catalog /Pages 2 0 R >> endobj\n"
+            b"2 0 obj << /Type /Pages /Kids [] /Count 0 >> endobj\n"
+            b"% load-test " + marker + b"\ntrailer << /Root 1 0 R >>\n%%EOF\n")
+
+
+def _current_rss_mb():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError):
+        return None
+
+
+def run_worker(worker_index, uploads, concurrency, environment):
+    """Runs in a worker process: boots Django, fires the uploads, returns raw measurements."""
+    os.environ.update(environment)
+    os.environ['LOAD_TEST_DB_PATH'] = os.path.join(
+        environment['LOAD_TEST_DB_DIR'], f"load-worker-{worker_index}.sqlite3")
+    import django
+    django.setup()
+    from django.core.management import call_command
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from django.test import Client
+    from django.test.utils import setup_test_environment
+
+    setup_test_environment()
+    call_command('migrate', verbosity=0)
+    baseline_rss_mb = _current_rss_mb()
+    peak_rss = {'mb': baseline_rss_mb or 0.0}
+    sampling = threading.Event()
+
+    def sample_memory():
+        while not sampling.wait(0.1):
+            rss = _current_rss_mb()
+            if rss is not None and rss > peak_rss['mb']:
+                peak_rss['mb'] = rss
+
+    threading.Thread(target=sample_memory, daemon=True).start()
+
+    def one_upload(index):
+        client = Client()
+        pdf = SimpleUploadedFile(f"statement-{worker_index}-{index}.pdf", make_upload_pdf(index),
+                                 content_type='application/pdf')
+        started = time.perf_counter()
+        response = client.post('/', {'pdf_file': pdf}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        upload_ms = (time.perf_counter() - started) * 1000
+        if response.status_code not in (200, 202):
+            return {'upload_ms': upload_ms, 'extraction_ms': None, 'ok': False,
+                    'error': f"upload HTTP {response.status_code}"}
+        body = response.json()
+        status_url = body.get('status_url')
+        state = 'succeeded' if body.get('status') == 'success' else body.get('status')
+        while status_url and time.perf_counter() - started < JOB_DEADLINE_SECONDS:
+            job = client.get(status_url).json()
+            state = job['state']
+            if state in ('succeeded', 'failed'):
+                break
+            time.sleep(POLL_INTERVAL_SECONDS)
+        extraction_ms = (time.perf_counter() - started) * 1000
+        ok = state == 'succeeded'
+        return {'upload_ms': upload_ms, 'extraction_ms': extraction_ms, 'ok': ok,
+                'error': None if ok else f"job {state}"}
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as clients:
+        samples = list(clients.map(one_upload, range(uploads)))
+    wall_seconds = time.perf_counter() - started
+    sampling.set()
+    return {
+        'worker': worker_index,
+        'pid': os.getpid(),
+        'uploads': uploads,
+        'wall_seconds': wall_seconds,
+        'samples': samples,
+        'baseline_rss_mb': baseline_rss_mb,
+        'peak_rss_mb': peak_rss['mb'],
+        # ru_maxrss is in kilobytes on Linux
+        'peak_maxrss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def summarize(worker_results, wall_seconds):
+    samples = [sample for result in worker_results for sample in result['samples']]
+    succeeded = [sample for sample in samples if sample['ok']]
+    upload_ms = [sample['upload_ms'] for sample in samples]
+    extraction_ms = [sample['extraction_ms'] for sample in succeeded]
+    errors = {}
+    for sample in samples:
+        if not sample['ok']:
+            errors[sample['error']] = errors.get(sample['error'], 0) + 1
+
+    def rounded(value):
+        return round(value, 1) if value is not None else None
+
+    return {
+        'uploads': len(samples),
+        'succeeded': len(succeeded),
+        'error_rate': round(1 - len(succeeded) / len(samples), 4) if samples else None,
+        'errors': errors,
+        'wall_seconds': round(wall_seconds, 2),
+        'throughput_per_second': round(len(succeeded) / wall_seconds, 3) if wall_seconds else None,
+        'upload_p50_ms': rounded(percentile(upload_ms, 0.50)),
+        'upload_p95_ms': rounded(percentile(upload_ms, 0.95)),
+        'upload_p99_ms': rounded(percentile(upload_ms, 0.99)),
+        'extraction_p50_ms': rounded(percentile(extraction_ms, 0.50)),
+        'extraction_p95_ms': rounded(percentile(extraction_ms, 0.95)),
+        'extraction_p99_ms': rounded(percentile(extraction_ms, 0.99)),
+        'workers': [{
+            'worker': result['worker'], 'pid': result['pid'], 'uploads': result['uploads'],
+            'baseline_rss_mb': rounded(result['baseline_rss_mb']),
+            'peak_rss_mb': rounded(result['peak_rss_mb']),
+            'peak_maxrss_mb': rounded(result['peak_maxrss_mb']),
+        } for result in worker_results],
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_comparison(previous, current):
+    print(f"\nCompared with {previous.get('git_commit') or 'previous run'} ({previous.get('created_at')}):")
+    print(f"{'metric':<24}{'before':>12}{'after':>12}{'change':>10}")
+    for metric in COMPARED_METRICS:
+        before, after = previous['results'].get(metric), current['results'].get(metric)
+        change = f"{(after - before) / before * 100:+.1f}%" if before and after is not None else ''
+        print(f"{metric:<24}{before if before is not None else '-':>12}{after if after is not None else '-':>12}"
+              f"{change:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--uploads', type=int, default=DEFAULT_UPLOADS, help="Uploads per worker process")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help="Simultaneous clients per worker process")
+    parser.add_argument('--processes', type=int, default=1, help="Worker processes, each with its own app")
+    parser.add_argument('--extraction-workers', type=int, default=None,
+                        help="EXTRACTION_WORKER_COUNT for each worker process")
+    parser.add_argument('--local-extraction', action='store_true',
+                        help="Leave the local text-layer engine on (the generated PDFs have no text layer)")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    parser.add_argument('--compare', help="Earlier results file to compare against")
+    add_fake_arguments(parser)
+    args = parser.parse_args()
+
+    fake = FakeGeminiServer(config_from_args(args)).start()
+    db_dir = tempfile.mkdtemp(prefix='load-test-')
+    environment = {
+        'DJANGO_SETTINGS_MODULE': 'load_settings',
+        'LOAD_TEST_DB_DIR': db_dir,
+        'DJANGO_SECRET_KEY': os.getenv('DJANGO_SECRET_KEY') or uuid.uuid4().hex * 2,
+        'GEMINI_API_KEY': 'load-test-key',
+        'GEMINI_API_ENDPOINT': fake.root_url.rstrip('/'),
+        'GEMINI_TRANSPORT': 'rest',
+        'EXTRACTION_CACHE_ENABLED': 'false',
+        'LOCAL_EXTRACTION_ENABLED': 'true' if args.local_extraction else 'false',
+    }
+    if args.extraction_workers:
+        environment['EXTRACTION_WORKER_COUNT'] = str(args.extraction_workers)
+
+    print(f"Fake Gemini at {fake.root_url}; {args.processes} worker process(es) x {args.uploads} uploads, "
+          f"{args.concurrency} concurrent clients each.")
+    context = multiprocessing.get_context('spawn')  # Each worker boots its own Django
+    with context.Pool(args.processes) as pool:
+        worker_results = pool.starmap(run_worker, [
+            (index, args.uploads, args.concurrency, environment) for index in range(args.processes)])
+    wall_seconds = max(result['wall_seconds'] for result in worker_results)
+    fake.shutdown()
+
+    report = {
+        'benchmark': 'upload_load',
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'fake_api_requests': fake.config.request_counts,
+        'results': summarize(worker_results, wall_seconds),
+    }
+    with open(args.output, 'w', encoding='utf-8') as output_file:
+        json.dump(report, output_file, indent=2)
+
+    results = report['results']
+    print(f"{results['succeeded']}/{results['uploads']} succeeded in {results['wall_seconds']} s "
+          f"({results['throughput_per_second']}/s), errors: {results['errors'] or 'none'}")
+    print(f"upload request  p50 {results['upload_p50_ms']} ms  p95 {results['upload_p95_ms']} ms  "
+          f"p99 {results['upload_p99_ms']} ms")
+    print(f"full extraction p50 {results['extraction_p50_ms']} ms  p95 {results['extraction_p95_ms']} ms  "
+          f"p99 {results['extraction_p99_ms']} ms")
+    for worker in results['workers']:
+        print(f"worker {worker['worker']} (pid {worker['pid']}): peak RSS {worker['peak_rss_mb']} MB "
+              f"(baseline {worker['baseline_rss_mb']} MB)")
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as previous_file:
+            print_comparison(json.load(previous_file), report)
+
+
+if __name__ == '__main__':
+    main()
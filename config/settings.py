@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 from pathlib import Path
 import os
+import tempfile
 import dj_database_url  # Added
 from dotenv import load_dotenv
 # import yaml  # Removed: No longer using config.yaml
@@ -48,6 +49,164 @@ if not GEMINI_API_KEY:
     print("Warning: GEMINI_API_KEY not found in environment variables.")
     # Consider: raise ImproperlyConfigured("GEMINI_API_KEY must be set in environment variables.")
 
+# Extraction result cache (see converter_app/result_cache.py)
+# Re-uploads of an identical PDF reuse the existing StatementData row instead of calling Gemini.
+EXTRACTION_CACHE_ENABLED = os.getenv('EXTRACTION_CACHE_ENABLED', 'true').lower() == 'true'
+# 'db' (default), 'file' (local directory), 'cache' (a Django cache shared between instances)
+# or a dotted path to a custom backend class.
+EXTRACTION_CACHE_BACKEND = os.getenv('EXTRACTION_CACHE_BACKEND', 'db')
+EXTRACTION_CACHE_TTL_SECONDS = int(os.getenv('EXTRACTION_CACHE_TTL_SECONDS', 7 * 24 * 60 * 60))
+EXTRACTION_CACHE_MAX_ENTRIES = int(os.getenv('EXTRACTION_CACHE_MAX_ENTRIES', 1000))
+# Eviction (TTL and max_entries) scans the whole cache, so it runs at most this often per process
+EXTRACTION_CACHE_EVICT_INTERVAL_SECONDS = int(os.getenv('EXTRACTION_CACHE_EVICT_INTERVAL_SECONDS', 5 * 60))
+EXTRACTION_CACHE_ALIAS = os.getenv('EXTRACTION_CACHE_ALIAS', 'default')  # Used by the 'cache' backend
+if os.getenv('EXTRACTION_CACHE_DIR'):  # Used by the 'file' backend; defaults to the system temp dir
+    EXTRACTION_CACHE_DIR = os.getenv('EXTRACTION_CACHE_DIR')
+
+# Background extraction jobs (see converter_app/jobs.py)
+# Uploads are processed on an in-process thread pool; the browser polls /jobs/<id>/ for the result.
+EXTRACTION_WORKER_COUNT = int(os.getenv('EXTRACTION_WORKER_COUNT', 4))
+# Running jobs with no progress for EXTRACTION_JOB_TIMEOUT_SECONDS, and single-upload jobs still pending
+# EXTRACTION_JOB_PENDING_TIMEOUT_SECONDS after they were queued (their process was recycled or frozen
+# before a worker picked them up), are reported as failed.
+EXTRACTION_JOB_TIMEOUT_SECONDS = int(os.getenv('EXTRACTION_JOB_TIMEOUT_SECONDS', 10 * 60))
+EXTRACTION_JOB_PENDING_TIMEOUT_SECONDS = int(os.getenv('EXTRACTION_JOB_PENDING_TIMEOUT_SECONDS', 15 * 60))
+
+# Batch uploads (see converter_app/batches.py)
+# Many PDFs or ZIP archives of PDFs per upload; their jobs run on a separate, bounded pool.
+EXTRACTION_BATCH_WORKER_COUNT = int(os.getenv('EXTRACTION_BATCH_WORKER_COUNT', 3))
+BATCH_MAX_FILES = int(os.getenv('BATCH_MAX_FILES', 50))
+MAX_BATCH_ARCHIVE_SIZE_BYTES = int(os.getenv('MAX_BATCH_ARCHIVE_SIZE_BYTES', 50 * 1024 * 1024))
+
+# Page-range chunked extraction (requires pypdf)
+# Statements longer than EXTRACTION_CHUNK_PAGES are split and the chunks extracted concurrently,
+# with at most EXTRACTION_CHUNK_PARALLELISM Gemini calls in flight per process.
+EXTRACTION_CHUNKING_ENABLED = os.getenv('EXTRACTION_CHUNKING_ENABLED', 'false').lower() == 'true'
+EXTRACTION_CHUNK_PAGES = int(os.getenv('EXTRACTION_CHUNK_PAGES', 5))
+EXTRACTION_CHUNK_PARALLELISM = int(os.getenv('EXTRACTION_CHUNK_PARALLELISM', 4))
+
+# Pre-rendered export artifacts (see converter_app/artifacts.py)
+# CSV/XLSX/JSON are rendered and compressed once after extraction; downloads serve the stored bytes.
+ARTIFACTS_ENABLED = os.getenv('ARTIFACTS_ENABLED', 'true').lower() == 'true'
+ARTIFACT_STORE_MAX_BYTES = int(os.getenv('ARTIFACT_STORE_MAX_BYTES', 200 * 1024 * 1024))
+ARTIFACT_MAX_BYTES = int(os.getenv('ARTIFACT_MAX_BYTES', 20 * 1024 * 1024))
+# Downloads record an artifact's last access (for LRU eviction) at most this often
+ARTIFACT_TOUCH_INTERVAL_SECONDS = int(os.getenv('ARTIFACT_TOUCH_INTERVAL_SECONDS', 60 * 60))
+
+# Normalized Transaction table (see converter_app/transactions.py)
+# Rows are inserted TRANSACTION_BATCH_SIZE at a time and streamed back TRANSACTION_FETCH_SIZE at a time.
+TRANSACTION_BATCH_SIZE = int(os.getenv('TRANSACTION_BATCH_SIZE', 1000))
+TRANSACTION_FETCH_SIZE = int(os.getenv('TRANSACTION_FETCH_SIZE', 2000))
+
+# Storage of StatementData transactions (see converter_app/statement_codec.py): 'columnar' packs them
+# compactly, falling back to JSON for rows it can't represent; 'json' stores plain JSON. Existing records
+# are converted with `manage.py pack_statements` (and back with --unpack, before switching to 'json').
+STATEMENT_STORAGE_CODEC = os.getenv('STATEMENT_STORAGE_CODEC', 'columnar')
+STATEMENT_CODEC_COMPRESSION = os.getenv('STATEMENT_CODEC_COMPRESSION', 'zstd')  # zlib when zstandard isn't installed
+
+# Parquet and Arrow IPC downloads (see converter_app/arrow_export.py). They need pyarrow, which isn't in
+# requirements.txt (it is large for a serverless bundle); without it those downloads answer 501.
+# Compression is 'zstd', 'lz4' (Arrow), 'snappy' (Parquet) or 'none'.
+PARQUET_COMPRESSION = os.getenv('PARQUET_COMPRESSION', 'zstd')
+PARQUET_ROW_GROUP_ROWS = int(os.getenv('PARQUET_ROW_GROUP_ROWS', 64 * 1024))
+ARROW_COMPRESSION = os.getenv('ARROW_COMPRESSION', 'zstd')
+
+# Transaction feed at /feed/transactions/ (see converter_app/feed.py): NDJSON for downstream sync jobs,
+# resumed from the cursor of the last line received. Disabled (404) unless FEED_AUTH_TOKEN is set;
+# requests need 'Authorization: Bearer <token>'. Only statements in the Transaction table are fed
+# (run `manage.py backfill_transactions` for older ones).
+FEED_AUTH_TOKEN = os.getenv('FEED_AUTH_TOKEN') or None
+FEED_MAX_ROWS = int(os.getenv('FEED_MAX_ROWS', 100000))
+FEED_SETTLE_SECONDS = int(os.getenv('FEED_SETTLE_SECONDS', 30))
+
+# Google API clients (see converter_app/google_clients.py)
+# Keep-alive transports and built API clients are reused across Sheets exports within a process.
+GOOGLE_HTTP_POOL_SIZE = int(os.getenv('GOOGLE_HTTP_POOL_SIZE', 8))
+GOOGLE_HTTP_IDLE_SECONDS = int(os.getenv('GOOGLE_HTTP_IDLE_SECONDS', 120))
+GOOGLE_HTTP_TIMEOUT_SECONDS = int(os.getenv('GOOGLE_HTTP_TIMEOUT_SECONDS', 60))
+GOOGLE_CLIENT_CACHE_SIZE = int(os.getenv('GOOGLE_CLIENT_CACHE_SIZE', 256))
+# Directory of API discovery documents (e.g. sheets.v4.json); unset uses the copies bundled with
+# google-api-python-client. Read once per process, so services are built without fetching them.
+GOOGLE_DISCOVERY_DIR = os.getenv('GOOGLE_DISCOVERY_DIR') or None
+
+# Read digitally generated PDFs from their text layer first; Gemini only when balances don't reconcile
+LOCAL_EXTRACTION_ENABLED = os.getenv('LOCAL_EXTRACTION_ENABLED', 'true').lower() == 'true'
+LOCAL_EXTRACTION_MAX_PAGES = int(os.getenv('LOCAL_EXTRACTION_MAX_PAGES', 50))
+
+# Live extraction progress: how often it is saved/polled. The browser polls the job status endpoint;
+# EXTRACTION_EVENTS_ENABLED switches it to a Server-Sent Events stream instead, which holds a worker
+# thread while open, so only enable it with spare workers (not on serverless). Each stream closes after
+# EXTRACTION_EVENTS_MAX_SECONDS and the browser reconnects.
+EXTRACTION_PROGRESS_INTERVAL_SECONDS = float(os.getenv('EXTRACTION_PROGRESS_INTERVAL_SECONDS', 0.5))
+EXTRACTION_EVENTS_ENABLED = os.getenv('EXTRACTION_EVENTS_ENABLED', 'false').lower() == 'true'
+EXTRACTION_EVENTS_MAX_SECONDS = int(os.getenv('EXTRACTION_EVENTS_MAX_SECONDS', 10))
+
+# Optional Gemini API endpoint override (e.g. a proxy or benchmarks/fake_gemini.py) and transport ('grpc' or 'rest')
+GEMINI_API_ENDPOINT = os.getenv('GEMINI_API_ENDPOINT') or None
+GEMINI_TRANSPORT = os.getenv('GEMINI_TRANSPORT') or None
+
+# Per-phase request/job timings: a Server-Timing response header and a timing record in the logs
+REQUEST_TIMING_ENABLED = os.getenv('REQUEST_TIMING_ENABLED', 'true').lower() == 'true'
+
+# Prometheus metrics at /metrics, scraped with 'Authorization: Bearer <METRICS_AUTH_TOKEN>'. Without a
+# token the endpoint 404s unless DEBUG is on. With several worker processes, point METRICS_MULTIPROCESS_DIR
+# at a directory they share (emptied on each deploy) so any worker reports the totals of all of them
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+METRICS_AUTH_TOKEN = os.getenv('METRICS_AUTH_TOKEN') or None
+METRICS_MULTIPROCESS_DIR = os.getenv('METRICS_MULTIPROCESS_DIR') or None
+METRICS_FLUSH_INTERVAL_SECONDS = float(os.getenv('METRICS_FLUSH_INTERVAL_SECONDS', 5))
+
+# Retention (see converter_app/retention.py), off by default: with STATEMENT_RETENTION_DAYS set, statements
+# older than that are permanently deleted with their transactions, artifacts and jobs,
+# STATEMENT_PURGE_BATCH_SIZE statements (their transactions STATEMENT_PURGE_TRANSACTION_BATCH_SIZE rows)
+# per transaction. Runs after extraction jobs at most every
+# STATEMENT_PURGE_INTERVAL_SECONDS (0 disables that; use `manage.py purge_statements` from a scheduler instead).
+STATEMENT_RETENTION_DAYS = int(os.getenv('STATEMENT_RETENTION_DAYS', 0))
+STATEMENT_PURGE_BATCH_SIZE = int(os.getenv('STATEMENT_PURGE_BATCH_SIZE', 200))
+STATEMENT_PURGE_TRANSACTION_BATCH_SIZE = int(os.getenv('STATEMENT_PURGE_TRANSACTION_BATCH_SIZE', 5000))
+STATEMENT_PURGE_INTERVAL_SECONDS = int(os.getenv('STATEMENT_PURGE_INTERVAL_SECONDS', 60 * 60))
+
+# Django cache, used for sessions (and by EXTRACTION_CACHE_BACKEND='cache').
+# CACHE_BACKEND: 'file' (default, shared by the worker processes of one host), 'redis' or 'memcached'
+# (shared between hosts; need the redis or pymemcache package and CACHE_LOCATION), 'locmem'
+# (single process only) or a dotted path to a cache backend class.
+CACHE_BACKENDS = {
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+    'memcached': 'django.core.cache.backends.memcached.PyMemcacheCache',
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+}
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'file')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS.get(CACHE_BACKEND, CACHE_BACKEND),
+        'LOCATION': os.getenv('CACHE_LOCATION') or (
+            os.path.join(tempfile.gettempdir(), 'converter-app-cache') if CACHE_BACKEND == 'file' else ''),
+        'TIMEOUT': int(os.getenv('CACHE_TIMEOUT_SECONDS', 14 * 24 * 60 * 60)),  # Covers SESSION_COOKIE_AGE
+    }
+}
+if CACHE_BACKEND in ('file', 'locmem'):  # Redis and memcached evict on their own
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 10000))}
+
+# Sessions are read from the cache; 'cached_db' (the default unless the cache is per-process
+# 'locmem') also writes them through to the database, so they survive a cache flush. 'cache' skips
+# the database entirely (only with a persistent cache).
+# Multi-host caveat: each host (or serverless instance) has its own 'file' cache, so once requests
+# of one browser hit different hosts, a host can serve a session another host has since changed.
+# Deployments with more than one host should use a shared 'redis'/'memcached' cache, or set
+# SESSION_ENGINE=db to read every session from the database.
+SESSION_ENGINES = {
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'db': 'django.contrib.sessions.backends.db',
+}
+SESSION_ENGINE = os.getenv('SESSION_ENGINE', 'db' if CACHE_BACKEND == 'locmem' else 'cached_db')
+SESSION_ENGINE = SESSION_ENGINES.get(SESSION_ENGINE, SESSION_ENGINE)
+
+# Configure the Gemini client when a worker process starts rather than on its first upload. Off by
+# default: it adds work to every cold start, which serverless deployments pay on each new instance
+GEMINI_WARMUP_ENABLED = os.getenv('GEMINI_WARMUP_ENABLED', 'false').lower() == 'true'
+
 # Gemini Model Name (now directly from .env, already assigned above)
 # GEMINI_MODEL_NAME = GEMINI_MODEL_NAME_FROM_CONFIG # This line is removed as GEMINI_MODEL_NAME is set from os.getenv
 
@@ -134,7 +293,7 @@ MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware', # Standard placement
     'converter_app.middleware.RequestIdMiddleware',  # Added RequestIdMiddleware
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'converter_app.middleware.TimedSessionMiddleware',  # SessionMiddleware, with the session save timed
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -300,6 +459,15 @@ if DEBUG:
     # LOGGING['loggers']['django.request']['level'] = 'DEBUG'
     LOGGING['loggers']['converter_app']['handlers'] = ['console_dev', 'rotating_file_json']
     LOGGING['loggers']['converter_app']['level'] = 'DEBUG'
+
+# File logging goes through a queue: request threads only enqueue records, and a background listener
+# thread formats them and writes the log files above. Console handlers (all production has) stay
+# synchronous (see converter_app/log_handlers.py)
+LOGGING_CONFIG = 'converter_app.log_handlers.configure_logging'
+LOG_QUEUE_ENABLED = os.getenv('LOG_QUEUE_ENABLED', 'true').lower() == 'true'
+LOG_QUEUE_MAX_SIZE = int(os.getenv('LOG_QUEUE_MAX_SIZE', 10000))
+# Fraction of DEBUG records kept (e.g. 0.1 in a busy development setup); other levels are never sampled
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv('LOG_DEBUG_SAMPLE_RATE', 1.0))
 # ------------------------------------------------------------------------------
 
 # ------------------------------------------------------------------------------
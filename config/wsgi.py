@@ -15,4 +15,8 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
 
+# With GEMINI_WARMUP_ENABLED, configure the Gemini client while the worker starts instead of on its first upload
+from converter_app.gemini_client import warm_up  # noqa: E402
+warm_up()
+
 app = application # Add this line for Vercel
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ConverterAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'converter_app'
+
+    def ready(self):
+        # Connect signal receivers
+        from . import signals  # noqa: F401
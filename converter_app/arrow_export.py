@@ -0,0 +1,147 @@
+import tempfile
+from decimal import Decimal
+
+from django.conf import settings
+
+from .transaction_table import iter_tables
+from .transactions import is_empty_amount, parse_amount
+from .utils import EXCEL_SPOOL_MAX_BYTES
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # The Parquet and Arrow downloads are disabled when pyarrow isn't installed
+    pyarrow = None
+
+# Defaults, overridable from settings.py
+DEFAULT_PARQUET_ROW_GROUP_ROWS = 64 * 1024  # Streamed tables are gathered into row groups of about this size
+DEFAULT_PARQUET_COMPRESSION = 'zstd'
+DEFAULT_ARROW_COMPRESSION = 'zstd'  # Per-buffer IPC compression; 'none' writes plain, memory-mappable buffers
+
+FORMAT_PARQUET = 'parquet'
+FORMAT_ARROW = 'arrow'
+COLUMNAR_CONTENT_TYPES = {
+    FORMAT_PARQUET: 'application/vnd.apache.parquet',
+    FORMAT_ARROW: 'application/vnd.apache.arrow.file',
+}
+# Same precision as the Transaction table's DecimalFields
+AMOUNT_PRECISION = 18
+AMOUNT_SCALE = 2
+AMOUNT_COLUMNS = ('debit', 'credit', 'balance')
+
+
+class InexactAmountError(ValueError):
+    """Raised for an amount the typed decimal columns can't hold exactly (see parse_amount)."""
+
+
+def is_available():
+    return pyarrow is not None
+
+
+def get_schema():
+    """
+    The typed schema of the Parquet and Arrow exports. `date` is null where the
+    statement's date couldn't be read; `raw_date` keeps the text as extracted.
+    """
+    amount_type = pyarrow.decimal128(AMOUNT_PRECISION, AMOUNT_SCALE)
+    return pyarrow.schema([
+        pyarrow.field('date', pyarrow.date32()),
+        pyarrow.field('raw_date', pyarrow.string(), nullable=False),
+        pyarrow.field('description', pyarrow.string(), nullable=False),
+    ] + [pyarrow.field(column, amount_type) for column in AMOUNT_COLUMNS])
+
+
+# Same text as the Transaction table stores, so both sources export identically
+def _raw_date_text(value):
+    return str(value)[:64] if value is not None else ''
+
+
+def _description_text(value):
+    return str(value or '')
+
+
+def _decimal_amount(value):
+    # Amounts from the Transaction table are already 2-place Decimals
+    if isinstance(value, Decimal):
+        return value
+    amount = parse_amount(value)
+    if amount is None and not is_empty_amount(value):
+        # Rather a refused download than a silently nulled or rounded amount
+        raise InexactAmountError(f"Amount {value!r} can't be exported as a {AMOUNT_SCALE}-place decimal.")
+    return amount
+
+
+def _record_batch(table, schema):
+    """Converts one TransactionTable to a RecordBatch, a whole column at a time."""
+    columns = [
+        table.parsed_dates(),
+        table.mapped('date', _raw_date_text),
+        table.mapped('description', _description_text),
+    ] + [table.mapped(column, _decimal_amount) for column in AMOUNT_COLUMNS]
+    return pyarrow.record_batch(
+        [pyarrow.array(values, type=field.type) for values, field in zip(columns, schema)], schema=schema)
+
+
+def iter_record_batches(data_list, schema=None):
+    """Yields transactions (a TransactionTable, an iterable of them, or a list of dicts) as RecordBatches."""
+    schema = schema or get_schema()
+    for table in iter_tables(data_list):
+        if len(table):
+            yield _record_batch(table, schema)
+
+
+def write_parquet(data_list, fileobj):
+    """
+    Writes transactions as a Parquet file to fileobj. Batches are gathered into
+    row groups of PARQUET_ROW_GROUP_ROWS, so a streamed statement is written with
+    bounded memory and without thousands of tiny row groups.
+    """
+    schema = get_schema()
+    row_group_rows = getattr(settings, 'PARQUET_ROW_GROUP_ROWS', DEFAULT_PARQUET_ROW_GROUP_ROWS)
+    compression = getattr(settings, 'PARQUET_COMPRESSION', DEFAULT_PARQUET_COMPRESSION)
+    pending = []
+    pending_rows = 0
+    with pyarrow.parquet.ParquetWriter(fileobj, schema, compression=compression) as writer:
+        for batch in iter_record_batches(data_list, schema):
+            pending.append(batch)
+            pending_rows += batch.num_rows
+            if pending_rows >= row_group_rows:
+                writer.write_table(pyarrow.Table.from_batches(pending, schema))
+                pending = []
+                pending_rows = 0
+        if pending:
+            writer.write_table(pyarrow.Table.from_batches(pending, schema))
+
+
+def write_arrow_ipc(data_list, fileobj):
+    """Writes transactions as an Arrow IPC file (Feather v2) to fileobj, one record batch per table."""
+    schema = get_schema()
+    compression = getattr(settings, 'ARROW_COMPRESSION', DEFAULT_ARROW_COMPRESSION)
+    options = pyarrow.ipc.IpcWriteOptions(compression=None if compression == 'none' else compression)
+    with pyarrow.ipc.new_file(fileobj, schema, options=options) as writer:
+        for batch in iter_record_batches(data_list, schema):
+            writer.write_batch(batch)
+
+
+COLUMNAR_WRITERS = {
+    FORMAT_PARQUET: write_parquet,
+    FORMAT_ARROW: write_arrow_ipc,
+}
+
+
+def convert_data_to_columnar_file(export_format, data_list):
+    """
+    Converts transactions to a Parquet or Arrow file object, rewound and ready to
+    stream. Small files are kept in memory, larger ones spill to disk. The caller
+    is responsible for closing it. Raises InexactAmountError when an amount can't be
+    represented exactly.
+    """
+    output_file = tempfile.SpooledTemporaryFile(max_size=EXCEL_SPOOL_MAX_BYTES)
+    try:
+        COLUMNAR_WRITERS[export_format](data_list, output_file)
+    except BaseException:
+        output_file.close()
+        raise
+    output_file.seek(0)
+    return output_file
@@ -0,0 +1,205 @@
+import gzip
+import json
+import logging
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import ExportArtifact, StatementData
+from .timing import span
+from .transaction_table import TransactionTable
+from .transactions import has_transactions, load_transaction_table
+from .utils import convert_data_to_excel_bytes, convert_data_to_csv_string
+
+try:
+    import brotli
+except ImportError:  # Fall back to gzip when Brotli isn't installed
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Total bytes of stored artifacts before least recently downloaded ones are evicted
+DEFAULT_ARTIFACT_STORE_MAX_BYTES = 200 * 1024 * 1024
+# Single artifacts larger than this aren't stored; the download views render those on demand
+DEFAULT_ARTIFACT_MAX_BYTES = 20 * 1024 * 1024
+# A download only writes an artifact's last_accessed_at when it is older than this; eviction
+# doesn't need finer recency than that, and most downloads then cost no write
+DEFAULT_ARTIFACT_TOUCH_INTERVAL_SECONDS = 60 * 60
+
+EXPORT_CONTENT_TYPES = {
+    ExportArtifact.FORMAT_CSV: 'text/csv',
+    ExportArtifact.FORMAT_XLSX: 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    ExportArtifact.FORMAT_JSON: 'application/json',
+}
+
+
+def render_export(export_format, extracted_data):
+    """Renders transactions in one of the download formats, returning uncompressed bytes."""
+    if export_format == ExportArtifact.FORMAT_CSV:
+        return convert_data_to_csv_string(extracted_data).encode('utf-8')
+    if export_format == ExportArtifact.FORMAT_XLSX:
+        return convert_data_to_excel_bytes(extracted_data)
+    if export_format == ExportArtifact.FORMAT_JSON:
+        return json.dumps(extracted_data, indent=2).encode('utf-8')
+    raise ValueError(f"Unknown export format: {export_format}")
+
+
+def compress_export(export_format, raw_bytes):
+    """Returns (content_encoding, stored_bytes) for a rendered export."""
+    if export_format == ExportArtifact.FORMAT_XLSX:
+        # XLSX is already a deflated ZIP archive; compressing it again gains nothing
+        return ExportArtifact.ENCODING_IDENTITY, raw_bytes
+    if brotli is not None:
+        return ExportArtifact.ENCODING_BROTLI, brotli.compress(raw_bytes, quality=9)
+    return ExportArtifact.ENCODING_GZIP, gzip.compress(raw_bytes, compresslevel=6)
+
+
+def decompress_artifact(artifact):
+    """Returns the artifact's content decoded back to the original file bytes."""
+    content = bytes(artifact.content)
+    if artifact.encoding == ExportArtifact.ENCODING_BROTLI:
+        return brotli.decompress(content)
+    if artifact.encoding == ExportArtifact.ENCODING_GZIP:
+        return gzip.decompress(content)
+    return content
+
+
+def get_export_rows(statement_record, export_format):
+    """
+    Returns the rows an export is rendered from: CSV/XLSX get a TransactionTable,
+    from the Transaction table when populated, matching what the download views
+    stream; JSON always mirrors the stored blob.
+    """
+    if export_format == ExportArtifact.FORMAT_JSON:
+        return statement_record.extracted_data
+    if has_transactions(statement_record.id):
+        return load_transaction_table(statement_record.id)
+    return TransactionTable.from_rows(statement_record.extracted_data)
+
+
+def get_export_bytes(statement_record, export_format):
+    """Returns a statement's export as uncompressed bytes, from the artifact store when possible."""
+    if getattr(settings, 'ARTIFACTS_ENABLED', True):
+        artifact = get_stored_artifact(statement_record.id, export_format)
+        if artifact is not None:
+            return decompress_artifact(artifact)
+    return render_export(export_format, get_export_rows(statement_record, export_format))
+
+
+def render_artifacts(statement_data_id, request_id='N/A'):
+    """
+    Renders and stores every download format for a statement. Called on the
+    background worker pool right after a successful extraction. Artifacts are
+    only stored while the statement's data_version is still the one rendered,
+    so a render that overlaps an edit never stores the old rows.
+    """
+    try:
+        statement_record = StatementData.objects.get(id=statement_data_id)
+    except StatementData.DoesNotExist:
+        return
+
+    max_artifact_bytes = getattr(
+        settings, 'ARTIFACT_MAX_BYTES', DEFAULT_ARTIFACT_MAX_BYTES)
+    table = None
+    for export_format in EXPORT_CONTENT_TYPES:
+        try:
+            with span(f"render_{export_format}"):
+                if export_format == ExportArtifact.FORMAT_JSON:
+                    export_rows = get_export_rows(statement_record, export_format)
+                else:
+                    if table is None:  # Built once and shared by the CSV and XLSX renders
+                        table = get_export_rows(statement_record, export_format)
+                    export_rows = table
+                raw_bytes = render_export(export_format, export_rows)
+            with span('compress'):
+                encoding, stored_bytes = compress_export(export_format, raw_bytes)
+            if len(stored_bytes) > max_artifact_bytes:
+                logger.info("Skipping %s artifact for statement %s: %s bytes exceeds the per-artifact limit.",
+                            export_format, statement_data_id, len(stored_bytes),
+                            extra={'request_id': request_id, 'record_id': statement_data_id, 'export_format': export_format})
+                continue
+            now = timezone.now()
+            with span('db_insert'), transaction.atomic():
+                # Locks the statement row, so an edit commits either before this check or after the
+                # insert, when its invalidation removes the artifact again
+                current = StatementData.objects.select_for_update().filter(
+                    id=statement_data_id, data_version=statement_record.data_version).exists()
+                if current:
+                    ExportArtifact.objects.update_or_create(
+                        statement_id=statement_data_id,
+                        export_format=export_format,
+                        defaults={
+                            'encoding': encoding,
+                            'content': stored_bytes,
+                            'raw_size': len(raw_bytes),
+                            'stored_size': len(stored_bytes),
+                            'created_at': now,
+                            'last_accessed_at': now,
+                        }
+                    )
+            if not current:
+                logger.info("Statement %s changed or was deleted while its downloads rendered; not storing them.",
+                            statement_data_id, extra={'request_id': request_id, 'record_id': statement_data_id})
+                break
+            logger.debug("Stored %s artifact for statement %s (%s -> %s bytes, %s).",
+                         export_format, statement_data_id, len(raw_bytes), len(stored_bytes), encoding,
+                         extra={'request_id': request_id, 'record_id': statement_data_id, 'export_format': export_format,
+                                'raw_size': len(raw_bytes), 'stored_size': len(stored_bytes)})
+        except Exception:
+            # Artifacts are an optimisation; the download views can always render on demand
+            logger.exception("Failed to render %s artifact for statement %s.", export_format, statement_data_id,
+                             extra={'request_id': request_id, 'record_id': statement_data_id, 'export_format': export_format})
+    evict_artifacts()
+
+
+def get_stored_artifact(statement_data_id, export_format):
+    """
+    Returns the stored artifact for a statement and format, or None, marking it as
+    recently used when its last_accessed_at is older than ARTIFACT_TOUCH_INTERVAL_SECONDS.
+    """
+    artifact = ExportArtifact.objects.filter(
+        statement_id=statement_data_id, export_format=export_format).first()
+    if artifact is not None:
+        touch_interval = getattr(
+            settings, 'ARTIFACT_TOUCH_INTERVAL_SECONDS', DEFAULT_ARTIFACT_TOUCH_INTERVAL_SECONDS)
+        now = timezone.now()
+        if artifact.last_accessed_at < now - timedelta(seconds=touch_interval):
+            ExportArtifact.objects.filter(pk=artifact.pk).update(last_accessed_at=now)
+            artifact.last_accessed_at = now
+    return artifact
+
+
+def invalidate_artifacts(statement_data_id):
+    """Drops every stored artifact of a statement, e.g. after its data changed."""
+    deleted, _ = ExportArtifact.objects.filter(
+        statement_id=statement_data_id).delete()
+    return deleted
+
+
+def evict_artifacts():
+    """
+    Deletes least recently downloaded artifacts until the store fits in
+    ARTIFACT_STORE_MAX_BYTES. Returns the number of artifacts removed.
+    """
+    max_total_bytes = getattr(
+        settings, 'ARTIFACT_STORE_MAX_BYTES', DEFAULT_ARTIFACT_STORE_MAX_BYTES)
+    total_bytes = ExportArtifact.objects.aggregate(
+        total=Sum('stored_size'))['total'] or 0
+    if total_bytes <= max_total_bytes:
+        return 0
+
+    evict_ids = []
+    for artifact_id, stored_size in ExportArtifact.objects.order_by(
+            'last_accessed_at').values_list('id', 'stored_size').iterator():
+        if total_bytes <= max_total_bytes:
+            break
+        evict_ids.append(artifact_id)
+        total_bytes -= stored_size
+    ExportArtifact.objects.filter(id__in=evict_ids).delete()
+    logger.info("Evicted %s export artifacts to stay under %s bytes.", len(evict_ids), max_total_bytes,
+                extra={'evicted_count': len(evict_ids), 'max_total_bytes': max_total_bytes})
+    return len(evict_ids)
@@ -0,0 +1,220 @@
+import hashlib
+import logging
+import os
+import posixpath
+import tempfile
+import zipfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .artifacts import get_export_bytes
+from .forms import is_zip_upload
+from .jobs import DEFAULT_JOB_TIMEOUT_SECONDS, get_batch_executor, queue_staged_job
+from .models import ExportArtifact, ExtractionBatch, ExtractionJob
+from .pipeline import EXTRACTION_PROMPT_VERSION
+from .metrics import CACHE_HITS, UPLOADS
+from .result_cache import build_cache_key, lookup_cached_result
+from .utils import EXCEL_SPOOL_MAX_BYTES
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_MAX_FILES = 50
+STAGE_CHUNK_BYTES = 64 * 1024
+PDF_SIGNATURE = b'%PDF-'
+
+
+class BatchFileError(Exception):
+    """A file in a batch that can't be processed; the message is shown for that file."""
+    pass
+
+
+def _stage_chunks(chunks, max_bytes):
+    """
+    Copies a file's chunks to a temp file that outlives the request, hashing them
+    on the way so the result cache needs no second pass. Returns (path, sha256 hex).
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
+        try:
+            for chunk in chunks:
+                if not size and chunk and not chunk.startswith(PDF_SIGNATURE):
+                    raise BatchFileError("Not a PDF file.")
+                size += len(chunk)
+                if size > max_bytes:
+                    raise BatchFileError(
+                        f"File size cannot exceed {max_bytes // (1024*1024)}MB.")
+                digest.update(chunk)
+                tmp_file.write(chunk)
+            if not size:
+                raise BatchFileError("The file is empty.")
+        except Exception:
+            tmp_file.close()
+            os.remove(tmp_file.name)
+            raise
+    return tmp_file.name, digest.hexdigest()
+
+
+def _iter_member_chunks(archive, member):
+    with archive.open(member) as member_file:
+        while True:
+            chunk = member_file.read(STAGE_CHUNK_BYTES)
+            if not chunk:
+                break
+            yield chunk
+
+
+def _iter_batch_entries(uploaded_files, max_bytes):
+    """
+    Yields (filename, chunks, error) for every PDF in a batch upload, expanding
+    ZIP archives. chunks must be consumed before the next entry is requested;
+    error is a message for entries that can't be processed (chunks is then None).
+    """
+    for uploaded_file in uploaded_files:
+        if not is_zip_upload(uploaded_file):
+            yield uploaded_file.name, uploaded_file.chunks(), None
+            continue
+
+        try:
+            archive = zipfile.ZipFile(uploaded_file)
+        except zipfile.BadZipFile:
+            yield uploaded_file.name, None, "Not a valid ZIP archive."
+            continue
+        with archive:
+            for member in archive.infolist():
+                filename = posixpath.basename(member.filename)
+                # Skip folders and the metadata files macOS adds to archives
+                if member.is_dir() or member.filename.startswith('__MACOSX/') or filename.startswith('.'):
+                    continue
+                if not filename.lower().endswith('.pdf'):
+                    yield filename, None, "Skipped: only PDF files are processed."
+                elif member.file_size > max_bytes:
+                    # Checked before decompressing anything, so oversized members cost nothing
+                    yield filename, None, f"File size cannot exceed {max_bytes // (1024*1024)}MB."
+                else:
+                    yield filename, _iter_member_chunks(archive, member), None
+
+
+def _fail_job(job, message):
+    job.status = ExtractionJob.STATUS_FAILED
+    job.message = message
+    job.save()
+
+
+def submit_batch(uploaded_files, request_id='N/A'):
+    """
+    Creates an ExtractionBatch with one ExtractionJob per PDF (ZIP archives are
+    expanded) and queues them on the bounded batch pool. PDFs already in the
+    result cache are completed immediately; unreadable files get a failed job
+    carrying the reason, so every file shows up in the batch's results.
+    """
+    batch = ExtractionBatch.objects.create()
+    max_files = getattr(settings, 'BATCH_MAX_FILES', DEFAULT_BATCH_MAX_FILES)
+    max_pdf_bytes = getattr(settings, 'MAX_PDF_UPLOAD_SIZE_BYTES', 5 * 1024 * 1024)
+    cache_enabled = getattr(settings, 'EXTRACTION_CACHE_ENABLED', True)
+    executor = get_batch_executor()
+
+    position = 0
+    for filename, chunks, error in _iter_batch_entries(uploaded_files, max_pdf_bytes):
+        job = ExtractionJob(batch=batch, batch_position=position,
+                            pdf_filename=filename[:255])
+        position += 1
+        if position > max_files:
+            _fail_job(job, f"Batch limit of {max_files} PDFs reached; the remaining files were not processed.")
+            logger.warning("Batch %s truncated at %s files.", batch.id, max_files,
+                           extra={'request_id': request_id, 'batch_id': str(batch.id)})
+            break
+        UPLOADS.inc(kind='batch')
+        if error:
+            _fail_job(job, error)
+            continue
+
+        try:
+            file_path, pdf_digest = _stage_chunks(chunks, max_pdf_bytes)
+        except BatchFileError as file_error:
+            _fail_job(job, str(file_error))
+            continue
+        except Exception as e:
+            logger.warning("Could not read %s from batch %s: %s", filename, batch.id, e,
+                           exc_info=True, extra={'request_id': request_id, 'batch_id': str(batch.id)})
+            _fail_job(job, "Could not read this file.")
+            continue
+
+        cache_key = None
+        if cache_enabled:
+            try:
+                cache_key = build_cache_key(
+                    pdf_digest, settings.GEMINI_MODEL_NAME, EXTRACTION_PROMPT_VERSION)
+                cached_result = lookup_cached_result(cache_key)
+            except Exception as cache_error:
+                # A cache failure must never block a fresh extraction
+                logger.warning("Result cache lookup failed for %s: %s", filename, cache_error,
+                               exc_info=True, extra={'request_id': request_id, 'batch_id': str(batch.id)})
+                cached_result = None
+            if cached_result:
+                CACHE_HITS.inc()
+                os.remove(file_path)
+                job.status = ExtractionJob.STATUS_SUCCEEDED
+                job.message = f"Successfully extracted {cached_result['transaction_count']} transactions."
+                job.results_ready = True
+                job.statement_id = cached_result['statement_data_id']
+                job.date_range_string = cached_result['date_range_string']
+                job.transaction_count = cached_result['transaction_count']
+                job.save()
+                continue
+
+        job.save()
+        queue_staged_job(job, file_path, cache_key=cache_key,
+                         request_id=request_id, executor=executor)
+
+    logger.info("Queued batch %s with %s files.", batch.id, min(position, max_files),
+                extra={'request_id': request_id, 'batch_id': str(batch.id), 'file_count': min(position, max_files)})
+    return batch
+
+
+def get_batch_jobs(batch):
+    """Returns the batch's jobs in upload order, failing them if the batch stopped making progress."""
+    jobs = list(batch.jobs.order_by('batch_position'))
+    unfinished = [job for job in jobs if job.status in (
+        ExtractionJob.STATUS_PENDING, ExtractionJob.STATUS_RUNNING)]
+    if unfinished:
+        # Queued files legitimately wait behind the rest of the batch, so staleness is
+        # judged on the batch as a whole: no job has moved for the timeout period
+        timeout = getattr(settings, 'EXTRACTION_JOB_TIMEOUT_SECONDS',
+                          DEFAULT_JOB_TIMEOUT_SECONDS)
+        last_activity = max(job.updated_at for job in jobs)
+        if last_activity < timezone.now() - timedelta(seconds=timeout):
+            batch.jobs.filter(id__in=[job.id for job in unfinished]).update(
+                status=ExtractionJob.STATUS_FAILED,
+                message="Processing timed out. Please try uploading the PDF again.",
+                updated_at=timezone.now())
+            jobs = list(batch.jobs.order_by('batch_position'))
+    return jobs
+
+
+def build_combined_archive(jobs, export_format):
+    """
+    Writes every successful job's export into one ZIP archive and returns it as a
+    rewound spooled file. Entries are named after the source PDF and date range.
+    """
+    # XLSX files are already deflated; recompressing them only costs CPU
+    compression = (zipfile.ZIP_STORED if export_format == ExportArtifact.FORMAT_XLSX
+                   else zipfile.ZIP_DEFLATED)
+    archive_file = tempfile.SpooledTemporaryFile(max_size=EXCEL_SPOOL_MAX_BYTES)
+    used_names = set()
+    with zipfile.ZipFile(archive_file, 'w', compression=compression) as archive:
+        for job in jobs:
+            if job.statement is None:
+                continue
+            stem = os.path.splitext(job.pdf_filename or 'statement')[0]
+            entry_name = f"{stem}_{job.date_range_string or 'statement'}.{export_format}"
+            suffix = 2
+            while entry_name in used_names:
+                entry_name = f"{stem}_{job.date_range_string or 'statement'}_{suffix}.{export_format}"
+                suffix += 1
+            used_names.add(entry_name)
+            archive.writestr(entry_name, get_export_bytes(job.statement, export_format))
+    archive_file.seek(0)
+    return archive_file
@@ -0,0 +1,131 @@
+import logging
+import re
+from datetime import date
+
+logger = logging.getLogger(__name__)
+
+# Rows inspected when deciding a statement's date format
+DEFAULT_DATE_SAMPLE_SIZE = 200
+
+_MONTH_NAMES = {
+    'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
+    'jul': 7, 'aug': 8, 'sep': 9, 'sept': 9, 'oct': 10, 'nov': 11, 'dec': 12,
+    'january': 1, 'february': 2, 'march': 3, 'april': 4, 'june': 6, 'july': 7,
+    'august': 8, 'september': 9, 'october': 10, 'november': 11, 'december': 12,
+}
+
+_ISO_PATTERN = re.compile(r'(\d{4})-(\d{1,2})-(\d{1,2})')
+_SLASH_LONG_YEAR_PATTERN = re.compile(r'(\d{1,2})/(\d{1,2})/(\d{4})')
+_SLASH_SHORT_YEAR_PATTERN = re.compile(r'(\d{1,2})/(\d{1,2})/(\d{2})')
+_MONTH_NAME_PATTERN = re.compile(r'(\d{1,2})-([A-Za-z]{3,9})-(\d{4})')
+
+# Candidate formats as (regex, group index of day, month, year), in tie-break order.
+# Ambiguous rows like 03/04/2024 are read day-first unless the statement says otherwise,
+# matching the order the per-row parser used to try formats in.
+DATE_FORMATS = {
+    'iso': (_ISO_PATTERN, 3, 2, 1),                      # 2024-01-15
+    'day_first': (_SLASH_LONG_YEAR_PATTERN, 1, 2, 3),    # 15/01/2024
+    'month_first': (_SLASH_LONG_YEAR_PATTERN, 2, 1, 3),  # 01/15/2024
+    'day_first_short': (_SLASH_SHORT_YEAR_PATTERN, 1, 2, 3),    # 15/01/24
+    'month_first_short': (_SLASH_SHORT_YEAR_PATTERN, 2, 1, 3),  # 01/15/24
+    'month_name': (_MONTH_NAME_PATTERN, 1, 2, 3),        # 15-Jan-2024, 15-January-2024
+}
+
+
+def _build_date(match, day_group, month_group, year_group):
+    """Returns the date for a regex match of one of DATE_FORMATS, or None if it isn't a real date."""
+    month_text = match.group(month_group)
+    month = int(month_text) if month_text.isdigit() else _MONTH_NAMES.get(month_text.lower())
+    if month is None:
+        return None
+    year_text = match.group(year_group)
+    year = int(year_text)
+    if len(year_text) == 2:
+        year += 1900 if year >= 69 else 2000  # Same pivot as strptime's %y
+    try:
+        return date(year, month, int(match.group(day_group)))
+    except ValueError:
+        return None
+
+
+def parse_date_as(date_str, format_name):
+    """Parses one date string with a named format from DATE_FORMATS, returning a date or None."""
+    if not date_str:
+        return None
+    pattern, day_group, month_group, year_group = DATE_FORMATS[format_name]
+    match = pattern.fullmatch(str(date_str).strip())
+    if match is None:
+        return None
+    return _build_date(match, day_group, month_group, year_group)
+
+
+def _sample(values, sample_size):
+    """Picks up to sample_size non-empty values spread evenly across the statement."""
+    values = [value for value in values if value]
+    if len(values) <= sample_size:
+        return values
+    step = len(values) / sample_size
+    return [values[int(position * step)] for position in range(sample_size)]
+
+
+def infer_date_format(date_strings, sample_size=DEFAULT_DATE_SAMPLE_SIZE):
+    """
+    Decides which of DATE_FORMATS a statement uses by parsing a sample of its
+    dates with every candidate and keeping the one that reads the most rows.
+    Returns the format name, or None if no candidate matches any row.
+    """
+    sample = _sample(date_strings, sample_size)
+    best_format, best_count = None, 0
+    for format_name in DATE_FORMATS:  # Dict order is the tie-break order
+        count = sum(1 for value in sample if parse_date_as(value, format_name) is not None)
+        if count > best_count:
+            best_format, best_count = format_name, count
+    logger.debug("Inferred statement date format '%s' from %s sampled rows (%s matched).",
+                 best_format, len(sample), best_count,
+                 extra={'date_format': best_format, 'sample_size': len(sample), 'matched_count': best_count})
+    return best_format
+
+
+def normalize_dates(date_strings, date_format=None):
+    """
+    Parses a statement's date strings in one pass, returning a list of dates
+    (None where a row can't be read) aligned with the input. The format is
+    inferred once for the whole statement unless given, so every row is read
+    the same way. Rows that don't fit the statement's format are tried
+    against the other candidates, and repeated strings are parsed only once.
+    """
+    date_strings = list(date_strings)
+    if date_format is None:
+        date_format = infer_date_format(date_strings)
+    if date_format is None:
+        return [None] * len(date_strings)
+
+    pattern, day_group, month_group, year_group = DATE_FORMATS[date_format]
+    fullmatch = pattern.fullmatch
+    fallback_formats = [name for name in DATE_FORMATS if name != date_format]
+    parsed_by_string = {}
+    normalized = []
+    for value in date_strings:
+        if not value:
+            normalized.append(None)
+            continue
+        if value in parsed_by_string:
+            normalized.append(parsed_by_string[value])
+            continue
+        text = str(value).strip()
+        match = fullmatch(text)
+        parsed = _build_date(match, day_group, month_group, year_group) if match else None
+        if parsed is None:
+            for format_name in fallback_formats:
+                parsed = parse_date_as(text, format_name)
+                if parsed is not None:
+                    break
+        parsed_by_string[value] = parsed
+        normalized.append(parsed)
+    return normalized
+
+
+def normalize_transaction_dates(transactions):
+    """normalize_dates() over the 'date' key of extracted rows; non-dict rows map to None."""
+    return normalize_dates(
+        row.get('date') if isinstance(row, dict) else None for row in transactions or [])
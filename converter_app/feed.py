@@ -0,0 +1,189 @@
+import base64
+import binascii
+import itertools
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import StatementData, Transaction
+from .transactions import DEFAULT_TRANSACTION_FETCH_SIZE
+
+# Defaults, overridable from settings.py
+DEFAULT_FEED_MAX_ROWS = 100000  # Transactions per response; the client follows the last cursor for more
+DEFAULT_FEED_SETTLE_SECONDS = 30  # Statements younger than this aren't served yet (see iter_feed_lines)
+FEED_STATEMENTS_PER_QUERY = 200
+FEED_LINES_PER_CHUNK = 500
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_CURSOR_VERSION = '1'
+
+
+class InvalidCursor(ValueError):
+    """Raised for a cursor that wasn't produced by this feed."""
+
+
+def encode_cursor(uploaded_at, statement_id, ordinal):
+    """
+    Returns the opaque cursor for a feed position: the statement's upload time (exact
+    to the microsecond), its id and the row's ordinal within it.
+    """
+    micros = (uploaded_at - _EPOCH) // timedelta(microseconds=1)
+    text = f"{_CURSOR_VERSION}:{micros}:{statement_id}:{ordinal}"
+    return base64.urlsafe_b64encode(text.encode('ascii')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Returns (uploaded_at, statement_id, ordinal) for a cursor from encode_cursor()."""
+    try:
+        text = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('ascii')
+        version, micros, statement_id, ordinal = text.split(':')
+        if version != _CURSOR_VERSION:
+            raise ValueError(version)
+        return _EPOCH + timedelta(microseconds=int(micros)), int(statement_id), int(ordinal)
+    except (binascii.Error, UnicodeError, ValueError, OverflowError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}") from e
+
+
+def _statement_pages(uploaded_at, statement_id, settled_before):
+    """
+    Yields pages of (id, uploaded_at, pdf_filename) for the statements after
+    (uploaded_at, statement_id), or from the start when uploaded_at is None, in
+    (uploaded_at, id) order. Each page is one range scan of the (uploaded_at, id)
+    index, so no page costs more than the first.
+    """
+    statements = StatementData.objects.filter(uploaded_at__lt=settled_before).order_by('uploaded_at', 'id')
+    while True:
+        page = statements
+        if uploaded_at is not None:
+            # The >= bound starts the index scan; the OR only trims ties on uploaded_at
+            page = page.filter(uploaded_at__gte=uploaded_at).filter(
+                Q(uploaded_at__gt=uploaded_at) | Q(id__gt=statement_id))
+        page = list(page.values_list('id', 'uploaded_at', 'pdf_filename')[:FEED_STATEMENTS_PER_QUERY])
+        if not page:
+            return
+        yield page
+        if len(page) < FEED_STATEMENTS_PER_QUERY:
+            return
+        statement_id, uploaded_at, _ = page[-1]
+
+
+def _increasing_runs(page):
+    """
+    Splits a page of statements into consecutive runs whose ids increase, so
+    (statement_id, ordinal) order within a run is also feed order. Ids follow
+    upload order, so a page is normally a single run.
+    """
+    run = []
+    for statement in page:
+        if run and statement[0] < run[-1][0]:
+            yield run
+            run = []
+        run.append(statement)
+    if run:
+        yield run
+
+
+def _run_rows(statements, fetch_size, after_ordinal=None):
+    """
+    Yields the feed rows of a run of statements in (statement_id, ordinal) order,
+    read with one range scan of the unique_transaction_ordinal index.
+    """
+    statement_info = {statement_id: (uploaded_at, pdf_filename)
+                      for statement_id, uploaded_at, pdf_filename in statements}
+    rows = Transaction.objects.filter(statement_id__in=statement_info)
+    if after_ordinal is not None:
+        rows = rows.filter(ordinal__gt=after_ordinal)
+    rows = (rows.order_by('statement_id', 'ordinal')
+            .values_list('statement_id', 'ordinal', 'date', 'raw_date', 'description',
+                         'debit', 'credit', 'balance'))
+    # A server-side cursor on PostgreSQL: rows arrive fetch_size at a time
+    rows = rows.iterator(chunk_size=fetch_size)
+    try:
+        for statement_id, *values in rows:
+            yield (statement_id, *statement_info[statement_id], *values)
+    finally:
+        rows.close()
+
+
+def _iter_feed_rows(cursor, settled_before, fetch_size):
+    """Yields the transaction rows after cursor in feed order, normally one query per page of statements."""
+    uploaded_at, statement_id, ordinal = decode_cursor(cursor) if cursor else (None, None, None)
+    if cursor:
+        # The rest of the cursor's own statement comes first
+        resume = list(StatementData.objects.filter(id=statement_id)
+                      .values_list('id', 'uploaded_at', 'pdf_filename'))
+        if resume:
+            yield from _run_rows(resume, fetch_size, after_ordinal=ordinal)
+    for page in _statement_pages(uploaded_at, statement_id, settled_before):
+        for run in _increasing_runs(page):
+            yield from _run_rows(run, fetch_size)
+
+
+def _decimal_text(value):
+    return None if value is None else str(value)
+
+
+def iter_feed_lines(cursor=None, limit=None):
+    """
+    Yields NDJSON text, FEED_LINES_PER_CHUNK lines at a time: one line per
+    transaction after `cursor` (from the start without one), oldest statement
+    first, up to `limit` (at most FEED_MAX_ROWS), then an end line with the cursor
+    to resume from and whether more rows may remain. Every transaction line
+    carries its own cursor too, so an interrupted sync can resume from the last
+    line it stored. Raises InvalidCursor before yielding anything for a bad cursor.
+
+    Pages through statements by keyset on (uploaded_at, id) and reads their rows
+    in (statement_id, ordinal) order, the unique_transaction_ordinal index, with a
+    server-side cursor, so memory and the cost of each query stay constant however
+    far into the feed the cursor is.
+    Statements uploaded in the last FEED_SETTLE_SECONDS are held back: uploaded_at
+    is set before the statement's transaction commits, and serving newer ones could
+    move a cursor past a statement that commits a moment later.
+    """
+    max_rows = getattr(settings, 'FEED_MAX_ROWS', DEFAULT_FEED_MAX_ROWS)
+    limit = min(limit or max_rows, max_rows)
+    settle_seconds = getattr(settings, 'FEED_SETTLE_SECONDS', DEFAULT_FEED_SETTLE_SECONDS)
+    fetch_size = getattr(settings, 'TRANSACTION_FETCH_SIZE', DEFAULT_TRANSACTION_FETCH_SIZE)
+    settled_before = timezone.now() - timedelta(seconds=settle_seconds)
+    if cursor:
+        decode_cursor(cursor)  # Fail before the response starts
+
+    return _iter_feed_chunks(cursor, limit, settled_before, fetch_size)
+
+
+def _iter_feed_chunks(cursor, limit, settled_before, fetch_size):
+    rows = _iter_feed_rows(cursor, settled_before, fetch_size)
+    end_cursor = cursor
+    count = 0
+    pending_lines = []
+    try:
+        for (statement_id, uploaded_at, pdf_filename, ordinal, date, raw_date, description,
+             debit, credit, balance) in itertools.islice(rows, limit):
+            end_cursor = encode_cursor(uploaded_at, statement_id, ordinal)
+            pending_lines.append(json.dumps({
+                'type': 'transaction',
+                'cursor': end_cursor,
+                'statement_id': statement_id,
+                'pdf_filename': pdf_filename,
+                'uploaded_at': uploaded_at.isoformat(),
+                'ordinal': ordinal,
+                'date': date.isoformat() if date else None,
+                'raw_date': raw_date,
+                'description': description,
+                # Strings, so amounts reach the client as the exact 2-place decimals stored
+                'debit': _decimal_text(debit),
+                'credit': _decimal_text(credit),
+                'balance': _decimal_text(balance),
+            }) + '\n')
+            count += 1
+            if len(pending_lines) >= FEED_LINES_PER_CHUNK:
+                yield ''.join(pending_lines)
+                pending_lines = []
+    finally:
+        rows.close()  # Releases the server-side cursor when the limit stops the read early
+    pending_lines.append(json.dumps({
+        'type': 'end', 'cursor': end_cursor, 'count': count, 'has_more': count >= limit}) + '\n')
+    yield ''.join(pending_lines)
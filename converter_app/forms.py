@@ -28,3 +28,55 @@ class PDFUploadForm(forms.Form):
         validators=[validate_file_type, validate_file_size]
     )
     # We can add more fields later if needed, e.g., for output format preference
+
+
+BATCH_ARCHIVE_CONTENT_TYPES = (
+    'application/zip', 'application/x-zip-compressed', 'application/x-zip')
+
+
+def is_zip_upload(file):
+    """True if an uploaded file is a ZIP archive (by content type or extension)."""
+    return file.content_type in BATCH_ARCHIVE_CONTENT_TYPES or file.name.lower().endswith('.zip')
+
+
+def validate_batch_file(file):
+    """Ensures each file in a batch is a PDF or a ZIP of PDFs within the size limits."""
+    if is_zip_upload(file):
+        max_size = getattr(settings, 'MAX_BATCH_ARCHIVE_SIZE_BYTES', 50 * 1024 * 1024)
+        if file.size > max_size:
+            raise ValidationError(
+                f'ZIP archives cannot exceed {max_size // (1024*1024)}MB.')
+        return
+    validate_file_type(file)
+    validate_file_size(file)
+
+class MultipleFileInput(forms.ClearableFileInput):
+    allow_multiple_selected = True
+
+
+class MultipleFileField(forms.FileField):
+    """FileField accepting several files; cleans (and validates) each one, returning a list."""
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('widget', MultipleFileInput())
+        super().__init__(*args, **kwargs)
+
+    def clean(self, data, initial=None):
+        single_file_clean = super().clean
+        if isinstance(data, (list, tuple)):
+            return [single_file_clean(item, initial) for item in data]
+        return [single_file_clean(data, initial)]
+
+
+class BatchUploadForm(forms.Form):
+    pdf_files = MultipleFileField(
+        label='Upload PDF Bank Statements or a ZIP archive',
+        validators=[validate_batch_file]  # Run on each file
+    )
+
+    def clean_pdf_files(self):
+        files = self.cleaned_data['pdf_files']
+        max_files = getattr(settings, 'BATCH_MAX_FILES', 50)
+        if len(files) > max_files:
+            raise ValidationError(f'A batch cannot contain more than {max_files} files.')
+        return files
@@ -0,0 +1,138 @@
+import logging
+import threading
+import time
+
+import google.generativeai as genai
+import httplib2
+from django.conf import settings
+from google.generativeai import client as genai_client
+from googleapiclient.discovery import build_from_document
+
+logger = logging.getLogger(__name__)
+
+# Where the File API's discovery document lives, relative to the API endpoint
+DISCOVERY_PATH = '/$discovery/rest'
+
+
+def _discovery_setup(file_client, discovery_url):
+    """
+    Returns a replacement for file_client._setup_discovery_api() that reads the
+    File API description from discovery_url instead of the library-wide
+    GENAI_API_DISCOVERY_URL. The document is fetched once and then shared by
+    every thread using this client.
+    """
+    document = []  # Fetched document, filled on first use
+    fetch_lock = threading.Lock()
+
+    def setup_discovery_api(metadata=()):
+        api_key = file_client._client_options.api_key
+        with fetch_lock:
+            if not document:
+                http = httplib2.Http()
+                try:
+                    response, content = http.request(f"{discovery_url}?version=v1beta&key={api_key}",
+                                                     headers=dict(metadata))
+                finally:
+                    http.close()
+                if response.status != 200:
+                    raise RuntimeError(f"File API discovery request to {discovery_url} failed "
+                                       f"with HTTP {response.status}.")
+                document.append(content.decode('utf-8'))
+        file_client._local.discovery_api = build_from_document(document[0], developerKey=api_key)
+
+    return setup_discovery_api
+
+
+class GeminiClient:
+    """
+    Per-process Gemini configuration shared by all request and worker threads.
+
+    genai.configure() discards the library's gRPC clients, so calling it per
+    upload reopened the channel to the API every time. Here it runs once per
+    (API key, model name, endpoint, transport); the GenerativeModel and the
+    underlying service clients are then reused until one of those settings changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entry = None  # ((api key, model name), GenerativeModel), swapped as one
+        self.setup_ms = None  # Time the last (re)configuration took
+        self.setup_count = 0
+
+    def _settings_key(self):
+        return (settings.GEMINI_API_KEY, settings.GEMINI_MODEL_NAME,
+                getattr(settings, 'GEMINI_API_ENDPOINT', None), getattr(settings, 'GEMINI_TRANSPORT', None))
+
+    def _configure(self, key, request_id):
+        """Configures genai and opens its clients for key. Caller holds the lock."""
+        api_key, model_name, api_endpoint, transport = key
+        started = time.perf_counter()
+        client_options = {'api_endpoint': api_endpoint} if api_endpoint else None
+        genai.configure(api_key=api_key, transport=transport or None, client_options=client_options)
+        # The library creates these lazily and without a lock; open them here so
+        # concurrent first requests don't each build their own channel
+        genai_client.get_default_generative_client()
+        file_client = genai_client.get_default_file_client()
+        if api_endpoint:
+            # genai.upload_file() fetches the File API description from a fixed Google URL;
+            # point this client (only) at the same endpoint as every other call
+            file_client._setup_discovery_api = _discovery_setup(
+                file_client, api_endpoint.rstrip('/') + DISCOVERY_PATH)
+        model = genai.GenerativeModel(model_name=model_name)
+        self.setup_ms = (time.perf_counter() - started) * 1000
+        self.setup_count += 1
+        reloaded = self._entry is not None
+        self._entry = (key, model)
+        logger.info("%s Gemini client for model '%s' in %.1f ms; later requests reuse it.",
+                    'Reloaded' if reloaded else 'Configured', model_name, self.setup_ms,
+                    extra={'request_id': request_id, 'model_name': model_name,
+                           'setup_ms': round(self.setup_ms, 1)})
+
+    def get_model(self, request_id='N/A'):
+        """Returns the shared GenerativeModel, (re)configuring first if the settings changed."""
+        key = self._settings_key()
+        entry = self._entry
+        if entry is not None and entry[0] == key:
+            return entry[1]
+        with self._lock:
+            if self._entry is None or self._entry[0] != key:
+                self._configure(key, request_id)
+            return self._entry[1]
+
+    def reset(self):
+        """Forgets the configured model; the next get_model() configures from scratch."""
+        with self._lock:
+            self._entry = None
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_gemini_client():
+    """Returns the process-wide GeminiClient."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = GeminiClient()
+    return _client
+
+
+def get_generative_model(request_id='N/A'):
+    """Shortcut for get_gemini_client().get_model()."""
+    return get_gemini_client().get_model(request_id)
+
+
+def warm_up():
+    """
+    Configures the Gemini client ahead of the first upload when
+    GEMINI_WARMUP_ENABLED is set; otherwise the first upload does it. Failures are
+    only logged: the first request will retry and report the error to the user.
+    """
+    if not getattr(settings, 'GEMINI_WARMUP_ENABLED', False) or not settings.GEMINI_API_KEY:
+        return
+    try:
+        get_generative_model(request_id='warm-up')
+    except Exception as e:
+        logger.warning("Gemini client warm-up failed: %s", e, exc_info=True)
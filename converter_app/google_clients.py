@@ -0,0 +1,252 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import google_auth_httplib2
+import googleapiclient
+import httplib2
+from django.conf import settings
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build_from_document
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable from settings.py
+DEFAULT_GOOGLE_HTTP_POOL_SIZE = 8  # Idle keep-alive transports kept per process
+DEFAULT_GOOGLE_HTTP_IDLE_SECONDS = 120  # Transports unused for longer are closed
+DEFAULT_GOOGLE_HTTP_TIMEOUT_SECONDS = 60
+DEFAULT_GOOGLE_CLIENT_CACHE_SIZE = 256  # Credentials/services kept, least recently used dropped first
+
+# google-api-python-client ships the discovery documents of Google's APIs
+BUNDLED_DISCOVERY_DIR = os.path.join(
+    os.path.dirname(googleapiclient.__file__), 'discovery_cache', 'documents')
+
+
+def credentials_identity(client_id, refresh_token, scopes=None):
+    """
+    Returns the cache key for one user's OAuth grant. The refresh token and the
+    granted scopes identify the grant across access-token refreshes, so a re-auth
+    that changes the scopes gets its own entry; it's hashed so raw tokens never
+    end up as dictionary keys or in logs.
+    """
+    scope_list = ' '.join(sorted(scopes or ()))
+    return hashlib.sha256(f"{client_id}:{refresh_token}:{scope_list}".encode('utf-8')).hexdigest()
+
+
+def _args_identity(credentials_args):
+    return credentials_identity(credentials_args.get('client_id'), credentials_args.get('refresh_token'),
+                                credentials_args.get('scopes'))
+
+
+def _is_newer_token(credentials_args, credentials):
+    """
+    True when credentials_args carry a different access token issued after the
+    cached one, i.e. the user re-authorised and the cached token is stale. An older
+    token (another session of the same grant) keeps the cached, fresher one.
+    """
+    token = credentials_args.get('token')
+    if not token or token == credentials.token:
+        return False
+    expiry = credentials_args.get('expiry')
+    return credentials.expiry is None or (expiry is not None and expiry > credentials.expiry)
+
+
+class GoogleClientManager:
+    """
+    Per-process home for Google API clients, shared by all request threads:
+
+    - a pool of keep-alive httplib2 transports, each used by one thread at a
+      time, so repeated exports reuse open TLS connections;
+    - Credentials and service objects cached by credential identity, so a
+      refreshed access token and the built API surface are reused;
+    - parsed discovery documents, read once from the bundled copies.
+    """
+
+    def __init__(self, pool_size, idle_seconds, timeout_seconds, cache_size):
+        self.pool_size = pool_size
+        self.idle_seconds = idle_seconds
+        self.timeout_seconds = timeout_seconds
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._idle_transports = []  # (last_used, httplib2.Http), most recently used last
+        self._credentials = OrderedDict()  # identity -> Credentials
+        self._services = OrderedDict()  # (identity, api, version) -> service
+        self._refresh_locks = {}  # identity -> Lock, so concurrent requests refresh once
+        self._discovery_documents = {}
+        self.discovery_load_ms = {}
+
+    # --- HTTP transports ---
+
+    def _close_idle_transports(self, now):
+        """Closes pooled transports idle for longer than idle_seconds. Caller holds the lock."""
+        cutoff = now - self.idle_seconds
+        stale = [http for last_used, http in self._idle_transports if last_used < cutoff]
+        if stale:
+            self._idle_transports = [(last_used, http) for last_used, http in self._idle_transports
+                                     if last_used >= cutoff]
+            for http in stale:
+                http.close()
+            logger.debug("Closed %s idle Google API transports.", len(stale),
+                         extra={'closed_count': len(stale)})
+
+    @contextmanager
+    def transport(self):
+        """Checks a keep-alive httplib2.Http out of the pool for the duration of the block."""
+        with self._lock:
+            self._close_idle_transports(time.monotonic())
+            http = self._idle_transports.pop()[1] if self._idle_transports else None
+        if http is None:
+            http = httplib2.Http(timeout=self.timeout_seconds)
+        try:
+            yield http
+        except Exception:
+            http.close()  # The connection may be half-used; don't hand it to the next request
+            raise
+        with self._lock:
+            if len(self._idle_transports) < self.pool_size:
+                self._idle_transports.append((time.monotonic(), http))
+                http = None
+        if http is not None:
+            http.close()
+
+    @contextmanager
+    def authorized_http(self, credentials):
+        """A pooled transport that signs requests with credentials; pass it to request.execute(http=...)."""
+        with self.transport() as http:
+            yield google_auth_httplib2.AuthorizedHttp(credentials, http=http)
+
+    # --- Credentials ---
+
+    def get_credentials(self, credentials_args):
+        """
+        Returns the cached Credentials for this grant, or builds them from
+        credentials_args (Credentials keyword arguments, as stored in the session).
+        Cached credentials are replaced when the session holds a newer access token
+        than they do, e.g. after a re-auth that kept the same refresh token.
+        """
+        identity = _args_identity(credentials_args)
+        with self._lock:
+            credentials = self._credentials.get(identity)
+            if credentials is not None:
+                if not _is_newer_token(credentials_args, credentials):
+                    self._credentials.move_to_end(identity)
+                    return credentials
+                self._forget_identity(identity)
+        credentials = Credentials(**credentials_args)
+        with self._lock:
+            # Another thread may have cached the same grant meanwhile; keep the first
+            credentials = self._credentials.setdefault(identity, credentials)
+            self._credentials.move_to_end(identity)
+            while len(self._credentials) > self.cache_size:
+                evicted, _ = self._credentials.popitem(last=False)
+                self._refresh_locks.pop(evicted, None)
+        return credentials
+
+    def refresh_credentials(self, credentials):
+        """
+        Refreshes expired credentials over a pooled transport. Concurrent callers
+        for the same grant wait for one refresh instead of each doing their own.
+        """
+        identity = credentials_identity(credentials.client_id, credentials.refresh_token, credentials.scopes)
+        with self._lock:
+            refresh_lock = self._refresh_locks.setdefault(identity, threading.Lock())
+        with refresh_lock:
+            if credentials.valid:
+                return credentials  # Refreshed by another request while we waited
+            with self.transport() as http:
+                credentials.refresh(google_auth_httplib2.Request(http))
+        return credentials
+
+    def forget_credentials(self, credentials_args):
+        """Drops a grant's cached credentials and services, e.g. after it was revoked."""
+        with self._lock:
+            self._forget_identity(_args_identity(credentials_args))
+
+    def _forget_identity(self, identity):
+        """Drops the credentials and services cached for identity. Caller holds the lock."""
+        self._credentials.pop(identity, None)
+        self._refresh_locks.pop(identity, None)
+        for key in [key for key in self._services if key[0] == identity]:
+            del self._services[key]
+
+    # --- Discovery documents and services ---
+
+    def get_discovery_document(self, api_name, api_version):
+        """
+        Returns a parsed discovery document, read once per process from
+        GOOGLE_DISCOVERY_DIR or the copies bundled with google-api-python-client.
+        """
+        key = f"{api_name}.{api_version}"
+        document = self._discovery_documents.get(key)
+        if document is None:
+            directory = getattr(settings, 'GOOGLE_DISCOVERY_DIR', None) or BUNDLED_DISCOVERY_DIR
+            path = os.path.join(directory, f"{key}.json")
+            started = time.perf_counter()
+            with open(path, 'r', encoding='utf-8') as discovery_file:
+                document = json.load(discovery_file)
+            load_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                document = self._discovery_documents.setdefault(key, document)
+                self.discovery_load_ms.setdefault(key, load_ms)
+            logger.info("Loaded %s discovery document from %s in %.1f ms.", key, path, load_ms,
+                        extra={'discovery_path': path, 'duration_ms': round(load_ms, 1)})
+        return document
+
+    def get_service(self, api_name, api_version, credentials):
+        """
+        Returns the cached API client for a grant, building it from the cached
+        discovery document (no HTTP request) the first time. Execute its requests
+        with http= from authorized_http(), since the service itself holds no transport.
+        """
+        key = (credentials_identity(credentials.client_id, credentials.refresh_token, credentials.scopes),
+               api_name, api_version)
+        with self._lock:
+            service = self._services.get(key)
+            if service is not None:
+                self._services.move_to_end(key)
+                return service
+        document = self.get_discovery_document(api_name, api_version)
+        # The placeholder transport is never used; requests run on pooled transports
+        service = build_from_document(
+            document, http=google_auth_httplib2.AuthorizedHttp(credentials, http=httplib2.Http()))
+        with self._lock:
+            service = self._services.setdefault(key, service)
+            self._services.move_to_end(key)
+            while len(self._services) > self.cache_size:
+                self._services.popitem(last=False)
+        return service
+
+    def close(self):
+        """Closes every pooled transport."""
+        with self._lock:
+            transports, self._idle_transports = self._idle_transports, []
+        for _, http in transports:
+            http.close()
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_google_client_manager():
+    """Returns the process-wide GoogleClientManager, configured from settings."""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = GoogleClientManager(
+                    pool_size=getattr(settings, 'GOOGLE_HTTP_POOL_SIZE',
+                                      DEFAULT_GOOGLE_HTTP_POOL_SIZE),
+                    idle_seconds=getattr(settings, 'GOOGLE_HTTP_IDLE_SECONDS',
+                                         DEFAULT_GOOGLE_HTTP_IDLE_SECONDS),
+                    timeout_seconds=getattr(settings, 'GOOGLE_HTTP_TIMEOUT_SECONDS',
+                                            DEFAULT_GOOGLE_HTTP_TIMEOUT_SECONDS),
+                    cache_size=getattr(settings, 'GOOGLE_CLIENT_CACHE_SIZE',
+                                       DEFAULT_GOOGLE_CLIENT_CACHE_SIZE),
+                )
+    return _manager
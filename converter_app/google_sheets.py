@@ -0,0 +1,111 @@
+import logging
+import time
+from datetime import date
+
+from .google_clients import get_google_client_manager
+from .metrics import API_ERRORS, SHEETS_UPLOAD_LATENCY
+from .timing import span
+from .transaction_table import TransactionTable
+from .transactions import parse_amount
+
+logger = logging.getLogger(__name__)
+
+TRANSACTIONS_SHEET_TITLE = 'Transactions'
+SHEET_COLUMNS = ['date', 'description', 'debit', 'credit', 'balance']
+SHEET_AMOUNT_COLUMNS = {'debit', 'credit', 'balance'}
+# Day zero of Google Sheets date serial numbers
+SHEETS_DATE_EPOCH = date(1899, 12, 30)
+# API round-trips the old create -> rename sheet -> write values sequence needed on top of create
+LEGACY_FOLLOW_UP_CALLS = 2
+
+
+def _text_cell(value):
+    """Returns the CellData for a value shown as plain text."""
+    if value is None or value == '':
+        return {}
+    # stringValue is never evaluated, so descriptions like "=SUM(...)" can't become formulas
+    return {'userEnteredValue': {'stringValue': str(value)}}
+
+
+def _date_cell(parsed_date):
+    return {
+        'userEnteredValue': {'numberValue': (parsed_date - SHEETS_DATE_EPOCH).days},
+        'userEnteredFormat': {'numberFormat': {'type': 'DATE', 'pattern': 'yyyy-mm-dd'}},
+    }
+
+
+def _cell_column(table, column):
+    """
+    Returns the CellData of every value in a column: real dates and numbers, everything
+    else as plain text. Repeated descriptions and dates share one (never mutated)
+    CellData dict instead of each allocating their own.
+    """
+    values = table.column(column)
+    if column == 'date':
+        cells_by_date = {}
+        return [_text_cell(value) if parsed_date is None
+                else cells_by_date.get(parsed_date) or cells_by_date.setdefault(parsed_date, _date_cell(parsed_date))
+                for value, parsed_date in zip(values, table.parsed_dates())]
+    if column in SHEET_AMOUNT_COLUMNS:
+        return [_text_cell(value) if amount is None else {'userEnteredValue': {'numberValue': float(amount)}}
+                for value, amount in zip(values, table.mapped(column, parse_amount))]
+    return table.mapped(column, _text_cell)
+
+
+def build_spreadsheet_body(title, extracted_data):
+    """
+    Returns (body, cell_count) for a spreadsheets.create request that creates the
+    spreadsheet with a "Transactions" sheet already holding the header and every row.
+    extracted_data is a TransactionTable or a list of transaction dicts.
+    """
+    table = extracted_data if isinstance(extracted_data, TransactionTable) else TransactionTable.from_rows(extracted_data)
+    cell_columns = [_cell_column(table, column) for column in SHEET_COLUMNS]
+    row_data = [{'values': [{'userEnteredValue': {'stringValue': column}} for column in SHEET_COLUMNS]}]
+    row_data.extend({'values': list(cells)} for cells in zip(*cell_columns))
+    body = {
+        'properties': {'title': title},
+        'sheets': [{
+            'properties': {
+                'title': TRANSACTIONS_SHEET_TITLE,
+                'gridProperties': {'frozenRowCount': 1},
+            },
+            'data': [{'startRow': 0, 'startColumn': 0, 'rowData': row_data}],
+        }],
+    }
+    return body, len(row_data) * len(SHEET_COLUMNS)
+
+
+def create_statement_spreadsheet(credentials, title, extracted_data, request_id='N/A'):
+    """
+    Creates a Google Sheet holding a statement's transactions in a single API
+    request, over a pooled keep-alive connection. Returns (spreadsheet_id,
+    spreadsheet_url, cell_count).
+    """
+    manager = get_google_client_manager()
+    service = manager.get_service('sheets', 'v4', credentials)
+    with span('sheets_build'):
+        body, cell_count = build_spreadsheet_body(title, extracted_data)
+
+    with manager.authorized_http(credentials) as http, span('sheets_api'), \
+            SHEETS_UPLOAD_LATENCY.time(outcome='error') as labels:
+        started = time.perf_counter()
+        try:
+            spreadsheet = service.spreadsheets().create(
+                body=body, fields='spreadsheetId,spreadsheetUrl').execute(http=http)
+        except Exception:
+            API_ERRORS.inc(api='sheets')
+            raise
+        create_ms = (time.perf_counter() - started) * 1000
+        labels['outcome'] = 'success'
+
+    # Each skipped follow-up call would have cost about one more round-trip like this one
+    saved_ms = LEGACY_FOLLOW_UP_CALLS * create_ms
+    discovery_load_ms = manager.discovery_load_ms.get('sheets.v4', 0.0)
+    logger.info("Created Google Sheet '%s' with %s cells in one request (%.0f ms). "
+                "Skipped %s follow-up API calls (~%.0f ms saved, estimated) "
+                "and reused the cached discovery document (loaded once in %.1f ms).",
+                title, cell_count, create_ms, LEGACY_FOLLOW_UP_CALLS, saved_ms, discovery_load_ms,
+                extra={'request_id': request_id, 'spreadsheet_id': spreadsheet.get('spreadsheetId'),
+                       'cell_count': cell_count, 'create_ms': round(create_ms, 1),
+                       'estimated_saved_ms': round(saved_ms, 1), 'discovery_load_ms': round(discovery_load_ms, 1)})
+    return spreadsheet.get('spreadsheetId'), spreadsheet.get('spreadsheetUrl'), cell_count
@@ -0,0 +1,334 @@
+import io
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.uploadedfile import InMemoryUploadedFile, TemporaryUploadedFile
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+from .artifacts import render_artifacts
+from .metrics import EXTRACTION_LATENCY, EXTRACTIONS_IN_FLIGHT
+from .models import ExportArtifact, ExtractionJob
+from .pipeline import run_extraction
+from .retention import (AUTO_PURGE_MAX_BATCHES, DEFAULT_PURGE_INTERVAL_SECONDS, get_retention_cutoff,
+                        purge_expired_statements)
+from .timing import finish_timer, start_timer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EXTRACTION_WORKERS = 4
+DEFAULT_BATCH_WORKERS = 3
+DEFAULT_JOB_TIMEOUT_SECONDS = 10 * 60  # A running job not updated for this long is reported as failed
+# A job still pending this long after it was created is reported as failed: the process that queued
+# it on its in-memory pool was most likely recycled or frozen before a worker picked it up
+DEFAULT_JOB_PENDING_TIMEOUT_SECONDS = 15 * 60
+DEFAULT_PROGRESS_INTERVAL_SECONDS = 0.5  # Minimum gap between progress writes to a job row
+
+_executor = None
+_batch_executor = None
+_executor_lock = threading.Lock()
+_last_purge_started = None  # time.monotonic() of this process's last automatic purge
+_purge_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Returns the process-wide worker pool. Extraction is dominated by waiting on
+    the Gemini API, so threads are enough and no external broker is needed.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                max_workers = getattr(
+                    settings, 'EXTRACTION_WORKER_COUNT', DEFAULT_EXTRACTION_WORKERS)
+                _executor = ThreadPoolExecutor(
+                    max_workers=max_workers, thread_name_prefix='extraction-worker')
+                logger.info("Started extraction worker pool with %s workers.", max_workers,
+                            extra={'max_workers': max_workers})
+    return _executor
+
+
+def get_batch_executor():
+    """
+    Returns the process-wide pool for batch uploads. It's separate from the main
+    pool and bounded by EXTRACTION_BATCH_WORKER_COUNT, so a batch of dozens of
+    statements queues behind itself instead of starving single uploads.
+    """
+    global _batch_executor
+    if _batch_executor is None:
+        with _executor_lock:
+            if _batch_executor is None:
+                max_workers = getattr(
+                    settings, 'EXTRACTION_BATCH_WORKER_COUNT', DEFAULT_BATCH_WORKERS)
+                _batch_executor = ThreadPoolExecutor(
+                    max_workers=max_workers, thread_name_prefix='batch-extraction-worker')
+                logger.info("Started batch extraction worker pool with %s workers.", max_workers,
+                            extra={'max_workers': max_workers})
+    return _batch_executor
+
+
+def stage_upload(pdf_file, request_id='N/A'):
+    """
+    Takes ownership of an uploaded PDF so it outlives the request, since Django
+    closes and removes its upload files once the response is sent. Returns
+    what the job extracts from: the upload's own BytesIO for files Django kept
+    in memory (no copy, nothing written to disk), otherwise a path. The job
+    disposes of it when done.
+    """
+    if isinstance(pdf_file, InMemoryUploadedFile) and isinstance(pdf_file.file, io.BytesIO):
+        buffer = pdf_file.file
+        pdf_file.file = io.BytesIO()  # Django closes this placeholder at the end of the request
+        buffer.seek(0)
+        logger.debug("Staged %s in memory (%s bytes).", pdf_file.name, pdf_file.size,
+                     extra={'request_id': request_id, 'staging': 'memory'})
+        return buffer
+
+    if isinstance(pdf_file, TemporaryUploadedFile):
+        upload_path = pdf_file.temporary_file_path()
+        staged_path = os.path.join(os.path.dirname(upload_path), f"statement-{uuid.uuid4().hex}.pdf")
+        try:
+            # A second name for Django's temp file: its own cleanup only removes the original name
+            os.link(upload_path, staged_path)
+            logger.debug("Staged %s by linking the upload temp file.", pdf_file.name,
+                         extra={'request_id': request_id, 'staging': 'link'})
+            return staged_path
+        except OSError as link_error:
+            logger.debug("Could not link upload temp file, copying it instead: %s", link_error,
+                         extra={'request_id': request_id})
+
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
+        for chunk in pdf_file.chunks():
+            tmp_file.write(chunk)
+    logger.debug("Staged %s by copying it to %s.", pdf_file.name, tmp_file.name,
+                 extra={'request_id': request_id, 'staging': 'copy'})
+    return tmp_file.name
+
+
+def discard_staged_upload(file_source, request_id='N/A'):
+    """Releases what stage_upload() returned: closes an in-memory buffer or removes a staged file."""
+    if not isinstance(file_source, str):
+        file_source.close()
+    elif os.path.exists(file_source):
+        logger.debug("Removing staged upload: %s", file_source,
+                     extra={'request_id': request_id, 'temp_file_path': file_source})
+        os.remove(file_source)
+
+
+class JobProgress:
+    """
+    on_row callback that records a job's streaming progress (rows parsed, the
+    latest row's date) on its ExtractionJob row, at most once per interval.
+    Safe to call from the chunk threads of a chunked extraction.
+    """
+
+    def __init__(self, job_id, interval_seconds):
+        self.job_id = job_id
+        self.interval_seconds = interval_seconds
+        self.rows_parsed = 0
+        self.progress_date = ''
+        self._lock = threading.Lock()
+        self._last_saved = 0.0
+        self._owner_thread = threading.get_ident()
+
+    def __call__(self, row):
+        with self._lock:
+            self.rows_parsed += 1
+            if isinstance(row, dict) and row.get('date'):
+                self.progress_date = str(row['date'])[:32]
+            now = time.monotonic()
+            if now - self._last_saved < self.interval_seconds:
+                return
+            self._last_saved = now
+            rows_parsed, progress_date = self.rows_parsed, self.progress_date
+        ExtractionJob.objects.filter(id=self.job_id).update(
+            rows_parsed=rows_parsed, progress_date=progress_date, updated_at=timezone.now())
+        if threading.get_ident() != self._owner_thread:
+            # Chunk pool threads outlive the job; don't leave a connection open in them
+            connection.close()
+
+
+# Written when a job finishes
+JOB_RESULT_FIELDS = ('status', 'message', 'results_ready', 'statement_id', 'date_range_string',
+                     'transaction_count', 'rows_parsed', 'progress_date')
+
+
+def _run_job(job_id, file_source, cache_key, request_id):
+    """Worker entry point: runs the extraction pipeline and records the outcome on the job row."""
+    close_old_connections()
+    timer = start_timer(request_id, f"extraction job {job_id}")
+    job_status = ExtractionJob.STATUS_FAILED
+    try:
+        # Claim the job: one that was failed while it waited in the queue isn't run after all
+        claimed = ExtractionJob.objects.filter(id=job_id, status=ExtractionJob.STATUS_PENDING).update(
+            status=ExtractionJob.STATUS_RUNNING, updated_at=timezone.now())
+        if not claimed:
+            logger.warning("Extraction job %s is no longer pending; not running it.", job_id,
+                           extra={'request_id': request_id, 'job_id': str(job_id)})
+            return
+        job = ExtractionJob.objects.get(id=job_id)
+        logger.info("Extraction job %s started.", job_id, extra={
+                    'request_id': request_id, 'job_id': str(job_id)})
+
+        progress = JobProgress(job_id, getattr(settings, 'EXTRACTION_PROGRESS_INTERVAL_SECONDS',
+                                               DEFAULT_PROGRESS_INTERVAL_SECONDS))
+        with EXTRACTIONS_IN_FLIGHT.track_inprogress(), EXTRACTION_LATENCY.time(outcome='error') as labels:
+            result = run_extraction(
+                file_source, job.pdf_filename, cache_key=cache_key, request_id=request_id, on_row=progress)
+            labels['outcome'] = result['status']
+
+        job.status = (ExtractionJob.STATUS_SUCCEEDED if result['status'] == 'success'
+                      else ExtractionJob.STATUS_FAILED)
+        job.message = result['message']
+        job.results_ready = result['results_ready']
+        job.statement_id = result['statement_data_id']
+        job.date_range_string = result['date_range_string']
+        job.transaction_count = result['transaction_count']
+        job.rows_parsed = result['transaction_count'] or progress.rows_parsed
+        job.progress_date = progress.progress_date
+        # Only while still running: a job already reported as timed out keeps that outcome
+        finished = ExtractionJob.objects.filter(id=job_id, status=ExtractionJob.STATUS_RUNNING).update(
+            **{field: getattr(job, field) for field in JOB_RESULT_FIELDS}, updated_at=timezone.now())
+        if not finished:
+            logger.warning("Extraction job %s was marked failed while running; discarding its result.", job_id,
+                           extra={'request_id': request_id, 'job_id': str(job_id)})
+            return
+        job_status = job.status
+        logger.info("Extraction job %s finished with status '%s'.", job_id, job.status,
+                    extra={'request_id': request_id, 'job_id': str(job_id), 'job_status': job.status})
+        if job.results_ready:
+            schedule_artifact_render(job.statement_id, request_id=request_id)
+        maybe_schedule_purge(request_id=request_id)
+    except Exception as e:
+        logger.exception("Extraction job %s crashed.", job_id, extra={
+                         'request_id': request_id, 'job_id': str(job_id)})
+        ExtractionJob.objects.filter(id=job_id).update(
+            status=ExtractionJob.STATUS_FAILED,
+            message=f"An error occurred during processing: {str(e)}",
+            updated_at=timezone.now())
+    finally:
+        if file_source is not None:
+            discard_staged_upload(file_source, request_id)
+        finish_timer(timer)
+        if timer is not None:
+            timer.log(job_id=str(job_id), job_status=job_status)
+        # Worker threads don't go through the request cycle, so clean up connections here
+        close_old_connections()
+
+
+def _render_artifacts_task(statement_data_id, request_id):
+    """Worker entry point: pre-renders the download formats of a statement."""
+    close_old_connections()
+    timer = start_timer(request_id, f"artifact render for statement {statement_data_id}")
+    try:
+        render_artifacts(statement_data_id, request_id=request_id)
+    finally:
+        finish_timer(timer)
+        if timer is not None:
+            timer.log(record_id=statement_data_id)
+        close_old_connections()
+
+
+def schedule_artifact_render(statement_data_id, request_id='N/A', only_if_missing=False):
+    """
+    Queues pre-rendering of a statement's CSV/XLSX/JSON downloads, if enabled.
+    With only_if_missing, nothing is queued when any format is already stored
+    (the missing one was evicted or is too large to store).
+    """
+    if not getattr(settings, 'ARTIFACTS_ENABLED', True):
+        return
+    if only_if_missing and ExportArtifact.objects.filter(statement_id=statement_data_id).exists():
+        return
+    get_executor().submit(_render_artifacts_task, statement_data_id, request_id)
+
+
+def _purge_task(request_id):
+    """Worker entry point: deletes a bounded number of expired statements."""
+    close_old_connections()
+    try:
+        purge_expired_statements(max_batches=AUTO_PURGE_MAX_BATCHES, request_id=request_id)
+    except Exception:
+        logger.exception("Purging expired statements failed.", extra={'request_id': request_id})
+    finally:
+        close_old_connections()
+
+
+def maybe_schedule_purge(request_id='N/A'):
+    """
+    Queues a purge of expired statements on the worker pool, at most once per
+    STATEMENT_PURGE_INTERVAL_SECONDS in this process, so retention needs no
+    separate scheduler.
+    """
+    global _last_purge_started
+    interval = getattr(settings, 'STATEMENT_PURGE_INTERVAL_SECONDS', DEFAULT_PURGE_INTERVAL_SECONDS)
+    if not interval or get_retention_cutoff() is None:
+        return
+    now = time.monotonic()
+    with _purge_lock:
+        if _last_purge_started is not None and now - _last_purge_started < interval:
+            return
+        _last_purge_started = now
+    get_executor().submit(_purge_task, request_id)
+
+
+def queue_staged_job(job, file_source, cache_key=None, request_id='N/A', executor=None):
+    """
+    Queues a pending job for a PDF already staged by stage_upload() (a path or
+    an in-memory buffer), on the main worker pool unless another executor is
+    given. The job owns the staged upload from here.
+    """
+    try:
+        (executor or get_executor()).submit(
+            _run_job, job.id, file_source, cache_key, request_id)
+    except Exception:
+        discard_staged_upload(file_source, request_id)
+        job.delete()
+        raise
+    logger.info("Queued extraction job %s for %s.", job.id, job.pdf_filename,
+                extra={'request_id': request_id, 'job_id': str(job.id), 'pdf_filename': job.pdf_filename})
+    return job
+
+
+def submit_extraction_job(pdf_file, cache_key=None, request_id='N/A'):
+    """Creates a pending ExtractionJob for an uploaded PDF and queues it on the worker pool."""
+    file_source = stage_upload(pdf_file, request_id)
+    job = ExtractionJob.objects.create(pdf_filename=pdf_file.name)
+    return queue_staged_job(job, file_source, cache_key=cache_key, request_id=request_id)
+
+
+def _fail_timed_out_job(job):
+    ExtractionJob.objects.filter(id=job.id, status=job.status).update(
+        status=ExtractionJob.STATUS_FAILED,
+        message="Processing timed out. Please try uploading the PDF again.",
+        updated_at=timezone.now())
+    job.refresh_from_db()
+
+
+def get_job_state(job):
+    """
+    Returns the job's status, reporting running jobs that have stopped making
+    progress (e.g. the worker process was recycled mid-extraction) as failed.
+    Pending jobs are given longer, since they may be queued behind other work on
+    the pool, and fail once EXTRACTION_JOB_PENDING_TIMEOUT_SECONDS have passed
+    since they were created. Batch jobs are timed out by get_batch_jobs() instead.
+    A job failed here is never run later: _run_job only claims pending jobs.
+    """
+    now = timezone.now()
+    if job.status == ExtractionJob.STATUS_RUNNING:
+        timeout = getattr(settings, 'EXTRACTION_JOB_TIMEOUT_SECONDS',
+                          DEFAULT_JOB_TIMEOUT_SECONDS)
+        if job.updated_at < now - timedelta(seconds=timeout):
+            _fail_timed_out_job(job)
+    elif job.status == ExtractionJob.STATUS_PENDING and job.batch_id is None:
+        timeout = getattr(settings, 'EXTRACTION_JOB_PENDING_TIMEOUT_SECONDS',
+                          DEFAULT_JOB_PENDING_TIMEOUT_SECONDS)
+        if job.created_at < now - timedelta(seconds=timeout):
+            _fail_timed_out_job(job)
+    return job.status
@@ -0,0 +1,82 @@
+import json
+
+
+class JSONArrayStreamParser:
+    """
+    Incremental parser for a JSON array of objects arriving in arbitrary text
+    pieces, as a streamed model response does. feed() returns the objects
+    completed by each piece, so rows can be reported before the array ends.
+
+    Text before the opening '[' (e.g. a ```json fence) is skipped. Only the
+    scanning state is kept between pieces; consumed text is dropped.
+    """
+
+    def __init__(self):
+        self._buffer = ''
+        self._position = 0  # Next unscanned index in _buffer
+        self._object_start = None  # Index in _buffer where the current top-level object began
+        self._depth = 0  # Nesting depth; 1 means directly inside the top-level array
+        self._in_string = False
+        self._escaped = False
+        self.started = False  # The opening '[' has been seen
+        self.finished = False  # The closing ']' has been seen
+        self.object_count = 0
+
+    def feed(self, text):
+        """Consumes the next piece of the response and returns the objects it completed."""
+        if self.finished or not text:
+            return []
+        self._buffer += text
+        completed = []
+        buffer = self._buffer
+        position = self._position
+        length = len(buffer)
+
+        while position < length:
+            char = buffer[position]
+            if not self.started:
+                if char == '[':
+                    self.started = True
+                    self._depth = 1
+                elif char == '{':
+                    # A lone object (e.g. an {"error": ...} payload) isn't a transaction list
+                    self.finished = True
+                    break
+                position += 1
+                continue
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                if self._depth == 1 and char == '{':
+                    self._object_start = position
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._depth == 1 and char == '}' and self._object_start is not None:
+                    try:
+                        completed.append(json.loads(buffer[self._object_start:position + 1]))
+                        self.object_count += 1
+                    except ValueError:
+                        pass  # Left for the full parse of the response to report
+                    self._object_start = None
+                elif self._depth == 0:
+                    self.finished = True
+                    position += 1
+                    break
+            position += 1
+
+        # Keep only the unfinished object, if any; everything before it is done with
+        keep_from = self._object_start if self._object_start is not None else position
+        self._buffer = buffer[keep_from:]
+        self._position = position - keep_from
+        if self._object_start is not None:
+            self._object_start = 0
+        return completed
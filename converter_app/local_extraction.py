@@ -0,0 +1,291 @@
+import logging
+import math
+import re
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # The local engine is unavailable without pypdf; Gemini handles everything
+    PdfReader = None
+
+from .dates import DATE_FORMATS, normalize_dates, parse_date_as
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable from settings.py
+DEFAULT_LOCAL_EXTRACTION_MAX_PAGES = 50  # Longer PDFs go straight to Gemini
+MIN_LOCAL_ROWS = 2  # Fewer rows leave nothing to reconcile
+BALANCE_TOLERANCE = Decimal('0.01')
+# Fragments whose baselines differ by less than this share a line, in font sizes
+LINE_TOLERANCE_RATIO = 0.4
+# Rough glyph width used to estimate where a fragment ends, in font sizes
+AVERAGE_CHAR_WIDTH_RATIO = 0.5
+
+# Header words that identify each column. Longer phrases are checked first.
+HEADER_KEYWORDS = {
+    'date': ('transaction date', 'posting date', 'post date', 'trans date', 'date'),
+    'description': ('description', 'transaction details', 'details', 'particulars',
+                    'narrative', 'transaction', 'memo', 'payee'),
+    'debit': ('withdrawals', 'withdrawal', 'paid out', 'money out', 'debits', 'debit', 'dr'),
+    'credit': ('deposits', 'deposit', 'paid in', 'money in', 'credits', 'credit', 'cr'),
+    'balance': ('balance',),
+}
+AMOUNT_COLUMNS = ('debit', 'credit', 'balance')
+# Balance-only lines that restate a balance rather than record a transaction
+_BALANCE_LINE_PATTERN = re.compile(
+    r'\b(?:opening|closing)\s+balance\b|\b(?:brought|carried)\s+f(?:or)?w(?:ar)?d\b|\bbalance\s+[bc]/?f\b',
+    re.IGNORECASE)
+
+# 1,234.56 / 1234.56 / -1,234.56 / (1,234.56) / $1,234.56 / 1,234.56 CR / 1,234.56-
+_AMOUNT_PATTERN = re.compile(
+    r'(?P<open>\()?(?P<sign>[-+])?[$£€]?\s?(?P<number>\d{1,3}(?:,\d{3})+|\d+)\.(?P<cents>\d{2})'
+    r'(?P<close>\))?(?P<trailing>-)?(?:\s?(?P<suffix>CR|DR|OD))?', re.IGNORECASE)
+
+
+class _Fragment:
+    """One run of text drawn by the PDF, with its position on the page in points."""
+    __slots__ = ('text', 'x', 'y', 'size')
+
+    def __init__(self, text, x, y, size):
+        self.text = text
+        self.x = x
+        self.y = y
+        self.size = size
+
+    @property
+    def right(self):
+        return self.x + len(self.text) * self.size * AVERAGE_CHAR_WIDTH_RATIO
+
+    @property
+    def center(self):
+        return (self.x + self.right) / 2
+
+    def distance_to(self, other):
+        """Horizontal distance between two fragments, whether their column is left, center or right aligned."""
+        return min(abs(self.x - other.x), abs(self.center - other.center), abs(self.right - other.right))
+
+
+def parse_money(text):
+    """Parses a statement amount like '1,234.50', '(12.00)' or '99.10 DR' to a Decimal, or None."""
+    match = _AMOUNT_PATTERN.fullmatch(text.strip())
+    if match is None:
+        return None
+    try:
+        amount = Decimal(f"{match.group('number').replace(',', '')}.{match.group('cents')}")
+    except InvalidOperation:
+        return None
+    negative = (match.group('sign') == '-' or match.group('trailing') is not None
+                or (match.group('open') is not None and match.group('close') is not None)
+                or (match.group('suffix') or '').upper() in ('DR', 'OD'))
+    return -amount if negative else amount
+
+
+def _page_fragments(page):
+    """Returns the page's non-blank text runs with their positions, via pypdf's text visitor."""
+    fragments = []
+
+    def visit(text, cm, tm, font_dict, font_size):
+        if not text or not text.strip():
+            return
+        # Text space -> user space: the text matrix's origin through the current transformation matrix
+        x = tm[4] * cm[0] + tm[5] * cm[2] + cm[4]
+        y = tm[4] * cm[1] + tm[5] * cm[3] + cm[5]
+        size = (font_size or 10) * math.hypot(tm[0], tm[1]) * math.hypot(cm[0], cm[1]) or 10
+        for part in text.split('\n'):
+            if part.strip():
+                fragments.append(_Fragment(part.strip(), x, y, size))
+
+    page.extract_text(visitor_text=visit)
+    return fragments
+
+
+def _group_lines(fragments):
+    """Groups fragments into lines, top of the page first, each sorted left to right."""
+    lines = []
+    for fragment in sorted(fragments, key=lambda f: (-f.y, f.x)):
+        if lines and abs(lines[-1][0].y - fragment.y) <= fragment.size * LINE_TOLERANCE_RATIO:
+            lines[-1].append(fragment)
+        else:
+            lines.append([fragment])
+    return [sorted(line, key=lambda f: f.x) for line in lines]
+
+
+def _match_header(line):
+    """Returns {column: header fragment} if the line is a transaction table header, else None."""
+    columns = {}
+    for fragment in line:
+        label = ' '.join(fragment.text.lower().replace('(', ' ').replace(')', ' ').split())
+        for column, keywords in HEADER_KEYWORDS.items():
+            if column not in columns and any(
+                    label == keyword or label.startswith(keyword + ' ') for keyword in keywords):
+                columns[column] = fragment
+                break
+    if {'date', 'debit', 'credit', 'balance'} <= columns.keys():
+        return columns
+    return None
+
+
+def _parse_date_text(text):
+    """Returns the date text if it reads as a date in any supported format, else None."""
+    for candidate in (text, '-'.join(text.split())):
+        if any(parse_date_as(candidate, format_name) for format_name in DATE_FORMATS):
+            return candidate
+    return None
+
+
+def _parse_line(line, columns):
+    """
+    Splits one table line into (date_text, description, {column: Decimal}).
+    Returns None if the line can't be read unambiguously.
+    """
+    description_header = columns.get('description')
+    date_parts, description_parts, amounts = [], [], {}
+    for fragment in line:
+        amount = parse_money(fragment.text)
+        if amount is not None and fragment.x > columns['date'].right:
+            column = min(AMOUNT_COLUMNS, key=lambda c: fragment.distance_to(columns[c]))
+            if column in amounts:
+                return None
+            # Debit and credit columns hold magnitudes, however the bank prints them
+            amounts[column] = abs(amount) if column != 'balance' else amount
+        elif description_header is None or fragment.x < description_header.x - fragment.size:
+            date_parts.append(fragment.text)
+        else:
+            description_parts.append(fragment.text)
+    date_text = _parse_date_text(' '.join(date_parts)) if date_parts else None
+    if date_parts and date_text is None:
+        if {'debit', 'credit'} & amounts.keys():
+            return None  # A transaction whose date isn't in a format we know
+        description_parts = date_parts + description_parts
+    return date_text, ' '.join(description_parts), amounts
+
+
+def _collect_rows(reader, max_pages):
+    """
+    Returns the candidate rows of every transaction table in the PDF as dicts with
+    Decimal amounts. A page without its own table header continues the table of
+    the page before it.
+    """
+    rows = []
+    columns = None
+    for page in reader.pages[:max_pages]:
+        previous_line_y = None
+        in_table = False  # Whether this page's table has started, so a line may continue a row
+        for line in _group_lines(_page_fragments(page)):
+            header = _match_header(line)
+            if header is not None:
+                columns = header
+                previous_line_y = line[0].y
+                in_table = True
+                continue
+            if columns is None:
+                continue  # Account details and other text above the table
+            parsed = _parse_line(line, columns)
+            if parsed is None:
+                return None
+            date_text, description, amounts = parsed
+            line_gap = (previous_line_y - line[0].y) if previous_line_y is not None else None
+            previous_line_y = line[0].y
+            if date_text is None and not ({'debit', 'credit'} & amounts.keys()):
+                # A wrapped description continues the row above when it follows right under it
+                if (rows and in_table and description and not amounts and line_gap is not None
+                        and line_gap <= line[0].size * 2.5):
+                    rows[-1]['description'] = f"{rows[-1]['description']} {description}".strip()
+                continue
+            if not ({'debit', 'credit'} & amounts.keys()) and _BALANCE_LINE_PATTERN.search(description):
+                continue  # "Opening balance", "Brought forward" and the like aren't transactions
+            if date_text is None:
+                if not rows:
+                    continue
+                date_text = rows[-1]['date']  # Later rows of a day often leave the date blank
+            in_table = True
+            rows.append({
+                'date': date_text,
+                'description': description,
+                'debit': amounts.get('debit'),
+                'credit': amounts.get('credit'),
+                'balance': amounts.get('balance'),
+            })
+    return rows
+
+
+def _reconciles(rows):
+    """True if every row's balance follows from the previous balance and the row's amounts."""
+    for previous, row in zip(rows, rows[1:]):
+        expected = previous['balance'] - (row['debit'] or 0) + (row['credit'] or 0)
+        if abs(expected - row['balance']) > BALANCE_TOLERANCE:
+            return False
+    return True
+
+
+def _check_rows(rows):
+    """Returns the reason the rows can't be trusted, or None if they're safe to use."""
+    if rows is None:
+        return "two amounts fell into one column"
+    if len(rows) < MIN_LOCAL_ROWS:
+        return f"found {len(rows)} table rows"
+    if any(row['balance'] is None for row in rows):
+        return "a row has no running balance"
+    if any(row['debit'] is not None and row['credit'] is not None for row in rows):
+        return "a row has both a debit and a credit"
+    # Both orders are accepted: some banks list the newest transaction first
+    if not _reconciles(rows) and not _reconciles(rows[::-1]):
+        return "running balances don't reconcile"
+    return None
+
+
+def extract_text_layer(file_source, request_id='N/A'):
+    """
+    Extracts transactions from a digitally generated PDF's text layer, without
+    calling any API. Finds the statement's table header, reads each row's
+    date, description and amounts from their positions, and returns rows
+    shaped like the Gemini output (ISO dates, float amounts). Returns None
+    whenever the result can't be trusted, most importantly when the running
+    balances don't reconcile, so the caller falls back to Gemini.
+    """
+    if PdfReader is None:
+        return None
+    started = time.perf_counter()
+    try:
+        reader = PdfReader(file_source)
+        if reader.is_encrypted:
+            return None
+        page_count = len(reader.pages)
+        max_pages = getattr(settings, 'LOCAL_EXTRACTION_MAX_PAGES', DEFAULT_LOCAL_EXTRACTION_MAX_PAGES)
+        if page_count > max_pages:
+            reason, rows = f"{page_count} pages is over the {max_pages} page limit", None
+        else:
+            rows = _collect_rows(reader, max_pages)
+            reason = _check_rows(rows)
+        if reason is None:
+            parsed_dates = normalize_dates(row['date'] for row in rows)
+            if any(parsed is None for parsed in parsed_dates):
+                reason = "a row's date couldn't be read"
+    except Exception as e:
+        # Malformed PDFs are common; whatever the local engine can't handle, Gemini gets
+        reason, rows = f"text layer could not be read ({e})", None
+    finally:
+        if not isinstance(file_source, str):
+            file_source.seek(0)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    if reason is not None:
+        logger.info("Local text-layer extraction not used: %s (%.0f ms).", reason, elapsed_ms,
+                    extra={'request_id': request_id, 'local_extraction': 'fallback',
+                           'fallback_reason': reason, 'duration_ms': round(elapsed_ms, 1)})
+        return None
+
+    logger.info("Extracted %s transactions from the PDF text layer in %.0f ms; "
+                "balances reconcile, skipping Gemini.", len(rows), elapsed_ms,
+                extra={'request_id': request_id, 'local_extraction': 'used',
+                       'transaction_count': len(rows), 'duration_ms': round(elapsed_ms, 1)})
+    return [{
+        'date': parsed_date.isoformat(),
+        'description': row['description'],
+        'debit': float(row['debit']) if row['debit'] is not None else None,
+        'credit': float(row['credit']) if row['credit'] is not None else None,
+        'balance': float(row['balance']),
+    } for row, parsed_date in zip(rows, parsed_dates)]
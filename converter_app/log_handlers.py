@@ -0,0 +1,112 @@
+import atexit
+import copy
+import logging
+import logging.config
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+
+from django.conf import settings
+
+# Defaults, overridable from settings.py
+DEFAULT_LOG_QUEUE_MAX_SIZE = 10000  # Records waiting for the listener thread; further records are dropped
+
+_listeners = []
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Hands records to a QueueListener thread, which does the formatting and I/O.
+    Never blocks the caller: when the queue is full the record is dropped and
+    counted, and the count is logged once there is room again.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0  # Since the last drop notice
+        self.dropped_total = 0
+
+    def prepare(self, record):
+        # Only the message is rendered here, as its args may change once the call returns.
+        # JSON/console formatting, tracebacks included, happens on the listener thread.
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            notice = logging.LogRecord(
+                __name__, logging.WARNING, __file__, 0,
+                f"Dropped {dropped} log records: the log queue was full.", None, None)
+            notice.request_id = 'N/A'
+            try:
+                self.queue.put_nowait(notice)
+            except queue.Full:
+                self.dropped += dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            self.dropped_total += 1
+
+
+class DebugSamplingFilter(logging.Filter):
+    """Keeps only a random fraction of DEBUG records; other levels always pass."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+
+def _stop_listeners():
+    while _listeners:
+        _listeners.pop().stop()  # Drains the queue, so nothing logged before exit is lost
+
+
+def configure_logging(logging_settings):
+    """
+    LOGGING_CONFIG entry point. Applies LOGGING with dictConfig and then, when
+    LOG_QUEUE_ENABLED is on, moves the file handlers of each configured logger
+    behind a queue served by one background listener thread, so requests never
+    wait on log formatting or file I/O. Console handlers stay synchronous: they
+    are what production (and its error reporting) relies on, and a record queued
+    there could be lost if the process dies. Loggers that share the same file
+    handlers share one queue. DEBUG records are sampled at LOG_DEBUG_SAMPLE_RATE.
+    """
+    _stop_listeners()  # Reconfiguring replaces the previous listeners
+    logging.config.dictConfig(logging_settings)
+
+    queue_enabled = getattr(settings, 'LOG_QUEUE_ENABLED', True)
+    sample_rate = getattr(settings, 'LOG_DEBUG_SAMPLE_RATE', 1.0)
+    max_size = getattr(settings, 'LOG_QUEUE_MAX_SIZE', DEFAULT_LOG_QUEUE_MAX_SIZE)
+    queue_handlers = {}  # tuple of target handlers -> their queue handler
+    sampled = set()
+    for logger_name in logging_settings.get('loggers', {}):
+        logger = logging.getLogger(logger_name)
+        if not logger.handlers:
+            continue
+        handlers = list(logger.handlers)
+        targets = tuple(handler for handler in handlers if isinstance(handler, logging.FileHandler))
+        if queue_enabled and targets:
+            if targets not in queue_handlers:
+                queue_handler = NonBlockingQueueHandler(queue.Queue(max_size))
+                listener = QueueListener(queue_handler.queue, *targets, respect_handler_level=True)
+                listener.start()
+                _listeners.append(listener)
+                queue_handlers[targets] = queue_handler
+            handlers = [handler for handler in handlers if handler not in targets] + [queue_handlers[targets]]
+            logger.handlers = handlers
+        if sample_rate < 1:
+            for handler in handlers:
+                if handler not in sampled:
+                    handler.addFilter(DebugSamplingFilter(sample_rate))
+                    sampled.add(handler)
+
+
+atexit.register(_stop_listeners)
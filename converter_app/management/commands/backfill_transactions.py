@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from converter_app.models import StatementData, Transaction
+from converter_app.transactions import DEFAULT_TRANSACTION_BATCH_SIZE, replace_transactions, store_transactions
+
+
+class Command(BaseCommand):
+    help = (
+        "Populates the Transaction table from StatementData.extracted_data for records "
+        "uploaded before it existed. Safe to re-run: records that already have "
+        "transactions are skipped (unless --rebuild is given)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=100,
+            help="Number of StatementData records loaded per query (default: 100).")
+        parser.add_argument(
+            '--batch-size', type=int, default=DEFAULT_TRANSACTION_BATCH_SIZE,
+            help=f"Transaction rows per INSERT (default: {DEFAULT_TRANSACTION_BATCH_SIZE}).")
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help="Rebuild the rows of every record, including those that already have transactions "
+                 "(e.g. rows stored with rounded amounts before amounts were parsed strictly).")
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        batch_size = options['batch_size']
+        rebuild = options['rebuild']
+        last_id = 0
+        records_done = 0
+        rows_written = 0
+
+        while True:
+            # Keyset pagination on id keeps every chunk query cheap, however far in we are
+            id_chunk = list(
+                StatementData.objects
+                .filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', flat=True)[:chunk_size]
+            )
+            if not id_chunk:
+                break
+            last_id = id_chunk[-1]
+
+            already_done = set() if rebuild else set(
+                Transaction.objects.filter(statement_id__in=id_chunk)
+                .values_list('statement_id', flat=True).distinct()
+            )
+            pending_ids = [pk for pk in id_chunk if pk not in already_done]
+            # Load the JSON blobs for this chunk only
+            for statement_record in StatementData.objects.filter(id__in=pending_ids).only('id', 'extracted_json', 'extracted_packed'):
+                # One transaction per record, so an interrupted run leaves no partial statements
+                if rebuild:
+                    rows_written += replace_transactions(
+                        statement_record, statement_record.extracted_data, batch_size=batch_size)
+                else:
+                    with transaction.atomic():
+                        rows_written += store_transactions(
+                            statement_record, statement_record.extracted_data, batch_size=batch_size)
+                records_done += 1
+
+            self.stdout.write(
+                f"Processed up to record ID {last_id}: {records_done} records backfilled, {rows_written} transactions written.")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Backfill complete: {records_done} records, {rows_written} transactions."))
@@ -0,0 +1,77 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from converter_app import statement_codec
+from converter_app.models import DEFAULT_STATEMENT_CODEC_COMPRESSION, StatementData
+
+
+class Command(BaseCommand):
+    help = (
+        "Converts the transactions of StatementData records stored as JSON to the compact "
+        "columnar format of statement_codec.py, or back to JSON with --unpack (run that "
+        "before setting STATEMENT_STORAGE_CODEC to 'json' or rolling back). Records the "
+        "codec can't represent stay JSON. Safe to re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--unpack', action='store_true',
+            help="Convert packed records back to JSON instead.")
+        parser.add_argument(
+            '--chunk-size', type=int, default=100,
+            help="Number of StatementData records converted per query and transaction (default: 100).")
+        parser.add_argument(
+            '--compression', choices=['zstd', 'zlib'], default=DEFAULT_STATEMENT_CODEC_COMPRESSION,
+            help=f"Compression for packed records (default: {DEFAULT_STATEMENT_CODEC_COMPRESSION}; "
+                 "zlib when zstandard isn't installed).")
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        unpack = options['unpack']
+        if unpack:
+            pending = StatementData.objects.filter(extracted_packed__isnull=False)
+            columns = ('id', 'extracted_packed')
+        else:
+            pending = StatementData.objects.filter(extracted_packed__isnull=True, extracted_json__isnull=False)
+            columns = ('id', 'extracted_json')
+        last_id = 0
+        converted = 0
+        skipped = 0
+        json_bytes = 0
+        packed_bytes = 0
+
+        while True:
+            # Keyset pagination on id keeps every chunk query cheap, however far in we are
+            records = list(pending.filter(id__gt=last_id).order_by('id').only(*columns)[:chunk_size])
+            if not records:
+                break
+            last_id = records[-1].id
+
+            with transaction.atomic():
+                for record in records:
+                    if unpack:
+                        rows = statement_codec.decode(record.extracted_packed)
+                        packed_bytes += len(record.extracted_packed)
+                        json_bytes += len(json.dumps(rows))
+                        # update() rather than save(): the rows are unchanged, so artifacts stay valid
+                        StatementData.objects.filter(id=record.id).update(extracted_json=rows, extracted_packed=None)
+                    else:
+                        packed = statement_codec.encode(record.extracted_json, compression=options['compression'])
+                        if packed is None:
+                            skipped += 1
+                            continue
+                        json_bytes += len(json.dumps(record.extracted_json))
+                        packed_bytes += len(packed)
+                        StatementData.objects.filter(id=record.id).update(extracted_packed=packed, extracted_json=None)
+                    converted += 1
+
+            self.stdout.write(
+                f"Processed up to record ID {last_id}: {converted} records converted, {skipped} kept as JSON.")
+
+        direction = "JSON" if unpack else "packed"
+        ratio = f" ({packed_bytes / json_bytes:.1%} of the JSON size)" if json_bytes else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"Conversion to {direction} complete: {converted} records, {skipped} kept as JSON. "
+            f"JSON text {json_bytes} bytes, packed {packed_bytes} bytes{ratio}."))
@@ -0,0 +1,63 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from converter_app.retention import (DEFAULT_PURGE_BATCH_SIZE, DEFAULT_PURGE_TRANSACTION_BATCH_SIZE,
+                                     get_retention_cutoff, purge_expired_statements)
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes statements older than STATEMENT_RETENTION_DAYS with their transactions, "
+        "export artifacts, cache entries and jobs, in small batches so uploads are never "
+        "blocked for long. Reports the rows and bytes reclaimed. Safe to run from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=None,
+            help="Purge statements uploaded more than this many days ago (default: STATEMENT_RETENTION_DAYS).")
+        parser.add_argument(
+            '--batch-size', type=int, default=None,
+            help=f"Statements deleted per transaction (default: STATEMENT_PURGE_BATCH_SIZE, {DEFAULT_PURGE_BATCH_SIZE}).")
+        parser.add_argument(
+            '--transaction-batch-size', type=int, default=None,
+            help=("Transaction rows deleted per transaction (default: STATEMENT_PURGE_TRANSACTION_BATCH_SIZE, "
+                  f"{DEFAULT_PURGE_TRANSACTION_BATCH_SIZE})."))
+        parser.add_argument(
+            '--max-batches', type=int, default=None,
+            help="Stop after this many batches; the next run carries on (default: no limit).")
+        parser.add_argument(
+            '--pause', type=float, default=0,
+            help="Seconds to sleep between batches, to spread the load on a busy database (default: 0).")
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Only report what would be purged.")
+
+    def handle(self, *args, **options):
+        if options['days'] is not None:
+            if options['days'] <= 0:
+                raise CommandError("--days must be a positive number of days.")
+            cutoff = timezone.now() - timedelta(days=options['days'])
+        else:
+            cutoff = get_retention_cutoff()
+            if cutoff is None:
+                self.stdout.write("Retention is disabled (STATEMENT_RETENTION_DAYS is 0); nothing to purge.")
+                return
+
+        stats = purge_expired_statements(
+            cutoff=cutoff, batch_size=options['batch_size'], max_batches=options['max_batches'],
+            pause_seconds=options['pause'], dry_run=options['dry_run'], request_id='purge_statements',
+            transaction_batch_size=options['transaction_batch_size'])
+
+        reclaimed_bytes = stats['data_bytes'] + stats['artifact_bytes']
+        verb = "Would purge" if options['dry_run'] else "Purged"
+        self.stdout.write(
+            f"{verb} statements uploaded before {cutoff.isoformat()}: {stats['statements']} statements, "
+            f"{stats['transactions']} transactions, {stats['export_artifacts']} export artifacts, "
+            f"{stats['cache_entries']} cache entries, {stats['jobs']} jobs, {stats['batches']} batches.")
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Reclaimable' if options['dry_run'] else 'Reclaimed'}: {reclaimed_bytes} bytes "
+            f"({stats['data_bytes']} of extracted transactions, {stats['artifact_bytes']} of export artifacts) "
+            f"in {stats['delete_batches']} batches."))
@@ -0,0 +1,417 @@
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Not on Windows; snapshots of exited processes are then kept as they are
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable from settings.py
+DEFAULT_METRICS_FLUSH_INTERVAL_SECONDS = 5.0
+# Latency buckets in seconds: exports take milliseconds, Gemini extractions up to minutes
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+SNAPSHOT_PREFIX = 'metrics-'
+# Counters and histograms of exited processes, merged into one file
+ARCHIVE_NAME = 'merged-metrics.json'
+LOCK_NAME = 'metrics.lock'
+# A live process refreshes its snapshot every flush interval; one this stale belongs to an exited process
+STALE_SNAPSHOT_INTERVALS = 3
+MIN_STALE_SNAPSHOT_SECONDS = 60
+
+
+class _Registry:
+    """The metrics of this process, by name, in the order they were defined."""
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()  # One lock for all updates; each update is a few dict operations
+        self.version = 0  # Bumped by every update
+        self.flushed_version = 0  # The version last written to the multiprocess directory
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+
+    @property
+    def dirty(self):
+        """True while updates haven't been written to the multiprocess directory yet."""
+        return self.version != self.flushed_version
+
+    def snapshot(self):
+        """Returns (version, metrics). Only reads, so a scrape can't hide updates from the flusher."""
+        with self.lock:
+            return self.version, {name: metric.dump() for name, metric in self.metrics.items()}
+
+
+REGISTRY = _Registry()
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # label values tuple -> value
+        REGISTRY.register(self)
+
+    def _key(self, labels):
+        if labels.keys() != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _update(self, labels, update):
+        key = self._key(labels)
+        with REGISTRY.lock:
+            self._values[key] = update(self._values.get(key))
+            REGISTRY.version += 1
+        _ensure_flusher()
+
+    def dump(self):
+        """[[label values, value], ...]; called with the registry lock held."""
+        return [[list(key), value] for key, value in self._values.items()]
+
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        self._update(labels, lambda value: (value or 0) + amount)
+
+
+class Gauge(_Metric):
+    type_name = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        self._update(labels, lambda value: (value or 0) + amount)
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        def update(state):
+            # [per-bucket counts (non-cumulative, last one is +Inf), sum, count]
+            state = state or [[0] * (len(self.buckets) + 1), 0.0, 0]
+            index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+            return state
+        self._update(labels, update)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the duration of the enclosed block in seconds. Labels may be changed inside it."""
+        started = time.perf_counter()
+        try:
+            yield labels
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def dump(self):
+        return [[list(key), [list(state[0]), state[1], state[2]]] for key, state in self._values.items()]
+
+
+# --- The application's metrics ---
+
+EXTRACTION_LATENCY = Histogram(
+    'statement_extraction_duration_seconds',
+    'Time from an extraction job starting to its result being saved.', ['outcome'])
+EXPORT_LATENCY = Histogram(
+    'statement_export_duration_seconds',
+    'Time to build a download response, by format (streamed bodies are timed to the first byte).', ['format'])
+SHEETS_UPLOAD_LATENCY = Histogram(
+    'sheets_upload_duration_seconds', 'Time to create a Google Sheet with a statement\'s rows.', ['outcome'])
+UPLOADS = Counter('statement_uploads_total', 'PDFs received for extraction.', ['kind'])
+CACHE_HITS = Counter('extraction_cache_hits_total', 'Uploads answered from the extraction result cache.')
+API_ERRORS = Counter('api_errors_total', 'Failed calls to external APIs.', ['api'])
+TRANSACTIONS_EXTRACTED = Counter(
+    'transactions_extracted_total', 'Transactions extracted from statements.', ['engine'])
+EXTRACTIONS_IN_FLIGHT = Gauge('extractions_in_flight', 'Extraction jobs currently running.')
+
+
+# --- Multiprocess aggregation ---
+# Each worker process writes its snapshot to METRICS_MULTIPROCESS_DIR; a scrape of
+# any worker sums all of them. Counters and histograms of exited processes are
+# kept (so totals don't drop when a worker restarts) by merging their snapshots
+# into one archive file; their gauges are dropped.
+
+_flusher_started = False
+_flusher_lock = threading.Lock()
+_instance = (None, None)  # (pid, snapshot file name) of this process
+
+
+def _multiprocess_dir():
+    return getattr(settings, 'METRICS_MULTIPROCESS_DIR', None)
+
+
+def _flush_interval():
+    return getattr(settings, 'METRICS_FLUSH_INTERVAL_SECONDS', DEFAULT_METRICS_FLUSH_INTERVAL_SECONDS)
+
+
+def _snapshot_path(directory):
+    """
+    This process's snapshot file. The name carries a start time and nonce besides
+    the pid, so a process that reuses an exited one's pid gets a file of its own.
+    """
+    global _instance
+    pid = os.getpid()
+    if _instance[0] != pid:  # First use, or a worker forked after it
+        _instance = (pid, f"{SNAPSHOT_PREFIX}{pid}-{int(time.time())}-{uuid.uuid4().hex[:8]}.json")
+    return os.path.join(directory, _instance[1])
+
+
+def _write_json(path, data):
+    """Writes data to path atomically."""
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, 'w', encoding='utf-8') as json_file:
+        json.dump(data, json_file)
+    os.replace(temporary_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, encoding='utf-8') as json_file:
+            return json.load(json_file)
+    except (OSError, ValueError):
+        return None  # Gone, being replaced right now, or left half-written by a killed process
+
+
+def flush_snapshot():
+    """
+    Writes this process's metrics to the multiprocess directory, atomically. The
+    registry only counts as flushed once the file is in place, and updates made
+    meanwhile leave it dirty for the next flush.
+    """
+    directory = _multiprocess_dir()
+    if not directory:
+        return
+    path = _snapshot_path(directory)
+    version, metrics = REGISTRY.snapshot()
+    try:
+        _write_json(path, {'pid': os.getpid(), 'metrics': metrics})
+    except OSError as e:
+        logger.warning("Could not write metrics snapshot to %s: %s", path, e, extra={'request_id': 'N/A'})
+        return
+    with REGISTRY.lock:
+        REGISTRY.flushed_version = max(REGISTRY.flushed_version, version)
+
+
+def _flush_periodically(interval):
+    while True:
+        time.sleep(interval)
+        if REGISTRY.dirty:
+            flush_snapshot()
+            continue
+        try:
+            os.utime(_snapshot_path(_multiprocess_dir()))  # Still alive, nothing new to write
+        except OSError:
+            flush_snapshot()
+
+
+def _ensure_flusher():
+    """Starts the background snapshot writer on the first update, if multiprocess mode is on."""
+    global _flusher_started
+    if _flusher_started:
+        return
+    with _flusher_lock:
+        if _flusher_started:
+            return
+        _flusher_started = True
+        if not _multiprocess_dir():
+            return
+        os.makedirs(_multiprocess_dir(), exist_ok=True)
+        threading.Thread(target=_flush_periodically, args=(_flush_interval(),), name='metrics-flush',
+                         daemon=True).start()
+        atexit.register(flush_snapshot)
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _snapshot_alive(path, pid, now):
+    """True if the process that wrote path is running and still refreshing its snapshot."""
+    try:
+        age = now - os.path.getmtime(path)
+    except OSError:
+        return False
+    stale_seconds = max(STALE_SNAPSHOT_INTERVALS * _flush_interval(), MIN_STALE_SNAPSHOT_SECONDS)
+    return age < stale_seconds and _process_alive(pid)
+
+
+def _other_snapshots(directory, archive):
+    """[(path, alive, metrics)] of the other processes' snapshots not yet merged into archive."""
+    own_path = _snapshot_path(directory)
+    merged = set(archive['merged'])
+    now = time.time()
+    snapshots = []
+    for path in glob.glob(os.path.join(directory, f"{SNAPSHOT_PREFIX}*.json")):
+        if path == own_path or os.path.basename(path) in merged:
+            continue
+        snapshot = _read_json(path)
+        if snapshot is not None:
+            snapshots.append((path, _snapshot_alive(path, snapshot['pid'], now), snapshot['metrics']))
+    return snapshots
+
+
+def _read_archive(directory):
+    return _read_json(os.path.join(directory, ARCHIVE_NAME)) or {'merged': [], 'metrics': {}}
+
+
+def merge_exited_snapshots(directory):
+    """
+    Folds the counters and histograms of exited processes' snapshots into the
+    archive file and removes the snapshots. The archive lists the files it has
+    absorbed, so a scrape never counts one twice, even if removing it fails.
+    """
+    if fcntl is None:
+        return
+    with open(os.path.join(directory, LOCK_NAME), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            archive = _read_archive(directory)
+            exited = [(path, metrics) for path, alive, metrics in _other_snapshots(directory, archive)
+                      if not alive]
+            if not exited:
+                return
+            totals = _sum_snapshots([(False, archive['metrics'])] + [(False, metrics) for _, metrics in exited])
+            merged = [name for name in archive['merged'] if os.path.exists(os.path.join(directory, name))]
+            _write_json(os.path.join(directory, ARCHIVE_NAME), {
+                'merged': merged + [os.path.basename(path) for path, _ in exited],
+                'metrics': {name: [[list(key), value] for key, value in samples.items()]
+                            for name, samples in totals.items() if samples},
+            })
+            for path, _ in exited:
+                os.remove(path)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+    logger.info("Merged metrics snapshots of %s exited processes.", len(exited), extra={'request_id': 'N/A'})
+
+
+def _load_snapshots():
+    """
+    [(alive, metrics)]: this process's live metrics plus, in multiprocess mode, the
+    archive and the snapshots of every other process. Exited processes' snapshots
+    are merged into the archive afterwards.
+    """
+    snapshots = [(True, REGISTRY.snapshot()[1])]
+    directory = _multiprocess_dir()
+    if not directory:
+        return snapshots
+    archive = _read_archive(directory)
+    others = _other_snapshots(directory, archive)
+    snapshots.append((False, archive['metrics']))
+    snapshots.extend((alive, metrics) for _, alive, metrics in others)
+    if not all(alive for _, alive, _ in others):
+        try:
+            merge_exited_snapshots(directory)
+        except OSError as e:
+            logger.warning("Could not merge exited processes' metrics snapshots: %s", e,
+                           extra={'request_id': 'N/A'})
+    return snapshots
+
+
+def _sum_snapshots(snapshots):
+    """Returns {metric name: {label values tuple: value}}, summed over (alive, metrics) snapshots."""
+    totals = {name: {} for name in REGISTRY.metrics}
+    for alive, metrics in snapshots:
+        for name, samples in metrics.items():
+            metric = REGISTRY.metrics.get(name)
+            if metric is None or (metric.type_name == 'gauge' and not alive):
+                continue
+            for label_values, value in samples:
+                key = tuple(label_values)
+                if metric.type_name == 'histogram':
+                    state = totals[name].setdefault(key, [[0] * (len(metric.buckets) + 1), 0.0, 0])
+                    if len(value[0]) != len(state[0]):
+                        continue  # Written by a version with different buckets
+                    state[0] = [a + b for a, b in zip(state[0], value[0])]
+                    state[1] += value[1]
+                    state[2] += value[2]
+                else:
+                    totals[name][key] = totals[name].get(key, 0) + value
+    return totals
+
+
+def collect():
+    """Returns {metric name: {label values tuple: value}}, summed over all processes."""
+    return _sum_snapshots(_load_snapshots())
+
+
+def _format_labels(labelnames, label_values, extra=()):
+    pairs = list(zip(labelnames, label_values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape_label(value)}"' for name, value in pairs) + '}'
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+def render_text():
+    """The metrics of all processes in the Prometheus text exposition format."""
+    totals = collect()
+    lines = []
+    for name, metric in REGISTRY.metrics.items():
+        lines.append(f"# HELP {name} {metric.documentation}")
+        lines.append(f"# TYPE {name} {metric.type_name}")
+        samples = totals[name]
+        if not samples and not metric.labelnames:
+            # Unlabelled metrics are always exported, so rates work from the first scrape
+            samples = {(): [[0] * (len(metric.buckets) + 1), 0.0, 0] if metric.type_name == 'histogram' else 0}
+        for label_values, value in sorted(samples.items()):
+            if metric.type_name != 'histogram':
+                lines.append(f"{name}{_format_labels(metric.labelnames, label_values)} {_format_number(value)}")
+                continue
+            bucket_counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip(metric.buckets + (float('inf'),), bucket_counts):
+                cumulative += bucket_count
+                labels = _format_labels(metric.labelnames, label_values, [('le', _format_number(bound))])
+                lines.append(f"{name}_bucket{labels} {cumulative}")
+            labels = _format_labels(metric.labelnames, label_values)
+            lines.append(f"{name}_sum{labels} {_format_number(total)}")
+            lines.append(f"{name}_count{labels} {count}")
+    return '\n'.join(lines) + '\n'
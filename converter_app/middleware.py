@@ -1,6 +1,10 @@
 import uuid
 import logging
 
+from django.contrib.sessions.middleware import SessionMiddleware
+
+from .timing import finish_timer, span, start_timer
+
 # It's good practice to get a logger instance if the middleware itself needs to log
 # For example, if there was an issue generating a request_id, though unlikely here.
 # middleware_logger = logging.getLogger(__name__)
@@ -22,9 +26,26 @@ class RequestIdMiddleware:
         # middleware_logger.debug(f"Request ID {request.request_id} generated for path {request.path}",
         # extra={'request_id': request.request_id})
 
-        response = self.get_response(request)
+        # Per-phase timings of this request (None when REQUEST_TIMING_ENABLED is off)
+        timer = start_timer(request.request_id, f"{request.method} {request.path}")
+        try:
+            response = self.get_response(request)
+        finally:
+            finish_timer(timer)
 
         # Code to be executed for each request/response after
         # the view is called.
+        if timer is not None:
+            # Streaming responses are timed up to the first byte; the body is produced later
+            response['Server-Timing'] = timer.server_timing_header()
+            timer.log(path=request.path, method=request.method, status_code=response.status_code)
 
         return response
+
+
+class TimedSessionMiddleware(SessionMiddleware):
+    """SessionMiddleware that reports the session save as its own phase of the request timing."""
+
+    def process_response(self, request, response):
+        with span('session_save'):
+            return super().process_response(request, response)
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:37
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('converter_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExtractionCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cache_key', models.CharField(max_length=64, unique=True)),
+                ('date_range_string', models.CharField(blank=True, default='', max_length=64)),
+                ('transaction_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_hit_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('hit_count', models.PositiveIntegerField(default=0)),
+                ('statement', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cache_entries', to='converter_app.statementdata')),
+            ],
+            options={
+                'verbose_name_plural': 'Extraction Cache Entries',
+            },
+        ),
+    ]
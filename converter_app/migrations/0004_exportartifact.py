@@ -0,0 +1,32 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:42
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('converter_app', '0003_extractionjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportArtifact',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('export_format', models.CharField(choices=[('csv', 'CSV'), ('xlsx', 'Excel'), ('json', 'JSON')], max_length=8)),
+                ('encoding', models.CharField(choices=[('identity', 'Uncompressed'), ('gzip', 'gzip'), ('br', 'Brotli')], max_length=8)),
+                ('content', models.BinaryField()),
+                ('raw_size', models.PositiveIntegerField()),
+                ('stored_size', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_accessed_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('statement', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='export_artifacts', to='converter_app.statementdata')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('statement', 'export_format'), name='unique_artifact_per_format')],
+            },
+        ),
+    ]
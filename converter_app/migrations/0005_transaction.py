@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('converter_app', '0004_exportartifact'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Transaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ordinal', models.PositiveIntegerField()),
+                ('date', models.DateField(blank=True, null=True)),
+                ('raw_date', models.CharField(blank=True, default='', max_length=64)),
+                ('description', models.TextField(blank=True, default='')),
+                ('debit', models.DecimalField(blank=True, decimal_places=2, max_digits=18, null=True)),
+                ('credit', models.DecimalField(blank=True, decimal_places=2, max_digits=18, null=True)),
+                ('balance', models.DecimalField(blank=True, decimal_places=2, max_digits=18, null=True)),
+                ('statement', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transactions', to='converter_app.statementdata')),
+            ],
+            options={
+                'ordering': ['statement', 'ordinal'],
+                'indexes': [models.Index(fields=['statement', 'date'], name='transaction_statement_date'), models.Index(fields=['date'], name='transaction_date')],
+                'constraints': [models.UniqueConstraint(fields=('statement', 'ordinal'), name='unique_transaction_ordinal')],
+            },
+        ),
+    ]
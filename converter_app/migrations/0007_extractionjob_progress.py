@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('converter_app', '0006_extractionbatch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='extractionjob',
+            name='progress_date',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='extractionjob',
+            name='rows_parsed',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Adds the compact extracted_packed column. The JSON field is renamed to
+    extracted_json in the model only; it keeps its extracted_data column and
+    becomes nullable, as packed records no longer store JSON. Existing records
+    stay JSON until `manage.py pack_statements` converts them.
+    """
+
+    dependencies = [
+        ('converter_app', '0008_statement_uploaded_at_index'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RenameField(
+                    model_name='statementdata',
+                    old_name='extracted_data',
+                    new_name='extracted_json',
+                ),
+                migrations.AlterField(
+                    model_name='statementdata',
+                    name='extracted_json',
+                    field=models.JSONField(db_column='extracted_data'),
+                ),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='statementdata',
+            name='extracted_json',
+            field=models.JSONField(blank=True, db_column='extracted_data', null=True),
+        ),
+        migrations.AddField(
+            model_name='statementdata',
+            name='extracted_packed',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
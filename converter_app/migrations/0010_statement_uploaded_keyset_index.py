@@ -0,0 +1,24 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:48
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('converter_app', '0009_statementdata_extracted_packed'),
+    ]
+
+    operations = [
+        # The composite index is built first, so uploaded_at is never left unindexed
+        migrations.AddIndex(
+            model_name='statementdata',
+            index=models.Index(fields=['uploaded_at', 'id'], name='statement_uploaded_keyset'),
+        ),
+        migrations.AlterField(
+            model_name='statementdata',
+            name='uploaded_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
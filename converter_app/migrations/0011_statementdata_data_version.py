@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('converter_app', '0010_statement_uploaded_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='statementdata',
+            name='data_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -1,18 +1,212 @@
+import uuid
+
+from django.conf import settings
 from django.db import models
 from django.utils import timezone
 
+from . import statement_codec
+
+# Defaults, overridable from settings.py
+DEFAULT_STATEMENT_STORAGE_CODEC = 'columnar'  # Or 'json'
+DEFAULT_STATEMENT_CODEC_COMPRESSION = 'zstd'  # Falls back to zlib when zstandard isn't installed
+
+
+def pack_extracted_data(rows):
+    """
+    Returns (extracted_packed, extracted_json) for a list of transaction dicts:
+    the encoded rows with no JSON, or just the JSON when the codec is off or
+    can't represent them.
+    """
+    if getattr(settings, 'STATEMENT_STORAGE_CODEC', DEFAULT_STATEMENT_STORAGE_CODEC) == 'columnar':
+        packed = statement_codec.encode(rows, compression=getattr(
+            settings, 'STATEMENT_CODEC_COMPRESSION', DEFAULT_STATEMENT_CODEC_COMPRESSION))
+        if packed is not None:
+            return packed, None
+    return None, rows
+
 # Create your models here.
 
 
 class StatementData(models.Model):
     pdf_filename = models.CharField(max_length=255, blank=True, null=True)
+    # Indexed with id (see Meta) for the default ordering, the retention purge and the feed's keyset
     uploaded_at = models.DateTimeField(default=timezone.now)
-    extracted_data = models.JSONField()  # Stores the list of transaction dicts
+    # The transactions are stored in one of two columns; use `extracted_data` to read or write them.
+    # Compact columnar encoding (see statement_codec.py):
+    extracted_packed = models.BinaryField(null=True, blank=True)
+    # Plain JSON list of dicts, the readable fallback: records saved before the codec existed, rows
+    # the codec can't represent, and everything while STATEMENT_STORAGE_CODEC is 'json'
+    extracted_json = models.JSONField(null=True, blank=True, db_column='extracted_data')
+    # Bumped whenever the transactions change after creation (see signals.py), so a download render
+    # that read older data doesn't store its artifacts
+    data_version = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         filename = self.pdf_filename or "Unknown file"
         return f"Statement from {filename} uploaded at {self.uploaded_at}"
 
+    @property
+    def extracted_data(self):
+        """The list of transaction dicts, decoded from whichever column holds them."""
+        packed = self.extracted_packed
+        if packed is None:
+            return self.extracted_json
+        decoded = self.__dict__.get('_decoded_rows')
+        if decoded is None or decoded[0] is not packed:  # Decode once per loaded value
+            decoded = (packed, statement_codec.decode(packed))
+            self.__dict__['_decoded_rows'] = decoded
+        return decoded[1]
+
+    @extracted_data.setter
+    def extracted_data(self, rows):
+        self.extracted_packed, self.extracted_json = pack_extracted_data(rows)
+
     class Meta:
         ordering = ['-uploaded_at']
         verbose_name_plural = "Statement Data Records"  # Optional: Nicer name in admin
+        indexes = [
+            # Keyset pagination over (uploaded_at, id) in the transaction feed (see feed.py)
+            models.Index(fields=['uploaded_at', 'id'], name='statement_uploaded_keyset'),
+        ]
+
+
+class ExtractionCacheEntry(models.Model):
+    # SHA-256 over the PDF digest, Gemini model name and prompt version
+    cache_key = models.CharField(max_length=64, unique=True)
+    statement = models.ForeignKey(
+        StatementData, on_delete=models.CASCADE, related_name='cache_entries')
+    date_range_string = models.CharField(max_length=64, blank=True, default='')
+    transaction_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+    last_hit_at = models.DateTimeField(default=timezone.now, db_index=True)
+    hit_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Cache entry {self.cache_key[:12]} -> statement {self.statement_id}"
+
+    class Meta:
+        verbose_name_plural = "Extraction Cache Entries"
+
+
+class ExtractionBatch(models.Model):
+    """A multi-file upload; each PDF in it is processed as its own ExtractionJob."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Extraction batch {self.id}"
+
+    class Meta:
+        ordering = ['-created_at']
+
+
+class ExtractionJob(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    # UUID so job ids handed to the browser can't be enumerated
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    pdf_filename = models.CharField(max_length=255, blank=True, null=True)
+    status = models.CharField(
+        max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    message = models.TextField(blank=True, default='')
+    results_ready = models.BooleanField(default=False)
+    statement = models.ForeignKey(
+        StatementData, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+    date_range_string = models.CharField(max_length=64, blank=True, default='')
+    transaction_count = models.PositiveIntegerField(default=0)
+    # Live progress while the model response streams in: rows parsed so far and the latest row's date
+    rows_parsed = models.PositiveIntegerField(default=0)
+    progress_date = models.CharField(max_length=32, blank=True, default='')
+    # Set for jobs created by a batch upload; position keeps the files in upload order
+    batch = models.ForeignKey(
+        ExtractionBatch, on_delete=models.CASCADE, null=True, blank=True, related_name='jobs')
+    batch_position = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Extraction job {self.id} ({self.status}) for {self.pdf_filename or 'Unknown file'}"
+
+    class Meta:
+        ordering = ['-created_at']
+
+
+class ExportArtifact(models.Model):
+    FORMAT_CSV = 'csv'
+    FORMAT_XLSX = 'xlsx'
+    FORMAT_JSON = 'json'
+    FORMAT_CHOICES = [
+        (FORMAT_CSV, 'CSV'),
+        (FORMAT_XLSX, 'Excel'),
+        (FORMAT_JSON, 'JSON'),
+    ]
+
+    # Values double as HTTP Content-Encoding tokens
+    ENCODING_IDENTITY = 'identity'
+    ENCODING_GZIP = 'gzip'
+    ENCODING_BROTLI = 'br'
+    ENCODING_CHOICES = [
+        (ENCODING_IDENTITY, 'Uncompressed'),
+        (ENCODING_GZIP, 'gzip'),
+        (ENCODING_BROTLI, 'Brotli'),
+    ]
+
+    statement = models.ForeignKey(
+        StatementData, on_delete=models.CASCADE, related_name='export_artifacts')
+    export_format = models.CharField(max_length=8, choices=FORMAT_CHOICES)
+    encoding = models.CharField(max_length=8, choices=ENCODING_CHOICES)
+    content = models.BinaryField()  # Pre-rendered file, compressed with `encoding`
+    raw_size = models.PositiveIntegerField()
+    stored_size = models.PositiveIntegerField()
+    created_at = models.DateTimeField(default=timezone.now)
+    last_accessed_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.export_format} artifact for statement {self.statement_id} ({self.encoding})"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['statement', 'export_format'], name='unique_artifact_per_format'),
+        ]
+
+
+class Transaction(models.Model):
+    """One row of StatementData.extracted_data, with typed columns so it can be queried in SQL."""
+    statement = models.ForeignKey(
+        StatementData, on_delete=models.CASCADE, related_name='transactions')
+    ordinal = models.PositiveIntegerField()  # Position within the statement, from 0
+    date = models.DateField(null=True, blank=True)  # Null when the date couldn't be parsed
+    raw_date = models.CharField(max_length=64, blank=True, default='')  # As extracted
+    description = models.TextField(blank=True, default='')
+    debit = models.DecimalField(
+        max_digits=18, decimal_places=2, null=True, blank=True)
+    credit = models.DecimalField(
+        max_digits=18, decimal_places=2, null=True, blank=True)
+    balance = models.DecimalField(
+        max_digits=18, decimal_places=2, null=True, blank=True)
+
+    def __str__(self):
+        return f"Transaction {self.ordinal} of statement {self.statement_id}"
+
+    class Meta:
+        ordering = ['statement', 'ordinal']
+        constraints = [
+            # Also serves as the (statement, ordinal) index for ordered exports
+            models.UniqueConstraint(
+                fields=['statement', 'ordinal'], name='unique_transaction_ordinal'),
+        ]
+        indexes = [
+            models.Index(fields=['statement', 'date'],
+                         name='transaction_statement_date'),
+            models.Index(fields=['date'], name='transaction_date'),
+        ]
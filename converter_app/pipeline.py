@@ -0,0 +1,500 @@
+import io
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import google.generativeai as genai
+from django.conf import settings
+from django.db import transaction
+
+try:
+    from pypdf import PdfReader, PdfWriter
+except ImportError:  # Chunked extraction is unavailable without pypdf
+    PdfReader = PdfWriter = None
+
+from .gemini_client import get_generative_model
+from .json_stream import JSONArrayStreamParser
+from .local_extraction import extract_text_layer
+from .metrics import API_ERRORS, TRANSACTIONS_EXTRACTED
+from .models import StatementData
+from .result_cache import store_cached_result
+from .timing import current_timer, span, use_timer
+from .transactions import store_transactions
+from .dates import normalize_transaction_dates
+
+logger = logging.getLogger(__name__)
+
+# Prompt sent to Gemini alongside the uploaded PDF.
+# Bump EXTRACTION_PROMPT_VERSION whenever the prompt changes, so the result cache
+# stops serving transactions extracted with the old wording.
+EXTRACTION_PROMPT_VERSION = '1'
+EXTRACTION_PROMPT = """
+                    Please analyze the content of the provided PDF bank statement.
+                    Extract all transaction details.
+                    Return the data as a JSON object.
+                    The JSON object should be a list of transactions.
+                    Each transaction object in the list should have the following keys:
+                    - "date": (string, e.g., "YYYY-MM-DD" or "DD/MM/YYYY")
+                    - "description": (string)
+                    - "debit": (float or null, if no debit amount)
+                    - "credit": (float or null, if no credit amount)
+                    - "balance": (float, the balance after the transaction)
+
+                    If the document does not appear to be a bank statement or if no transactions can be reliably extracted,
+                    please return a JSON object with a single key "error", like this:
+                    { "error": "Document does not appear to be a bank statement or no transactions found." }
+
+                    Ensure the output contains ONLY the JSON object. Do NOT wrap the JSON in markdown code fences (like ```json ... ```).
+                    The response should start directly with `{` or `[` and end with `}` or `]`.
+                    Example of a single transaction object if successful:
+                    {
+                        "date": "2024-01-15",
+                        "description": "Grocery Store Purchase",
+                        "debit": 55.75,
+                        "credit": null,
+                        "balance": 1234.50
+                    }
+                    """
+
+
+# Page-range chunking defaults, overridable from settings.py
+DEFAULT_CHUNK_PAGES = 5
+DEFAULT_CHUNK_PARALLELISM = 4
+# How many rows at a chunk boundary are compared when removing duplicates
+MAX_BOUNDARY_OVERLAP_ROWS = 5
+# Tolerance when checking that balances carry over between chunks
+BALANCE_TOLERANCE = 0.01
+# Extra attempts for a chunk whose extraction failed, or whose balances don't join its neighbour's
+CHUNK_RETRIES = 1
+
+
+class ExtractionError(Exception):
+    """Raised when a PDF can't be turned into transactions. The message is shown to the user."""
+
+
+class NoTransactionsFound(ExtractionError):
+    """Raised when Gemini answers with its explicit "error" payload: no transactions in the document."""
+
+
+def clean_model_response(raw_response_text):
+    """Strips surrounding whitespace and markdown code fences from a model response."""
+    cleaned_response_text = raw_response_text.strip()
+    if cleaned_response_text.startswith("```json"):
+        # Remove ```json
+        cleaned_response_text = cleaned_response_text[7:]
+    # General markdown fence
+    if cleaned_response_text.startswith("```"):
+        cleaned_response_text = cleaned_response_text[3:]
+    if cleaned_response_text.endswith("```"):
+        cleaned_response_text = cleaned_response_text[:-3]
+    return cleaned_response_text.strip()  # Strip again after removal
+
+
+def compute_date_range_string(transactions, parsed_dates=None):
+    """
+    Returns a filename-friendly date range (e.g. '2024-01-01_to_2024-01-31') for a transaction list.
+    parsed_dates, if given, are the rows' already normalized dates.
+    """
+    if parsed_dates is None:
+        parsed_dates = normalize_transaction_dates(transactions)
+    known_dates = [parsed_dt for parsed_dt in parsed_dates if parsed_dt is not None]
+    min_date = min(known_dates) if known_dates else None
+    max_date = max(known_dates) if known_dates else None
+
+    date_range_string = "statement"  # Default
+    if min_date and max_date:
+        date_range_string = f"{min_date:%Y-%m-%d}_to_{max_date:%Y-%m-%d}"
+    elif min_date:  # Only min date found
+        date_range_string = f"from_{min_date:%Y-%m-%d}"
+    elif max_date:  # Only max date found
+        date_range_string = f"up_to_{max_date:%Y-%m-%d}"
+    return date_range_string
+
+
+def _parse_model_response(raw_response_text, request_id):
+    """Parses a Gemini response into transactions, raising ExtractionError for error payloads."""
+    cleaned_response_text = clean_model_response(raw_response_text)
+    try:
+        parsed_data = json.loads(cleaned_response_text)
+    except json.JSONDecodeError:
+        logger.error("Could not decode JSON response from Gemini API.",
+                     exc_info=True, extra={'request_id': request_id, 'raw_response': cleaned_response_text})
+        raise ExtractionError(
+            'Could not understand the response from the API (Invalid JSON).')
+    logger.debug("Gemini response parsed as JSON.", extra={
+                 'request_id': request_id})
+
+    if isinstance(parsed_data, dict) and "error" in parsed_data:
+        logger.warning("Gemini API returned structured error: %s", parsed_data['error'],
+                       extra={'request_id': request_id, 'gemini_error': parsed_data['error']})
+        raise NoTransactionsFound(f"Could not process PDF: {parsed_data['error']}")
+    if not isinstance(parsed_data, list):
+        logger.error("Received unexpected JSON structure from Gemini API. Type: %s", type(parsed_data),
+                     extra={'request_id': request_id, 'response_type': str(type(parsed_data)), 'response_preview': cleaned_response_text[:200]})
+        raise ExtractionError(
+            'Received an unexpected data structure from the API.')
+    return parsed_data
+
+
+def _extract_with_gemini(model, file_source, display_name, request_id, on_row=None):
+    """
+    Uploads one PDF (a path or a binary file object) to Gemini and returns its
+    transactions. The response is streamed; on_row, if given, is called with
+    each transaction as soon as it has fully arrived.
+    """
+    logger.info("Uploading file to Gemini: %s", display_name,
+                extra={'request_id': request_id, 'pdf_filename': display_name})
+    try:
+        with span('gemini_upload'):
+            uploaded_file_part = genai.upload_file(
+                path=file_source,
+                mime_type='application/pdf',
+                display_name=display_name
+            )
+    except Exception:
+        API_ERRORS.inc(api='gemini')
+        raise
+    logger.info("File uploaded to Gemini successfully. Gemini File ID: %s", uploaded_file_part.name,
+                extra={'request_id': request_id, 'gemini_file_id': uploaded_file_part.name})
+    # The genai.upload_file creates a File resource that might need explicit deletion
+    # depending on SDK version and how it's managed.
+    # For now, we assume the SDK handles its lifecycle or it's short-lived.
+
+    logger.info("Calling Gemini model '%s' for analysis.", settings.GEMINI_MODEL_NAME,
+                extra={'request_id': request_id, 'model_name': settings.GEMINI_MODEL_NAME})
+    started = time.perf_counter()
+    first_row_ms = None
+    parser = JSONArrayStreamParser()
+    response_parts = []
+    try:
+        with span('gemini_generate'):
+            for response_chunk in model.generate_content([uploaded_file_part, EXTRACTION_PROMPT], stream=True):
+                try:
+                    text = response_chunk.text
+                except ValueError:  # A chunk carrying only metadata such as the finish reason
+                    continue
+                response_parts.append(text)
+                for row in parser.feed(text):
+                    if first_row_ms is None:
+                        first_row_ms = (time.perf_counter() - started) * 1000
+                    if on_row is not None:
+                        on_row(row)
+    except Exception:
+        API_ERRORS.inc(api='gemini')
+        raise
+    total_ms = (time.perf_counter() - started) * 1000
+
+    raw_response_text = ''.join(response_parts)
+    first_row_text = f"{first_row_ms:.0f} ms" if first_row_ms is not None else "n/a"
+    logger.info("Gemini response streamed in %.0f ms: %s rows, first row after %s.",
+                total_ms, parser.object_count, first_row_text,
+                extra={'request_id': request_id, 'response_length': len(raw_response_text),
+                       'streamed_rows': parser.object_count, 'total_ms': round(total_ms, 1),
+                       'first_row_ms': round(first_row_ms, 1) if first_row_ms is not None else None})
+    # The streamed rows are only for progress; the full parse validates the response as before
+    with span('json_parse'):
+        return _parse_model_response(raw_response_text, request_id)
+
+
+_chunk_executor = None
+_chunk_executor_lock = threading.Lock()
+
+
+def _get_chunk_executor():
+    """Returns the process-wide pool that bounds concurrent per-chunk Gemini calls."""
+    global _chunk_executor
+    if _chunk_executor is None:
+        with _chunk_executor_lock:
+            if _chunk_executor is None:
+                _chunk_executor = ThreadPoolExecutor(
+                    max_workers=getattr(
+                        settings, 'EXTRACTION_CHUNK_PARALLELISM', DEFAULT_CHUNK_PARALLELISM),
+                    thread_name_prefix='extraction-chunk')
+    return _chunk_executor
+
+
+def split_pdf_into_chunks(file_source, pages_per_chunk):
+    """
+    Splits a PDF (a path or a binary file object) into page ranges. Returns a list of (first_page, last_page, BytesIO)
+    tuples with 1-based inclusive page numbers, or an empty list when the PDF
+    fits in a single chunk.
+    """
+    reader = PdfReader(file_source)
+    page_count = len(reader.pages)
+    if page_count <= pages_per_chunk:
+        return []
+
+    chunks = []
+    for start in range(0, page_count, pages_per_chunk):
+        end = min(start + pages_per_chunk, page_count)
+        writer = PdfWriter()
+        for page_index in range(start, end):
+            writer.add_page(reader.pages[page_index])
+        chunk_buffer = io.BytesIO()
+        writer.write(chunk_buffer)
+        chunk_buffer.seek(0)
+        chunks.append((start + 1, end, chunk_buffer))
+    return chunks
+
+
+def _to_amount(value):
+    """Best-effort float conversion of an amount field; None when absent or unparsable."""
+    if value in (None, ''):
+        return None
+    try:
+        return float(str(value).replace(',', ''))
+    except ValueError:
+        return None
+
+
+def _boundary_key(row):
+    # Descriptions of a row split across pages are often truncated differently
+    # in each chunk, so duplicates are matched on date, amounts and balance only.
+    return (row.get('date'), _to_amount(row.get('debit')),
+            _to_amount(row.get('credit')), _to_amount(row.get('balance')))
+
+
+def merge_chunk_transactions(chunk_results, request_id='N/A'):
+    """
+    Concatenates per-chunk transaction lists (already in page order), dropping rows
+    duplicated across a chunk boundary and checking that the running balance
+    carries over from one chunk to the next. Returns (transactions, mismatches),
+    where mismatches lists the (previous_chunk_index, chunk_index) boundaries at
+    which it doesn't; chunks without rows don't form boundaries.
+    """
+    merged = []
+    mismatches = []
+    previous_index = None  # Chunk the last merged row came from
+    for chunk_index, rows in enumerate(chunk_results):
+        if merged and rows:
+            # Drop the longest prefix of this chunk that repeats the tail of the merged list
+            max_overlap = min(len(merged), len(rows), MAX_BOUNDARY_OVERLAP_ROWS)
+            overlap = 0
+            for size in range(max_overlap, 0, -1):
+                if [_boundary_key(r) for r in merged[-size:]] == [_boundary_key(r) for r in rows[:size]]:
+                    overlap = size
+                    break
+            if overlap:
+                logger.debug("Dropping %s duplicated boundary row(s) at chunk %s.", overlap, chunk_index,
+                             extra={'request_id': request_id, 'chunk_index': chunk_index, 'overlap_rows': overlap})
+                rows = rows[overlap:]
+
+        if merged and rows:
+            previous_balance = _to_amount(merged[-1].get('balance'))
+            first = rows[0]
+            first_balance = _to_amount(first.get('balance'))
+            if previous_balance is not None and first_balance is not None:
+                expected_balance = previous_balance - \
+                    (_to_amount(first.get('debit')) or 0) + \
+                    (_to_amount(first.get('credit')) or 0)
+                if abs(expected_balance - first_balance) > BALANCE_TOLERANCE:
+                    mismatches.append((previous_index, chunk_index))
+                    logger.warning("Balance does not carry over at chunk %s: expected %.2f, got %.2f.",
+                                   chunk_index, expected_balance, first_balance,
+                                   extra={'request_id': request_id, 'chunk_index': chunk_index,
+                                          'expected_balance': expected_balance, 'actual_balance': first_balance})
+        if rows:
+            merged.extend(rows)
+            previous_index = chunk_index
+    return merged, mismatches
+
+
+def _extract_chunked(model, chunks, pdf_filename, request_id, on_row=None):
+    """
+    Extracts each page-range chunk concurrently and merges the results in page
+    order. on_row is called from the chunk threads, so it must be thread-safe;
+    a retried chunk reports its rows again.
+
+    Only Gemini's explicit "no transactions" answer counts as an empty chunk. A
+    chunk that fails any other way (an API error, invalid or truncated JSON) is
+    retried CHUNK_RETRIES times, as are the two chunks at a boundary where the
+    running balance doesn't carry over; if that doesn't fix it, the extraction
+    fails rather than return a statement with rows missing.
+    """
+    timer = current_timer()
+
+    def extract_chunk(chunk):
+        first_page, last_page, chunk_buffer = chunk
+        for attempt in range(CHUNK_RETRIES + 1):
+            chunk_buffer.seek(0)
+            try:
+                with use_timer(timer):  # The chunk's phases count towards the job that started it
+                    return _extract_with_gemini(
+                        model, chunk_buffer, f"{pdf_filename} (pages {first_page}-{last_page})", request_id,
+                        on_row=on_row)
+            except NoTransactionsFound as no_rows:
+                # Cover pages or summary-only pages legitimately contain no transactions
+                logger.info("No transactions in pages %s-%s: %s", first_page, last_page, no_rows,
+                            extra={'request_id': request_id, 'first_page': first_page, 'last_page': last_page})
+                return []
+            except Exception as chunk_error:
+                if attempt >= CHUNK_RETRIES:
+                    raise ExtractionError(
+                        f"Could not process pages {first_page}-{last_page} of the PDF: {chunk_error}"
+                    ) from chunk_error
+                logger.warning("Extracting pages %s-%s failed, retrying: %s", first_page, last_page, chunk_error,
+                               extra={'request_id': request_id, 'first_page': first_page, 'last_page': last_page})
+
+    executor = _get_chunk_executor()
+    # map() yields results in submission (i.e. page) order, and raises the first chunk's failure
+    chunk_results = list(executor.map(extract_chunk, chunks))
+    if not any(chunk_results):
+        raise ExtractionError(
+            "Could not process PDF: no transactions could be extracted from any page.")
+
+    transactions, mismatches = merge_chunk_transactions(chunk_results, request_id=request_id)
+    if mismatches:
+        retry_indexes = sorted({chunk_index for boundary in mismatches for chunk_index in boundary})
+        logger.warning("Balances don't carry over at %s chunk boundaries; re-extracting chunks %s.",
+                       len(mismatches), retry_indexes,
+                       extra={'request_id': request_id, 'stitch_mismatches': len(mismatches)})
+        for chunk_index, rows in zip(retry_indexes,
+                                     executor.map(extract_chunk, [chunks[i] for i in retry_indexes])):
+            chunk_results[chunk_index] = rows
+        transactions, mismatches = merge_chunk_transactions(chunk_results, request_id=request_id)
+    if mismatches:
+        previous_index, chunk_index = mismatches[0]
+        raise ExtractionError(
+            f"Could not process PDF: the running balance doesn't carry over between pages "
+            f"{chunks[previous_index][1]} and {chunks[chunk_index][0]}. Please try uploading it again.")
+
+    logger.info("Merged %s chunks into %s transactions.", len(chunks), len(transactions),
+                extra={'request_id': request_id, 'chunk_count': len(chunks),
+                       'transaction_count': len(transactions)})
+    return transactions
+
+
+def extract_transactions(file_source, pdf_filename, request_id='N/A', on_row=None):
+    """
+    Returns the list of transaction dicts for a PDF, given as a path or a binary
+    file object such as an in-memory upload. Long statements are split into page
+    ranges and extracted in parallel when chunking is enabled. on_row is called
+    with each row as it streams in (from several threads when chunked).
+
+    Digitally generated PDFs are first read locally from their text layer;
+    Gemini is only called when that result can't be trusted.
+    """
+    if getattr(settings, 'LOCAL_EXTRACTION_ENABLED', True):
+        with span('local_extraction'):
+            local_rows = extract_text_layer(file_source, request_id=request_id)
+        if local_rows is not None:
+            if on_row is not None:
+                for row in local_rows:
+                    on_row(row)
+            TRANSACTIONS_EXTRACTED.inc(len(local_rows), engine='local')
+            return local_rows
+
+    model = get_generative_model(request_id)
+
+    chunks = []
+    if getattr(settings, 'EXTRACTION_CHUNKING_ENABLED', False):
+        if PdfReader is None:
+            logger.warning("Chunked extraction is enabled but pypdf is not installed; extracting in one call.",
+                           extra={'request_id': request_id})
+        else:
+            try:
+                with span('pdf_split'):
+                    chunks = split_pdf_into_chunks(
+                        file_source, getattr(settings, 'EXTRACTION_CHUNK_PAGES', DEFAULT_CHUNK_PAGES))
+            except Exception as split_error:
+                logger.warning("Could not split PDF into page ranges, extracting in one call: %s", split_error,
+                               extra={'request_id': request_id})
+            if not isinstance(file_source, str):
+                file_source.seek(0)  # pypdf leaves the buffer wherever it stopped reading
+
+    if chunks:
+        logger.info("Extracting %s as %s page-range chunks.", pdf_filename, len(chunks),
+                    extra={'request_id': request_id, 'chunk_count': len(chunks)})
+        transactions = _extract_chunked(model, chunks, pdf_filename, request_id, on_row=on_row)
+    else:
+        transactions = _extract_with_gemini(model, file_source, pdf_filename, request_id, on_row=on_row)
+    TRANSACTIONS_EXTRACTED.inc(len(transactions), engine='gemini')
+    return transactions
+
+
+def run_extraction(file_source, pdf_filename, cache_key=None, request_id='N/A', on_row=None):
+    """
+    Runs the full upload -> extract -> parse -> save pipeline for one PDF, given
+    as a path or a binary file object. on_row is passed to extract_transactions().
+
+    Returns a result dict shaped like the upload view's JSON response:
+    {'status': 'success' | 'error', 'message': str, 'results_ready': bool,
+     'statement_data_id': int | None, 'date_range_string': str, 'transaction_count': int}
+    """
+    result = {
+        'status': 'error',
+        'message': '',
+        'results_ready': False,
+        'statement_data_id': None,
+        'date_range_string': '',
+        'transaction_count': 0,
+    }
+    try:
+        try:
+            parsed_data = extract_transactions(
+                file_source, pdf_filename, request_id=request_id, on_row=on_row)
+        except ExtractionError as extraction_error:
+            result['message'] = str(extraction_error)
+            return result
+
+        if not parsed_data:  # Empty list of transactions
+            logger.info("run_extraction: No transactions found in the PDF.", extra={
+                        'request_id': request_id})
+            result['status'] = 'success'
+            result['message'] = "No transactions found in the PDF. It might not be a bank statement or it's empty."
+            return result
+
+        logger.info("run_extraction: Successfully extracted %s transactions.", len(parsed_data),
+                    extra={'request_id': request_id, 'transaction_count': len(parsed_data)})
+        # Dates are normalized once per statement and reused for the Transaction rows
+        with span('date_parse'):
+            parsed_dates = normalize_transaction_dates(parsed_data)
+            date_range_string = compute_date_range_string(parsed_data, parsed_dates)
+        logger.debug("run_extraction: Date range determined: %s", date_range_string,
+                     extra={'request_id': request_id, 'date_range': date_range_string})
+
+        # --- Save to Database ---
+        try:
+            logger.info("run_extraction: Saving extracted data to database for %s.", pdf_filename,
+                        extra={'request_id': request_id, 'pdf_filename': pdf_filename})
+            with span('db_insert'), transaction.atomic():
+                statement_record = StatementData.objects.create(
+                    pdf_filename=pdf_filename,
+                    extracted_data=parsed_data
+                )
+                # Normalized, indexed copy of the rows for queries and exports
+                store_transactions(
+                    statement_record, parsed_data, parsed_dates=parsed_dates)
+            logger.info("run_extraction: Data saved to database successfully. Record ID: %s", statement_record.id,
+                        extra={'request_id': request_id, 'record_id': statement_record.id})
+        except Exception as db_error:
+            logger.error("run_extraction: Error saving data to database.",
+                         exc_info=True, extra={'request_id': request_id, 'db_error': str(db_error)})
+            result['message'] = 'Failed to save statement data to database. Please try again.'
+            return result
+
+        if cache_key:
+            try:
+                with span('cache_store'):
+                    store_cached_result(cache_key, statement_record,
+                                        date_range_string, len(parsed_data))
+            except Exception as cache_error:
+                logger.warning("run_extraction: Failed to store result in cache: %s", cache_error,
+                               exc_info=True, extra={'request_id': request_id, 'record_id': statement_record.id})
+
+        result.update({
+            'status': 'success',
+            'message': f"Successfully extracted {len(parsed_data)} transactions.",
+            'results_ready': True,
+            'statement_data_id': statement_record.id,
+            'date_range_string': date_range_string,
+            'transaction_count': len(parsed_data),
+        })
+        return result
+    except Exception as e:
+        logger.error("run_extraction: An error occurred during PDF processing.",
+                     exc_info=True, extra={'request_id': request_id, 'exception_type': type(e).__name__})
+        result['message'] = f"An error occurred during processing: {str(e)}"
+        return result
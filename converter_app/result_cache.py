@@ -0,0 +1,315 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import ExtractionCacheEntry, StatementData
+
+logger = logging.getLogger(__name__)
+
+# Default cache behaviour, overridable from settings.py
+DEFAULT_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60  # One week
+DEFAULT_CACHE_MAX_ENTRIES = 1000
+# Minimum gap between evictions in one process; each one scans the whole cache, so it isn't run per store
+DEFAULT_CACHE_EVICT_INTERVAL_SECONDS = 5 * 60
+
+
+def compute_pdf_digest(uploaded_file):
+    """Returns the SHA-256 hex digest of an uploaded file, reading it chunk by chunk."""
+    digest = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        digest.update(chunk)
+    uploaded_file.seek(0)  # Leave the file ready for the extraction step
+    return digest.hexdigest()
+
+
+def build_cache_key(pdf_digest, model_name, prompt_version):
+    """
+    Combines the PDF digest with the model name and prompt version, so a model
+    or prompt change never serves results produced by an older configuration.
+    """
+    raw_key = f"{pdf_digest}:{model_name}:{prompt_version}"
+    return hashlib.sha256(raw_key.encode('utf-8')).hexdigest()
+
+
+class BaseResultCacheBackend:
+    """
+    Maps a cache key to a small payload describing an existing StatementData row:
+    {'statement_data_id': int, 'date_range_string': str, 'transaction_count': int}
+    """
+
+    def __init__(self, ttl_seconds, max_entries):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+    def get(self, cache_key):
+        raise NotImplementedError
+
+    def set(self, cache_key, payload):
+        raise NotImplementedError
+
+    def delete(self, cache_key):
+        raise NotImplementedError
+
+    def evict(self):
+        """Removes expired entries and trims the cache to max_entries. Returns the number removed."""
+        return 0
+
+
+class DatabaseResultCacheBackend(BaseResultCacheBackend):
+    """Stores entries in the ExtractionCacheEntry table. Evicts by TTL, then least recently hit."""
+
+    def get(self, cache_key):
+        entry = ExtractionCacheEntry.objects.filter(cache_key=cache_key).first()
+        if entry is None:
+            return None
+        if entry.created_at < timezone.now() - timedelta(seconds=self.ttl_seconds):
+            entry.delete()
+            return None
+        ExtractionCacheEntry.objects.filter(pk=entry.pk).update(
+            last_hit_at=timezone.now(), hit_count=F('hit_count') + 1)
+        return {
+            'statement_data_id': entry.statement_id,
+            'date_range_string': entry.date_range_string,
+            'transaction_count': entry.transaction_count,
+        }
+
+    def set(self, cache_key, payload):
+        now = timezone.now()
+        ExtractionCacheEntry.objects.update_or_create(
+            cache_key=cache_key,
+            defaults={
+                'statement_id': payload['statement_data_id'],
+                'date_range_string': payload['date_range_string'],
+                'transaction_count': payload['transaction_count'],
+                'created_at': now,
+                'last_hit_at': now,
+            }
+        )
+
+    def delete(self, cache_key):
+        ExtractionCacheEntry.objects.filter(cache_key=cache_key).delete()
+
+    def evict(self):
+        expiry_cutoff = timezone.now() - timedelta(seconds=self.ttl_seconds)
+        removed, _ = ExtractionCacheEntry.objects.filter(
+            created_at__lt=expiry_cutoff).delete()
+        # LRU trim: keep the max_entries most recently hit rows
+        surplus_ids = list(ExtractionCacheEntry.objects.order_by(
+            '-last_hit_at').values_list('id', flat=True)[self.max_entries:])
+        if surplus_ids:
+            trimmed, _ = ExtractionCacheEntry.objects.filter(
+                id__in=surplus_ids).delete()
+            removed += trimmed
+        return removed
+
+
+class FileResultCacheBackend(BaseResultCacheBackend):
+    """
+    Stores one small JSON file per key in a local directory. The file mtime is
+    touched on every hit, so LRU eviction can order entries by mtime.
+    """
+
+    def __init__(self, ttl_seconds, max_entries, directory=None):
+        super().__init__(ttl_seconds, max_entries)
+        self.directory = directory or getattr(
+            settings, 'EXTRACTION_CACHE_DIR',
+            os.path.join(tempfile.gettempdir(), 'statement-extraction-cache'))
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, cache_key):
+        return os.path.join(self.directory, f"{cache_key}.json")
+
+    def get(self, cache_key):
+        path = self._path(cache_key)
+        try:
+            with open(path, 'r', encoding='utf-8') as cache_file:
+                payload = json.load(cache_file)
+        except (FileNotFoundError, ValueError):
+            return None
+        if payload.pop('created_at', 0) < time.time() - self.ttl_seconds:
+            self.delete(cache_key)
+            return None
+        try:
+            os.utime(path, None)  # Mark as recently used
+        except OSError:
+            pass
+        return payload
+
+    def set(self, cache_key, payload):
+        path = self._path(cache_key)
+        # Write to a temp file and rename, so concurrent readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as tmp_file:
+            json.dump(dict(payload, created_at=time.time()), tmp_file)
+        os.replace(tmp_path, path)
+
+    def delete(self, cache_key):
+        try:
+            os.remove(self._path(cache_key))
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+        entries.sort(reverse=True)  # Most recently used first
+
+        removed = 0
+        expiry_cutoff = time.time() - self.ttl_seconds
+        for position, (mtime, path) in enumerate(entries):
+            # mtime >= created_at, so an entry idle past the TTL is certainly expired
+            if position >= self.max_entries or mtime < expiry_cutoff:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+
+class DjangoCacheResultCacheBackend(BaseResultCacheBackend):
+    """
+    Stores entries in a Django cache (e.g. Redis or Memcached), so serverless
+    instances can share hits. TTL is passed as the cache timeout; LRU eviction
+    is delegated to the cache server itself.
+    """
+
+    key_prefix = 'statement-extraction'
+
+    def __init__(self, ttl_seconds, max_entries, alias=None):
+        super().__init__(ttl_seconds, max_entries)
+        self.cache = caches[alias or getattr(
+            settings, 'EXTRACTION_CACHE_ALIAS', 'default')]
+
+    def _key(self, cache_key):
+        return f"{self.key_prefix}:{cache_key}"
+
+    def get(self, cache_key):
+        return self.cache.get(self._key(cache_key))
+
+    def set(self, cache_key, payload):
+        self.cache.set(self._key(cache_key), dict(payload),
+                       timeout=self.ttl_seconds)
+
+    def delete(self, cache_key):
+        self.cache.delete(self._key(cache_key))
+
+
+RESULT_CACHE_BACKENDS = {
+    'db': DatabaseResultCacheBackend,
+    'file': FileResultCacheBackend,
+    'cache': DjangoCacheResultCacheBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+# Process-local counters, reported by get_cache_stats()
+_stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+_stats_lock = threading.Lock()
+
+_last_evicted = None  # time.monotonic() of this process's last eviction
+_evict_lock = threading.Lock()
+
+
+def _increment_stat(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def get_cache_stats():
+    """Returns a snapshot of this process's hit/miss counters."""
+    with _stats_lock:
+        snapshot = dict(_stats)
+    lookups = snapshot['hits'] + snapshot['misses']
+    snapshot['hit_ratio'] = (snapshot['hits'] / lookups) if lookups else 0.0
+    return snapshot
+
+
+def get_result_cache():
+    """
+    Returns the configured backend. EXTRACTION_CACHE_BACKEND may be one of
+    'db', 'file', 'cache', or a dotted path to a BaseResultCacheBackend subclass.
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                backend_name = getattr(settings, 'EXTRACTION_CACHE_BACKEND', 'db')
+                backend_class = RESULT_CACHE_BACKENDS.get(backend_name)
+                if backend_class is None:
+                    backend_class = import_string(backend_name)
+                _backend = backend_class(
+                    ttl_seconds=getattr(
+                        settings, 'EXTRACTION_CACHE_TTL_SECONDS', DEFAULT_CACHE_TTL_SECONDS),
+                    max_entries=getattr(
+                        settings, 'EXTRACTION_CACHE_MAX_ENTRIES', DEFAULT_CACHE_MAX_ENTRIES),
+                )
+    return _backend
+
+
+def lookup_cached_result(cache_key):
+    """
+    Returns the cached payload for cache_key, or None on a miss. Entries whose
+    StatementData row no longer exists are dropped and counted as misses.
+    """
+    backend = get_result_cache()
+    payload = backend.get(cache_key)
+    if payload and not StatementData.objects.filter(id=payload.get('statement_data_id')).exists():
+        logger.info("Result cache entry points at a deleted StatementData row; dropping it.",
+                    extra={'cache_key': cache_key, 'record_id': payload.get('statement_data_id')})
+        backend.delete(cache_key)
+        payload = None
+
+    _increment_stat('hits' if payload else 'misses')
+    return payload
+
+
+def _eviction_due():
+    """True at most once per EXTRACTION_CACHE_EVICT_INTERVAL_SECONDS in this process (always when 0)."""
+    global _last_evicted
+    interval = getattr(settings, 'EXTRACTION_CACHE_EVICT_INTERVAL_SECONDS', DEFAULT_CACHE_EVICT_INTERVAL_SECONDS)
+    now = time.monotonic()
+    with _evict_lock:
+        if interval and _last_evicted is not None and now - _last_evicted < interval:
+            return False
+        _last_evicted = now
+    return True
+
+
+def store_cached_result(cache_key, statement_record, date_range_string, transaction_count):
+    """
+    Records a freshly extracted StatementData row under cache_key. Eviction scans
+    the whole cache, so it runs at most once per EXTRACTION_CACHE_EVICT_INTERVAL_SECONDS;
+    the cache can briefly hold more than max_entries in between.
+    """
+    backend = get_result_cache()
+    backend.set(cache_key, {
+        'statement_data_id': statement_record.id,
+        'date_range_string': date_range_string,
+        'transaction_count': transaction_count,
+    })
+    _increment_stat('stores')
+    if not _eviction_due():
+        return
+    removed = backend.evict()
+    if removed:
+        _increment_stat('evictions', removed)
@@ -0,0 +1,170 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Func, IntegerField, Sum, TextField
+from django.db.models.functions import Cast, Coalesce, Length
+from django.utils import timezone
+
+from .models import ExportArtifact, ExtractionBatch, ExtractionJob, StatementData, Transaction
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable from settings.py
+DEFAULT_STATEMENT_RETENTION_DAYS = 0  # Keep statements forever unless the operator opts in
+DEFAULT_PURGE_BATCH_SIZE = 200  # Statements deleted per transaction, so no lock is held for long
+DEFAULT_PURGE_TRANSACTION_BATCH_SIZE = 5000  # Transaction rows deleted per transaction, however long the statements
+DEFAULT_PURGE_INTERVAL_SECONDS = 60 * 60  # Minimum gap between automatic purges in one process
+AUTO_PURGE_MAX_BATCHES = 20  # Per automatic run, so a large backlog doesn't tie up an extraction worker
+
+
+def get_retention_cutoff(now=None):
+    """Statements uploaded before the returned time are expired; None when retention is disabled."""
+    retention_days = getattr(settings, 'STATEMENT_RETENTION_DAYS', DEFAULT_STATEMENT_RETENTION_DAYS)
+    if not retention_days or retention_days <= 0:
+        return None
+    return (now or timezone.now()) - timedelta(days=retention_days)
+
+
+def _expired_statements(cutoff):
+    # Statements still being handed out by the result cache are kept until their entry goes cold
+    return (StatementData.objects
+            .filter(uploaded_at__lt=cutoff)
+            .exclude(cache_entries__last_hit_at__gte=cutoff))
+
+
+def _stored_data_bytes(statement_ids):
+    """Bytes the statements' transactions take in the table (JSON as compressed by PostgreSQL, or packed)."""
+    if connection.vendor == 'postgresql':
+        json_size = Func('extracted_json', function='pg_column_size', output_field=IntegerField())
+    else:
+        json_size = Length(Cast('extracted_json', TextField()))
+    size = Coalesce(json_size, 0) + Coalesce(Length('extracted_packed'), 0)
+    return StatementData.objects.filter(id__in=statement_ids).aggregate(total=Sum(size))['total'] or 0
+
+
+def _new_purge_stats():
+    return {'statements': 0, 'transactions': 0, 'export_artifacts': 0, 'cache_entries': 0,
+            'jobs': 0, 'batches': 0, 'data_bytes': 0, 'artifact_bytes': 0, 'delete_batches': 0}
+
+
+def _expired_jobs_and_batches(cutoff):
+    finished = (ExtractionJob.STATUS_SUCCEEDED, ExtractionJob.STATUS_FAILED)
+    jobs = ExtractionJob.objects.filter(created_at__lt=cutoff, batch__isnull=True, status__in=finished)
+    batches = ExtractionBatch.objects.filter(created_at__lt=cutoff).exclude(
+        jobs__status__in=(ExtractionJob.STATUS_PENDING, ExtractionJob.STATUS_RUNNING))
+    return jobs, batches
+
+
+def _delete_in_batches(queryset, batch_size, stats, pause_seconds):
+    """Deletes the queryset's rows batch_size at a time, oldest first, one transaction per batch."""
+    while True:
+        ids = list(queryset.order_by('created_at').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return
+        with transaction.atomic():
+            _, deleted = queryset.model.objects.filter(id__in=ids).delete()
+        stats['jobs'] += deleted.get('converter_app.ExtractionJob', 0)  # Including a batch's jobs
+        stats['batches'] += deleted.get('converter_app.ExtractionBatch', 0)
+        stats['delete_batches'] += 1
+        if len(ids) < batch_size:
+            return
+        if pause_seconds:
+            time.sleep(pause_seconds)
+
+
+def _delete_transactions(statement_ids, batch_size, stats, pause_seconds):
+    """
+    Deletes the statements' Transaction rows batch_size at a time, one transaction
+    per batch, so a few very long statements can't make one delete unbounded.
+    """
+    rows = Transaction.objects.filter(statement_id__in=statement_ids)
+    while True:
+        # Served by the (statement, ordinal) index
+        ids = list(rows.order_by('statement_id', 'ordinal').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return
+        with transaction.atomic():
+            deleted, _ = Transaction.objects.filter(id__in=ids).delete()
+        stats['transactions'] += deleted
+        stats['delete_batches'] += 1
+        if len(ids) < batch_size:
+            return
+        if pause_seconds:
+            time.sleep(pause_seconds)
+
+
+def purge_expired_statements(cutoff=None, batch_size=None, max_batches=None, pause_seconds=0,
+                             dry_run=False, request_id='N/A', transaction_batch_size=None):
+    """
+    Deletes statements uploaded before `cutoff` (default: STATEMENT_RETENTION_DAYS
+    ago) with their transactions, export artifacts and result cache entries, then
+    finished jobs and batches of the same age. Works oldest first in batches of
+    `batch_size` statements, whose Transaction rows are deleted first in batches
+    of `transaction_batch_size` rows, each batch in its own short transaction, so
+    uploads are never blocked for long. Returns the rows and bytes reclaimed;
+    with dry_run, what would be.
+    """
+    cutoff = cutoff or get_retention_cutoff()
+    stats = _new_purge_stats()
+    if cutoff is None:
+        return stats
+    batch_size = batch_size or getattr(settings, 'STATEMENT_PURGE_BATCH_SIZE', DEFAULT_PURGE_BATCH_SIZE)
+    transaction_batch_size = transaction_batch_size or getattr(
+        settings, 'STATEMENT_PURGE_TRANSACTION_BATCH_SIZE', DEFAULT_PURGE_TRANSACTION_BATCH_SIZE)
+    expired = _expired_statements(cutoff)
+
+    if dry_run:
+        ids = list(expired.values_list('id', flat=True))
+        stats['statements'] = len(ids)
+        stats['data_bytes'] = _stored_data_bytes(ids)
+        stats['artifact_bytes'] = ExportArtifact.objects.filter(
+            statement_id__in=ids).aggregate(total=Sum('stored_size'))['total'] or 0
+        jobs, batches = _expired_jobs_and_batches(cutoff)
+        stats['jobs'] = jobs.count()
+        stats['batches'] = batches.distinct().count()
+        return stats
+
+    while max_batches is None or stats['delete_batches'] < max_batches:
+        # Served by the uploaded_at index; only the ids of one batch are ever loaded
+        ids = list(expired.order_by('uploaded_at').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        data_bytes = _stored_data_bytes(ids)
+        artifact_bytes = ExportArtifact.objects.filter(
+            statement_id__in=ids).aggregate(total=Sum('stored_size'))['total'] or 0
+        _delete_transactions(ids, transaction_batch_size, stats, pause_seconds)
+        with transaction.atomic():
+            # Only the statements' artifacts and cache entries are left to cascade
+            _, deleted = StatementData.objects.filter(id__in=ids).delete()
+        stats['statements'] += deleted.get('converter_app.StatementData', 0)
+        stats['transactions'] += deleted.get('converter_app.Transaction', 0)  # Stored meanwhile
+        stats['export_artifacts'] += deleted.get('converter_app.ExportArtifact', 0)
+        stats['cache_entries'] += deleted.get('converter_app.ExtractionCacheEntry', 0)
+        stats['data_bytes'] += data_bytes
+        stats['artifact_bytes'] += artifact_bytes
+        stats['delete_batches'] += 1
+        logger.debug("Purged %s expired statements (%s bytes).", len(ids), data_bytes + artifact_bytes,
+                     extra={'request_id': request_id, 'purged_ids': ids})
+        if len(ids) < batch_size:
+            break
+        if pause_seconds:
+            time.sleep(pause_seconds)
+    else:
+        logger.info("Statement purge stopped after %s batches; expired statements may remain.", max_batches,
+                    extra={'request_id': request_id})
+        return stats
+
+    # Jobs outlive their statement (statement is SET_NULL); drop them once they are as old
+    for queryset in _expired_jobs_and_batches(cutoff):
+        _delete_in_batches(queryset, batch_size, stats, pause_seconds)
+
+    if stats['statements'] or stats['jobs'] or stats['batches']:
+        logger.info("Purged %s statements uploaded before %s: %s transactions, %s export artifacts, "
+                    "%s jobs and %s batches; %s bytes reclaimed.",
+                    stats['statements'], cutoff.isoformat(), stats['transactions'], stats['export_artifacts'],
+                    stats['jobs'], stats['batches'], stats['data_bytes'] + stats['artifact_bytes'],
+                    extra={'request_id': request_id, 'purge_stats': stats, 'cutoff': cutoff.isoformat()})
+    return stats
@@ -0,0 +1,49 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_save, pre_save
+from django.dispatch import receiver
+
+from .artifacts import invalidate_artifacts
+from .models import StatementData
+from .transactions import replace_transactions
+
+# The fields extracted_data is stored in
+STATEMENT_DATA_FIELDS = ('extracted_json', 'extracted_packed')
+
+
+@receiver(pre_save, sender=StatementData)
+def detect_data_change(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    Records on the instance whether a save of an existing statement changes its
+    transactions, comparing its rows with the stored ones (so re-encoding the
+    same rows isn't a change). Saves of other fields (update_fields without the
+    data fields) skip the query.
+    """
+    instance._data_changed = False
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    if update_fields is not None and set(STATEMENT_DATA_FIELDS).isdisjoint(update_fields):
+        return
+    stored = StatementData.objects.filter(pk=instance.pk).values_list(*STATEMENT_DATA_FIELDS).first()
+    if stored is None:
+        return
+    stored_rows = StatementData(**dict(zip(STATEMENT_DATA_FIELDS, stored))).extracted_data
+    instance._data_changed = stored_rows != instance.extracted_data
+
+
+@receiver(post_save, sender=StatementData)
+def refresh_derived_data_on_change(sender, instance, created, **kwargs):
+    """
+    When an existing statement's transactions change, its Transaction rows are
+    rebuilt from extracted_data, its data_version bumped and its pre-rendered
+    downloads dropped, in one transaction, so no export keeps serving the old
+    rows. Saves that leave the data alone keep everything.
+    """
+    if created or not getattr(instance, '_data_changed', False):
+        return  # The pipeline stores a new statement's rows itself
+    instance._data_changed = False
+    with transaction.atomic():
+        StatementData.objects.filter(pk=instance.pk).update(data_version=F('data_version') + 1)
+        instance.refresh_from_db(fields=['data_version'])
+        replace_transactions(instance, instance.extracted_data)
+        invalidate_artifacts(instance.id)
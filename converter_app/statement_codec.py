@@ -0,0 +1,173 @@
+import json
+import math
+import struct
+import sys
+import zlib
+from array import array
+
+try:
+    import zstandard
+except ImportError:  # Fall back to zlib when zstandard isn't installed
+    zstandard = None
+
+# Compact storage for a statement's transactions (StatementData.extracted_packed). The rows all share
+# the same keys, so they are stored column by column: strings (dates, descriptions) dictionary-encoded
+# as uint32 indexes, amounts as int64 cents, anything else as a JSON list. The result is compressed with
+# zstd, or zlib when zstandard isn't installed. Decoding gives back exactly the encoded rows, key order
+# and int/float types included; statements the layout can't represent losslessly aren't encoded.
+#
+# Layout: MAGIC, a compression byte, then the compressed body: a 4-byte little-endian header length,
+# the JSON header (row count, keys, per-column metadata and dictionaries) and the columns' little-endian
+# arrays in key order.
+MAGIC = b'STC1'
+COMPRESSION_ZLIB = 0
+COMPRESSION_ZSTD = 1
+ZSTD_LEVEL = 9
+ZLIB_LEVEL = 6
+
+_NULL_INDEX = 0xFFFFFFFF  # A null in a dictionary-encoded column
+_NULL_AMOUNT = -2 ** 63  # A null in an amount column
+_LITTLE_ENDIAN = sys.byteorder == 'little'
+
+
+class CodecError(ValueError):
+    """Raised for data that isn't a valid encoded statement."""
+
+
+def _to_le_bytes(values):
+    if not _LITTLE_ENDIAN:
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_le_bytes(typecode, data):
+    values = array(typecode)
+    values.frombytes(data)
+    if not _LITTLE_ENDIAN:
+        values.byteswap()
+    return values
+
+
+def _encode_strings(values):
+    dictionary = {}
+    indexes = array('I', [
+        _NULL_INDEX if value is None else dictionary.setdefault(value, len(dictionary))
+        for value in values])
+    return {'kind': 'dict', 'values': list(dictionary)}, _to_le_bytes(indexes)
+
+
+def _encode_amounts(values):
+    """int64 cents, or None when a value isn't a whole number of cents."""
+    minor_units = array('q')
+    int_rows = []
+    for row_index, value in enumerate(values):
+        if value is None:
+            minor_units.append(_NULL_AMOUNT)
+            continue
+        if not math.isfinite(value) or (value == 0 and math.copysign(1, value) < 0):
+            return None  # NaN, infinities and -0.0 don't survive a round trip through cents
+        minor = round(value * 100)
+        if abs(minor) >= 2 ** 53 or minor / 100 != value:
+            return None  # Fractions of a cent, or beyond float precision
+        if type(value) is int:
+            int_rows.append(row_index)
+        minor_units.append(minor)
+    return {'kind': 'amount', 'ints': int_rows}, _to_le_bytes(minor_units)
+
+
+def _encode_column(values):
+    present = [value for value in values if value is not None]
+    if all(type(value) is str for value in present):
+        return _encode_strings(values)
+    if all(type(value) in (int, float) for value in present):
+        encoded = _encode_amounts(values)
+        if encoded is not None:
+            return encoded
+    return {'kind': 'json', 'values': values}, b''
+
+
+def _compress(body, compression):
+    if compression == 'zstd' and zstandard is not None:
+        return COMPRESSION_ZSTD, zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    return COMPRESSION_ZLIB, zlib.compress(body, ZLIB_LEVEL)
+
+
+def encode(rows, compression='zstd'):
+    """
+    Returns the encoded bytes for a list of transaction dicts, or None when the
+    rows can't be stored losslessly in this layout.
+    """
+    if not isinstance(rows, list) or not rows or not all(type(row) is dict for row in rows):
+        return None
+    keys = list(rows[0])
+    if not all(isinstance(key, str) for key in keys) or any(list(row) != keys for row in rows):
+        return None
+
+    columns = []
+    sections = []
+    for key in keys:
+        meta, data = _encode_column([row[key] for row in rows])
+        meta['size'] = len(data)
+        columns.append(meta)
+        sections.append(data)
+    header = json.dumps({'rows': len(rows), 'keys': keys, 'columns': columns},
+                        separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    compression_id, compressed = _compress(
+        b''.join([struct.pack('<I', len(header)), header] + sections), compression)
+    return MAGIC + bytes([compression_id]) + compressed
+
+
+def is_encoded(data):
+    return data is not None and bytes(data[:len(MAGIC)]) == MAGIC
+
+
+def _decompress(data):
+    if not is_encoded(data) or len(data) <= len(MAGIC):
+        raise CodecError("Not an encoded statement.")
+    compression_id = data[len(MAGIC)]
+    payload = bytes(data[len(MAGIC) + 1:])
+    try:
+        if compression_id == COMPRESSION_ZLIB:
+            return zlib.decompress(payload)
+        if compression_id == COMPRESSION_ZSTD:
+            if zstandard is None:
+                raise CodecError("Statement is zstd-compressed but the zstandard package isn't installed.")
+            return zstandard.ZstdDecompressor().decompress(payload)
+    except (zlib.error, getattr(zstandard, 'ZstdError', zlib.error)) as e:
+        raise CodecError(f"Corrupt encoded statement: {e}") from e
+    raise CodecError(f"Unknown compression {compression_id}.")
+
+
+def _decode_column(meta, data):
+    if meta['kind'] == 'dict':
+        dictionary = meta['values']
+        return [None if index == _NULL_INDEX else dictionary[index] for index in _from_le_bytes('I', data)]
+    if meta['kind'] == 'amount':
+        values = [None if minor == _NULL_AMOUNT else minor / 100 for minor in _from_le_bytes('q', data)]
+        for row_index in meta['ints']:
+            values[row_index] = int(values[row_index])
+        return values
+    if meta['kind'] == 'json':
+        return meta['values']
+    raise CodecError(f"Unknown column kind {meta['kind']!r}.")
+
+
+def decode(data):
+    """Returns the list of transaction dicts stored by encode()."""
+    body = _decompress(data)
+    (header_size,) = struct.unpack_from('<I', body)
+    offset = 4 + header_size
+    header = json.loads(body[4:offset])
+    row_count = header['rows']
+    columns = []
+    for meta in header['columns']:
+        columns.append(_decode_column(meta, body[offset:offset + meta['size']]))
+        offset += meta['size']
+    if any(len(column) != row_count for column in columns):
+        raise CodecError("Encoded statement columns don't match its row count.")
+    # Filled column by column: several times faster than building each row with dict(zip(...))
+    rows = [{} for _ in range(row_count)]
+    for key, column in zip(header['keys'], columns):
+        for row, value in zip(rows, column):
+            row[key] = value
+    return rows
@@ -13,12 +13,15 @@ document.addEventListener('DOMContentLoaded', () => {
   const downloadOptions = document.getElementById('downloadOptions');
   const fileIcon = document.getElementById('fileIcon');
   const uploadText = document.getElementById('uploadText');
+  const batchResults = document.getElementById('batchResults');
 
   let selectedFile = null;
+  let selectedFiles = []; // Set instead of selectedFile for a batch (several PDFs or a ZIP)
 
   // Function to reset UI elements
   const resetUI = () => {
       selectedFile = null;
+      selectedFiles = [];
       fileInput.value = ''; // Clear the file input
       dropZone.classList.remove('border-emerald-400', 'bg-emerald-50', 'border-blue-500', 'bg-blue-50');
       dropZone.classList.add('border-slate-300', 'hover:border-blue-400');
@@ -31,6 +34,7 @@ document.addEventListener('DOMContentLoaded', () => {
         <div class="space-y-1">
           <p class="text-sm font-medium text-slate-900">Upload your PDF statement</p>
           <p class="text-xs text-slate-500">Drag & drop your file here or click to browse</p>
+          <p class="text-xs text-slate-400">Converting many statements? Select several PDFs or a ZIP archive.</p>
         </div>
       `;
       
@@ -50,6 +54,8 @@ document.addEventListener('DOMContentLoaded', () => {
       downloadOptions.classList.add('hidden');
       const downloadButtonsContainer = downloadOptions.querySelector('.grid');
       if(downloadButtonsContainer) downloadButtonsContainer.innerHTML = ''; // Clear old buttons
+      batchResults.classList.add('hidden');
+      batchResults.innerHTML = '';
   };
 
   // Handle file selection
@@ -57,6 +63,8 @@ document.addEventListener('DOMContentLoaded', () => {
     // Always clear previous messages and download options when a new selection attempt is made
     messageDisplay.classList.add('hidden');
     downloadOptions.classList.add('hidden');
+    batchResults.classList.add('hidden');
+    selectedFiles = [];
 
     if (file && file.type === 'application/pdf') {
       selectedFile = file;
@@ -100,10 +108,57 @@ document.addEventListener('DOMContentLoaded', () => {
     }
   };
 
+  const isZipFile = (file) => ['application/zip', 'application/x-zip-compressed'].includes(file.type)
+    || file.name.toLowerCase().endsWith('.zip');
+
+  // Handle a selection of several PDFs and/or ZIP archives (batch mode).
+  // A single PDF keeps using the regular single-file flow.
+  const handleFilesSelect = (files) => {
+    const fileArray = Array.from(files || []);
+    if (fileArray.length === 1 && !isZipFile(fileArray[0])) {
+      handleFileSelect(fileArray[0]);
+      return;
+    }
+    if (!fileArray.length || !fileArray.every(file => file.type === 'application/pdf' || isZipFile(file))) {
+      // Shows the invalid-file error and resets the selection
+      handleFileSelect(fileArray.find(file => file.type !== 'application/pdf' && !isZipFile(file)) || null);
+      return;
+    }
+
+    messageDisplay.classList.add('hidden');
+    downloadOptions.classList.add('hidden');
+    batchResults.classList.add('hidden');
+    selectedFile = null;
+    selectedFiles = fileArray;
+
+    dropZone.classList.remove('border-slate-300', 'hover:border-blue-400', 'border-blue-500', 'bg-blue-50');
+    dropZone.classList.add('border-emerald-400', 'bg-emerald-50');
+    fileIcon.classList.remove('bg-blue-100', 'text-blue-600');
+    fileIcon.classList.add('bg-emerald-100', 'text-emerald-600');
+    uploadText.innerHTML = `
+      <div class="space-y-1">
+        <p class="text-sm font-medium text-slate-900">Selected for batch conversion:</p>
+        <p class="text-sm font-medium text-emerald-600" id="selectedFileName"></p>
+      </div>
+    `;
+    uploadText.querySelector('#selectedFileName').textContent = fileArray.length === 1
+      ? fileArray[0].name
+      : `${fileArray.length} files`;
+
+    browseButton.style.display = 'none';
+    submitButton.disabled = false;
+    submitButton.innerHTML = `
+      <svg xmlns="http://www.w3.org/2000/svg" width="20" height="20" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><path d="M21 15v4a2 2 0 0 1-2 2H5a2 2 0 0 1-2-2v-4"/><polyline points="17 8 12 3 7 8"/><line x1="12" y1="3" x2="12" y2="15"/></svg>
+      Upload & Convert All
+    `;
+    submitButton.classList.remove('bg-slate-200', 'text-slate-400', 'cursor-not-allowed');
+    submitButton.classList.add('bg-gradient-to-r', 'from-blue-600', 'to-indigo-600', 'text-white', 'shadow-md', 'hover:shadow-lg', 'hover:from-blue-700', 'hover:to-indigo-700', 'transform', 'hover:-translate-y-0.5');
+  };
+
   // File input change handler
   fileInput.addEventListener('change', (e) => {
-    if (e.target.files && e.target.files[0]) {
-      handleFileSelect(e.target.files[0]);
+    if (e.target.files && e.target.files.length) {
+      handleFilesSelect(e.target.files);
     }
   });
 
@@ -129,8 +184,8 @@ document.addEventListener('DOMContentLoaded', () => {
 
   dropZone.addEventListener('drop', (e) => {
     e.preventDefault();
-    if (e.dataTransfer.files && e.dataTransfer.files[0]) {
-      handleFileSelect(e.dataTransfer.files[0]);
+    if (e.dataTransfer.files && e.dataTransfer.files.length) {
+      handleFilesSelect(e.dataTransfer.files);
     } else {
        dropZone.classList.remove('border-blue-500', 'bg-blue-50');
        dropZone.classList.add('border-slate-300', 'hover:border-blue-400');
@@ -191,6 +246,9 @@ document.addEventListener('DOMContentLoaded', () => {
       const excelUrl = downloadOptions.dataset.excelUrl;
       const jsonUrl = downloadOptions.dataset.jsonUrl;
       const gsheetsUrl = downloadOptions.dataset.gsheetsUrl;
+      // Only set when the server can write them (pyarrow installed)
+      const parquetUrl = downloadOptions.dataset.parquetUrl;
+      const arrowUrl = downloadOptions.dataset.arrowUrl;
 
       downloadButtonsContainer.innerHTML = `
         <a href="${csvUrl}" download class="relative group flex flex-col items-center justify-center p-4 bg-white border border-slate-200 rounded-xl shadow-sm transition-all duration-300 hover:shadow-md hover:border-green-300 hover:bg-green-50/50 overflow-hidden">
@@ -233,14 +291,246 @@ document.addEventListener('DOMContentLoaded', () => {
            <div class="absolute inset-x-0 bottom-0 h-0.5 bg-gradient-to-r from-transparent via-cyan-500 to-transparent transform scale-x-0 group-hover:scale-x-100 transition-transform duration-500"></div>
         </a>
       `;
+      [[parquetUrl, 'Parquet'], [arrowUrl, 'Arrow']].forEach(([url, label]) => {
+        if (!url) return;
+        downloadButtonsContainer.insertAdjacentHTML('beforeend', `
+        <a href="${url}" download class="relative group flex flex-col items-center justify-center p-4 bg-white border border-slate-200 rounded-xl shadow-sm transition-all duration-300 hover:shadow-md hover:border-indigo-300 hover:bg-indigo-50/50 overflow-hidden">
+          <div class="absolute inset-0 bg-gradient-to-br from-indigo-600 to-indigo-500 opacity-0 group-hover:opacity-5 transition-opacity duration-300"></div>
+          <div class="w-12 h-12 mb-3 flex items-center justify-center rounded-full bg-gradient-to-br from-indigo-600 to-indigo-500 text-white">
+            <svg xmlns="http://www.w3.org/2000/svg" width="20" height="20" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><path d="M14.5 2H6a2 2 0 0 0-2 2v16a2 2 0 0 0 2 2h12a2 2 0 0 0 2-2V7.5L14.5 2z"/><polyline points="14 2 14 8 20 8"/><path d="M9 12v6"/><path d="M12 14v4"/><path d="M15 10v8"/></svg>
+          </div>
+          <span class="font-medium text-slate-800 group-hover:text-indigo-700">${label}</span>
+          <span class="text-xs text-slate-500 mt-1">Typed columns for data tools</span>
+          <div class="absolute inset-x-0 bottom-0 h-0.5 bg-gradient-to-r from-transparent via-indigo-500 to-transparent transform scale-x-0 group-hover:scale-x-100 transition-transform duration-500"></div>
+        </a>`);
+      });
       downloadOptions.classList.remove('hidden');
   };
 
+  // Progress line for a pending/running job, with the rows extracted so far when known
+  const describeJobProgress = (job) => {
+    if (job.rows_parsed > 0) {
+      return job.current_date
+        ? `Extracted ${job.rows_parsed} transactions so far (up to ${job.current_date})...`
+        : `Extracted ${job.rows_parsed} transactions so far...`;
+    }
+    return job.state === 'pending'
+      ? 'Waiting for a free worker...'
+      : 'Analyzing statement (this may take a moment)...';
+  };
+
+  // Poll the background job status endpoint until the extraction finishes.
+  // Resolves with an object shaped like the upload view's JSON response.
+  const JOB_POLL_INTERVAL_MS = 1500;
+  const pollJobStatus = async (statusUrl) => {
+    let progress = 75;
+    while (true) {
+      const response = await fetch(statusUrl, {
+        headers: { 'X-Requested-With': 'XMLHttpRequest' },
+      });
+      if (!response.ok) {
+        throw new Error(`Server error: ${response.status} ${response.statusText}`);
+      }
+      const job = await response.json();
+
+      if (job.state === 'succeeded') {
+        return { status: 'success', message: job.message, results_ready: job.results_ready };
+      }
+      if (job.state === 'failed') {
+        return { status: 'error', message: job.message };
+      }
+
+      // Still pending/running: creep the bar forward without ever reaching 100%
+      progress = Math.min(progress + 2, 95);
+      progressBar.style.width = `${progress}%`;
+      progressText.textContent = describeJobProgress(job);
+      await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+    }
+  };
+
+  // Follow the job's Server-Sent Events to show rows as they are extracted.
+  // Once it finishes, the status endpoint is read once (it also stores the result
+  // in the session). Falls back to polling if the event stream isn't available.
+  const followJobEvents = (eventsUrl, statusUrl) => {
+    if (!window.EventSource || !eventsUrl) {
+      return pollJobStatus(statusUrl);
+    }
+    return new Promise((resolve, reject) => {
+      const source = new EventSource(eventsUrl);
+      let progress = 75;
+      const finish = () => {
+        source.close();
+        pollJobStatus(statusUrl).then(resolve, reject);
+      };
+      source.addEventListener('progress', (event) => {
+        const job = JSON.parse(event.data);
+        progress = Math.min(progress + (job.rows_parsed > 0 ? 1 : 2), 95);
+        progressText.textContent = describeJobProgress(job);
+        progressBar.style.width = `${progress}%`;
+      });
+      source.addEventListener('done', finish);
+      source.onerror = () => {
+        // The browser reconnects by itself unless the stream was refused outright
+        if (source.readyState === EventSource.CLOSED) {
+          finish();
+        }
+      };
+    });
+  };
+
+  // Render one row per file of a batch: its state, and download links once converted
+  const BATCH_STATE_LABELS = { pending: 'Queued', running: 'Processing...', succeeded: 'Done', failed: 'Failed' };
+  const renderBatchResults = (batch) => {
+    batchResults.innerHTML = '';
+    batch.files.forEach(file => {
+      const row = document.createElement('li');
+      row.className = 'flex items-center justify-between gap-3 px-4 py-2';
+
+      const details = document.createElement('div');
+      details.className = 'min-w-0';
+      const name = document.createElement('p');
+      name.className = 'font-medium text-slate-800 truncate';
+      name.textContent = file.filename;
+      const state = document.createElement('p');
+      state.className = file.state === 'failed' ? 'text-xs text-red-600' : 'text-xs text-slate-500';
+      state.textContent = file.state === 'failed' || file.state === 'succeeded'
+        ? file.message
+        : BATCH_STATE_LABELS[file.state];
+      details.append(name, state);
+      row.appendChild(details);
+
+      if (file.downloads) {
+        const links = document.createElement('div');
+        links.className = 'flex gap-2 flex-shrink-0';
+        [['csv', 'CSV'], ['excel', 'Excel'], ['json', 'JSON']].forEach(([key, label]) => {
+          const link = document.createElement('a');
+          link.href = file.downloads[key];
+          link.setAttribute('download', '');
+          link.className = 'text-xs font-medium text-blue-700 hover:underline';
+          link.textContent = label;
+          links.appendChild(link);
+        });
+        row.appendChild(links);
+      }
+      batchResults.appendChild(row);
+    });
+    batchResults.classList.remove('hidden');
+  };
+
+  // Poll the batch status endpoint until every file has finished, updating per-file progress
+  const pollBatchStatus = async (statusUrl) => {
+    while (true) {
+      const response = await fetch(statusUrl, {
+        headers: { 'X-Requested-With': 'XMLHttpRequest' },
+      });
+      if (!response.ok) {
+        throw new Error(`Server error: ${response.status} ${response.statusText}`);
+      }
+      const batch = await response.json();
+      renderBatchResults(batch);
+      const progress = batch.total ? Math.round(10 + 90 * batch.completed / batch.total) : 100;
+      progressBar.style.width = `${progress}%`;
+      progressText.textContent = `Converted ${batch.completed} of ${batch.total} files...`;
+      if (batch.state === 'completed') {
+        return batch;
+      }
+      await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+    }
+  };
+
+  // Combined downloads of a batch: every converted statement in one ZIP per format
+  const showBatchDownloadOptions = (batch) => {
+    const downloadButtonsContainer = downloadOptions.querySelector('.grid');
+    if (!downloadButtonsContainer) return;
+    downloadButtonsContainer.innerHTML = '';
+    [['csv', 'CSV'], ['excel', 'Excel'], ['json', 'JSON']].forEach(([key, label]) => {
+      const link = document.createElement('a');
+      link.href = batch.combined_downloads[key];
+      link.setAttribute('download', '');
+      link.className = 'relative group flex flex-col items-center justify-center p-4 bg-white border border-slate-200 rounded-xl shadow-sm transition-all duration-300 hover:shadow-md hover:border-blue-300 hover:bg-blue-50/50';
+      link.innerHTML = `
+        <span class="font-medium text-slate-800 group-hover:text-blue-700"></span>
+        <span class="text-xs text-slate-500 mt-1">All statements as one ZIP archive</span>
+      `;
+      link.querySelector('span').textContent = `${label} (ZIP)`;
+      downloadButtonsContainer.appendChild(link);
+    });
+    downloadOptions.classList.remove('hidden');
+  };
+
+  const submitBatch = async () => {
+    messageDisplay.classList.add('hidden');
+    downloadOptions.classList.add('hidden');
+    progressContainer.classList.remove('hidden');
+    progressBar.style.width = '5%';
+    progressText.textContent = 'Uploading files...';
+    submitButton.disabled = true;
+    submitButton.innerHTML = `
+      <svg class="animate-spin -ml-1 mr-3 h-5 w-5 text-white" xmlns="http://www.w3.org/2000/svg" fill="none" viewBox="0 0 24 24">
+        <circle class="opacity-25" cx="12" cy="12" r="10" stroke="currentColor" stroke-width="4"></circle>
+        <path class="opacity-75" fill="currentColor" d="M4 12a8 8 0 018-8V0C5.373 0 0 5.373 0 12h4zm2 5.291A7.962 7.962 0 014 12H0c0 3.042 1.135 5.824 3 7.938l3-2.647z"></path>
+      </svg>
+      Processing...
+    `;
+
+    const formData = new FormData();
+    selectedFiles.forEach(file => formData.append('pdf_files', file));
+    const csrfToken = document.querySelector('[name=csrfmiddlewaretoken]').value;
+
+    try {
+      const response = await fetch(form.dataset.batchUrl, {
+        method: 'POST',
+        headers: {
+          'X-CSRFToken': csrfToken,
+          'X-Requested-With': 'XMLHttpRequest',
+        },
+        body: formData,
+      });
+      if (!response.ok) {
+        let errorMsg = `Server error: ${response.status} ${response.statusText}`;
+        try {
+          const errorResult = await response.json();
+          if (errorResult && errorResult.errors && errorResult.errors.pdf_files && errorResult.errors.pdf_files[0]) {
+            errorMsg = errorResult.errors.pdf_files[0].message;
+          } else if (errorResult && errorResult.message) {
+            errorMsg = errorResult.message;
+          }
+        } catch (e) { /* Ignore if response is not JSON, keep original errorMsg */ }
+        throw new Error(errorMsg);
+      }
+
+      const accepted = await response.json();
+      const batch = await pollBatchStatus(accepted.status_url);
+      progressContainer.classList.add('hidden');
+      if (batch.succeeded) {
+        showSuccess(`Converted ${batch.succeeded} of ${batch.total} statements.`);
+        showBatchDownloadOptions(batch);
+      } else {
+        showError(`None of the ${batch.total} files could be converted.`);
+      }
+    } catch (error) {
+      console.error('Batch upload error:', error);
+      showError(`Upload failed: ${error.message}`);
+      progressContainer.classList.add('hidden');
+    } finally {
+      submitButton.disabled = false;
+      submitButton.innerHTML = `
+        <svg xmlns="http://www.w3.org/2000/svg" width="20" height="20" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><path d="M21 15v4a2 2 0 0 1-2 2H5a2 2 0 0 1-2-2v-4"/><polyline points="17 8 12 3 7 8"/><line x1="12" y1="3" x2="12" y2="15"/></svg>
+        Upload & Convert All
+      `;
+    }
+  };
+
    // Handle form submission with Fetch API
   if (form) { // Check if form element exists before adding listener
     form.addEventListener('submit', async (e) => {
       e.preventDefault();
 
+    if (selectedFiles.length) {
+      await submitBatch();
+      return;
+    }
+
     if (!selectedFile) {
       console.error('No file selected, aborting submission.'); // New log
       showError('No file selected. Please choose a PDF file to upload.'); // User-facing message
@@ -305,7 +595,12 @@ document.addEventListener('DOMContentLoaded', () => {
           throw new Error(errorMsg);
       }
 
-      const result = await response.json(); // Parse JSON response
+      let result = await response.json(); // Parse JSON response
+
+      // Extraction runs in the background; wait for the job to finish
+      if (result.status === 'accepted' && result.status_url) {
+        result = await followJobEvents(result.events_url, result.status_url);
+      }
 
       progressContainer.classList.add('hidden'); // Hide progress bar on completion
 
@@ -387,6 +682,7 @@ document.addEventListener('DOMContentLoaded', () => {
      <div class="space-y-1">
        <p class="text-sm font-medium text-slate-900">Upload your PDF statement</p>
        <p class="text-xs text-slate-500">Drag & drop your file here or click to browse</p>
+       <p class="text-xs text-slate-400">Converting many statements? Select several PDFs or a ZIP archive.</p>
      </div>
    `;
    // Do NOT hide messageDisplay here, as it might contain a server-rendered message.
@@ -1,3 +1,1200 @@
-from django.test import TestCase
+import io
+import json
+import logging
+import math
+import os
+import queue
+import tempfile
+import time
+import zipfile
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import openpyxl
+from django.conf import settings
+from django.core.files.uploadedfile import InMemoryUploadedFile, SimpleUploadedFile, TemporaryUploadedFile
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (arrow_export, batches, feed, gemini_client, jobs, local_extraction, log_handlers, metrics, pipeline,
+               result_cache, statement_codec, timing)
+from .artifacts import get_export_rows, get_stored_artifact, render_artifacts, render_export
+from .dates import infer_date_format, normalize_dates, normalize_transaction_dates
+from .google_clients import BUNDLED_DISCOVERY_DIR, GoogleClientManager
+from .models import ExportArtifact, ExtractionBatch, ExtractionCacheEntry, ExtractionJob, StatementData, Transaction
+from .retention import get_retention_cutoff, purge_expired_statements
+from .transaction_table import TABLE_COLUMNS, TransactionTable
+from .transactions import (find_unstorable_value, iter_transaction_tables, load_transaction_table, parse_amount,
+                           replace_transactions, store_transactions)
+from .utils import (convert_data_to_csv_string, convert_data_to_excel_bytes, convert_data_to_excel_file,
+                    iter_csv_chunks, sanitize_for_formula_injection)
+
+
+def make_rows(*amounts):
+    return [{'date': f'2024-01-{index + 1:02d}', 'description': f'row {index}',
+             'debit': amount, 'credit': None, 'balance': '10.00'}
+            for index, amount in enumerate(amounts)]
+
+
+class ParseAmountTests(SimpleTestCase):
+    def test_reads_supported_formats(self):
+        cases = {
+            '1,234.50': Decimal('1234.50'),
+            '$1,234.50': Decimal('1234.50'),
+            '£12': Decimal('12.00'),
+            '-$5.25': Decimal('-5.25'),
+            '(12.00)': Decimal('-12.00'),
+            '12.00-': Decimal('-12.00'),
+            '99.10 DR': Decimal('-99.10'),
+            '3.20 CR': Decimal('3.20'),
+            ' 12.5 ': Decimal('12.50'),
+            '12.500': Decimal('12.50'),
+            1.5: Decimal('1.50'),
+            7: Decimal('7.00'),
+            Decimal('2.10'): Decimal('2.10'),
+        }
+        for value, expected in cases.items():
+            with self.subTest(value=value):
+                self.assertEqual(parse_amount(value), expected)
+
+    def test_rejects_instead_of_rounding_or_guessing(self):
+        for value in ('1.234,56', '12.345', 100.123, 0.1 + 0.2, '(12.00', 'abc', '1e5', True,
+                      float('nan'), '99999999999999999.00'):
+            with self.subTest(value=value):
+                self.assertIsNone(parse_amount(value))
+
+    def test_empty_values(self):
+        for value in (None, ''):
+            self.assertIsNone(parse_amount(value))
+
+    def test_find_unstorable_value(self):
+        self.assertIsNone(find_unstorable_value(make_rows('1.50', None, '', ' ', 2)))
+        self.assertEqual(find_unstorable_value(make_rows('1.50', '1.234,56')), (1, 'debit', '1.234,56'))
+        self.assertEqual(find_unstorable_value([{'date': 'x' * 65}]), (0, 'date', 'x' * 65))
+
+
+class StoreTransactionsTests(TestCase):
+    def create_statement(self, rows):
+        return StatementData.objects.create(pdf_filename='s.pdf', extracted_data=rows)
+
+    def test_stores_exact_statements(self):
+        statement = self.create_statement(make_rows('$1,234.50', 2))
+        self.assertEqual(store_transactions(statement, statement.extracted_data), 2)
+        self.assertEqual(list(Transaction.objects.filter(statement=statement).order_by('ordinal')
+                              .values_list('debit', flat=True)), [Decimal('1234.50'), Decimal('2.00')])
+
+    def test_inexact_statement_is_exported_from_extracted_data(self):
+        rows = make_rows('1.50', 100.123, '1.234,56')
+        statement = self.create_statement(rows)
+        self.assertEqual(store_transactions(statement, rows), 0)
+        self.assertFalse(Transaction.objects.filter(statement=statement).exists())
+        table = get_export_rows(statement, ExportArtifact.FORMAT_CSV)
+        self.assertEqual(table.debit, ['1.50', 100.123, '1.234,56'])
+
+    def test_replace_transactions(self):
+        statement = self.create_statement(make_rows('1.00'))
+        store_transactions(statement, statement.extracted_data)
+        self.assertEqual(replace_transactions(statement, make_rows('2.00', '3.00')), 2)
+        self.assertEqual(Transaction.objects.filter(statement=statement).count(), 2)
+        self.assertEqual(replace_transactions(statement, make_rows('2.001')), 0)
+        self.assertFalse(Transaction.objects.filter(statement=statement).exists())
+
+
+@skipUnless(arrow_export.is_available(), "pyarrow isn't installed")
+class ColumnarExportTests(SimpleTestCase):
+    def test_refuses_inexact_amounts(self):
+        table = TransactionTable.from_rows(make_rows('1.50', '1.234,56'))
+        with self.assertRaises(arrow_export.InexactAmountError):
+            arrow_export.convert_data_to_columnar_file(arrow_export.FORMAT_PARQUET, table)
+
+    def test_exact_amounts_round_trip(self):
+        import pyarrow.parquet
+
+        table = TransactionTable.from_rows(make_rows('$1,234.50', None, 2))
+        with arrow_export.convert_data_to_columnar_file(arrow_export.FORMAT_PARQUET, table) as output_file:
+            debits = pyarrow.parquet.read_table(output_file).column('debit').to_pylist()
+        self.assertEqual(debits, [Decimal('1234.50'), None, Decimal('2.00')])
+
+
+class MetricsSnapshotTests(SimpleTestCase):
+    def test_scrape_leaves_updates_for_the_flusher(self):
+        metrics.UPLOADS.inc(kind='test')
+        self.assertTrue(metrics.REGISTRY.dirty)
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_MULTIPROCESS_DIR=directory):
+            metrics.render_text()
+            self.assertTrue(metrics.REGISTRY.dirty)
+            metrics.flush_snapshot()
+            self.assertFalse(metrics.REGISTRY.dirty)
+            self.assertTrue(os.path.exists(metrics._snapshot_path(directory)))
+
+    def test_failed_flush_stays_dirty(self):
+        metrics.UPLOADS.inc(kind='test')
+        with tempfile.TemporaryDirectory() as directory:
+            missing = os.path.join(directory, 'missing')
+            with override_settings(METRICS_MULTIPROCESS_DIR=missing):
+                metrics.flush_snapshot()
+        self.assertTrue(metrics.REGISTRY.dirty)
+
+
+    def write_snapshot(self, directory, name, pid, uploads, in_flight, age_seconds=0):
+        path = os.path.join(directory, name)
+        with open(path, 'w', encoding='utf-8') as snapshot_file:
+            json.dump({'pid': pid, 'metrics': {
+                'statement_uploads_total': [[['exited'], uploads]],
+                'extractions_in_flight': [[[], in_flight]],
+            }}, snapshot_file)
+        modified = time.time() - age_seconds
+        os.utime(path, (modified, modified))
+        return path
+
+    def test_exited_processes_are_merged_once(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_MULTIPROCESS_DIR=directory):
+            exited = self.write_snapshot(directory, 'metrics-999-1-a.json', 999, uploads=3, in_flight=2)
+            alive = self.write_snapshot(directory, 'metrics-998-1-b.json', 998, uploads=4, in_flight=1)
+            with mock.patch.object(metrics, '_process_alive', side_effect=lambda pid: pid == 998):
+                for _ in range(2):  # The second scrape reads the exited process from the archive
+                    totals = metrics.collect()
+                    self.assertEqual(totals['statement_uploads_total'][('exited',)], 7)
+                    # Only the live process's gauge counts
+                    own_in_flight = sum(value for _, value in metrics.EXTRACTIONS_IN_FLIGHT.dump())
+                    self.assertEqual(totals['extractions_in_flight'][()], own_in_flight + 1)
+            self.assertFalse(os.path.exists(exited))
+            self.assertTrue(os.path.exists(alive))
+            self.assertTrue(os.path.exists(os.path.join(directory, metrics.ARCHIVE_NAME)))
+
+    def test_reused_pid_gets_its_own_snapshot(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_MULTIPROCESS_DIR=directory):
+            # Left by an exited process whose pid this one now has; it stopped refreshing its file
+            stale = self.write_snapshot(directory, f'metrics-{os.getpid()}-1-a.json', os.getpid(),
+                                        uploads=5, in_flight=1, age_seconds=3600)
+            self.assertNotEqual(metrics._snapshot_path(directory), stale)
+            self.assertEqual(metrics.collect()['statement_uploads_total'][('exited',)], 5)
+            self.assertFalse(os.path.exists(stale))
+
+
+@override_settings(METRICS_ENABLED=True, DEBUG=False)
+class MetricsViewTests(TestCase):
+    @override_settings(METRICS_AUTH_TOKEN=None)
+    def test_no_token_hides_the_endpoint(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+        with override_settings(DEBUG=True):
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    @override_settings(METRICS_AUTH_TOKEN='secret')
+    def test_token_required(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'# TYPE statement_uploads_total counter', response.content)
+
+
+class LogQueueTests(SimpleTestCase):
+    def record(self, message):
+        return logging.LogRecord('converter_app', logging.INFO, __file__, 0, message, None, None)
+
+    @override_settings(LOG_QUEUE_ENABLED=True, LOG_DEBUG_SAMPLE_RATE=1.0)
+    def test_only_file_handlers_are_queued(self):
+        logger = logging.getLogger('converter_app.tests.log_queue')
+        console = logging.StreamHandler(io.StringIO())
+        with tempfile.TemporaryDirectory() as directory:
+            log_file = logging.FileHandler(os.path.join(directory, 'app.log'))
+            logger.handlers = [console, log_file]
+            listeners = []
+            with mock.patch.object(log_handlers, '_listeners', listeners), \
+                    mock.patch.object(log_handlers.logging.config, 'dictConfig'):
+                log_handlers.configure_logging({'loggers': {'converter_app.tests.log_queue': {}}})
+            try:
+                self.assertIs(logger.handlers[0], console)  # Still written synchronously
+                self.assertIsInstance(logger.handlers[1], log_handlers.NonBlockingQueueHandler)
+                self.assertEqual(listeners[0].handlers, (log_file,))
+                logger.warning("queued %s", 'record')
+                self.assertEqual(console.stream.getvalue(), 'queued record\n')
+            finally:
+                for listener in listeners:
+                    listener.stop()  # Drains the queue into the file
+                logger.handlers = []
+                log_file.close()
+            with open(os.path.join(directory, 'app.log'), encoding='utf-8') as written:
+                self.assertEqual(written.read(), 'queued record\n')
+
+    @override_settings(LOG_QUEUE_ENABLED=True)
+    def test_console_only_logging_gets_no_queue(self):
+        logger = logging.getLogger('converter_app.tests.console_only')
+        console = logging.StreamHandler(io.StringIO())
+        logger.handlers = [console]
+        self.addCleanup(setattr, logger, 'handlers', [])
+        listeners = []
+        with mock.patch.object(log_handlers, '_listeners', listeners), \
+                mock.patch.object(log_handlers.logging.config, 'dictConfig'):
+            log_handlers.configure_logging({'loggers': {'converter_app.tests.console_only': {}}})
+        self.assertEqual(logger.handlers, [console])
+        self.assertEqual(listeners, [])
+
+    def test_full_queue_drops_and_reports(self):
+        handler = log_handlers.NonBlockingQueueHandler(queue.Queue(2))
+        for index in range(3):
+            handler.handle(self.record(f'record {index}'))
+        self.assertEqual((handler.dropped, handler.dropped_total), (1, 1))
+        self.assertEqual([handler.queue.get_nowait().getMessage() for _ in range(2)], ['record 0', 'record 1'])
+
+        handler.handle(self.record('record 3'))  # Room again: the drop is reported first
+        notice, record = handler.queue.get_nowait(), handler.queue.get_nowait()
+        self.assertEqual(notice.getMessage(), 'Dropped 1 log records: the log queue was full.')
+        self.assertEqual(notice.levelno, logging.WARNING)
+        self.assertEqual(record.getMessage(), 'record 3')
+        self.assertEqual(handler.dropped, 0)
+
+
+class StageUploadTests(SimpleTestCase):
+    def test_in_memory_upload_hands_over_its_buffer(self):
+        buffer = io.BytesIO(b'%PDF-1.4 in memory')
+        buffer.read()
+        upload = InMemoryUploadedFile(buffer, 'pdf_file', 'statement.pdf', 'application/pdf', 18, None)
+        staged = jobs.stage_upload(upload)
+        self.assertIs(staged, buffer)
+        self.assertEqual(staged.tell(), 0)
+        upload.close()  # What Django does once the response is sent
+        self.assertEqual(staged.read(), b'%PDF-1.4 in memory')
+        jobs.discard_staged_upload(staged)
+        self.assertTrue(staged.closed)
+
+    def test_temporary_upload_is_linked_and_outlives_the_request(self):
+        upload = TemporaryUploadedFile('statement.pdf', 'application/pdf', 11, None)
+        upload.write(b'%PDF-1.4 on')
+        upload.flush()
+        staged = jobs.stage_upload(upload)
+        self.assertIsInstance(staged, str)
+        self.assertNotEqual(staged, upload.temporary_file_path())
+        upload.close()  # Removes Django's own name for the file
+        with open(staged, 'rb') as staged_file:
+            self.assertEqual(staged_file.read(), b'%PDF-1.4 on')
+        jobs.discard_staged_upload(staged)
+        self.assertFalse(os.path.exists(staged))
+
+    def test_falls_back_to_a_copy_when_linking_fails(self):
+        upload = TemporaryUploadedFile('statement.pdf', 'application/pdf', 15, None)
+        upload.write(b'%PDF-1.4 copied')
+        upload.flush()
+        with mock.patch.object(jobs.os, 'link', side_effect=OSError('cross-device link')):
+            staged = jobs.stage_upload(upload)
+        self.addCleanup(jobs.discard_staged_upload, staged)
+        upload.close()
+        with open(staged, 'rb') as staged_file:
+            self.assertEqual(staged_file.read(), b'%PDF-1.4 copied')
+
+
+class JobEventStreamTests(TestCase):
+    def setUp(self):
+        self.job = ExtractionJob.objects.create(pdf_filename='s.pdf')
+        session = self.client.session
+        session['extraction_job_id'] = str(self.job.id)
+        session.save()
+        self.url = f'/jobs/{self.job.id}/events/'
+
+    def test_disabled_by_default(self):
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    @override_settings(EXTRACTION_EVENTS_ENABLED=True, EXTRACTION_EVENTS_MAX_SECONDS=0)
+    def test_stream_ends_at_the_cap(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'retry: 3000\n\n')
+
+    def test_status_reports_progress(self):
+        ExtractionJob.objects.filter(id=self.job.id).update(rows_parsed=3, progress_date='2024-01-03')
+        job = self.client.get(f'/jobs/{self.job.id}/').json()
+        self.assertEqual((job['rows_parsed'], job['current_date']), (3, '2024-01-03'))
+
+
+class RetentionTests(TestCase):
+    def test_disabled_by_default(self):
+        self.assertIsNone(get_retention_cutoff())
+        with mock.patch.object(jobs, 'get_executor') as get_executor:
+            jobs.maybe_schedule_purge()
+        get_executor.assert_not_called()
+
+    @override_settings(STATEMENT_RETENTION_DAYS=30)
+    def test_cutoff(self):
+        now = timezone.now()
+        self.assertEqual(get_retention_cutoff(now), now - timedelta(days=30))
+
+    @override_settings(STATEMENT_RETENTION_DAYS=30)
+    def test_purges_only_statements_before_the_cutoff(self):
+        now = timezone.now()
+        expired = StatementData.objects.create(pdf_filename='old.pdf', extracted_data=make_rows('1.00'),
+                                               uploaded_at=now - timedelta(days=31))
+        kept = StatementData.objects.create(pdf_filename='new.pdf', extracted_data=make_rows('1.00'),
+                                            uploaded_at=now - timedelta(days=29))
+        for statement in (expired, kept):
+            store_transactions(statement, statement.extracted_data)
+        purge_expired_statements(batch_size=1)
+        self.assertEqual(list(StatementData.objects.values_list('id', flat=True)), [kept.id])
+        self.assertEqual(list(Transaction.objects.values_list('statement_id', flat=True)), [kept.id])
+
+    @override_settings(STATEMENT_RETENTION_DAYS=30)
+    def test_transactions_are_deleted_in_bounded_batches(self):
+        statement = StatementData.objects.create(pdf_filename='old.pdf', extracted_data=make_rows(*range(7)),
+                                                 uploaded_at=timezone.now() - timedelta(days=31))
+        store_transactions(statement, statement.extracted_data)
+        with CaptureQueriesContext(connection) as queries:
+            stats = purge_expired_statements(transaction_batch_size=3)
+        batch_deletes = [query['sql'] for query in queries.captured_queries
+                         if query['sql'].startswith('DELETE FROM "converter_app_transaction" WHERE '
+                                                    '"converter_app_transaction"."id" IN')]
+        self.assertEqual([sql.count(',') + 1 for sql in batch_deletes], [3, 3, 1])
+        self.assertEqual((stats['statements'], stats['transactions'], stats['delete_batches']), (1, 7, 4))
+        self.assertFalse(Transaction.objects.exists())
+
+
+class ExtractionJobStateTests(TestCase):
+    def create_job(self, status, age_seconds=0, created_seconds_ago=0):
+        job = ExtractionJob.objects.create(pdf_filename='s.pdf', status=status)
+        ExtractionJob.objects.filter(id=job.id).update(
+            updated_at=timezone.now() - timedelta(seconds=age_seconds),
+            created_at=timezone.now() - timedelta(seconds=created_seconds_ago))
+        return ExtractionJob.objects.get(id=job.id)
+
+    def run_job(self, job, result=None, side_effect=None):
+        result = result or {'status': 'success', 'message': 'Done.', 'results_ready': False,
+                            'statement_data_id': None, 'date_range_string': '', 'transaction_count': 0}
+        with mock.patch.object(jobs, 'run_extraction', return_value=result, side_effect=side_effect) as run:
+            jobs._run_job(job.id, None, None, 'test')
+        job.refresh_from_db()
+        return run
+
+    @override_settings(EXTRACTION_JOB_TIMEOUT_SECONDS=60, EXTRACTION_JOB_PENDING_TIMEOUT_SECONDS=300)
+    def test_queued_jobs_get_the_pending_timeout(self):
+        job = self.create_job(ExtractionJob.STATUS_PENDING, age_seconds=120, created_seconds_ago=120)
+        self.assertEqual(jobs.get_job_state(job), ExtractionJob.STATUS_PENDING)
+        job = self.create_job(ExtractionJob.STATUS_PENDING, age_seconds=400, created_seconds_ago=400)
+        self.assertEqual(jobs.get_job_state(job), ExtractionJob.STATUS_FAILED)
+        self.run_job(job).assert_not_called()  # A worker reaching it later leaves it failed
+        self.assertEqual(job.status, ExtractionJob.STATUS_FAILED)
+
+    @override_settings(EXTRACTION_JOB_TIMEOUT_SECONDS=60)
+    def test_stale_running_jobs_time_out(self):
+        self.assertEqual(jobs.get_job_state(self.create_job(ExtractionJob.STATUS_RUNNING, age_seconds=30)),
+                         ExtractionJob.STATUS_RUNNING)
+        self.assertEqual(jobs.get_job_state(self.create_job(ExtractionJob.STATUS_RUNNING, age_seconds=120)),
+                         ExtractionJob.STATUS_FAILED)
+
+    def test_runs_a_pending_job(self):
+        job = self.create_job(ExtractionJob.STATUS_PENDING)
+        self.run_job(job).assert_called_once()
+        self.assertEqual((job.status, job.message), (ExtractionJob.STATUS_SUCCEEDED, 'Done.'))
+
+    def test_doesnt_run_a_job_it_cant_claim(self):
+        job = self.create_job(ExtractionJob.STATUS_FAILED)
+        self.run_job(job).assert_not_called()
+        self.assertEqual(job.status, ExtractionJob.STATUS_FAILED)
+
+    def test_keeps_a_timeout_reported_while_running(self):
+        job = self.create_job(ExtractionJob.STATUS_PENDING)
+        result = {'status': 'success', 'message': 'Done.', 'results_ready': False,
+                  'statement_data_id': None, 'date_range_string': '', 'transaction_count': 0}
+
+        def timed_out(*args, **kwargs):
+            ExtractionJob.objects.filter(id=job.id).update(status=ExtractionJob.STATUS_FAILED, message='Timed out.')
+            return result
+
+        self.run_job(job, side_effect=timed_out)
+        self.assertEqual((job.status, job.message), (ExtractionJob.STATUS_FAILED, 'Timed out.'))
+
+
+class StatementChangeTests(TestCase):
+    def test_edit_rebuilds_transactions_and_drops_artifacts(self):
+        statement = StatementData.objects.create(pdf_filename='s.pdf', extracted_data=make_rows('1.00'))
+        store_transactions(statement, statement.extracted_data)
+        render_artifacts(statement.id)
+        self.assertTrue(ExportArtifact.objects.filter(statement=statement).exists())
+
+        statement.extracted_data = make_rows('2.00', '3.00')
+        statement.save()
+        self.assertEqual(list(Transaction.objects.filter(statement=statement).order_by('ordinal')
+                              .values_list('debit', flat=True)), [Decimal('2.00'), Decimal('3.00')])
+        self.assertFalse(ExportArtifact.objects.filter(statement=statement).exists())
+        self.assertEqual(get_export_rows(statement, ExportArtifact.FORMAT_CSV).debit,
+                         [Decimal('2.00'), Decimal('3.00')])
+
+    def test_other_changes_keep_transactions_and_artifacts(self):
+        statement = StatementData.objects.create(pdf_filename='s.pdf', extracted_data=make_rows('1.00'))
+        store_transactions(statement, statement.extracted_data)
+        render_artifacts(statement.id)
+        statement.pdf_filename = 'renamed.pdf'
+        with mock.patch('converter_app.signals.replace_transactions') as replace:
+            with self.assertNumQueries(1):
+                statement.save(update_fields=['pdf_filename'])
+            statement.save()  # Compares the rows with the stored ones
+            statement.extracted_data = make_rows('1.00')  # Same rows, written again
+            statement.save()
+        replace.assert_not_called()
+        self.assertEqual(ExportArtifact.objects.filter(statement=statement).count(), 3)
+        self.assertEqual(StatementData.objects.get(id=statement.id).data_version, 0)
+
+    def test_render_that_overlaps_an_edit_stores_nothing(self):
+        statement = StatementData.objects.create(pdf_filename='s.pdf', extracted_data=make_rows('1.00'))
+        original_render = render_export
+
+        def render_then_edit(export_format, rows):
+            edited = StatementData.objects.get(id=statement.id)
+            edited.extracted_data = make_rows('2.00')
+            edited.save()
+            return original_render(export_format, rows)
+
+        with mock.patch('converter_app.artifacts.render_export', side_effect=render_then_edit):
+            render_artifacts(statement.id)
+        self.assertFalse(ExportArtifact.objects.filter(statement=statement).exists())
+        self.assertEqual(StatementData.objects.get(id=statement.id).data_version, 1)
+        render_artifacts(statement.id)
+        self.assertEqual(ExportArtifact.objects.filter(statement=statement).count(), 3)
+
+    @override_settings(ARTIFACT_TOUCH_INTERVAL_SECONDS=3600)
+    def test_downloads_record_access_at_most_hourly(self):
+        statement = StatementData.objects.create(pdf_filename='s.pdf', extracted_data=make_rows('1.00'))
+        render_artifacts(statement.id)
+        with self.assertNumQueries(1):
+            self.assertIsNotNone(get_stored_artifact(statement.id, ExportArtifact.FORMAT_CSV))
+        ExportArtifact.objects.update(last_accessed_at=timezone.now() - timedelta(hours=2))
+        with self.assertNumQueries(2):
+            artifact = get_stored_artifact(statement.id, ExportArtifact.FORMAT_CSV)
+        self.assertGreater(artifact.last_accessed_at, timezone.now() - timedelta(minutes=1))
+
+
+class ColumnarDownloadLinkTests(TestCase):
+    def test_links_follow_pyarrow_availability(self):
+        for available in (False, True):
+            with self.subTest(available=available), \
+                    mock.patch.object(arrow_export, 'is_available', return_value=available):
+                page = self.client.get('/').content.decode()
+                self.assertEqual('data-parquet-url' in page, available)
+                self.assertEqual('data-arrow-url' in page, available)
+
+    def test_downloads_answer_501_without_pyarrow(self):
+        with mock.patch.object(arrow_export, 'is_available', return_value=False):
+            self.assertEqual(self.client.get('/download/parquet/').status_code, 501)
+
+
+class DiscoveryDocumentTests(SimpleTestCase):
+    def manager(self):
+        return GoogleClientManager(pool_size=1, idle_seconds=60, timeout_seconds=10, cache_size=1)
+
+    @override_settings(GOOGLE_DISCOVERY_DIR=None)
+    def test_bundled_copy_by_default(self):
+        self.assertTrue(os.path.exists(os.path.join(BUNDLED_DISCOVERY_DIR, 'sheets.v4.json')))
+        self.assertEqual(self.manager().get_discovery_document('sheets', 'v4')['name'], 'sheets')
+
+    def test_reads_google_discovery_dir(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'sheets.v4.json'), 'w', encoding='utf-8') as document:
+                document.write('{"name": "local copy"}')
+            with override_settings(GOOGLE_DISCOVERY_DIR=directory):
+                self.assertEqual(self.manager().get_discovery_document('sheets', 'v4'), {'name': 'local copy'})
+
+
+class GoogleClientReuseTests(SimpleTestCase):
+    def manager(self, **options):
+        return GoogleClientManager(**{'pool_size': 1, 'idle_seconds': 60, 'timeout_seconds': 10,
+                                      'cache_size': 4, **options})
+
+    def test_transports_are_reused_and_pool_is_bounded(self):
+        manager = self.manager()
+        with manager.transport() as outer, manager.transport() as inner:
+            self.assertIsNot(outer, inner)
+        # inner went back to the pool first; with pool_size=1 outer was closed
+        with manager.transport() as reused:
+            self.assertIs(reused, inner)
+        self.assertEqual(len(manager._idle_transports), 1)
+
+    def test_failed_request_closes_its_transport(self):
+        manager = self.manager()
+        with mock.patch('converter_app.google_clients.httplib2.Http') as http_class:
+            with self.assertRaises(RuntimeError), manager.transport():
+                raise RuntimeError('half-read response')
+        http_class.return_value.close.assert_called_once_with()
+        self.assertEqual(manager._idle_transports, [])
+
+    def test_idle_transports_are_closed(self):
+        manager = self.manager(idle_seconds=0)
+        with manager.transport() as stale:
+            pass
+        with mock.patch.object(stale, 'close') as close, manager.transport() as http:
+            self.assertIsNot(http, stale)
+        close.assert_called_once_with()
+
+    def test_credentials_and_services_are_cached_per_grant(self):
+        manager = self.manager(cache_size=1)
+        credentials = manager.get_credentials(credentials_args())
+        self.assertIs(manager.get_credentials(credentials_args()), credentials)
+        service = manager.get_service('sheets', 'v4', credentials)
+        self.assertIs(manager.get_service('sheets', 'v4', credentials), service)
+
+        manager.forget_credentials(credentials_args())
+        self.assertIsNot(manager.get_credentials(credentials_args()), credentials)
+        self.assertIsNot(manager.get_service('sheets', 'v4', credentials), service)
+
+    def test_concurrent_refreshes_of_one_grant_refresh_once(self):
+        manager = self.manager()
+        credentials = manager.get_credentials(credentials_args(expiry_hours=-1))
+
+        def refresh(request):
+            credentials.token = 'refreshed'
+            credentials.expiry = (timezone.now() + timedelta(hours=1)).replace(tzinfo=None)
+
+        with mock.patch.object(credentials, 'refresh', side_effect=refresh) as refresh_mock:
+            manager.refresh_credentials(credentials)
+            manager.refresh_credentials(credentials)  # A waiting request finds it already valid
+        refresh_mock.assert_called_once()
+        self.assertEqual(credentials.token, 'refreshed')
+
+
+def credentials_args(token='token-1', expiry_hours=1, scopes=('https://www.googleapis.com/auth/spreadsheets',)):
+    return {'token': token, 'refresh_token': 'refresh', 'scopes': list(scopes),
+            'token_uri': 'https://oauth2.googleapis.com/token', 'client_id': 'client', 'client_secret': 'secret',
+            'expiry': (timezone.now() + timedelta(hours=expiry_hours)).replace(tzinfo=None)}
+
+
+class GoogleSheetsTests(SimpleTestCase):
+    def manager(self):
+        return GoogleClientManager(pool_size=1, idle_seconds=60, timeout_seconds=10, cache_size=4)
+
+    def test_reauth_replaces_cached_credentials(self):
+        manager = self.manager()
+        cached = manager.get_credentials(credentials_args())
+        service = manager.get_service('sheets', 'v4', cached)
+        self.assertIs(manager.get_credentials(credentials_args()), cached)
+        # Same refresh token, newer access token: the user re-authorised
+        fresh = manager.get_credentials(credentials_args(token='token-2', expiry_hours=2))
+        self.assertIsNot(fresh, cached)
+        self.assertEqual(fresh.token, 'token-2')
+        self.assertIsNot(manager.get_service('sheets', 'v4', fresh), service)
+
+    def test_older_session_token_keeps_cached_credentials(self):
+        manager = self.manager()
+        cached = manager.get_credentials(credentials_args(token='refreshed', expiry_hours=2))
+        self.assertIs(manager.get_credentials(credentials_args(token='token-1')), cached)
+
+    def test_scopes_are_part_of_the_cache_key(self):
+        manager = self.manager()
+        narrow = manager.get_credentials(credentials_args())
+        wide = manager.get_credentials(credentials_args(
+            scopes=('https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive.file')))
+        self.assertIsNot(wide, narrow)
+        self.assertIn('https://www.googleapis.com/auth/drive.file', wide.scopes)
+
+    def test_spreadsheet_is_created_in_one_request(self):
+        from googleapiclient.http import HttpMockSequence
+        from .google_sheets import create_statement_spreadsheet
+
+        manager = self.manager()
+        http = HttpMockSequence([({'status': '200'}, json.dumps(
+            {'spreadsheetId': 'sheet-1', 'spreadsheetUrl': 'https://sheets.example/sheet-1'}))])
+        manager._idle_transports.append((float('inf'), http))
+        credentials = manager.get_credentials(credentials_args())
+        rows = [{'date': '2024-01-02', 'description': '=SUM(A1)', 'debit': '1,234.50', 'credit': None,
+                 'balance': '10.00'}]
+        with mock.patch('converter_app.google_sheets.get_google_client_manager', return_value=manager):
+            result = create_statement_spreadsheet(credentials, 'Bank Statement', rows)
+
+        self.assertEqual(result, ('sheet-1', 'https://sheets.example/sheet-1', 10))
+        self.assertEqual(len(http.request_sequence), 1)  # No follow-up rename or values calls
+        body = json.loads(http.request_sequence[0][2])
+        sheet = body['sheets'][0]
+        self.assertEqual(sheet['properties']['title'], 'Transactions')
+        header, row = sheet['data'][0]['rowData']
+        self.assertEqual([cell['userEnteredValue']['stringValue'] for cell in header['values']],
+                         ['date', 'description', 'debit', 'credit', 'balance'])
+        date_cell, description, debit, credit, balance = row['values']
+        self.assertEqual(date_cell['userEnteredValue'], {'numberValue': 45293})
+        self.assertEqual(description['userEnteredValue'], {'stringValue': '=SUM(A1)'})
+        self.assertEqual(debit['userEnteredValue'], {'numberValue': 1234.5})
+        self.assertEqual(credit, {})
+
+
+class GeminiClientTests(SimpleTestCase):
+    def setUp(self):
+        # Configure a throwaway copy of the library's client state, not the process-wide one
+        from google.generativeai import client as genai_client
+        self.genai_client = genai_client
+        patcher = mock.patch.object(genai_client, '_client_manager', genai_client._ClientManager())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @override_settings(GEMINI_API_ENDPOINT='http://127.0.0.1:8765', GEMINI_TRANSPORT='rest')
+    def test_custom_endpoint_serves_the_file_api_discovery_document(self):
+        import httplib2
+        from benchmarks.fake_gemini import discovery_document
+
+        library_url = self.genai_client.GENAI_API_DISCOVERY_URL
+        gemini_client.GeminiClient().get_model()
+        self.assertEqual(self.genai_client.GENAI_API_DISCOVERY_URL, library_url)
+
+        content = json.dumps(discovery_document('http://127.0.0.1:8765/')).encode('utf-8')
+        with mock.patch.object(gemini_client.httplib2, 'Http') as http_class:
+            http_class.return_value.request.return_value = (httplib2.Response({'status': '200'}), content)
+            file_client = self.genai_client.get_default_file_client()
+            file_client._setup_discovery_api()
+            file_client._setup_discovery_api()  # e.g. another thread: reuses the fetched document
+        http_class.return_value.request.assert_called_once()
+        url = http_class.return_value.request.call_args.args[0]
+        self.assertTrue(url.startswith('http://127.0.0.1:8765/$discovery/rest?'))
+        self.assertTrue(hasattr(file_client._local.discovery_api, 'media'))
+
+    @override_settings(GEMINI_API_ENDPOINT=None)
+    def test_default_endpoint_keeps_the_library_discovery(self):
+        gemini_client.GeminiClient().get_model()
+        file_client = self.genai_client.get_default_file_client()
+        self.assertNotIn('_setup_discovery_api', vars(file_client))
+
+    def test_warm_up_is_opt_in(self):
+        with mock.patch.object(gemini_client, 'get_generative_model') as get_model:
+            with self.settings():
+                del settings.GEMINI_WARMUP_ENABLED
+                gemini_client.warm_up()
+            with override_settings(GEMINI_WARMUP_ENABLED=False):
+                gemini_client.warm_up()
+            get_model.assert_not_called()
+            with override_settings(GEMINI_WARMUP_ENABLED=True):
+                gemini_client.warm_up()
+        get_model.assert_called_once_with(request_id='warm-up')
+
+
+@override_settings(FEED_AUTH_TOKEN='secret', FEED_SETTLE_SECONDS=30)
+class TransactionFeedTests(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        # The second statement has the larger id but was uploaded first
+        for minutes_ago, amounts in ((5, ('1.00', '2.00')), (10, ('3.00',)), (1, ('4.00', '5.00', '6.00'))):
+            statement = StatementData.objects.create(
+                pdf_filename=f'{minutes_ago}.pdf', uploaded_at=now - timedelta(minutes=minutes_ago),
+                extracted_data=make_rows(*amounts))
+            store_transactions(statement, statement.extracted_data)
+        StatementData.objects.create(pdf_filename='new.pdf', extracted_data=make_rows('7.00'))
+
+    def read(self, cursor=None, limit=None):
+        lines = [json.loads(line) for chunk in feed.iter_feed_lines(cursor, limit)
+                 for line in chunk.splitlines()]
+        return lines[:-1], lines[-1]
+
+    def test_cursor_round_trip(self):
+        uploaded_at = timezone.now()
+        self.assertEqual(feed.decode_cursor(feed.encode_cursor(uploaded_at, 12, 3)), (uploaded_at, 12, 3))
+
+    def test_invalid_cursor(self):
+        for cursor in ('nonsense', feed.encode_cursor(timezone.now(), 1, 0)[:-2] + '!!'):
+            with self.subTest(cursor=cursor), self.assertRaises(feed.InvalidCursor):
+                feed.iter_feed_lines(cursor)
+
+    def test_feed_order_skips_unsettled_statements(self):
+        rows, end = self.read()
+        self.assertEqual([row['debit'] for row in rows], ['3.00', '1.00', '2.00', '4.00', '5.00', '6.00'])
+        self.assertEqual(end, {'type': 'end', 'cursor': rows[-1]['cursor'], 'count': 6, 'has_more': False})
+
+    def test_paging_matches_a_full_read(self):
+        full, _ = self.read()
+        paged, cursor = [], None
+        while True:
+            rows, end = self.read(cursor, limit=2)
+            paged.extend(rows)
+            cursor = end['cursor']
+            if not end['has_more']:
+                break
+        self.assertEqual(paged, full)
+
+    def test_view_requires_token(self):
+        url = reverse('converter_app:transaction_feed')
+        self.assertEqual(self.client.get(url).status_code, 401)
+        response = self.client.get(url, HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 7)
+        self.assertEqual(self.client.get(url, {'cursor': 'nonsense'},
+                                         HTTP_AUTHORIZATION='Bearer secret').status_code, 400)
+        with override_settings(FEED_AUTH_TOKEN=None):
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class StatementCodecTests(SimpleTestCase):
+    def test_round_trip(self):
+        rows = [
+            {'date': '2024-01-01', 'description': 'Café', 'debit': 12.5, 'credit': None, 'balance': 100},
+            {'date': '2024-01-01', 'description': None, 'debit': None, 'credit': 0.1, 'balance': -3.07},
+            {'date': None, 'description': 'Café', 'debit': 0, 'credit': 1e13, 'balance': [1, 'x']},
+        ]
+        for compression in ('zstd', 'zlib'):
+            with self.subTest(compression=compression):
+                decoded = statement_codec.decode(statement_codec.encode(rows, compression=compression))
+                self.assertEqual(decoded, rows)
+                self.assertEqual([list(row) for row in decoded], [list(row) for row in rows])
+                self.assertEqual([type(row['balance']) for row in decoded], [int, float, list])
+
+    def test_amounts_that_are_not_whole_cents_round_trip(self):
+        for amount in (1.005, -0.0, float('inf'), 2 ** 60):
+            with self.subTest(amount=amount):
+                decoded = statement_codec.decode(statement_codec.encode([{'debit': 1.5}, {'debit': amount}]))
+                self.assertEqual(decoded, [{'debit': 1.5}, {'debit': amount}])
+                self.assertEqual(math.copysign(1, decoded[1]['debit']), math.copysign(1, amount))
+
+    def test_rows_without_a_shared_layout_are_not_encoded(self):
+        for rows in ([], {'debit': 1}, [['a']], [{'a': 1, 'b': 2}, {'b': 2, 'a': 1}], [{'a': 1}, {'b': 1}]):
+            with self.subTest(rows=rows):
+                self.assertIsNone(statement_codec.encode(rows))
+
+    def test_corrupt_data(self):
+        with self.assertRaises(statement_codec.CodecError):
+            statement_codec.decode(statement_codec.MAGIC + b'\x00garbage')
+
+    @override_settings(STATEMENT_STORAGE_CODEC='columnar')
+    def test_model_reads_back_either_column(self):
+        statement = StatementData(extracted_data=[{'debit': 1.0}, {'credit': 2.0}])
+        self.assertIsNone(statement.extracted_packed)  # Rows with different keys stay JSON
+        self.assertEqual(statement.extracted_data, [{'debit': 1.0}, {'credit': 2.0}])
+        statement.extracted_data = make_rows(1.25, None)
+        self.assertIsNone(statement.extracted_json)
+        self.assertEqual(statement.extracted_data, make_rows(1.25, None))
+
+
+class DateInferenceTests(SimpleTestCase):
+    def test_statement_format_decides_ambiguous_rows(self):
+        self.assertEqual(infer_date_format(['03/04/2024', '25/04/2024']), 'day_first')
+        self.assertEqual(infer_date_format(['03/04/2024', '04/25/2024']), 'month_first')
+        self.assertEqual(normalize_dates(['03/04/2024', '04/25/2024']), [date(2024, 3, 4), date(2024, 4, 25)])
+        self.assertEqual(normalize_dates(['03/04/2024']), [date(2024, 4, 3)])  # Day first on a tie
+
+    def test_other_formats_and_unreadable_rows(self):
+        self.assertEqual(normalize_dates(['2024-01-15', '15-Jan-2024', '15/01/24', '', None, 'soon', '31/02/2024']),
+                         [date(2024, 1, 15)] * 3 + [None] * 4)
+        self.assertEqual(normalize_dates(['soon', 'later']), [None, None])
+        self.assertEqual(normalize_transaction_dates([{'date': '2024-01-15'}, 'not a row']),
+                         [date(2024, 1, 15), None])
+
+
+class TransactionTableTests(SimpleTestCase):
+    rows = [
+        {'date': '2024-01-02', 'description': '=SUM(A1)', 'debit': '1.00', 'credit': None, 'balance': '9.00'},
+        'not a row',
+        {'date': '2024-01-03', 'description': '=SUM(A1)', 'debit': None, 'credit': 2, 'balance': '11.00'},
+    ]
+
+    def test_from_rows_and_values_agree(self):
+        table = TransactionTable.from_rows(self.rows)
+        self.assertEqual(len(table), 2)
+        self.assertEqual(table.credit, [None, 2])
+        values = TransactionTable.from_values(zip(*(table.column(name) for name in TABLE_COLUMNS)))
+        self.assertEqual([values.column(name) for name in TABLE_COLUMNS],
+                         [table.column(name) for name in TABLE_COLUMNS])
+        self.assertEqual(len(TransactionTable.from_values([])), 0)
+
+    def test_derived_columns_are_cached(self):
+        table = TransactionTable.from_rows(self.rows)
+        func = mock.Mock(side_effect=sanitize_for_formula_injection)
+        self.assertEqual(table.mapped('description', func), ["'=SUM(A1)", "'=SUM(A1)"])
+        self.assertIs(table.mapped('description', func), table.mapped('description', func))
+        self.assertEqual(func.call_count, 1)  # Once per distinct string
+        self.assertEqual(table.parsed_dates(), [date(2024, 1, 2), date(2024, 1, 3)])
+
+    def test_csv_is_the_same_for_rows_and_tables(self):
+        table = TransactionTable.from_rows(self.rows)
+        csv_text = convert_data_to_csv_string(table)
+        self.assertEqual(convert_data_to_csv_string(self.rows), csv_text)
+        self.assertEqual(''.join(iter_csv_chunks(iter([table, table]), rows_per_chunk=2)),
+                         csv_text + csv_text.split('\r\n', 1)[1])
+
+
+class ResultCacheTests(TestCase):
+    def setUp(self):
+        self.statement = StatementData.objects.create(pdf_filename='s.pdf', extracted_data=make_rows('1.00'))
+        self.payload = {'statement_data_id': self.statement.id, 'date_range_string': 'Jan 2024',
+                        'transaction_count': 1}
+
+    def test_key_covers_model_and_prompt(self):
+        key = result_cache.build_cache_key('digest', 'model-a', '1')
+        self.assertEqual(key, result_cache.build_cache_key('digest', 'model-a', '1'))
+        self.assertNotEqual(key, result_cache.build_cache_key('digest', 'model-b', '1'))
+        self.assertNotEqual(key, result_cache.build_cache_key('digest', 'model-a', '2'))
+
+    def test_backends_store_and_expire_entries(self):
+        with tempfile.TemporaryDirectory() as directory:
+            backends = [result_cache.DatabaseResultCacheBackend(ttl_seconds=60, max_entries=10),
+                        result_cache.FileResultCacheBackend(ttl_seconds=60, max_entries=10, directory=directory)]
+            for backend in backends:
+                with self.subTest(backend=type(backend).__name__):
+                    backend.set('key', self.payload)
+                    self.assertEqual(backend.get('key'), self.payload)
+                    self.assertIsNone(backend.get('other'))
+                    backend.ttl_seconds = -1
+                    self.assertIsNone(backend.get('key'))
+
+    def test_database_backend_keeps_most_recently_hit(self):
+        backend = result_cache.DatabaseResultCacheBackend(ttl_seconds=60, max_entries=2)
+        for key in ('a', 'b', 'c'):
+            backend.set(key, self.payload)
+        backend.get('a')
+        self.assertEqual(backend.evict(), 1)
+        self.assertIsNone(backend.get('b'))
+        self.assertIsNotNone(backend.get('a'))
+
+    def test_eviction_runs_at_most_once_per_interval(self):
+        backend = mock.Mock(**{'evict.return_value': 0})
+        with mock.patch.object(result_cache, 'get_result_cache', return_value=backend), \
+                mock.patch.object(result_cache, '_last_evicted', None):
+            with override_settings(EXTRACTION_CACHE_EVICT_INTERVAL_SECONDS=60):
+                for key in ('a', 'b', 'c'):
+                    result_cache.store_cached_result(key, self.statement, 'Jan 2024', 1)
+                self.assertEqual((backend.set.call_count, backend.evict.call_count), (3, 1))
+            with override_settings(EXTRACTION_CACHE_EVICT_INTERVAL_SECONDS=0):
+                result_cache.store_cached_result('d', self.statement, 'Jan 2024', 1)
+                self.assertEqual(backend.evict.call_count, 2)
+
+    def test_lookup_drops_entries_of_deleted_statements(self):
+        backend = result_cache.DatabaseResultCacheBackend(ttl_seconds=60, max_entries=10)
+        with mock.patch.object(result_cache, 'get_result_cache', return_value=backend):
+            result_cache.store_cached_result('key', self.statement, 'Jan 2024', 1)
+            self.assertEqual(result_cache.lookup_cached_result('key'), self.payload)
+            StatementData.objects.filter(id=self.statement.id).delete()
+            self.assertIsNone(result_cache.lookup_cached_result('key'))
+        self.assertFalse(ExtractionCacheEntry.objects.exists())
+
+
+def make_text_pdf(pages):
+    """A minimal PDF whose pages draw (x, y, text) runs in 9pt Helvetica."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>",
+               ("<< /Type /Pages /Kids [%s] /Count %s >>" % (
+                   ' '.join(f"{4 + 2 * index} 0 R" for index in range(len(pages))), len(pages))).encode(),
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    for index, runs in enumerate(pages):
+        content = ''.join(f"BT /F1 9 Tf 1 0 0 1 {x} {y} Tm ({text}) Tj ET\n" for x, y, text in runs).encode()
+        objects.append((f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                        f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * index} 0 R >>").encode())
+        objects.append(b"<< /Length %d >>\nstream\n%sendstream" % (len(content), content))
+    pdf, offsets = b"%PDF-1.4\n", []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    pdf += b''.join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    pdf += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return pdf
+
+
+def statement_line(y, date_text, description, debit=None, credit=None, balance=None):
+    """Runs for one statement table line, with the amounts right-aligned under their headers."""
+    runs = [(40, y, date_text), (110, y, description)]
+    for right, amount in ((385, debit), (465, credit), (555, balance)):
+        if amount is not None:
+            runs.append((right - len(amount) * 4.5, y, amount))
+    return runs
+
+
+class LocalExtractionTests(SimpleTestCase):
+    def row(self, debit, credit, balance):
+        return {'date': '01/02/2024', 'description': 'x', 'debit': debit and Decimal(debit),
+                'credit': credit and Decimal(credit), 'balance': balance and Decimal(balance)}
+
+    def test_parse_money(self):
+        cases = {'1,234.50': Decimal('1234.50'), '(12.00)': Decimal('-12.00'), '99.10 DR': Decimal('-99.10'),
+                 '$5.00-': Decimal('-5.00'), '3.20 CR': Decimal('3.20'),
+                 '12': None, '1.234,56': None, '12.345': None, 'Total': None}
+        for text, expected in cases.items():
+            with self.subTest(text=text):
+                self.assertEqual(local_extraction.parse_money(text), expected)
+
+    def test_rows_must_reconcile_in_either_order(self):
+        rows = [self.row(None, None, '100.00'), self.row('30.00', None, '70.00'), self.row(None, '5.00', '75.00')]
+        self.assertIsNone(local_extraction._check_rows(rows))
+        self.assertIsNone(local_extraction._check_rows(rows[::-1]))
+        rows[1]['balance'] = Decimal('71.00')
+        self.assertEqual(local_extraction._check_rows(rows), "running balances don't reconcile")
+        self.assertEqual(local_extraction._check_rows(rows[:1]), "found 1 table rows")
+        self.assertEqual(local_extraction._check_rows(None), "two amounts fell into one column")
+
+    @skipUnless(local_extraction.PdfReader is not None, "pypdf isn't installed")
+    def test_multi_page_statement_with_headerless_continuation_page(self):
+        first_page = [(40, 760, 'ACME BANK Statement of account'), (40, 740, 'Account 12345678'),
+                      (40, 700, 'Date'), (110, 700, 'Description'), (360, 700, 'Debit'),
+                      (440, 700, 'Credit'), (520, 700, 'Balance')]
+        first_page += statement_line(684, '01/01/2024', 'Opening balance', balance='1,000.00')
+        first_page += statement_line(670, '02/01/2024', 'COFFEE SHOP', debit='3.50', balance='996.50')
+        first_page += statement_line(656, '03/01/2024', 'SALARY', credit='1,200.00', balance='2,196.50')
+        first_page += statement_line(642, '', 'Carried forward', balance='2,196.50')
+        # Page two repeats the bank's letterhead but not the table header
+        second_page = [(40, 760, 'ACME BANK Statement of account'), (40, 748, 'Account 12345678 continued')]
+        second_page += statement_line(720, '04/01/2024', 'Balance brought forward', balance='2,196.50')
+        second_page += statement_line(706, '04/01/2024', 'RENT', debit='800.00', balance='1,396.50')
+        second_page.append((110, 694, 'REF 998877'))
+        second_page += statement_line(680, '05/01/2024', 'REFUND', credit='10.00', balance='1,406.50')
+
+        rows = local_extraction.extract_text_layer(io.BytesIO(make_text_pdf([first_page, second_page])))
+        self.assertEqual(rows, [
+            {'date': '2024-01-02', 'description': 'COFFEE SHOP', 'debit': 3.5, 'credit': None, 'balance': 996.5},
+            {'date': '2024-01-03', 'description': 'SALARY', 'debit': None, 'credit': 1200.0, 'balance': 2196.5},
+            {'date': '2024-01-04', 'description': 'RENT REF 998877', 'debit': 800.0, 'credit': None,
+             'balance': 1396.5},
+            {'date': '2024-01-05', 'description': 'REFUND', 'debit': None, 'credit': 10.0, 'balance': 1406.5},
+        ])
+
+
+def balance_rows(*movements, opening=100):
+    """Rows whose running balance follows from `opening` and each (debit, credit) movement."""
+    rows, balance = [], opening
+    for index, (debit, credit) in enumerate(movements):
+        balance = balance - (debit or 0) + (credit or 0)
+        rows.append({'date': f'2024-01-{index + 1:02d}', 'description': f'row {index}',
+                     'debit': debit, 'credit': credit, 'balance': balance})
+    return rows
+
+
+class ChunkMergeTests(SimpleTestCase):
+    def setUp(self):
+        self.rows = balance_rows((10, None), (None, 5), (20, None), (1, None), (None, 2))
+        self.chunks = [(1, 5, io.BytesIO()), (6, 10, io.BytesIO()), (11, 15, io.BytesIO())]
+
+    def test_merge_drops_boundary_duplicates_and_reports_mismatches(self):
+        rows = self.rows
+        merged, mismatches = pipeline.merge_chunk_transactions([rows[:3], [], rows[2:]])
+        self.assertEqual((merged, mismatches), (rows, []))
+        merged, mismatches = pipeline.merge_chunk_transactions([rows[:2], [], rows[3:]])
+        self.assertEqual(mismatches, [(0, 2)])  # Row 2 went missing between chunks 0 and 2
+
+    def extract(self, responses):
+        """Runs _extract_chunked with each chunk's calls answered by responses[first_page] in turn."""
+        calls = {first_page: list(answers) for first_page, answers in responses.items()}
+
+        def fake_extract(model, chunk_buffer, display_name, request_id, on_row=None):
+            answer = calls[int(display_name.split('pages ')[1].split('-')[0])].pop(0)
+            if isinstance(answer, Exception):
+                raise answer
+            return answer
+
+        with mock.patch.object(pipeline, '_extract_with_gemini', side_effect=fake_extract):
+            return pipeline._extract_chunked(None, self.chunks, 's.pdf', 'test')
+
+    def test_only_an_explicit_empty_answer_skips_a_chunk(self):
+        rows = self.rows
+        self.assertEqual(self.extract({1: [rows[:3]], 6: [pipeline.NoTransactionsFound('none')],
+                                       11: [rows[3:]]}), rows)
+        self.assertEqual(self.extract({1: [rows[:3]], 6: [pipeline.ExtractionError('Invalid JSON'), []],
+                                       11: [rows[3:]]}), rows)
+        with self.assertRaisesRegex(pipeline.ExtractionError, 'pages 6-10'):
+            self.extract({1: [rows[:3]], 6: [ConnectionError('reset'), ConnectionError('reset')],
+                          11: [rows[3:]]})
+
+    def test_chunks_at_a_balance_mismatch_are_retried(self):
+        rows = self.rows
+        self.assertEqual(self.extract({1: [rows[:2], rows[:3]], 6: [[]], 11: [rows[3:], rows[3:]]}), rows)
+        with self.assertRaisesRegex(pipeline.ExtractionError, 'between pages 5 and 11'):
+            self.extract({1: [rows[:2], rows[:2]], 6: [[]], 11: [rows[3:], rows[3:]]})
+
+
+class ExportSourceTests(TestCase):
+    rows = [
+        {'date': '2024-01-02', 'description': 'Salary', 'debit': None, 'credit': 1234.5, 'balance': '1,334.50'},
+        {'date': '2024-01-03', 'description': None, 'debit': '$12', 'credit': '', 'balance': 1322.5},
+        {'date': None, 'description': '=cmd', 'debit': '(0.50)', 'credit': ' ', 'balance': 1322},
+    ]
+
+    def test_both_sources_export_the_same(self):
+        statement = StatementData.objects.create(pdf_filename='s.pdf', extracted_data=self.rows)
+        from_blob = TransactionTable.from_rows(self.rows)
+        store_transactions(statement, self.rows)
+        from_table = load_transaction_table(statement.id)
+
+        csv_text = convert_data_to_csv_string(from_blob)
+        self.assertEqual(convert_data_to_csv_string(from_table), csv_text)
+        self.assertEqual(''.join(iter_csv_chunks(iter_transaction_tables(statement.id, fetch_size=2))), csv_text)
+        self.assertIn("2024-01-02,Salary,,1234.50,1334.50\r\n", csv_text)
+        self.assertIn(",'=cmd,-0.50,,1322.00\r\n", csv_text)
+
+        sheets = [openpyxl.load_workbook(io.BytesIO(convert_data_to_excel_bytes(table))).active
+                  for table in (from_blob, from_table)]
+        cells = [[[(cell.value, cell.number_format) for cell in row] for row in sheet.iter_rows()]
+                 for sheet in sheets]
+        self.assertEqual(cells[0], cells[1])
+        self.assertEqual(cells[0][1][3], (1234.5, '#,##0.00'))
+
+    def test_inexact_amounts_are_exported_as_extracted(self):
+        table = TransactionTable.from_rows(make_rows(100.123, '1.234,56'))
+        self.assertEqual(convert_data_to_csv_string(table).splitlines()[1:],
+                         ['2024-01-01,row 0,100.123,,10.00', '2024-01-02,row 1,"1.234,56",,10.00'])
+        sheet = openpyxl.load_workbook(io.BytesIO(convert_data_to_excel_bytes(table))).active
+        self.assertEqual([row[2] for row in sheet.iter_rows(min_row=2, values_only=True)], [100.123, '1.234,56'])
+
+
+@override_settings(ARTIFACTS_ENABLED=False)
+class CsvDownloadTests(TestCase):
+    def setUp(self):
+        self.statement = StatementData.objects.create(pdf_filename='s.pdf', extracted_data=make_rows(*range(7)))
+        session = self.client.session
+        session.update({'statement_data_id': self.statement.id, 'date_range_string': 'jan'})
+        session.save()
+
+    def test_download_is_streamed_in_chunks(self):
+        response = self.client.get(reverse('converter_app:download_csv'))
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="jan.csv"')
+        csv_text = convert_data_to_csv_string(self.statement.extracted_data)
+        self.assertEqual(b''.join(response.streaming_content).decode(), csv_text)
+        chunks = list(iter_csv_chunks(self.statement.extracted_data, rows_per_chunk=3))
+        self.assertEqual([chunk.count('\n') for chunk in chunks], [3, 3, 2])  # Header and 7 rows
+        self.assertEqual(''.join(chunks), csv_text)
+
+    def test_stored_rows_are_streamed_too(self):
+        store_transactions(self.statement, self.statement.extracted_data)
+        response = self.client.get(reverse('converter_app:download_csv'))
+        self.assertEqual(b''.join(response.streaming_content).decode(),
+                         convert_data_to_csv_string(self.statement.extracted_data))
+
+    def test_without_a_statement(self):
+        self.client.session.flush()
+        self.client.cookies.clear()
+        self.assertEqual(self.client.get(reverse('converter_app:download_csv')).status_code, 404)
+
+
+@override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+                   CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class SessionTests(TestCase):
+    def save_session(self, **values):
+        session = self.client.session
+        session.update(values)
+        session.save()
+
+    def test_plain_get_issues_no_session_queries(self):
+        self.save_session(google_credentials={'token': 'token'})
+        with self.assertNumQueries(0):  # Read from the cache, and nothing changed to save
+            response = self.client.get(reverse('converter_app:upload_pdf'))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+
+    def test_fresh_visit_clears_the_previous_statements(self):
+        self.save_session(statement_data_id=1, statement_data_ids=[1, 2], date_range_string='jan')
+        response = self.client.get(reverse('converter_app:upload_pdf'))
+        self.assertIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        session = self.client.session
+        self.assertFalse({'statement_data_id', 'statement_data_ids', 'date_range_string'} & session.keys())
+
+
+class ServerTimingTests(TestCase):
+    def test_spans_add_up_per_phase(self):
+        timer = timing.Timer('req', 'test')
+        with timing.use_timer(timer):
+            for _ in range(2):
+                with timing.span('gemini_call'):
+                    pass
+            with timing.span('db_insert'):
+                pass
+        with timing.span('outside'):  # No active timer: a no-op
+            pass
+        header = timer.server_timing_header()
+        self.assertRegex(header, r'^gemini_call;dur=\d+\.\d;desc="2 calls", db_insert;dur=\d+\.\d, total;dur=\d+\.\d$')
+
+    @override_settings(ARTIFACTS_ENABLED=False, REQUEST_TIMING_ENABLED=True)
+    def test_response_carries_the_request_phases(self):
+        statement = StatementData.objects.create(pdf_filename='s.pdf', extracted_data=make_rows('1.00'))
+        session = self.client.session
+        session.update({'statement_data_id': statement.id})
+        session.save()
+        response = self.client.get(reverse('converter_app:download_excel'))
+        phases = [entry.split(';')[0] for entry in response['Server-Timing'].split(', ')]
+        self.assertIn('export_query', phases)
+        self.assertIn('export_render', phases)
+        self.assertEqual(phases[-1], 'total')
+        self.assertIsNone(timing.current_timer())  # Cleared for the next request on this thread
+
+    @override_settings(REQUEST_TIMING_ENABLED=False)
+    def test_disabled(self):
+        self.assertFalse(self.client.get(reverse('converter_app:upload_pdf')).has_header('Server-Timing'))
+
+
+@override_settings(ARTIFACTS_ENABLED=False)
+class ExcelDownloadTests(TestCase):
+    def test_download_streams_a_workbook_with_numeric_amounts(self):
+        statement = StatementData.objects.create(pdf_filename='s.pdf', extracted_data=make_rows('1,234.50', '=1+1'))
+        session = self.client.session
+        session.update({'statement_data_id': statement.id, 'date_range_string': 'jan'})
+        session.save()
+        response = self.client.get(reverse('converter_app:download_excel'))
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="jan.xlsx"')
+        sheet = openpyxl.load_workbook(io.BytesIO(b''.join(response.streaming_content))).active
+        self.assertEqual(list(sheet.iter_rows(values_only=True)), [
+            ('date', 'description', 'debit', 'credit', 'balance'),
+            ('2024-01-01', 'row 0', 1234.5, None, 10),
+            ('2024-01-02', 'row 1', "'=1+1", None, 10),
+        ])
+        self.assertEqual(sheet['C2'].number_format, '#,##0.00')
+
+    def test_large_workbooks_spill_to_disk(self):
+        with mock.patch('converter_app.utils.EXCEL_SPOOL_MAX_BYTES', 1024):
+            with convert_data_to_excel_file(make_rows(*range(500))) as excel_file:
+                self.assertTrue(excel_file._rolled)
+                self.assertEqual(excel_file.tell(), 0)
+        with convert_data_to_excel_file(make_rows(1)) as excel_file:
+            self.assertFalse(excel_file._rolled)
+
+
+def make_zip(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, content in members.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+
+@override_settings(EXTRACTION_CACHE_ENABLED=False, MAX_PDF_UPLOAD_SIZE_BYTES=1024 * 1024, BATCH_MAX_FILES=50)
+class BatchUploadTests(TestCase):
+    pdf = b'%PDF-1.4 statement'
+
+    def submit(self, *files):
+        with mock.patch.object(batches, 'queue_staged_job') as queue:
+            batch = batches.submit_batch(files)
+        for call in queue.call_args_list:
+            os.remove(call.args[1])  # The staged copies the workers would have consumed
+        return queue, list(batch.jobs.order_by('batch_position'))
+
+    def test_archives_are_expanded_and_bad_files_reported(self):
+        archive = make_zip({'jan.pdf': self.pdf, 'docs/feb.PDF': self.pdf, 'docs/': '', '__MACOSX/._jan.pdf': 'x',
+                            'notes.txt': 'x', 'fake.pdf': b'hello', 'big.pdf': b'%PDF-' + bytes(1024 * 1024)})
+        queue, jobs = self.submit(SimpleUploadedFile('mar.pdf', self.pdf, 'application/pdf'),
+                                  SimpleUploadedFile('all.zip', archive, 'application/zip'),
+                                  SimpleUploadedFile('broken.zip', b'not a zip', 'application/zip'))
+        self.assertEqual([(job.pdf_filename, job.status, job.message) for job in jobs], [
+            ('mar.pdf', ExtractionJob.STATUS_PENDING, ''),
+            ('jan.pdf', ExtractionJob.STATUS_PENDING, ''),
+            ('feb.PDF', ExtractionJob.STATUS_PENDING, ''),
+            ('notes.txt', ExtractionJob.STATUS_FAILED, 'Skipped: only PDF files are processed.'),
+            ('fake.pdf', ExtractionJob.STATUS_FAILED, 'Not a PDF file.'),
+            ('big.pdf', ExtractionJob.STATUS_FAILED, 'File size cannot exceed 1MB.'),
+            ('broken.zip', ExtractionJob.STATUS_FAILED, 'Not a valid ZIP archive.'),
+        ])
+        self.assertEqual(queue.call_count, 3)
+
+    @override_settings(BATCH_MAX_FILES=2)
+    def test_batches_stop_at_the_file_limit(self):
+        queue, jobs = self.submit(*(SimpleUploadedFile(f'{month}.pdf', self.pdf) for month in ('a', 'b', 'c', 'd')))
+        self.assertEqual(queue.call_count, 2)
+        self.assertEqual(len(jobs), 3)
+        self.assertIn('Batch limit of 2 PDFs', jobs[2].message)
+
+    @override_settings(EXTRACTION_CACHE_ENABLED=True)
+    def test_cached_files_complete_without_a_job(self):
+        statement = StatementData.objects.create(pdf_filename='a.pdf', extracted_data=make_rows('1.00'))
+        with mock.patch.object(batches, 'lookup_cached_result', return_value={
+                'statement_data_id': statement.id, 'date_range_string': 'jan', 'transaction_count': 1}):
+            queue, jobs = self.submit(SimpleUploadedFile('a.pdf', self.pdf))
+        queue.assert_not_called()
+        self.assertEqual((jobs[0].status, jobs[0].statement_id), (ExtractionJob.STATUS_SUCCEEDED, statement.id))
+
+    @override_settings(ARTIFACTS_ENABLED=False)
+    def test_combined_archive_names_entries_uniquely(self):
+        statement = StatementData.objects.create(pdf_filename='a.pdf', extracted_data=make_rows('1.00'))
+        batch = ExtractionBatch.objects.create()
+        jobs = [ExtractionJob.objects.create(batch=batch, batch_position=position, pdf_filename='a.pdf',
+                                             statement=statement if position < 2 else None, date_range_string='jan')
+                for position in range(3)]
+        with batches.build_combined_archive(jobs, ExportArtifact.FORMAT_CSV) as archive_file:
+            with zipfile.ZipFile(archive_file) as archive:
+                self.assertEqual(archive.namelist(), ['a_jan.csv', 'a_jan_2.csv'])
+                self.assertEqual(archive.read('a_jan.csv').decode(), convert_data_to_csv_string(make_rows('1.00')))
@@ -0,0 +1,129 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Shared no-op span, returned when no timer is active so disabled timing costs one attribute lookup
+_NO_SPAN = nullcontext()
+_local = threading.local()
+
+
+class Timer:
+    """
+    Per-phase durations of one request or background job. Spans with the same
+    name add up (e.g. the Gemini calls of several chunks). Safe to record into
+    from several threads.
+    """
+
+    def __init__(self, request_id, label):
+        self.request_id = request_id
+        self.label = label
+        self.started = time.perf_counter()
+        self.total_ms = None
+        self.spans = {}  # name -> [total ms, count], in the order phases first ran
+        self._lock = threading.Lock()
+
+    def add(self, name, duration_ms):
+        with self._lock:
+            span = self.spans.setdefault(name, [0.0, 0])
+            span[0] += duration_ms
+            span[1] += 1
+
+    def finish(self):
+        if self.total_ms is None:
+            self.total_ms = (time.perf_counter() - self.started) * 1000
+        return self.total_ms
+
+    def server_timing_header(self):
+        """The Server-Timing header value, e.g. 'cache_lookup;dur=1.2, stage_upload;dur=3.4, total;dur=9.0'."""
+        with self._lock:
+            spans = list(self.spans.items())
+        entries = []
+        for name, (duration_ms, count) in spans:
+            entry = f"{name};dur={duration_ms:.1f}"
+            if count > 1:
+                entry += f';desc="{count} calls"'
+            entries.append(entry)
+        entries.append(f"total;dur={self.finish():.1f}")
+        return ', '.join(entries)
+
+    def log(self, **extra):
+        """Writes the structured timing record of this request or job."""
+        total_ms = self.finish()
+        with self._lock:
+            spans = list(self.spans.items())
+        summary = ', '.join(f"{name} {duration_ms:.0f} ms" for name, (duration_ms, _) in spans) or 'no spans'
+        logger.info("Timing for %s: %.0f ms (%s).", self.label, total_ms, summary,
+                    extra={'request_id': self.request_id, 'timing_label': self.label,
+                           'total_ms': round(total_ms, 1),
+                           'timings_ms': {name: round(duration_ms, 1) for name, (duration_ms, _) in spans},
+                           'timing_counts': {name: count for name, (_, count) in spans}, **extra})
+
+
+class _Span:
+    __slots__ = ('timer', 'name', 'started')
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.timer.add(self.name, (time.perf_counter() - self.started) * 1000)
+        return False
+
+
+def start_timer(request_id, label):
+    """
+    Starts timing a request or background job on the current thread and returns
+    its Timer, or None when timing is disabled. Pair with finish_timer().
+    """
+    if not getattr(settings, 'REQUEST_TIMING_ENABLED', True):
+        return None
+    timer = Timer(request_id, label)
+    _local.timer = timer
+    return timer
+
+
+def finish_timer(timer):
+    """Stops timing on the current thread; pool threads are reused, so this must always run."""
+    _local.timer = None
+    if timer is not None:
+        timer.finish()
+
+
+def current_timer():
+    return getattr(_local, 'timer', None)
+
+
+@contextmanager
+def use_timer(timer):
+    """Records this thread's spans into `timer`, e.g. a chunk thread working for a job."""
+    previous = current_timer()
+    _local.timer = timer
+    try:
+        yield timer
+    finally:
+        _local.timer = previous
+
+
+def span(name):
+    """
+    Times the enclosed block as phase `name` of the current request or job:
+
+        with span('db_insert'):
+            ...
+
+    A no-op when no timer is active on this thread.
+    """
+    timer = getattr(_local, 'timer', None)
+    if timer is None:
+        return _NO_SPAN
+    return _Span(timer, name)
@@ -0,0 +1,90 @@
+from .dates import normalize_dates
+
+TABLE_COLUMNS = ('date', 'description', 'debit', 'credit', 'balance')
+
+
+class TransactionTable:
+    """
+    A statement's transactions as parallel column lists (date, description,
+    debit, credit, balance), in the order and with the keys of extracted_data.
+    Built once per export and shared by every exporter; derived columns
+    (sanitized text, parsed amounts and dates) are computed once per table and
+    cached, instead of once per row dict per exporter.
+    """
+    __slots__ = TABLE_COLUMNS + ('_derived',)
+
+    def __init__(self, date, description, debit, credit, balance):
+        self.date = date
+        self.description = description
+        self.debit = debit
+        self.credit = credit
+        self.balance = balance
+        self._derived = {}
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Builds a table from extracted_data-style dicts; rows that aren't dicts are skipped."""
+        rows = [row for row in rows or [] if isinstance(row, dict)]
+        return cls(*([row.get(column) for row in rows] for column in TABLE_COLUMNS))
+
+    @classmethod
+    def from_values(cls, values, with_parsed_dates=False):
+        """
+        Builds a table from (date, description, debit, credit, balance) tuples, e.g. a
+        values_list(). With with_parsed_dates, each tuple ends with the row's already
+        parsed date, which parsed_dates() then returns instead of parsing again.
+        """
+        columns = [list(column) for column in zip(*values)]
+        columns = columns or [[] for _ in range(len(TABLE_COLUMNS) + with_parsed_dates)]
+        table = cls(*columns[:len(TABLE_COLUMNS)])
+        if with_parsed_dates:
+            table._derived['parsed_dates'] = columns[len(TABLE_COLUMNS)]
+        return table
+
+    def __len__(self):
+        return len(self.date)
+
+    def column(self, name):
+        return getattr(self, name)
+
+    def mapped(self, name, func):
+        """
+        Returns func applied to every value of a column, computed on first use and
+        cached. Repeated strings (descriptions mostly) are converted only once.
+        """
+        key = (name, func)
+        values = self._derived.get(key)
+        if values is None:
+            by_string = {}
+            values = []
+            for value in getattr(self, name):
+                if type(value) is str:
+                    if value not in by_string:
+                        by_string[value] = func(value)
+                    values.append(by_string[value])
+                else:
+                    values.append(func(value))
+            self._derived[key] = values
+        return values
+
+    def parsed_dates(self):
+        """The date column as datetime.date objects (None where unreadable), inferred once for the table."""
+        values = self._derived.get('parsed_dates')
+        if values is None:
+            values = self._derived['parsed_dates'] = normalize_dates(self.date)
+        return values
+
+
+def iter_tables(data):
+    """
+    Yields the TransactionTables to export from data: a table, an iterable of
+    tables (e.g. streamed chunks), or a list of extracted_data dicts.
+    """
+    if data is None:
+        return
+    if isinstance(data, TransactionTable):
+        yield data
+    elif isinstance(data, list):
+        yield TransactionTable.from_rows(data)
+    else:
+        yield from data
@@ -0,0 +1,200 @@
+import logging
+import re
+from itertools import islice
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Transaction
+from .dates import normalize_transaction_dates
+from .transaction_table import TransactionTable
+
+logger = logging.getLogger(__name__)
+
+# Rows per INSERT when populating the Transaction table
+DEFAULT_TRANSACTION_BATCH_SIZE = 1000
+# Rows fetched per round-trip when streaming transactions back out
+DEFAULT_TRANSACTION_FETCH_SIZE = 2000
+
+TWO_PLACES = Decimal('0.01')
+# Largest value that fits DecimalField(max_digits=18, decimal_places=2)
+MAX_AMOUNT = Decimal('9999999999999999.99')
+AMOUNT_COLUMNS = ('debit', 'credit', 'balance')
+RAW_DATE_MAX_LENGTH = 64  # Transaction.raw_date's max_length
+# The amount formats local_extraction.parse_money reads, with the cents optional: an optional
+# sign or parentheses, currency symbol, thousands separated by commas, and a trailing
+# minus or CR/DR/OD. Anything else (e.g. '1.234,56') isn't an amount we can read safely.
+_AMOUNT_PATTERN = re.compile(
+    r'(?P<open>\()?(?P<sign>[-+])?[$£€]?\s?(?P<number>\d{1,3}(?:,\d{3})+|\d+)(?:\.(?P<fraction>\d+))?'
+    r'(?P<close>\))?(?P<trailing>-)?(?:\s?(?P<suffix>CR|DR|OD))?', re.IGNORECASE)
+
+
+def _parse_amount_text(text):
+    match = _AMOUNT_PATTERN.fullmatch(text.strip())
+    if match is None or (match.group('open') is None) != (match.group('close') is None):
+        return None
+    amount = Decimal(f"{match.group('number').replace(',', '')}.{match.group('fraction') or '0'}")
+    negative = (match.group('sign') == '-' or match.group('trailing') is not None
+                or match.group('open') is not None or (match.group('suffix') or '').upper() in ('DR', 'OD'))
+    return -amount if negative else amount
+
+
+def parse_amount(value):
+    """
+    Converts an extracted amount (a number, or a string like '1,234.50', '$12.00',
+    '(12.00)' or '99.10 DR') to a 2-place Decimal. Returns None for an empty value
+    and for one that can't be stored exactly: unreadable text, more than two
+    decimal places (never rounded) or too large for the Transaction table.
+    """
+    if value is None or value == '' or isinstance(value, bool):
+        return None
+    if isinstance(value, str):
+        amount = _parse_amount_text(value)
+    elif isinstance(value, (int, float, Decimal)):
+        try:
+            amount = Decimal(str(value))  # str() of a float is its shortest exact repr
+        except InvalidOperation:
+            return None
+    else:
+        return None
+    if amount is None or not amount.is_finite() or abs(amount) > MAX_AMOUNT:
+        return None
+    quantized = amount.quantize(TWO_PLACES)
+    return quantized if quantized == amount else None
+
+
+def is_empty_amount(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def export_amount(value):
+    """
+    The form an amount is exported in: the 2-place Decimal parse_amount() reads,
+    as stored in the Transaction table, so a statement exports the same from
+    either source (1234.5, '1,234.50' and Decimal('1234.50') all give 1234.50).
+    Empty values give None; ones that can't be read exactly are kept as extracted.
+    """
+    if is_empty_amount(value):
+        return None
+    amount = parse_amount(value)
+    return value if amount is None else amount
+
+
+def find_unstorable_value(extracted_data):
+    """
+    Returns (ordinal, column, value) for the first value of a statement's rows that
+    the Transaction table can't hold exactly, or None when every row round-trips.
+    """
+    for ordinal, row in enumerate(extracted_data or []):
+        if not isinstance(row, dict):
+            continue
+        for column in AMOUNT_COLUMNS:
+            value = row.get(column)
+            if not is_empty_amount(value) and parse_amount(value) is None:
+                return ordinal, column, value
+        raw_date = row.get('date')
+        if raw_date is not None and len(str(raw_date)) > RAW_DATE_MAX_LENGTH:
+            return ordinal, 'date', raw_date
+    return None
+
+
+def build_transactions(statement_record, extracted_data, parsed_dates=None):
+    """
+    Yields unsaved Transaction objects for each row of a statement's extracted data.
+    parsed_dates are the rows' normalized dates; they're inferred here if not given.
+    """
+    extracted_data = extracted_data or []
+    if parsed_dates is None:
+        parsed_dates = normalize_transaction_dates(extracted_data)
+    for ordinal, (row, parsed_date) in enumerate(zip(extracted_data, parsed_dates)):
+        if not isinstance(row, dict):
+            continue
+        raw_date = row.get('date')
+        raw_date = str(raw_date) if raw_date is not None else ''
+        yield Transaction(
+            statement=statement_record,
+            ordinal=ordinal,
+            date=parsed_date,
+            raw_date=raw_date[:RAW_DATE_MAX_LENGTH],
+            description=str(row.get('description') or ''),
+            debit=parse_amount(row.get('debit')),
+            credit=parse_amount(row.get('credit')),
+            balance=parse_amount(row.get('balance')),
+        )
+
+
+def store_transactions(statement_record, extracted_data, batch_size=None, parsed_dates=None):
+    """
+    Populates the Transaction table for a statement with bulk_create, batch_size
+    rows per INSERT. Returns the number of rows written.
+
+    A statement with any value the table can't hold exactly (see parse_amount) gets
+    no rows at all, so its exports keep reading extracted_data, exactly as extracted.
+    """
+    batch_size = batch_size or getattr(
+        settings, 'TRANSACTION_BATCH_SIZE', DEFAULT_TRANSACTION_BATCH_SIZE)
+    unstorable = find_unstorable_value(extracted_data)
+    if unstorable is not None:
+        ordinal, column, value = unstorable
+        logger.warning("Not normalizing statement %s: row %s %s %r can't be stored exactly; "
+                       "its exports use extracted_data.", statement_record.id, ordinal, column, value,
+                       extra={'record_id': statement_record.id})
+        return 0
+    written = 0
+    batch = []
+    for transaction_row in build_transactions(statement_record, extracted_data, parsed_dates):
+        batch.append(transaction_row)
+        if len(batch) >= batch_size:
+            Transaction.objects.bulk_create(batch)
+            written += len(batch)
+            batch = []
+    if batch:
+        Transaction.objects.bulk_create(batch)
+        written += len(batch)
+    logger.debug("Stored %s normalized transactions for statement %s.", written, statement_record.id,
+                 extra={'record_id': statement_record.id, 'transaction_count': written})
+    return written
+
+
+def replace_transactions(statement_record, extracted_data, batch_size=None):
+    """Rebuilds a statement's Transaction rows from extracted_data, atomically. Returns the number written."""
+    with transaction.atomic():
+        Transaction.objects.filter(statement_id=statement_record.id).delete()
+        return store_transactions(statement_record, extracted_data, batch_size=batch_size)
+
+
+def has_transactions(statement_data_id):
+    """True if the statement's rows have been normalized into the Transaction table."""
+    return Transaction.objects.filter(statement_id=statement_data_id).exists()
+
+
+def _transaction_values(statement_data_id):
+    return (Transaction.objects
+            .filter(statement_id=statement_data_id)
+            .order_by('ordinal')
+            .values_list('raw_date', 'description', 'debit', 'credit', 'balance', 'date'))
+
+
+def load_transaction_table(statement_data_id):
+    """
+    Returns all of a statement's rows from the Transaction table as one TransactionTable,
+    with the dates parsed when the rows were stored.
+    """
+    return TransactionTable.from_values(_transaction_values(statement_data_id), with_parsed_dates=True)
+
+
+def iter_transaction_tables(statement_data_id, fetch_size=None):
+    """
+    Streams a statement's rows from the Transaction table in their original order,
+    as one TransactionTable per fetch_size rows, so memory use doesn't depend on
+    the statement length.
+    """
+    fetch_size = fetch_size or getattr(
+        settings, 'TRANSACTION_FETCH_SIZE', DEFAULT_TRANSACTION_FETCH_SIZE)
+    rows = _transaction_values(statement_data_id).iterator(chunk_size=fetch_size)
+    while True:
+        chunk = list(islice(rows, fetch_size))
+        if not chunk:
+            return
+        yield TransactionTable.from_values(chunk, with_parsed_dates=True)
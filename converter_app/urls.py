@@ -5,13 +5,26 @@ app_name = 'converter_app'  # Optional: for namespacing URLs
 
 urlpatterns = [
     path('', views.upload_pdf_view, name='upload_pdf'),
+    path('jobs/<uuid:job_id>/', views.extraction_job_status_view,
+         name='extraction_job_status'),
+    path('jobs/<uuid:job_id>/events/', views.extraction_job_events_view,
+         name='extraction_job_events'),
+    path('batch/', views.batch_upload_view, name='batch_upload'),
+    path('batches/<uuid:batch_id>/', views.batch_status_view,
+         name='batch_status'),
     path('download/csv/', views.download_csv_view, name='download_csv'),
     path('download/excel/', views.download_excel_view, name='download_excel'),
     path('download/json/', views.download_json_view, name='download_json'),
+    path('download/parquet/', views.download_parquet_view, name='download_parquet'),
+    path('download/arrow/', views.download_arrow_view, name='download_arrow'),
+    path('download/batch/<str:export_format>/', views.download_batch_view,
+         name='download_batch'),
     path('google-auth-redirect/', views.google_auth_redirect,
          name='google_auth_redirect'),
     path('oauth2callback/', views.google_auth_callback,
          name='google_auth_callback'),  # Matches redirect URI in GCP
     path('upload-to-sheets/', views.upload_to_google_sheets_view,
          name='upload_to_sheets'),
+    path('feed/transactions/', views.transaction_feed_view, name='transaction_feed'),
+    path('metrics', views.metrics_view, name='metrics'),
 ]
@@ -1,6 +1,11 @@
 import csv
-import io
+import tempfile
+from decimal import Decimal
 import openpyxl  # We'll install this next
+from openpyxl.cell import WriteOnlyCell
+
+from .transaction_table import iter_tables
+from .transactions import export_amount
 
 
 def sanitize_for_formula_injection(value):
@@ -10,47 +15,124 @@ def sanitize_for_formula_injection(value):
     return value
 
 
-def convert_data_to_csv_string(data_list):
+CSV_FIELDNAMES = ['date', 'description', 'debit', 'credit', 'balance']
+CSV_AMOUNT_COLUMNS = ('debit', 'credit', 'balance')
+# Rows are grouped into chunks so a streamed response isn't one tiny write per row
+CSV_ROWS_PER_CHUNK = 500
+
+
+class _EchoBuffer:
+    """File-like object whose write() hands the formatted line back instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def _sanitized_amount(value):
+    return sanitize_for_formula_injection(export_amount(value))
+
+
+def iter_csv_chunks(data_list, rows_per_chunk=CSV_ROWS_PER_CHUNK):
     """
-    Converts a list of dictionaries (transactions) to a CSV formatted string.
+    Yields transactions (a TransactionTable, an iterable of them, or a list of
+    dictionaries) as CSV text, a chunk of rows at a time. Each table's columns are
+    sanitized once, so memory use doesn't grow with the row count of a stream.
+    Amounts are written as export_amount() formats them, so the CSV is the same
+    whether the rows came from the Transaction table or extracted_data.
     """
     if not data_list:
-        return ""
-    output = io.StringIO()
-    fieldnames = ['date', 'description', 'debit', 'credit', 'balance']
+        return
+    writer = csv.writer(_EchoBuffer())
+    pending_lines = [writer.writerow(CSV_FIELDNAMES)]
+    for table in iter_tables(data_list):
+        columns = [table.mapped(key, _sanitized_amount if key in CSV_AMOUNT_COLUMNS
+                                else sanitize_for_formula_injection) for key in CSV_FIELDNAMES]
+        for row_values in zip(*columns):
+            pending_lines.append(writer.writerow(row_values))
+            if len(pending_lines) >= rows_per_chunk:
+                yield ''.join(pending_lines)
+                pending_lines = []
+    if pending_lines:
+        yield ''.join(pending_lines)
 
-    processed_data_list = []
-    for row_data in data_list:
-        # Sanitize each value in the row
-        processed_row = {key: sanitize_for_formula_injection(
-            row_data.get(key)) for key in fieldnames}
-        processed_data_list.append(processed_row)
 
-    writer = csv.DictWriter(output, fieldnames=fieldnames)
-    writer.writeheader()
-    writer.writerows(processed_data_list)
-    return output.getvalue()
+def convert_data_to_csv_string(data_list):
+    """
+    Converts transactions (a TransactionTable or a list of dictionaries) to a CSV formatted string.
+    """
+    return ''.join(iter_csv_chunks(data_list))
 
 
-def convert_data_to_excel_bytes(data_list):
+EXCEL_AMOUNT_COLUMNS = ('debit', 'credit', 'balance')
+EXCEL_AMOUNT_FORMAT = '#,##0.00'
+# Finished workbooks up to this size stay in memory; larger ones roll over to a temp file
+EXCEL_SPOOL_MAX_BYTES = 5 * 1024 * 1024
+
+
+def _to_excel_number(value):
     """
-    Converts a list of dictionaries (transactions) to Excel (XLSX) format as bytes.
+    Returns an amount as a number for a numeric cell, else None: the export_amount()
+    Decimal when it reads exactly, so both row sources write the same cells, or a
+    number with more places as extracted. Text that doesn't read exactly (e.g.
+    '1.234,56') stays text rather than become a different number.
     """
-    workbook = openpyxl.Workbook()
-    sheet = workbook.active
+    if isinstance(value, bool):
+        return None
+    amount = export_amount(value)
+    if isinstance(amount, (int, float, Decimal)):
+        return amount
+    return None
+
+
+def write_excel_workbook(data_list, fileobj):
+    """
+    Writes transactions (a TransactionTable, an iterable of them, or a list of
+    dictionaries) as an XLSX workbook to fileobj.
+
+    Uses openpyxl's write-only mode, which streams each row out instead of keeping
+    every cell object in memory, so memory use stays flat as the row count grows.
+    """
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
 
     headers = ['date', 'description', 'debit', 'credit', 'balance']
     sheet.append(headers)  # Always append headers
 
-    if data_list:  # Only append data rows if data_list is not empty
-        for row_dict in data_list:
-            # Ensure all keys are present, defaulting to None if missing from a specific dict
-            # Sanitize each value before appending
-            row_values = [sanitize_for_formula_injection(
-                row_dict.get(header)) for header in headers]
+    amount_indexes = [index for index, header in enumerate(headers) if header in EXCEL_AMOUNT_COLUMNS]
+    for table in iter_tables(data_list):
+        # Sanitized text for every column, and numbers for the amount columns, computed once per table
+        columns = [table.mapped(header, _sanitized_amount if header in EXCEL_AMOUNT_COLUMNS
+                                else sanitize_for_formula_injection) for header in headers]
+        numbers = [table.mapped(headers[index], _to_excel_number) for index in amount_indexes]
+        for row_index, row in enumerate(zip(*columns)):
+            row_values = list(row)
+            for index, number_column in zip(amount_indexes, numbers):
+                number = number_column[row_index]
+                if number is not None:
+                    # Real numeric cells, so amounts can be summed and sorted in Excel
+                    cell = WriteOnlyCell(sheet, value=number)
+                    cell.number_format = EXCEL_AMOUNT_FORMAT
+                    row_values[index] = cell
             sheet.append(row_values)
 
-    excel_bytes = io.BytesIO()
-    workbook.save(excel_bytes)
-    excel_bytes.seek(0)
-    return excel_bytes.getvalue()
+    workbook.save(fileobj)
+
+
+def convert_data_to_excel_file(data_list):
+    """
+    Converts transactions (a TransactionTable or a list of dictionaries) to an XLSX file object, rewound and
+    ready to stream. Small workbooks are kept in memory, larger ones spill to disk.
+    The caller is responsible for closing it.
+    """
+    excel_file = tempfile.SpooledTemporaryFile(max_size=EXCEL_SPOOL_MAX_BYTES)
+    write_excel_workbook(data_list, excel_file)
+    excel_file.seek(0)
+    return excel_file
+
+
+def convert_data_to_excel_bytes(data_list):
+    """
+    Converts transactions (a TransactionTable or a list of dictionaries) to Excel (XLSX) format as bytes.
+    """
+    with convert_data_to_excel_file(data_list) as excel_file:
+        return excel_file.read()
@@ -1,33 +1,129 @@
-from django.http import HttpResponse, Http404
-import google.auth.transport.requests
-from googleapiclient.discovery import build
-from google.oauth2.credentials import Credentials
+from django.http import FileResponse, HttpResponse, Http404, StreamingHttpResponse
 from google_auth_oauthlib.flow import Flow
 from django.urls import reverse
 from django.shortcuts import redirect
 import json  # Re-importing here for clarity, though already imported above
-from .utils import convert_data_to_csv_string, convert_data_to_excel_bytes
+from .utils import convert_data_to_excel_file, iter_csv_chunks
 from django.shortcuts import render, redirect  # Added redirect
 from django.http import JsonResponse  # Added JsonResponse
 from django.conf import settings
-import google.generativeai as genai
 import json  # For parsing JSON response if needed, and for displaying
 from datetime import datetime  # Added for date parsing
-import tempfile  # Added
 import os  # Added
-from django.core.files.uploadedfile import InMemoryUploadedFile  # Added
-from .forms import PDFUploadForm
-from .models import StatementData  # Added import for the new model
+from .forms import BatchUploadForm, PDFUploadForm
+from .google_clients import get_google_client_manager
+from .google_sheets import create_statement_spreadsheet
+from django.utils.cache import patch_vary_headers
+from django.utils.crypto import constant_time_compare
+from functools import wraps
+from .artifacts import EXPORT_CONTENT_TYPES, decompress_artifact, get_stored_artifact
+from .batches import build_combined_archive, get_batch_jobs, submit_batch
+from .models import ExportArtifact, ExtractionBatch, ExtractionJob, StatementData  # Added import for the new model
+from .jobs import (DEFAULT_PROGRESS_INTERVAL_SECONDS, get_job_state, schedule_artifact_render,
+                   submit_extraction_job)
+from .transaction_table import TransactionTable
+from .transactions import has_transactions, iter_transaction_tables
+from . import arrow_export, feed, metrics
+from .pipeline import EXTRACTION_PROMPT_VERSION
+from .timing import span
+from .result_cache import (build_cache_key, compute_pdf_digest, get_cache_stats,
+                           lookup_cached_result)
 import logging  # Added for logging
+import time
 
 # Instantiate logger
 logger = logging.getLogger(__name__)
 
 
+FLASH_SESSION_KEY = 'flash'
+# Separate message keys used before they were consolidated under FLASH_SESSION_KEY
+LEGACY_FLASH_KEYS = {
+    'upload_message': 'message',
+    'gsheet_success_message': 'gsheet_message',
+    'gsheet_url': 'gsheet_url',
+    'gsheet_title': 'gsheet_title',
+    'user_message': None,
+    'error_message': None,
+}
+
+
+def _clear_processing_session(request, request_id):
+    """
+    Clears all session data related to any PREVIOUS PDF processing cycle
+    before starting a new one. Google credentials should persist.
+    """
+    logger.info("New PDF upload. Clearing session data from any previous PDF processing cycle.", extra={
+                'request_id': request_id})
+    keys_to_clear = [
+        'statement_data_id',        # ID of the previously processed statement
+        'date_range_string',        # Date range of the previously processed statement
+        FLASH_SESSION_KEY,          # Message (or GSheet link) not yet shown from previous operations
+        *LEGACY_FLASH_KEYS,         # The same, as stored by earlier versions
+        'extraction_job_id',        # Background job of the previous upload
+        'statement_data_ids',       # All statements of the previous upload (several for a batch)
+        'extraction_batch_id',      # Background batch of the previous upload
+    ]
+    debug_enabled = logger.isEnabledFor(logging.DEBUG)
+    for key in keys_to_clear:
+        if key in request.session:
+            if debug_enabled:
+                logger.debug("Clearing '%s' from session: %s", key, request.session.get(key), extra={
+                             'request_id': request_id})
+            request.session.pop(key, None)
+
+    # Ensure 'statement_data' (old key, if present from very old sessions) is also cleared
+    if 'statement_data' in request.session:
+        logger.debug("Clearing legacy 'statement_data' key from session.", extra={
+                     'request_id': request_id})
+        request.session.pop('statement_data', None)
+
+
+def _set_session_statements(request, statement_ids, date_range_string):
+    """
+    Points the session at the statements of the latest upload. statement_data_id
+    (the first one) is what the single-statement views use by default.
+    """
+    values = {
+        'statement_data_ids': list(statement_ids),
+        'statement_data_id': statement_ids[0] if statement_ids else None,
+        'date_range_string': date_range_string,
+    }
+    for key, value in values.items():
+        if request.session.get(key, values) != value:  # Unchanged keys don't mark the session modified
+            request.session[key] = value
+
+
+def _set_flash(request, message=None, gsheet_message=None, gsheet_url=None, gsheet_title=None):
+    """
+    Stores the message for the next upload page load, replacing any pending one:
+    a general message ("Error..." ones are shown as errors) or a GSheet link.
+    The session is only marked modified when the stored value actually changes.
+    """
+    flash = {key: value for key, value in (
+        ('message', message), ('gsheet_message', gsheet_message),
+        ('gsheet_url', gsheet_url), ('gsheet_title', gsheet_title)) if value}
+    if request.session.get(FLASH_SESSION_KEY) != flash:
+        request.session[FLASH_SESSION_KEY] = flash
+
+
+def _pop_flash(request):
+    """
+    Returns and clears the pending message, or {} when there is none. The
+    session is only modified (and saved) when there was something to clear.
+    """
+    flash = request.session.pop(FLASH_SESSION_KEY, None) or {}
+    for legacy_key, key in LEGACY_FLASH_KEYS.items():
+        if legacy_key in request.session:
+            value = request.session.pop(legacy_key)
+            if key and value:
+                flash.setdefault(key, value)
+    return flash
+
+
 # Create your views here.
 def upload_pdf_view(request):
     request_id = getattr(request, 'request_id', 'N/A')
-    logger.debug(f"Enter upload_pdf_view. Method: {request.method}", extra={
+    logger.debug("Enter upload_pdf_view. Method: %s", request.method, extra={
                  'request_id': request_id, 'method': request.method, 'path': request.path})
     # This view now handles both the initial GET request (rendering the page)
     # and the AJAX POST request (processing the file).
@@ -46,244 +142,67 @@ def upload_pdf_view(request):
         form = PDFUploadForm(request.POST, request.FILES)
         if form.is_valid():
             pdf_file = form.cleaned_data['pdf_file']
-            logger.info(f"upload_pdf_view: Form is valid. Processing PDF: {pdf_file.name}",
+            logger.info("upload_pdf_view: Form is valid. Processing PDF: %s", pdf_file.name,
                         extra={'request_id': request_id, 'pdf_filename': pdf_file.name, 'size_bytes': pdf_file.size})
 
-            # Clear all session data related to any PREVIOUS PDF processing cycle
-            # before starting a new one. Google credentials should persist.
-            logger.info("upload_pdf_view: New PDF upload. Clearing session data from any previous PDF processing cycle.", extra={
-                        'request_id': request_id})
-            keys_to_clear = [
-                'statement_data_id',        # ID of the previously processed statement
-                'date_range_string',        # Date range of the previously processed statement
-                'gsheet_success_message',   # Success message from a previous GSheet upload
-                'gsheet_url',               # URL from a previous GSheet upload
-                'gsheet_title',             # Title from a previous GSheet upload
-                'upload_message',           # General upload message from previous operations
-                'user_message',             # General user message from previous operations
-                'error_message'             # General error message from previous operations
-            ]
-            for key in keys_to_clear:
-                if key in request.session:
-                    logger.debug(f"Clearing '{key}' from session: {request.session.get(key)}", extra={
-                                 'request_id': request_id})
-                    request.session.pop(key, None)
-
-            # Ensure 'statement_data' (old key, if present from very old sessions) is also cleared
-            if 'statement_data' in request.session:
-                logger.debug(f"Clearing legacy 'statement_data' key from session.", extra={
-                             'request_id': request_id})
-                request.session.pop('statement_data', None)
-
-            try:
-                logger.debug("upload_pdf_view: Configuring Gemini API for new PDF.", extra={
-                             'request_id': request_id})
-                genai.configure(api_key=settings.GEMINI_API_KEY)
-
-                file_path_for_api = None
-                temp_file_created = False
-                uploaded_file_part = None  # Initialize to ensure it's defined for finally
+            _clear_processing_session(request, request_id)
+            metrics.UPLOADS.inc(kind='single')
 
+            # --- Result cache: skip Gemini entirely for a PDF we've already extracted ---
+            cache_key = None
+            if getattr(settings, 'EXTRACTION_CACHE_ENABLED', True):
                 try:
-                    if isinstance(pdf_file, InMemoryUploadedFile):
-                        logger.debug("upload_pdf_view: Handling InMemoryUploadedFile.", extra={
-                                     'request_id': request_id})
-                        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-                            for chunk in pdf_file.chunks():
-                                tmp_file.write(chunk)
-                            file_path_for_api = tmp_file.name
-                            temp_file_created = True
-                        logger.debug(f"upload_pdf_view: Temp file created for InMemoryUploadedFile: {file_path_for_api}",
-                                     extra={'request_id': request_id, 'temp_file_path': file_path_for_api})
-                    else:
-                        file_path_for_api = pdf_file.temporary_file_path()
-                        logger.debug(f"upload_pdf_view: Using Django's temporary_file_path: {file_path_for_api}",
-                                     extra={'request_id': request_id, 'temp_file_path': file_path_for_api})
-
-                    if not file_path_for_api:
-                        logger.error("upload_pdf_view: Could not determine file path for API.", extra={
-                                     'request_id': request_id})
-                        raise ValueError(
-                            "Could not determine file path for API.")
-
-                    logger.info(f"upload_pdf_view: Uploading file to Gemini: {pdf_file.name}",
-                                extra={'request_id': request_id, 'pdf_filename': pdf_file.name, 'api_file_path': file_path_for_api})
-                    uploaded_file_part = genai.upload_file(
-                        path=file_path_for_api,
-                        display_name=pdf_file.name
-                    )
-                    logger.info(f"upload_pdf_view: File uploaded to Gemini successfully. Gemini File ID: {uploaded_file_part.name}",
-                                extra={'request_id': request_id, 'gemini_file_id': uploaded_file_part.name})
-
-                    model = genai.GenerativeModel(
-                        model_name=settings.GEMINI_MODEL_NAME)
-                    logger.info(f"upload_pdf_view: Calling Gemini model '{settings.GEMINI_MODEL_NAME}' for analysis.",
-                                extra={'request_id': request_id, 'model_name': settings.GEMINI_MODEL_NAME})
-                    prompt = f"""
-                    Please analyze the content of the provided PDF bank statement.
-                    Extract all transaction details.
-                    Return the data as a JSON object.
-                    The JSON object should be a list of transactions.
-                    Each transaction object in the list should have the following keys:
-                    - "date": (string, e.g., "YYYY-MM-DD" or "DD/MM/YYYY")
-                    - "description": (string)
-                    - "debit": (float or null, if no debit amount)
-                    - "credit": (float or null, if no credit amount)
-                    - "balance": (float, the balance after the transaction)
-
-                    If the document does not appear to be a bank statement or if no transactions can be reliably extracted,
-                    please return a JSON object with a single key "error", like this:
-                    {{ "error": "Document does not appear to be a bank statement or no transactions found." }}
-
-                    Ensure the output contains ONLY the JSON object. Do NOT wrap the JSON in markdown code fences (like ```json ... ```).
-                    The response should start directly with `{{` or `[` and end with `}}` or `]`.
-                    Example of a single transaction object if successful:
-                    {{
-                        "date": "2024-01-15",
-                        "description": "Grocery Store Purchase",
-                        "debit": 55.75,
-                        "credit": null,
-                        "balance": 1234.50
-                    }}
-                    """
-                    response = model.generate_content(
-                        [uploaded_file_part, prompt])
-                    raw_response_text = response.text
-                    logger.debug(f"upload_pdf_view: Gemini raw response received. Length: {len(raw_response_text)}",
-                                 extra={'request_id': request_id, 'response_length': len(raw_response_text)})
-
-                    # Attempt to strip markdown fences if present
-                    cleaned_response_text = raw_response_text.strip()
-                    if cleaned_response_text.startswith("```json"):
-                        # Remove ```json
-                        cleaned_response_text = cleaned_response_text[7:]
-                    # General markdown fence
-                    if cleaned_response_text.startswith("```"):
-                        cleaned_response_text = cleaned_response_text[3:]
-                    if cleaned_response_text.endswith("```"):
-                        cleaned_response_text = cleaned_response_text[:-3]
-                    cleaned_response_text = cleaned_response_text.strip()  # Strip again after removal
-
-                    try:
-                        parsed_data = json.loads(cleaned_response_text)
-                        logger.debug("upload_pdf_view: Gemini response parsed as JSON.", extra={
-                                     'request_id': request_id})
-                        if isinstance(parsed_data, dict) and "error" in parsed_data:
-                            logger.warning(f"upload_pdf_view: Gemini API returned structured error: {parsed_data['error']}",
-                                           extra={'request_id': request_id, 'gemini_error': parsed_data['error']})
-                            return JsonResponse({'status': 'error', 'message': f"Could not process PDF: {parsed_data['error']}"}, status=400)
-                        elif isinstance(parsed_data, list):
-                            if not parsed_data:  # Empty list of transactions
-                                logger.info("upload_pdf_view: No transactions found in PDF by Gemini.", extra={
-                                            'request_id': request_id})
-                                return JsonResponse({'status': 'success', 'message': "No transactions found in the PDF. It might not be a bank statement or it's empty.", 'results_ready': False})
-                            else:
-                                logger.info(f"upload_pdf_view: Successfully extracted {len(parsed_data)} transactions by Gemini.",
-                                            extra={'request_id': request_id, 'transaction_count': len(parsed_data)})
-                                parsed_json_data = parsed_data  # Keep local var for processing
-                                user_friendly_message = f"Successfully extracted {len(parsed_data)} transactions. Choose an option below."
-                                results_ready = True  # Set flag for template
-
-                                # --- Parse dates and find range ---
-                                min_date = None
-                                max_date = None
-                                # Added %d/%m/%y for two-digit year format
-                                date_formats = [
-                                    "%Y-%m-%d", "%d/%m/%Y", "%m/%d/%Y", "%d-%b-%Y", "%d-%B-%Y", "%d/%m/%y"]
-
-                                for item in parsed_json_data:
-                                    date_str = item.get('date')
-                                    if date_str:
-                                        parsed_dt = None
-                                        for fmt in date_formats:
-                                            try:
-                                                parsed_dt = datetime.strptime(
-                                                    date_str, fmt).date()
-                                                break  # Stop trying formats once one works
-                                            except (ValueError, TypeError):
-                                                continue  # Try next format
-
-                                        if parsed_dt:
-                                            if min_date is None or parsed_dt < min_date:
-                                                min_date = parsed_dt
-                                            if max_date is None or parsed_dt > max_date:
-                                                max_date = parsed_dt
-
-                                # --- Generate date range string for filename/title ---
-                                date_range_string = "statement"  # Default
-                                if min_date and max_date:
-                                    date_range_string = f"{min_date:%Y-%m-%d}_to_{max_date:%Y-%m-%d}"
-                                elif min_date:  # Only min date found
-                                    date_range_string = f"from_{min_date:%Y-%m-%d}"
-                                elif max_date:  # Only max date found
-                                    date_range_string = f"up_to_{max_date:%Y-%m-%d}"
-                                logger.debug(f"upload_pdf_view: Date range determined: {date_range_string}",
-                                             extra={'request_id': request_id, 'date_range': date_range_string})
-
-                                # Store data and date range string in session
-                                logger.debug("upload_pdf_view: Storing extracted data and date range in session.", extra={
-                                             'request_id': request_id})
-                                # Keep date range for filenames
-                                request.session['date_range_string'] = date_range_string
-
-                                # --- Save to Database ---
-                                statement_record = None
-                                try:
-                                    logger.info(f"upload_pdf_view: Saving extracted data to database for {pdf_file.name}.",
-                                                extra={'request_id': request_id, 'pdf_filename': pdf_file.name})
-                                    statement_record = StatementData.objects.create(
-                                        pdf_filename=pdf_file.name if pdf_file else None,
-                                        extracted_data=parsed_json_data
-                                    )
-                                    logger.info(f"upload_pdf_view: Data saved to database successfully. Record ID: {statement_record.id}",
-                                                extra={'request_id': request_id, 'record_id': statement_record.id})
-                                    # Store the ID of the record in the session
-                                    request.session['statement_data_id'] = statement_record.id
-                                    # Remove old full data if present
-                                    request.session.pop('statement_data', None)
-                                except Exception as db_error:
-                                    logger.error("upload_pdf_view: Error saving data to database.",
-                                                 exc_info=True, extra={'request_id': request_id, 'db_error': str(db_error)})
-                                    return JsonResponse({'status': 'error', 'message': 'Failed to save statement data to database. Please try again.'}, status=500)
-                                # --- End Save to Database ---
-                                # --- End date parsing (moved comment for clarity) ---
-
-                                logger.info("upload_pdf_view: AJAX request successful, returning JSON response.", extra={
-                                            'request_id': request_id})
-                                return JsonResponse({
-                                    'status': 'success',
-                                    'message': f"Successfully extracted {len(parsed_data)} transactions.",
-                                    'results_ready': True
-                                })
-                        else:
-                            logger.error(f"upload_pdf_view: Received unexpected JSON structure from Gemini API. Type: {type(parsed_data)}",
-                                         extra={'request_id': request_id, 'response_type': str(type(parsed_data)), 'response_preview': cleaned_response_text[:200]})
-                            return JsonResponse({'status': 'error', 'message': 'Received an unexpected data structure from the API.'}, status=500)
-                    except json.JSONDecodeError:
-                        logger.error("upload_pdf_view: Could not decode JSON response from Gemini API.",
-                                     exc_info=True, extra={'request_id': request_id, 'raw_response': cleaned_response_text})
-                        return JsonResponse({'status': 'error', 'message': 'Could not understand the response from the API (Invalid JSON).'}, status=500)
-
-                finally:
-                    if temp_file_created and file_path_for_api and os.path.exists(file_path_for_api):
-                        logger.debug(f"upload_pdf_view: Removing temp file: {file_path_for_api}",
-                                     extra={'request_id': request_id, 'temp_file_path': file_path_for_api})
-                        os.remove(file_path_for_api)
-                    # The genai.upload_file creates a File resource that might need explicit deletion
-                    # depending on SDK version and how it's managed.
-                    # For now, we assume the SDK handles its lifecycle or it's short-lived.
-                    # If you encounter issues with too many uploaded files on the Gemini service,
-                    # you might need to explicitly delete `uploaded_file_part` using `genai.delete_file(uploaded_file_part.name)`
-                    # after you're done with it, but ensure it exists first.
-
+                    with span('cache_lookup'):
+                        cache_key = build_cache_key(compute_pdf_digest(pdf_file),
+                                                    settings.GEMINI_MODEL_NAME, EXTRACTION_PROMPT_VERSION)
+                        cached_result = lookup_cached_result(cache_key)
+                except Exception as cache_error:
+                    # A cache failure must never block a fresh extraction
+                    logger.warning("upload_pdf_view: Result cache lookup failed: %s", cache_error,
+                                   exc_info=True, extra={'request_id': request_id})
+                    cached_result = None
+
+                if cached_result:
+                    metrics.CACHE_HITS.inc()
+                    logger.info("upload_pdf_view: Result cache hit for %s. Reusing record ID: %s",
+                                pdf_file.name, cached_result['statement_data_id'],
+                                extra={'request_id': request_id, 'record_id': cached_result['statement_data_id'],
+                                       'cache_key': cache_key, 'cache_stats': get_cache_stats()})
+                    _set_session_statements(
+                        request, [cached_result['statement_data_id']], cached_result['date_range_string'])
+                    return JsonResponse({
+                        'status': 'success',
+                        'message': f"Successfully extracted {cached_result['transaction_count']} transactions.",
+                        'results_ready': True
+                    })
+                logger.debug("upload_pdf_view: Result cache miss.", extra={
+                             'request_id': request_id, 'cache_key': cache_key, 'cache_stats': get_cache_stats()})
+
+            # --- Hand the extraction off to the background worker pool ---
+            # The Gemini round-trip can take 30-60s; the browser polls the job status endpoint instead.
+            try:
+                with span('stage_upload'):
+                    job = submit_extraction_job(
+                        pdf_file, cache_key=cache_key, request_id=request_id)
             except Exception as e:
-                logger.error("upload_pdf_view: An error occurred during PDF processing.",
+                logger.error("upload_pdf_view: Could not queue PDF for processing.",
                              exc_info=True, extra={'request_id': request_id, 'exception_type': type(e).__name__})
                 error_message = f"An error occurred during processing: {str(e)}"
                 return JsonResponse({'status': 'error', 'message': error_message}, status=500)
+
+            request.session['extraction_job_id'] = str(job.id)
+            accepted = {
+                'status': 'accepted',
+                'message': 'PDF received. Analyzing statement...',
+                'job_id': str(job.id),
+                'status_url': reverse('converter_app:extraction_job_status', args=[job.id]),
+            }
+            if _job_events_enabled():  # Otherwise script.js polls status_url
+                accepted['events_url'] = reverse('converter_app:extraction_job_events', args=[job.id])
+            return JsonResponse(accepted, status=202)
         else:
             # Form validation failed
-            logger.warning(f"upload_pdf_view: Form validation failed. Errors: {form.errors.as_json()}",
+            logger.warning("upload_pdf_view: Form validation failed. Errors: %s", form.errors.as_json(),
                            extra={'request_id': request_id, 'form_errors': form.errors.as_json()})
             form_errors = form.errors.as_json()
             return JsonResponse({'status': 'error', 'message': 'Invalid form submission.', 'errors': json.loads(form_errors)}, status=400)
@@ -302,29 +221,26 @@ def upload_pdf_view(request):
         gsheet_url_val = None
         gsheet_title_val = None
 
-        # Prioritize Google Sheets specific messages
-        logger.info(f"upload_pdf_view (GET): GSheet session variables ON LOAD - Message: {request.session.get('gsheet_success_message')}, URL: {request.session.get('gsheet_url')}, Title: {request.session.get('gsheet_title')}",
+        # Prioritize Google Sheets specific messages. Popping only writes the session when a message was pending.
+        flash = _pop_flash(request)
+        logger.info("upload_pdf_view (GET): Pending session message ON LOAD - Message: %s, GSheet message: %s, URL: %s, Title: %s",
+                    flash.get('message'), flash.get('gsheet_message'), flash.get('gsheet_url'), flash.get('gsheet_title'),
                     extra={'request_id': request_id,
-                           'session_gsheet_success_message': request.session.get('gsheet_success_message'),
-                           'session_gsheet_url': request.session.get('gsheet_url'),
-                           'session_gsheet_title': request.session.get('gsheet_title')})
-        _gsheet_success_message = request.session.get('gsheet_success_message')
-        _upload_message = request.session.get(
-            'upload_message')  # Check for general messages early
+                           'session_gsheet_success_message': flash.get('gsheet_message'),
+                           'session_gsheet_url': flash.get('gsheet_url'),
+                           'session_gsheet_title': flash.get('gsheet_title')})
+        _gsheet_success_message = flash.get('gsheet_message')
+        _upload_message = flash.get('message')  # Check for general messages early
 
         if _gsheet_success_message:
             gsheet_success_message_val = _gsheet_success_message
-            gsheet_url_val = request.session.get('gsheet_url')
-            gsheet_title_val = request.session.get('gsheet_title')
+            gsheet_url_val = flash.get('gsheet_url')
+            gsheet_title_val = flash.get('gsheet_title')
             results_ready = True  # GSheet link implies results are ready for this load
-            logger.debug(f"upload_pdf_view: GET with GSheet success: '{gsheet_success_message_val}', URL: {gsheet_url_val}", extra={
+            logger.debug("upload_pdf_view: GET with GSheet success: '%s', URL: %s",
+                         gsheet_success_message_val, gsheet_url_val, extra={
                          'request_id': request_id})
 
-            # Pop GSheet specific messages
-            request.session.pop('gsheet_success_message', None)
-            request.session.pop('gsheet_url', None)
-            request.session.pop('gsheet_title', None)
-
             # # Clear statement-specific data as the GSheet cycle for this PDF is complete
             # # MODIFIED: Do not clear statement_data_id and date_range_string here,
             # # so that download options remain available for the same processed statement.
@@ -343,21 +259,20 @@ def upload_pdf_view(request):
                 error_message = _upload_message
             else:
                 user_friendly_message = _upload_message
-            logger.debug(f"upload_pdf_view: GET with general message: '{_upload_message}'", extra={
+            logger.debug("upload_pdf_view: GET with general message: '%s'", _upload_message, extra={
                          'request_id': request_id})
-            request.session.pop('upload_message', None)  # Pop after retrieving
 
             # If an error message is shown AND there's statement data, keep results ready
             if error_message and request.session.get('statement_data_id'):
                 results_ready = True
-                logger.debug(f"upload_pdf_view: General error message displayed for statement_data_id '{request.session.get('statement_data_id')}'. Setting results_ready=True.", extra={
+                logger.debug("upload_pdf_view: General error message displayed for statement_data_id '%s'. Setting results_ready=True.", request.session.get('statement_data_id'), extra={
                              'request_id': request_id})
             # If it's just a user_friendly_message (not an error) without GSheet success,
             # and statement_data_id exists, it implies a multi-step process that isn't an error.
             # Example: "PDF processed, choose download option." - results_ready should be true.
             elif user_friendly_message and request.session.get('statement_data_id'):
                 results_ready = True
-                logger.debug(f"upload_pdf_view: General user message displayed for statement_data_id '{request.session.get('statement_data_id')}'. Setting results_ready=True.", extra={
+                logger.debug("upload_pdf_view: General user message displayed for statement_data_id '%s'. Setting results_ready=True.", request.session.get('statement_data_id'), extra={
                              'request_id': request_id})
 
         # This is a "fresh" visit (no GSheet message, no general upload_message)
@@ -365,13 +280,17 @@ def upload_pdf_view(request):
             logger.info("upload_pdf_view: Fresh visit (no GSheet or general messages). Clearing any old statement data.", extra={
                         'request_id': request_id})
             if 'statement_data_id' in request.session:
-                logger.debug(f"upload_pdf_view: Clearing old statement_data_id: {request.session.get('statement_data_id')}", extra={
+                logger.debug("upload_pdf_view: Clearing old statement_data_id: %s",
+                             request.session.get('statement_data_id'), extra={
                              'request_id': request_id})
                 request.session.pop('statement_data_id', None)
             if 'date_range_string' in request.session:
-                logger.debug(f"upload_pdf_view: Clearing old date_range_string: {request.session.get('date_range_string')}", extra={
+                logger.debug("upload_pdf_view: Clearing old date_range_string: %s",
+                             request.session.get('date_range_string'), extra={
                              'request_id': request_id})
                 request.session.pop('date_range_string', None)
+            if 'statement_data_ids' in request.session:  # Only a session that had one needs saving
+                request.session.pop('statement_data_ids', None)
             results_ready = False  # Explicitly set to false for a clean slate
 
         # Final check: if gsheet_success_message_val was set earlier, results_ready must be true.
@@ -388,132 +307,594 @@ def upload_pdf_view(request):
             'gsheet_success_message': gsheet_success_message_val,
             'gsheet_url': gsheet_url_val,
             'gsheet_title': gsheet_title_val,
+            # Parquet/Arrow links are only offered when pyarrow is installed
+            'columnar_exports_available': arrow_export.is_available(),
         })
 
 
-def download_csv_view(request):
+def extraction_job_status_view(request, job_id):
+    """
+    Polled by script.js after an upload. Reports the background job's state and,
+    once it succeeds, points the session at the new StatementData record.
+    """
     request_id = getattr(request, 'request_id', 'N/A')
-    logger.debug("Enter download_csv_view.", extra={
+    logger.debug("Enter extraction_job_status_view. Job: %s", job_id, extra={
+                 'request_id': request_id, 'job_id': str(job_id), 'path': request.path})
+
+    # Jobs are only visible to the session that submitted them
+    if request.session.get('extraction_job_id') != str(job_id):
+        logger.warning("extraction_job_status_view: Job ID does not belong to this session.",
+                       extra={'request_id': request_id, 'job_id': str(job_id)})
+        raise Http404("Unknown extraction job.")
+
+    try:
+        job = ExtractionJob.objects.get(id=job_id)
+    except ExtractionJob.DoesNotExist:
+        logger.error("extraction_job_status_view: ExtractionJob %s not found.", job_id,
+                     extra={'request_id': request_id, 'job_id': str(job_id)})
+        raise Http404("Unknown extraction job.")
+
+    state = get_job_state(job)
+    if state == ExtractionJob.STATUS_SUCCEEDED and job.results_ready and \
+            request.session.get('statement_data_id') != job.statement_id:
+        logger.info("extraction_job_status_view: Job %s succeeded. Storing record ID %s in session.",
+                    job_id, job.statement_id,
+                    extra={'request_id': request_id, 'job_id': str(job_id), 'record_id': job.statement_id})
+        _set_session_statements(
+            request, [job.statement_id], job.date_range_string)
+
+    return JsonResponse({
+        'job_id': str(job.id),
+        'state': state,
+        'message': job.message,
+        'results_ready': state == ExtractionJob.STATUS_SUCCEEDED and job.results_ready,
+        'rows_parsed': job.rows_parsed,
+        'current_date': job.progress_date,
+    })
+
+
+# Each open event stream holds a worker thread (and a serverless invocation), so streams are
+# off by default and kept short; EventSource reconnects on its own after one ends
+DEFAULT_EVENTS_ENABLED = False
+DEFAULT_EVENTS_MAX_SECONDS = 10
+EVENTS_KEEPALIVE_SECONDS = 15
+EVENTS_RETRY_MS = 3000  # Browser reconnect delay after the stream drops
+
+
+def _job_events_enabled():
+    return getattr(settings, 'EXTRACTION_EVENTS_ENABLED', DEFAULT_EVENTS_ENABLED)
+
+
+def _format_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+def _job_event_stream(job_id, request_id):
+    """
+    Yields Server-Sent Events for a job: 'progress' whenever its row count or
+    date moves, then one 'done' once it has finished. Final session updates
+    are left to extraction_job_status_view, since a streamed response's
+    session is saved before the first event is sent.
+    """
+    interval = getattr(settings, 'EXTRACTION_PROGRESS_INTERVAL_SECONDS', DEFAULT_PROGRESS_INTERVAL_SECONDS)
+    deadline = time.monotonic() + getattr(settings, 'EXTRACTION_EVENTS_MAX_SECONDS', DEFAULT_EVENTS_MAX_SECONDS)
+    last_payload = None
+    last_sent = time.monotonic()
+    yield f"retry: {EVENTS_RETRY_MS}\n\n"
+    while time.monotonic() < deadline:
+        job = ExtractionJob.objects.filter(id=job_id).first()
+        if job is None:
+            yield _format_event('done', {'state': ExtractionJob.STATUS_FAILED, 'message': 'Unknown extraction job.'})
+            return
+        state = get_job_state(job)
+        payload = {'state': state, 'rows_parsed': job.rows_parsed, 'current_date': job.progress_date}
+        if state in (ExtractionJob.STATUS_SUCCEEDED, ExtractionJob.STATUS_FAILED):
+            payload['message'] = job.message
+            logger.debug("Job %s event stream finished with state '%s'.", job_id, state,
+                         extra={'request_id': request_id, 'job_id': str(job_id)})
+            yield _format_event('done', payload)
+            return
+        if payload != last_payload:
+            yield _format_event('progress', payload)
+            last_payload, last_sent = payload, time.monotonic()
+        elif time.monotonic() - last_sent >= EVENTS_KEEPALIVE_SECONDS:
+            yield ": keep-alive\n\n"  # Comment line; stops proxies closing an idle stream
+            last_sent = time.monotonic()
+        time.sleep(interval)
+
+
+def extraction_job_events_view(request, job_id):
+    """
+    Server-Sent Events feed of a background job's live progress (rows parsed
+    so far, latest date reached), consumed by script.js with EventSource. Only
+    when EXTRACTION_EVENTS_ENABLED; each stream ends after EXTRACTION_EVENTS_MAX_SECONDS
+    and the browser reconnects.
+    """
+    request_id = getattr(request, 'request_id', 'N/A')
+    logger.debug("Enter extraction_job_events_view. Job: %s", job_id, extra={
+                 'request_id': request_id, 'job_id': str(job_id), 'path': request.path})
+    if not _job_events_enabled():
+        raise Http404("Event streams are disabled.")
+
+    # Jobs are only visible to the session that submitted them
+    if request.session.get('extraction_job_id') != str(job_id):
+        logger.warning("extraction_job_events_view: Job ID does not belong to this session.",
+                       extra={'request_id': request_id, 'job_id': str(job_id)})
+        raise Http404("Unknown extraction job.")
+
+    response = StreamingHttpResponse(
+        _job_event_stream(job_id, request_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Tell nginx-style proxies not to buffer the stream
+    return response
+
+
+def batch_upload_view(request):
+    """
+    AJAX endpoint for batch mode: accepts many PDFs and/or ZIP archives of PDFs
+    and queues one extraction job per statement. Progress is polled from
+    batch_status_view.
+    """
+    request_id = getattr(request, 'request_id', 'N/A')
+    logger.debug("Enter batch_upload_view. Method: %s", request.method, extra={
+                 'request_id': request_id, 'method': request.method, 'path': request.path})
+    if request.method != 'POST' or request.headers.get('X-Requested-With') != 'XMLHttpRequest':
+        logger.warning("batch_upload_view: Invalid request.", extra={'request_id': request_id})
+        return JsonResponse({'status': 'error', 'message': 'Invalid request type.'}, status=400)
+
+    form = BatchUploadForm(request.POST, request.FILES)
+    if not form.is_valid():
+        logger.warning("batch_upload_view: Form validation failed. Errors: %s", form.errors.as_json(),
+                       extra={'request_id': request_id, 'form_errors': form.errors.as_json()})
+        return JsonResponse({'status': 'error', 'message': 'Invalid form submission.',
+                             'errors': json.loads(form.errors.as_json())}, status=400)
+
+    uploaded_files = form.cleaned_data['pdf_files']
+    logger.info("batch_upload_view: Form is valid. Processing %s uploaded files.", len(uploaded_files),
+                extra={'request_id': request_id, 'file_count': len(uploaded_files)})
+    _clear_processing_session(request, request_id)
+
+    try:
+        batch = submit_batch(uploaded_files, request_id=request_id)
+    except Exception as e:
+        logger.error("batch_upload_view: Could not queue batch for processing.",
+                     exc_info=True, extra={'request_id': request_id, 'exception_type': type(e).__name__})
+        return JsonResponse({'status': 'error', 'message': f"An error occurred during processing: {str(e)}"}, status=500)
+
+    request.session['extraction_batch_id'] = str(batch.id)
+    return JsonResponse({
+        'status': 'accepted',
+        'message': 'Files received. Analyzing statements...',
+        'batch_id': str(batch.id),
+        'status_url': reverse('converter_app:batch_status', args=[batch.id]),
+    }, status=202)
+
+
+def batch_status_view(request, batch_id):
+    """
+    Polled by script.js during a batch upload. Reports every file's state and,
+    as files succeed, points the session at their StatementData records.
+    """
+    request_id = getattr(request, 'request_id', 'N/A')
+    logger.debug("Enter batch_status_view. Batch: %s", batch_id, extra={
+                 'request_id': request_id, 'batch_id': str(batch_id), 'path': request.path})
+
+    # Batches are only visible to the session that submitted them
+    if request.session.get('extraction_batch_id') != str(batch_id):
+        logger.warning("batch_status_view: Batch ID does not belong to this session.",
+                       extra={'request_id': request_id, 'batch_id': str(batch_id)})
+        raise Http404("Unknown extraction batch.")
+    try:
+        batch = ExtractionBatch.objects.get(id=batch_id)
+    except ExtractionBatch.DoesNotExist:
+        raise Http404("Unknown extraction batch.")
+
+    jobs = get_batch_jobs(batch)
+    files = []
+    succeeded_jobs = []
+    for job in jobs:
+        ready = job.status == ExtractionJob.STATUS_SUCCEEDED and job.results_ready
+        file_state = {
+            'job_id': str(job.id),
+            'filename': job.pdf_filename,
+            'state': job.status,
+            'message': job.message,
+            'results_ready': ready,
+            'transaction_count': job.transaction_count,
+        }
+        if ready:
+            succeeded_jobs.append(job)
+            query = f"?statement={job.statement_id}"
+            file_state['downloads'] = {
+                'csv': reverse('converter_app:download_csv') + query,
+                'excel': reverse('converter_app:download_excel') + query,
+                'json': reverse('converter_app:download_json') + query,
+            }
+        files.append(file_state)
+
+    statement_ids = [job.statement_id for job in succeeded_jobs]
+    if statement_ids != request.session.get('statement_data_ids'):
+        _set_session_statements(
+            request, statement_ids, succeeded_jobs[0].date_range_string if succeeded_jobs else 'statement')
+
+    finished = [job for job in jobs if job.status in (
+        ExtractionJob.STATUS_SUCCEEDED, ExtractionJob.STATUS_FAILED)]
+    return JsonResponse({
+        'batch_id': str(batch.id),
+        'state': 'completed' if len(finished) == len(jobs) else 'running',
+        'total': len(jobs),
+        'completed': len(finished),
+        'succeeded': len(succeeded_jobs),
+        'failed': len(finished) - len(succeeded_jobs),
+        'files': files,
+        'combined_downloads': {
+            'csv': reverse('converter_app:download_batch', args=['csv']),
+            'excel': reverse('converter_app:download_batch', args=['excel']),
+            'json': reverse('converter_app:download_batch', args=['json']),
+        } if succeeded_jobs else {},
+    })
+
+
+# URL names for the combined download -> export format
+BATCH_DOWNLOAD_FORMATS = {
+    'csv': ExportArtifact.FORMAT_CSV,
+    'excel': ExportArtifact.FORMAT_XLSX,
+    'json': ExportArtifact.FORMAT_JSON,
+}
+
+
+def download_batch_view(request, export_format):
+    """Downloads every successfully converted statement of the session's batch as one ZIP archive."""
+    request_id = getattr(request, 'request_id', 'N/A')
+    logger.debug("Enter download_batch_view.", extra={
                  'request_id': request_id, 'path': request.path})
-    statement_data_id = request.session.get('statement_data_id')
-    date_range_str = request.session.get('date_range_string', 'statement')
+    if export_format not in BATCH_DOWNLOAD_FORMATS:
+        raise Http404("Unknown export format.")
+    batch_id = request.session.get('extraction_batch_id')
+    statement_ids = request.session.get('statement_data_ids') or []
+    if not batch_id or not statement_ids:
+        logger.warning("download_batch_view: No batch results found in session.",
+                       extra={'request_id': request_id})
+        raise Http404("No batch results found in session. Please upload your PDFs first.")
+
+    jobs = (ExtractionJob.objects
+            .filter(batch_id=batch_id, statement_id__in=statement_ids, results_ready=True)
+            .select_related('statement')
+            .order_by('batch_position'))
+    archive_file = build_combined_archive(jobs, BATCH_DOWNLOAD_FORMATS[export_format])
+
+    filename = f"statements_{export_format}.zip"
+    logger.info("download_batch_view: Combined archive '%s' prepared for %s statements.", filename, len(statement_ids),
+                extra={'request_id': request_id, 'output_filename': filename, 'batch_id': batch_id})
+    return FileResponse(archive_file, as_attachment=True, filename=filename,
+                        content_type='application/zip')
+
+
+def _timed_export(export_format):
+    """Records a download view's response time in the per-format export latency histogram."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            with metrics.EXPORT_LATENCY.time(format=export_format):
+                return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _accepts_encoding(request, encoding):
+    """True if the client's Accept-Encoding header allows `encoding` (q=0 means refused)."""
+    for part in request.headers.get('Accept-Encoding', '').split(','):
+        token, _, params = part.strip().partition(';')
+        if token.strip().lower() == encoding:
+            return params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000')
+    return False
+
+
+def _serve_stored_artifact(request, statement_data_id, export_format, filename, request_id):
+    """
+    Returns a response built from the pre-rendered artifact of a statement, or None
+    if there isn't one. Compressed bytes are sent as-is when the client accepts the
+    encoding, and decompressed otherwise.
+    """
+    if not getattr(settings, 'ARTIFACTS_ENABLED', True):
+        return None
+    with span('artifact_lookup'):
+        artifact = get_stored_artifact(statement_data_id, export_format)
+    if artifact is None:
+        return None
+
+    if artifact.encoding == ExportArtifact.ENCODING_IDENTITY:
+        response = HttpResponse(bytes(artifact.content))
+    elif _accepts_encoding(request, artifact.encoding):
+        response = HttpResponse(bytes(artifact.content))
+        response['Content-Encoding'] = artifact.encoding
+    else:
+        response = HttpResponse(decompress_artifact(artifact))
+    response['Content-Type'] = EXPORT_CONTENT_TYPES[export_format]
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    logger.info("Serving stored %s artifact '%s' for record ID %s.", export_format, filename, statement_data_id,
+                extra={'request_id': request_id, 'record_id': statement_data_id, 'output_filename': filename,
+                       'content_encoding': response.get('Content-Encoding', 'identity')})
+    return response
+
 
+def _get_requested_statement(request, view_name, request_id):
+    """
+    Returns (statement_data_id, date_range_string) for a download. Defaults to the
+    session's current statement; ?statement=<id> picks another statement of the
+    latest upload, e.g. one file of a batch. Raises Http404 if there is none.
+    """
+    requested_id = request.GET.get('statement')
+    if requested_id:
+        if not requested_id.isdigit() or int(requested_id) not in request.session.get('statement_data_ids', []):
+            logger.warning("%s: Requested statement %s does not belong to this session.", view_name, requested_id,
+                           extra={'request_id': request_id})
+            raise Http404("Unknown statement.")
+        job = ExtractionJob.objects.filter(
+            statement_id=int(requested_id)).exclude(date_range_string='').first()
+        return int(requested_id), (job.date_range_string if job else 'statement')
+
+    statement_data_id = request.session.get('statement_data_id')
     if not statement_data_id:
-        logger.warning("download_csv_view: No statement_data_id found in session.", extra={
+        logger.warning("%s: No statement_data_id found in session.", view_name, extra={
                        'request_id': request_id})
-        # Optionally, redirect to upload page with a message
-        # request.session['upload_message'] = "No data to download. Please upload a PDF first."
-        # return redirect(reverse('converter_app:upload_pdf'))
         raise Http404(
             "No statement data ID found in session. Please upload a PDF first.")
+    return statement_data_id, request.session.get('date_range_string', 'statement')
+
+
+def _get_export_rows(statement_data_id, view_name, format_label, date_range_str, request_id):
+    """
+    Returns the statement's rows for an exporter, as TransactionTables. Rows are
+    streamed from the normalized Transaction table a chunk at a time when it has
+    been populated, falling back to the extracted_data JSON blob for records that
+    haven't been backfilled. Raises Http404 when there's nothing to export.
+    """
+    with span('export_query'):
+        transactions_stored = has_transactions(statement_data_id)
+    if transactions_stored:
+        logger.info("%s: Streaming normalized transactions (ID: %s) for %s generation.",
+                    view_name, statement_data_id, format_label,
+                    extra={'request_id': request_id, 'record_id': statement_data_id, 'date_range': date_range_str})
+        return iter_transaction_tables(statement_data_id)
 
     try:
-        statement_record = StatementData.objects.get(id=statement_data_id)
-        extracted_data = statement_record.extracted_data
-        logger.info(f"download_csv_view: Retrieved statement data (ID: {statement_data_id}) for CSV generation.",
+        with span('export_query'):
+            statement_record = StatementData.objects.get(id=statement_data_id)
+            extracted_data = statement_record.extracted_data
+        logger.info("%s: Retrieved statement data (ID: %s) for %s generation.",
+                    view_name, statement_data_id, format_label,
                     extra={'request_id': request_id, 'record_id': statement_data_id, 'date_range': date_range_str})
     except StatementData.DoesNotExist:
-        logger.error(f"download_csv_view: StatementData with ID {statement_data_id} not found.",
+        logger.error("%s: StatementData with ID %s not found.", view_name, statement_data_id,
                      extra={'request_id': request_id, 'record_id': statement_data_id})
         raise Http404(
             "Statement data not found. It might have been cleared or an error occurred.")
 
     if not extracted_data:  # Should not happen if record exists and has data, but good check
-        logger.warning(f"download_csv_view: StatementData record ID {statement_data_id} has no extracted_data.",
+        logger.warning("%s: StatementData record ID %s has no extracted_data.", view_name, statement_data_id,
                        extra={'request_id': request_id, 'record_id': statement_data_id})
         raise Http404("No extracted data available for this statement.")
+    return TransactionTable.from_rows(extracted_data)
+
+
+@_timed_export('csv')
+def download_csv_view(request):
+    request_id = getattr(request, 'request_id', 'N/A')
+    logger.debug("Enter download_csv_view.", extra={
+                 'request_id': request_id, 'path': request.path})
+    statement_data_id, date_range_str = _get_requested_statement(
+        request, 'download_csv_view', request_id)
+
+    stored_response = _serve_stored_artifact(
+        request, statement_data_id, ExportArtifact.FORMAT_CSV, f"{date_range_str}.csv", request_id)
+    if stored_response is not None:
+        return stored_response
+
+    export_rows = _get_export_rows(
+        statement_data_id, 'download_csv_view', 'CSV', date_range_str, request_id)
 
-    csv_data = convert_data_to_csv_string(extracted_data)
+    # No pre-rendered artifact (evicted, too large or not rendered yet): render now,
+    # and queue a background render so the next download is served from the store
+    schedule_artifact_render(
+        statement_data_id, request_id=request_id, only_if_missing=True)
 
     filename = f"{date_range_str}.csv"
-    logger.info(f"download_csv_view: CSV file '{filename}' prepared for download.",
+    logger.info("download_csv_view: Streaming CSV file '%s' for download.", filename,
                 extra={'request_id': request_id, 'output_filename': filename})
-    response = HttpResponse(csv_data, content_type='text/csv')
+    # Rows are formatted as the response is sent instead of building the whole file in memory
+    response = StreamingHttpResponse(
+        iter_csv_chunks(export_rows), content_type='text/csv')
     response['Content-Disposition'] = f'attachment; filename="{filename}"'
     return response
 
 
+@_timed_export('xlsx')
 def download_excel_view(request):
     request_id = getattr(request, 'request_id', 'N/A')
     logger.debug("Enter download_excel_view.", extra={
                  'request_id': request_id, 'path': request.path})
-    statement_data_id = request.session.get('statement_data_id')
-    date_range_str = request.session.get('date_range_string', 'statement')
+    statement_data_id, date_range_str = _get_requested_statement(
+        request, 'download_excel_view', request_id)
 
-    if not statement_data_id:
-        logger.warning("download_excel_view: No statement_data_id found in session.", extra={
-                       'request_id': request_id})
-        raise Http404(
-            "No statement data ID found in session. Please upload a PDF first.")
+    stored_response = _serve_stored_artifact(
+        request, statement_data_id, ExportArtifact.FORMAT_XLSX, f"{date_range_str}.xlsx", request_id)
+    if stored_response is not None:
+        return stored_response
 
-    try:
-        statement_record = StatementData.objects.get(id=statement_data_id)
-        extracted_data = statement_record.extracted_data
-        logger.info(f"download_excel_view: Retrieved statement data (ID: {statement_data_id}) for Excel generation.",
-                    extra={'request_id': request_id, 'record_id': statement_data_id, 'date_range': date_range_str})
-    except StatementData.DoesNotExist:
-        logger.error(f"download_excel_view: StatementData with ID {statement_data_id} not found.",
-                     extra={'request_id': request_id, 'record_id': statement_data_id})
-        raise Http404(
-            "Statement data not found. It might have been cleared or an error occurred.")
+    export_rows = _get_export_rows(
+        statement_data_id, 'download_excel_view', 'Excel', date_range_str, request_id)
 
-    if not extracted_data:
-        logger.warning(f"download_excel_view: StatementData record ID {statement_data_id} has no extracted_data.",
-                       extra={'request_id': request_id, 'record_id': statement_data_id})
-        raise Http404("No extracted data available for this statement.")
+    # No pre-rendered artifact (evicted, too large or not rendered yet): render now,
+    # and queue a background render so the next download is served from the store
+    schedule_artifact_render(
+        statement_data_id, request_id=request_id, only_if_missing=True)
 
-    excel_data = convert_data_to_excel_bytes(extracted_data)
+    with span('export_render'):
+        excel_file = convert_data_to_excel_file(export_rows)
 
     filename = f"{date_range_str}.xlsx"
-    logger.info(f"download_excel_view: Excel file '{filename}' prepared for download.",
+    logger.info("download_excel_view: Excel file '%s' prepared for download.", filename,
                 extra={'request_id': request_id, 'output_filename': filename})
-    response = HttpResponse(
-        excel_data,
+    # FileResponse streams the spooled workbook in blocks and closes it when done,
+    # so the file is never copied into a second in-memory bytes object.
+    response = FileResponse(
+        excel_file,
+        as_attachment=True,
+        filename=filename,
         content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
     )
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
     return response
 
 
+def _download_columnar_export(request, export_format, view_name, format_label):
+    """Builds a Parquet or Arrow download in record batches from the statement's transactions."""
+    request_id = getattr(request, 'request_id', 'N/A')
+    logger.debug("Enter %s.", view_name, extra={
+                 'request_id': request_id, 'path': request.path})
+    if not arrow_export.is_available():
+        logger.warning("%s: pyarrow isn't installed, so %s downloads are unavailable.", view_name, format_label,
+                       extra={'request_id': request_id})
+        return HttpResponse(f"{format_label} downloads aren't available on this server.",
+                            status=501, content_type='text/plain')
+    statement_data_id, date_range_str = _get_requested_statement(
+        request, view_name, request_id)
+
+    export_rows = _get_export_rows(
+        statement_data_id, view_name, format_label, date_range_str, request_id)
+
+    try:
+        with span('export_render'):
+            output_file = arrow_export.convert_data_to_columnar_file(export_format, export_rows)
+    except arrow_export.InexactAmountError as e:
+        logger.warning("%s: Statement %s can't be exported as %s: %s", view_name, statement_data_id, format_label, e,
+                       extra={'request_id': request_id, 'record_id': statement_data_id})
+        return HttpResponse(f"{e} Download this statement as CSV, Excel or JSON instead.",
+                            status=422, content_type='text/plain')
+
+    filename = f"{date_range_str}.{export_format}"
+    logger.info("%s: %s file '%s' prepared for download.", view_name, format_label, filename,
+                extra={'request_id': request_id, 'output_filename': filename})
+    return FileResponse(
+        output_file,
+        as_attachment=True,
+        filename=filename,
+        content_type=arrow_export.COLUMNAR_CONTENT_TYPES[export_format]
+    )
+
+
+@_timed_export('parquet')
+def download_parquet_view(request):
+    return _download_columnar_export(
+        request, arrow_export.FORMAT_PARQUET, 'download_parquet_view', 'Parquet')
+
+
+@_timed_export('arrow')
+def download_arrow_view(request):
+    return _download_columnar_export(
+        request, arrow_export.FORMAT_ARROW, 'download_arrow_view', 'Arrow')
+
+
+@_timed_export('json')
 def download_json_view(request):
     request_id = getattr(request, 'request_id', 'N/A')
     logger.debug("Enter download_json_view.", extra={
                  'request_id': request_id, 'path': request.path})
-    statement_data_id = request.session.get('statement_data_id')
-    date_range_str = request.session.get('date_range_string', 'statement')
+    statement_data_id, date_range_str = _get_requested_statement(
+        request, 'download_json_view', request_id)
 
-    if not statement_data_id:
-        logger.warning("download_json_view: No statement_data_id found in session.", extra={
-                       'request_id': request_id})
-        raise Http404(
-            "No statement data ID found in session. Please upload a PDF first.")
+    stored_response = _serve_stored_artifact(
+        request, statement_data_id, ExportArtifact.FORMAT_JSON, f"{date_range_str}.json", request_id)
+    if stored_response is not None:
+        return stored_response
 
     try:
-        statement_record = StatementData.objects.get(id=statement_data_id)
-        extracted_data = statement_record.extracted_data
-        logger.info(f"download_json_view: Retrieved statement data (ID: {statement_data_id}) for JSON generation.",
+        with span('export_query'):
+            statement_record = StatementData.objects.get(id=statement_data_id)
+            extracted_data = statement_record.extracted_data
+        logger.info("download_json_view: Retrieved statement data (ID: %s) for JSON generation.", statement_data_id,
                     extra={'request_id': request_id, 'record_id': statement_data_id, 'date_range': date_range_str})
     except StatementData.DoesNotExist:
-        logger.error(f"download_json_view: StatementData with ID {statement_data_id} not found.",
+        logger.error("download_json_view: StatementData with ID %s not found.", statement_data_id,
                      extra={'request_id': request_id, 'record_id': statement_data_id})
         raise Http404(
             "Statement data not found. It might have been cleared or an error occurred.")
 
     if not extracted_data:
-        logger.warning(f"download_json_view: StatementData record ID {statement_data_id} has no extracted_data.",
+        logger.warning("download_json_view: StatementData record ID %s has no extracted_data.", statement_data_id,
                        extra={'request_id': request_id, 'record_id': statement_data_id})
         raise Http404("No extracted data available for this statement.")
 
-    json_string = json.dumps(extracted_data, indent=2)
+    # No pre-rendered artifact (evicted, too large or not rendered yet): render now,
+    # and queue a background render so the next download is served from the store
+    schedule_artifact_render(
+        statement_data_id, request_id=request_id, only_if_missing=True)
+
+    with span('export_render'):
+        json_string = json.dumps(extracted_data, indent=2)
 
     filename = f"{date_range_str}.json"
-    logger.info(f"download_json_view: JSON file '{filename}' prepared for download.",
+    logger.info("download_json_view: JSON file '%s' prepared for download.", filename,
                 extra={'request_id': request_id, 'output_filename': filename})
     response = HttpResponse(json_string, content_type='application/json')
     response['Content-Disposition'] = f'attachment; filename="{filename}"'
     return response
 
 
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint. Reports the metrics of every worker process when
+    METRICS_MULTIPROCESS_DIR is set. Requires 'Authorization: Bearer
+    <METRICS_AUTH_TOKEN>'; without a token it only answers when DEBUG is on.
+    """
+    token = getattr(settings, 'METRICS_AUTH_TOKEN', None)
+    if not getattr(settings, 'METRICS_ENABLED', True) or not (token or settings.DEBUG):
+        raise Http404("Metrics are disabled.")
+    if token and not constant_time_compare(request.headers.get('Authorization', ''), f"Bearer {token}"):
+        logger.warning("metrics_view: Rejected scrape without a valid token.",
+                       extra={'request_id': getattr(request, 'request_id', 'N/A')})
+        return HttpResponse('Unauthorized', status=401, content_type='text/plain')
+    response = HttpResponse(metrics.render_text(), content_type=metrics.CONTENT_TYPE)
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+def transaction_feed_view(request):
+    """
+    Streams stored transactions as NDJSON for downstream sync jobs (see
+    feed.iter_feed_lines). ?cursor= resumes after a line's cursor, ?limit= caps
+    the rows of this response. Requires 'Authorization: Bearer <FEED_AUTH_TOKEN>';
+    the feed is disabled when FEED_AUTH_TOKEN isn't set.
+    """
+    request_id = getattr(request, 'request_id', 'N/A')
+    token = getattr(settings, 'FEED_AUTH_TOKEN', None)
+    if not token:
+        raise Http404("The transaction feed is disabled.")
+    if not constant_time_compare(request.headers.get('Authorization', ''), f"Bearer {token}"):
+        logger.warning("transaction_feed_view: Rejected request without a valid token.",
+                       extra={'request_id': request_id})
+        return HttpResponse('Unauthorized', status=401, content_type='text/plain')
+
+    limit = request.GET.get('limit')
+    if limit is not None:
+        limit = int(limit) if limit.isdigit() else 0
+        if limit < 1:
+            return HttpResponse('limit must be a positive integer.', status=400, content_type='text/plain')
+    cursor = request.GET.get('cursor') or None
+    try:
+        lines = feed.iter_feed_lines(cursor, limit)
+    except feed.InvalidCursor:
+        logger.warning("transaction_feed_view: Invalid cursor %r.", cursor, extra={'request_id': request_id})
+        return HttpResponse('Invalid cursor.', status=400, content_type='text/plain')
+
+    logger.info("transaction_feed_view: Streaming feed from cursor %s (limit %s).",
+                cursor or 'start', limit or 'default', extra={'request_id': request_id})
+    response = StreamingHttpResponse(lines, content_type='application/x-ndjson')
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
 # Imports for Google OAuth
 # import pathlib # No longer needed for CLIENT_SECRETS_FILE
 
@@ -580,20 +961,19 @@ def google_auth_redirect(request):
             prompt='consent'
         )
         request.session['oauth_state'] = state
-        logger.debug(f"google_auth_redirect: OAuth state '{state}' stored in session. Redirecting to {authorization_url}",
+        logger.debug("google_auth_redirect: OAuth state '%s' stored in session. Redirecting to %s",
+                     state, authorization_url,
                      extra={'request_id': request_id, 'oauth_state': state, 'auth_url': authorization_url})
         return redirect(authorization_url)
     except ValueError as ve:  # Catch specific configuration errors
-        logger.exception(f"google_auth_redirect: Configuration error for Google OAuth. Details: {str(ve)}", extra={
+        logger.exception("google_auth_redirect: Configuration error for Google OAuth. Details: %s", ve, extra={
                          'request_id': request_id})
-        request.session[
-            'upload_message'] = f"Error: Google API client configuration error. {str(ve)}. Please contact support."
+        _set_flash(request, message=f"Error: Google API client configuration error. {str(ve)}. Please contact support.")
         return redirect(reverse('converter_app:upload_pdf'))
     except Exception as e:
         logger.exception("google_auth_redirect: Error initiating Google OAuth flow.", extra={
                          'request_id': request_id})
-        request.session[
-            'upload_message'] = f"Error initiating Google authentication: {str(e)}"
+        _set_flash(request, message=f"Error initiating Google authentication: {str(e)}")
         return redirect(reverse('converter_app:upload_pdf'))
 
 
@@ -654,12 +1034,11 @@ def google_auth_callback(request):
         logger.debug("google_auth_callback: Stored relevant Google credentials (token, refresh_token, scopes, expiry) in session.",
                      extra={'request_id': request_id})
     except ValueError as ve:  # Catch specific configuration errors
-        logger.exception(f"google_auth_callback: Configuration error for Google OAuth. Details: {str(ve)}", extra={
+        logger.exception("google_auth_callback: Configuration error for Google OAuth. Details: %s", ve, extra={
                          'request_id': request_id})
         if 'OAUTHLIB_INSECURE_TRANSPORT' in os.environ:
             del os.environ['OAUTHLIB_INSECURE_TRANSPORT']
-        request.session[
-            'upload_message'] = f"Error: Google API client configuration error. {str(ve)}. Please contact support."
+        _set_flash(request, message=f"Error: Google API client configuration error. {str(ve)}. Please contact support.")
         return redirect(reverse('converter_app:upload_pdf'))
     except Exception as e:
         logger.exception("google_auth_callback: Failed to fetch authorization token or instantiate flow.", extra={
@@ -680,7 +1059,8 @@ def google_auth_callback(request):
     next_url = request.session.pop('google_auth_next_url', None)
     redirect_target = next_url or reverse('converter_app:upload_pdf')
     
-    logger.info(f"google_auth_callback: Google authentication successful. Credentials stored. Redirecting to: {redirect_target}", extra={
+    logger.info("google_auth_callback: Google authentication successful. Credentials stored. Redirecting to: %s",
+                redirect_target, extra={
                 'request_id': request_id, 'redirect_target': redirect_target})
     return redirect(redirect_target)
 
@@ -701,25 +1081,28 @@ def upload_to_google_sheets_view(request):
     if not statement_data_id:
         logger.warning("upload_to_google_sheets_view: No statement_data_id found in session. Redirecting to upload page.",
                        extra={'request_id': request_id})
-        request.session['upload_message'] = "Error: No statement data ID found to upload. Please upload a PDF first."
+        _set_flash(request, message="Error: No statement data ID found to upload. Please upload a PDF first.")
         return redirect(reverse('converter_app:upload_pdf'))
 
     extracted_data = None
     try:
-        statement_record = StatementData.objects.get(id=statement_data_id)
-        extracted_data = statement_record.extracted_data
-        logger.info(f"upload_to_google_sheets_view: Retrieved statement data (ID: {statement_data_id}) for Google Sheets upload.",
+        with span('export_query'):
+            statement_record = StatementData.objects.get(id=statement_data_id)
+            extracted_data = statement_record.extracted_data
+        logger.info("upload_to_google_sheets_view: Retrieved statement data (ID: %s) for Google Sheets upload.",
+                    statement_data_id,
                     extra={'request_id': request_id, 'record_id': statement_data_id})
     except StatementData.DoesNotExist:
-        logger.error(f"upload_to_google_sheets_view: StatementData with ID {statement_data_id} not found.",
+        logger.error("upload_to_google_sheets_view: StatementData with ID %s not found.", statement_data_id,
                      extra={'request_id': request_id, 'record_id': statement_data_id})
-        request.session['upload_message'] = "Error: Statement data not found. It might have been cleared."
+        _set_flash(request, message="Error: Statement data not found. It might have been cleared.")
         return redirect(reverse('converter_app:upload_pdf'))
 
     if not extracted_data:
-        logger.warning(f"upload_to_google_sheets_view: StatementData record ID {statement_data_id} has no extracted_data.",
+        logger.warning("upload_to_google_sheets_view: StatementData record ID %s has no extracted_data.",
+                       statement_data_id,
                        extra={'request_id': request_id, 'record_id': statement_data_id})
-        request.session['upload_message'] = "Error: No extracted data available for this statement."
+        _set_flash(request, message="Error: No extracted data available for this statement.")
         return redirect(reverse('converter_app:upload_pdf'))
 
     if not credentials_dict:
@@ -736,7 +1119,7 @@ def upload_to_google_sheets_view(request):
         if not credentials_dict.get('refresh_token'):
             logger.warning("upload_to_google_sheets_view: Google API refresh token missing. Redirecting to auth.",
                            extra={'request_id': request_id})
-            request.session['upload_message'] = "Google API refresh token is missing. Please re-authenticate."
+            _set_flash(request, message="Google API refresh token is missing. Please re-authenticate.")
             request.session['google_auth_next_url'] = request.path # Store current path
             return redirect(reverse('converter_app:google_auth_redirect'))
 
@@ -757,9 +1140,10 @@ def upload_to_google_sheets_view(request):
             settings, s) or not getattr(settings, s)]
 
         if missing_settings:
-            logger.error(f"upload_to_google_sheets_view: Missing Google OAuth client configuration in Django settings: {', '.join(missing_settings)}",
+            logger.error("upload_to_google_sheets_view: Missing Google OAuth client configuration in Django settings: %s",
+                         ', '.join(missing_settings),
                          extra={'request_id': request_id, 'missing_settings': missing_settings})
-            request.session['upload_message'] = "Critical error: Google API client configuration is missing on the server. Please contact support."
+            _set_flash(request, message="Critical error: Google API client configuration is missing on the server. Please contact support.")
             return redirect(reverse('converter_app:upload_pdf'))
 
         final_creds_args = {
@@ -772,7 +1156,9 @@ def upload_to_google_sheets_view(request):
             'expiry': datetime.fromisoformat(credentials_dict['expiry']) if credentials_dict.get('expiry') else None
         }
 
-        credentials = Credentials(**final_creds_args)
+        # Reuses this grant's Credentials (and any access token refreshed by an earlier export)
+        google_clients = get_google_client_manager()
+        credentials = google_clients.get_credentials(final_creds_args)
 
         # Check if credentials are valid (optional but good practice)
         # You might need to handle refreshing the token if it's expired
@@ -785,11 +1171,11 @@ def upload_to_google_sheets_view(request):
                 try:
                     logger.debug("upload_to_google_sheets_view: Refreshing Google credentials.", extra={
                                  'request_id': request_id})
-                    credentials.refresh(
-                        google.auth.transport.requests.Request())
+                    with span('sheets_token_refresh'):
+                        google_clients.refresh_credentials(credentials)
                     logger.info("upload_to_google_sheets_view: Google credentials refreshed successfully. Updating session.", extra={
                                 'request_id': request_id})
-                    request.session['google_credentials'] = {
+                    refreshed_credentials = {
                         'token': credentials.token,
                         'refresh_token': credentials.refresh_token,
                         # client_id, client_secret, and token_uri are static server config,
@@ -798,9 +1184,12 @@ def upload_to_google_sheets_view(request):
                         'scopes': credentials.scopes,
                         'expiry': credentials.expiry.isoformat() if credentials.expiry else None
                     }
+                    if refreshed_credentials != credentials_dict:  # Only rewrite the session when the token changed
+                        request.session['google_credentials'] = refreshed_credentials
                 except Exception as refresh_error:
                     logger.exception("upload_to_google_sheets_view: Failed to refresh Google credentials. Redirecting to auth.",
                                      extra={'request_id': request_id})
+                    google_clients.forget_credentials(final_creds_args)
                     request.session['google_auth_next_url'] = request.path # Store current path
                     return redirect(reverse('converter_app:google_auth_redirect'))
             else: # This else corresponds to 'if credentials.expired and all_fields_present_for_refresh:'
@@ -812,120 +1201,37 @@ def upload_to_google_sheets_view(request):
             logger.debug("upload_to_google_sheets_view: Google credentials are valid.", extra={
                          'request_id': request_id})
 
-        logger.debug("upload_to_google_sheets_view: Building Google Sheets API service.", extra={
-                     'request_id': request_id})
-        service = build('sheets', 'v4', credentials=credentials)
-        sheets_api = service.spreadsheets()
-
-        # --- Create New Spreadsheet ---
+        # --- Create the spreadsheet, its "Transactions" sheet and all rows in one request ---
         spreadsheet_title = f"Bank Statement {date_range_str}"
-        spreadsheet_body = {
-            'properties': {
-                'title': spreadsheet_title
-            }
-            # Optionally define sheet properties here if needed
-        }
         try:
-            logger.info(f"upload_to_google_sheets_view: Creating new Google Sheet with title '{spreadsheet_title}'.",
-                        extra={'request_id': request_id, 'sheet_title': spreadsheet_title})
-            spreadsheet = sheets_api.create(
-                body=spreadsheet_body, fields='spreadsheetId,spreadsheetUrl').execute()
-            spreadsheet_id = spreadsheet.get('spreadsheetId')
-            spreadsheet_url = spreadsheet.get('spreadsheetUrl')
-            logger.info(f"upload_to_google_sheets_view: Google Sheet created successfully. ID: {spreadsheet_id}, URL: {spreadsheet_url}",
+            logger.info("upload_to_google_sheets_view: Creating new Google Sheet with title '%s'.", spreadsheet_title,
+                        extra={'request_id': request_id, 'sheet_title': spreadsheet_title, 'num_rows_to_write': len(extracted_data)})
+            spreadsheet_id, spreadsheet_url, cell_count = create_statement_spreadsheet(
+                credentials, spreadsheet_title, extracted_data, request_id=request_id)
+            logger.info("upload_to_google_sheets_view: Google Sheet created successfully. ID: %s, URL: %s",
+                        spreadsheet_id, spreadsheet_url,
                         extra={'request_id': request_id, 'spreadsheet_id': spreadsheet_id, 'spreadsheet_url': spreadsheet_url})
-
-            # --- (Optional) Rename the default 'Sheet1' ---
-            logger.debug(f"upload_to_google_sheets_view: Attempting to rename default sheet to 'Transactions' for sheet ID {spreadsheet_id}.",
-                         extra={'request_id': request_id, 'spreadsheet_id': spreadsheet_id})
-            rename_request_body = {
-                'requests': [
-                    {
-                        'updateSheetProperties': {
-                            'properties': {
-                                'sheetId': 0,  # Default sheet usually has ID 0
-                                'title': "Transactions",  # New name for the sheet
-                            },
-                            'fields': 'title',
-                        }
-                    }
-                ]
-            }
-            try:
-                sheets_api.batchUpdate(
-                    spreadsheetId=spreadsheet_id, body=rename_request_body).execute()
-                sheet_name_for_range = "Transactions"
-                logger.info(f"upload_to_google_sheets_view: Default sheet renamed to 'Transactions' for sheet ID {spreadsheet_id}.",
-                            extra={'request_id': request_id, 'spreadsheet_id': spreadsheet_id})
-            except Exception as rename_error:
-                logger.warning(f"upload_to_google_sheets_view: Failed to rename default sheet for sheet ID {spreadsheet_id}. Error: {rename_error}",
-                               extra={'request_id': request_id, 'spreadsheet_id': spreadsheet_id, 'rename_error': str(rename_error)})
-                sheet_name_for_range = "Sheet1"  # Fallback to default if rename fails
-
         except Exception as create_error:
-            logger.exception(f"upload_to_google_sheets_view: Error creating Google Sheet.",
+            logger.exception("upload_to_google_sheets_view: Error creating Google Sheet.",
                              extra={'request_id': request_id, 'sheet_title': spreadsheet_title})
-            request.session['upload_message'] = f"Error creating Google Sheet: {create_error}"
+            _set_flash(request, message=f"Error creating Google Sheet: {create_error}")
             return redirect(reverse('converter_app:upload_pdf'))
 
-        logger.debug("upload_to_google_sheets_view: Preparing data for Sheets API.",
-                     extra={'request_id': request_id, 'num_rows_to_write': len(extracted_data)})
-        # Prepare data for Sheets API (list of lists)
-        range_start = 'A1'  # Where to start writing data
-        headers = ['date', 'description', 'debit', 'credit', 'balance']
-        values_to_write = [headers]  # Start with header row
-        for row_dict in extracted_data:  # Use extracted_data here
-            # Use empty string for missing values
-            row_values = [row_dict.get(header, '') for header in headers]
-            values_to_write.append(row_values)
-
-        body = {
-            'values': values_to_write
-        }
-
-        # Determine the full range to write to
-        # Example: If 26 data rows + 1 header row, range is A1:E27
-        num_rows = len(values_to_write)
-        num_cols = len(headers)
-        # Convert column number to letter (e.g., 5 -> E) - simple version for few columns
-        end_col_letter = chr(ord('A') + num_cols - 1) if num_cols > 0 else 'A'
-        # Use the potentially renamed sheet name here
-        range_name = f"'{sheet_name_for_range}'!{range_start}:{end_col_letter}{num_rows}"
-
-        # Call the Sheets API to update values
-        # valueInputOption='USER_ENTERED' tries to mimic typing data in
-        logger.info(f"upload_to_google_sheets_view: Writing data to Google Sheet. ID: {spreadsheet_id}, Range: {range_name}",
-                    extra={'request_id': request_id, 'spreadsheet_id': spreadsheet_id, 'range': range_name, 'num_rows': num_rows})
-        result = sheets_api.values().update(
-            spreadsheetId=spreadsheet_id,
-            range=range_name,
-            valueInputOption='USER_ENTERED',
-            body=body
-        ).execute()
-        logger.info(f"upload_to_google_sheets_view: Successfully wrote data to Google Sheet. Updated cells: {result.get('updatedCells')}",
-                    extra={'request_id': request_id, 'spreadsheet_id': spreadsheet_id, 'updated_cells': result.get('updatedCells')})
-
-        # Set session variables for the template to construct the success message safely
-        request.session[
-            'gsheet_success_message'] = f"Successfully uploaded {result.get('updatedCells')} cells."
-        request.session['gsheet_url'] = spreadsheet_url
-        request.session['gsheet_title'] = spreadsheet_title
-        # Clear any generic user_message
-        request.session.pop('user_message', None)
-        # Clear old upload_message format
-        request.session.pop('upload_message', None)
-        # Explicitly mark session as modified to ensure changes save before redirect
-        request.session.modified = True
+        # Pending message for the template to construct the success message safely; replaces any earlier one
+        _set_flash(request, gsheet_message=f"Successfully uploaded {cell_count} cells.",
+                   gsheet_url=spreadsheet_url, gsheet_title=spreadsheet_title)
     except Exception as e:
         logger.exception("upload_to_google_sheets_view: Error uploading data to Google Sheets.",
                          extra={'request_id': request_id})
-        request.session['upload_message'] = f"Error uploading to Google Sheets: {e}"
+        _set_flash(request, message=f"Error uploading to Google Sheets: {e}")
 
-    logger.info(f"upload_to_google_sheets_view: GSheet success session PRE-REDIRECT - Message: {request.session.get('gsheet_success_message')}, URL: {request.session.get('gsheet_url')}, Title: {request.session.get('gsheet_title')}",
+    flash = request.session.get(FLASH_SESSION_KEY, {})
+    logger.info("upload_to_google_sheets_view: GSheet success session PRE-REDIRECT - Message: %s, URL: %s, Title: %s",
+                flash.get('gsheet_message'), flash.get('gsheet_url'), flash.get('gsheet_title'),
                 extra={'request_id': request_id,
-                       'session_gsheet_success_message': request.session.get('gsheet_success_message'),
-                       'session_gsheet_url': request.session.get('gsheet_url'),
-                       'session_gsheet_title': request.session.get('gsheet_title')})
+                       'session_gsheet_success_message': flash.get('gsheet_message'),
+                       'session_gsheet_url': flash.get('gsheet_url'),
+                       'session_gsheet_title': flash.get('gsheet_title')})
     logger.debug("upload_to_google_sheets_view: Upload process finished, redirecting to upload_pdf.", extra={
                  'request_id': request_id})
     # Clear session data after attempting upload? Optional.